@@ -8,9 +8,34 @@ import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI
 
-from profile_matcher.api import client_config_router
-from profile_matcher.database import session_manager
-from profile_matcher.database.data_creator import InitialDataCreator
+from profile_matcher.api import (
+    DeadlineMiddleware,
+    QueryStatsMiddleware,
+    campaign_players_router,
+    catalog_sync,
+    client_config_router,
+    diagnostics_router,
+    match_cache,
+    players_router,
+    shadow_runner,
+)
+from profile_matcher.database import (
+    CACHE_INVALIDATION,
+    CATALOG_CHANNEL,
+    active_campaigns_write_behind,
+    invalidation_listener,
+    publish_catalog_version,
+    session_manager,
+    session_manager_for,
+    sharded_session_manager,
+)
+from profile_matcher.database.data_creator import INITIAL_PLAYER_ID, InitialDataCreator
+from profile_matcher.repository import (
+    PLAYER_REPOSITORY_BACKEND,
+    PLAYER_SNAPSHOT_PATH,
+    RepositoryBackend,
+    in_memory_player_repository,
+)
 
 load_dotenv()
 POSTGRES_URL = os.getenv('DATABASE_URL')
@@ -26,6 +51,13 @@ async def connect_to_db():
     )
 
 
+if CACHE_INVALIDATION:
+    # The catalog is refreshed as soon as another worker switches to a new version. Registered once, not in the lifespan,
+    # which runs again on every start of the app
+    invalidation_listener.subscribe(CATALOG_CHANNEL, catalog_sync.notify_version)
+    invalidation_listener.on_connection_change(catalog_sync.set_notified)
+
+
 # For purpose of this test, create a lifespan event that will create the database, tables and test data when
 # the app starts. In a normal scenario, the database would be created prior to the project and the tables would
 # be created via Alembic (or another migration tool).
@@ -33,21 +65,60 @@ async def connect_to_db():
 # seed.
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with session_manager.session() as db_session:
+    if PLAYER_REPOSITORY_BACKEND is RepositoryBackend.MEMORY:
+        # The players are served from memory, seeded from a snapshot: no database is needed to match them
+        player_count = in_memory_player_repository.load_snapshot_file(
+            PLAYER_SNAPSHOT_PATH
+        )
+        logging.getLogger('uvicorn').info(
+            f'{player_count} players loaded from {PLAYER_SNAPSHOT_PATH}'
+        )
+        await catalog_sync.start()
+        yield
+        await catalog_sync.stop()
+        logging.getLogger('uvicorn').info(f'Match cache: {match_cache.stats()}')
+        await shadow_runner.stop()
+        return
+
+    if sharded_session_manager is not None:
+        await sharded_session_manager.create_database_if_not_exists()
+        await sharded_session_manager.create_all()
+    # The initial player is created in its shard when the players are sharded
+    async with session_manager_for(INITIAL_PLAYER_ID).session() as db_session:
         await session_manager.create_database_if_not_exists()
         connection = await connect_to_db()
         await session_manager.create_all()
         data_creator = InitialDataCreator()
         await data_creator.try_create_data(db_session)
+        await active_campaigns_write_behind.start()
+        if CACHE_INVALIDATION:
+            catalog_sync.on_new_version = publish_catalog_version
+            # Listens on the connection opened above
+            await invalidation_listener.start(connection)
+        await catalog_sync.start()
         yield
+        await catalog_sync.stop()
+        await invalidation_listener.stop()
+        logging.getLogger('uvicorn').info(f'Match cache: {match_cache.stats()}')
+        await shadow_runner.stop()
+        # Write the active campaigns still queued before closing the database
+        await active_campaigns_write_behind.stop()
         if session_manager.get_engine is not None:
             # Close the DB connection
             await session_manager.close()
             await connection.close()
+        if sharded_session_manager is not None:
+            await sharded_session_manager.close()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(QueryStatsMiddleware)
+# Added last, so that it runs first: a rejected request costs nothing else
+app.add_middleware(DeadlineMiddleware, paths=('/get_client_config/',))
 app.include_router(client_config_router, tags=['client'])
+app.include_router(campaign_players_router, tags=['campaign'])
+app.include_router(players_router, tags=['player'])
+app.include_router(diagnostics_router, tags=['admin'])
 
 log_config = str(pathlib.Path(__file__).parent / 'log.ini')
 logging.config.fileConfig(log_config, disable_existing_loggers=False)
@@ -1,3 +1,24 @@
-from .routes import client_config_router
+from .middlewares import DeadlineMiddleware, QueryStatsMiddleware
+from .routes import (
+    HttpCampaignSource,
+    catalog_sync,
+    campaign_players_router,
+    client_config_router,
+    diagnostics_router,
+    match_cache,
+    players_router,
+    shadow_runner,
+)
 
-__all__ = ['client_config_router']
+__all__ = [
+    'DeadlineMiddleware',
+    'QueryStatsMiddleware',
+    'HttpCampaignSource',
+    'catalog_sync',
+    'campaign_players_router',
+    'client_config_router',
+    'diagnostics_router',
+    'match_cache',
+    'players_router',
+    'shadow_runner',
+]
@@ -0,0 +1,4 @@
+from ._deadline import DeadlineMiddleware
+from ._query_stats import QueryStatsMiddleware
+
+__all__ = ['DeadlineMiddleware', 'QueryStatsMiddleware']
@@ -0,0 +1,102 @@
+import logging
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from profile_matcher.concurrency import (
+    AdmissionController,
+    AdmissionSlot,
+    DeadlineExceededException,
+    admission_controller,
+    admission_scope,
+    deadline_scope,
+)
+
+logger = logging.getLogger('uvicorn')
+
+load_dotenv()
+
+# Time given to a request to be answered. A client can ask for less with the X-Request-Timeout header (milliseconds).
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT_MS', '1000')) / 1000
+
+REQUEST_TIMEOUT_HEADER = b'x-request-timeout'
+
+
+class DeadlineMiddleware:
+    """
+    Give a deadline to the requests of the paths starting with one of paths, and shed the load when it cannot be met.
+    The admission controller rejects a request right away when it would not be answered before its deadline, and the
+    database and campaign stages stop once the deadline is exceeded. In both cases, a 503 is returned with a
+    Retry-After header, instead of letting the requests pile up on the connection pool.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        paths: tuple[str, ...],
+        timeout: float = REQUEST_TIMEOUT,
+        controller: AdmissionController = admission_controller,
+    ):
+        self.app = app
+        self.paths = paths
+        self.timeout = timeout
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        timeout = self.__request_timeout(scope)
+        if not self.controller.try_acquire(timeout):
+            logger.warning(
+                f'{scope["method"]} {scope["path"]} rejected: {self.controller.in_flight} requests in flight, '
+                f'{self.controller.estimated_latency() * 1000:.0f} ms estimated latency'
+            )
+            await self.__service_unavailable(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_and_track(message: Message):
+            nonlocal response_started
+            response_started = response_started or (
+                message['type'] == 'http.response.start'
+            )
+            await send(message)
+
+        # Released once the response is sent, or later if the request left a shared computation running
+        slot = AdmissionSlot(self.controller)
+        start = time.perf_counter()
+        try:
+            with admission_scope(slot), deadline_scope(timeout):
+                await self.app(scope, receive, send_and_track)
+        except DeadlineExceededException:
+            if response_started:
+                raise
+            logger.warning(f'{scope["method"]} {scope["path"]}: deadline exceeded')
+            await self.__service_unavailable(scope, receive, send)
+        finally:
+            slot.release(time.perf_counter() - start)
+
+    def __request_timeout(self, scope: Scope) -> float:
+        """
+        Timeout asked by the client, within the timeout of the service.
+        """
+        value: Optional[bytes] = dict(scope['headers']).get(REQUEST_TIMEOUT_HEADER)
+        try:
+            return min(self.timeout, float(value) / 1000) if value else self.timeout
+        except ValueError:
+            return self.timeout
+
+    async def __service_unavailable(self, scope: Scope, receive: Receive, send: Send):
+        response = JSONResponse(
+            {'detail': 'The service is overloaded, please retry later.'},
+            status_code=503,
+            headers={'Retry-After': str(self.controller.retry_after())},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,54 @@
+import logging
+import os
+
+from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from profile_matcher.database import count_queries
+
+logger = logging.getLogger('uvicorn')
+
+load_dotenv()
+
+# A statement executed this many times by a single request is reported as a probable N+1
+REPEATED_STATEMENT_THRESHOLD = int(os.getenv('REPEATED_STATEMENT_THRESHOLD', '5'))
+
+
+class QueryStatsMiddleware:
+    """
+    Count the statements, rows and database time of every request. They are sent in the Server-Timing header and
+    logged once the response is sent, with a warning for the statements repeated by the request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as stats:
+
+            async def send_with_server_timing(message: Message):
+                # Statements executed while a streamed body is sent are only logged
+                if message['type'] == 'http.response.start':
+                    MutableHeaders(scope=message).append(
+                        'Server-Timing', stats.server_timing()
+                    )
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_server_timing)
+            finally:
+                logger.debug(
+                    f'{scope["method"]} {scope["path"]}: {stats.statements} statements, {stats.rows} rows, '
+                    f'{stats.duration * 1000:.1f} ms in the database'
+                )
+                for statement, count in stats.repeated_statements(
+                    REPEATED_STATEMENT_THRESHOLD
+                ).items():
+                    logger.warning(
+                        f'{scope["method"]} {scope["path"]} executed {count} times: {statement}'
+                    )
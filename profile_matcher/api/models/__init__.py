@@ -1,15 +1,53 @@
-from ._campaign import ActiveCampaign, MatcherContent, Matcher, Level
+from ._campaign import (
+    ActiveCampaign,
+    CampaignChanges,
+    CampaignTombstone,
+    MatcherContent,
+    Matcher,
+    Level,
+    Range,
+    Recency,
+    active_campaigns_adapter,
+)
 from ._error_response import ErrorResponse
-from ._player_profile_response import PlayerProfileResponse, Inventory, Clan, Device
+from ._memory_diagnostics import (
+    AllocationDiffResponse,
+    LiveObjectsResponse,
+    MemoryDiffResponse,
+    MemorySnapshotResponse,
+    MemoryTracingStatus,
+    SessionObjects,
+)
+from ._worker_stats import WorkerStatsResponse
+from ._player_profile_response import (
+    PlayerProfileResponse,
+    Inventory,
+    Clan,
+    Device,
+    player_profile_projection,
+)
 
 __all__ = [
     'PlayerProfileResponse',
+    'player_profile_projection',
     'Inventory',
     'Clan',
     'Device',
     'ActiveCampaign',
+    'active_campaigns_adapter',
     'ErrorResponse',
     'MatcherContent',
     'Matcher',
     'Level',
+    'Range',
+    'Recency',
+    'CampaignChanges',
+    'CampaignTombstone',
+    'AllocationDiffResponse',
+    'LiveObjectsResponse',
+    'MemoryDiffResponse',
+    'MemorySnapshotResponse',
+    'MemoryTracingStatus',
+    'SessionObjects',
+    'WorkerStatsResponse',
 ]
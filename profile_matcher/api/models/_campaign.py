@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
 
 class Level(BaseModel):
@@ -9,15 +9,30 @@ class Level(BaseModel):
     max: int
 
 
+class Range(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
+class Recency(BaseModel):
+    min_days: Optional[float] = None
+    max_days: Optional[float] = None
+
+
 class MatcherContent(BaseModel):
     country: Optional[list[str]] = None
     items: Optional[list[str]] = None
+    language: Optional[list[str]] = None
+    gender: Optional[list[str]] = None
+    device_model: Optional[list[str]] = None
 
 
 class Matcher(BaseModel):
     level: Level
     has: MatcherContent
     does_not_have: MatcherContent
+    total_spent: Optional[Range] = None
+    last_purchase: Optional[Recency] = None
 
 
 class ActiveCampaign(BaseModel):
@@ -29,3 +44,17 @@ class ActiveCampaign(BaseModel):
     end_date: datetime
     enabled: bool
     last_updated: datetime
+
+
+class CampaignTombstone(BaseModel):
+    name: str
+    removed_at: datetime
+
+
+class CampaignChanges(BaseModel):
+    campaigns: list[ActiveCampaign]
+    removed: list[CampaignTombstone] = []
+
+
+# Built once: building the validator of a type is far more expensive than validating a catalog with it
+active_campaigns_adapter = TypeAdapter(list[ActiveCampaign])
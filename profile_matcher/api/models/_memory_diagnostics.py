@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class MemoryTracingStatus(BaseModel):
+    tracing: bool
+    # Frames kept per allocation traceback
+    frames: int
+    # Memory traced, now and at most since tracing started, in bytes
+    traced: int
+    peak: int
+    # Ids of the snapshots kept, oldest first
+    snapshots: list[int]
+
+
+class MemorySnapshotResponse(BaseModel):
+    id: int
+    taken_at: datetime
+    traced: int
+
+
+class AllocationDiffResponse(BaseModel):
+    filename: str
+    lineno: Optional[int]
+    size: int
+    size_diff: int
+    count: int
+    count_diff: int
+
+
+class MemoryDiffResponse(BaseModel):
+    since: MemorySnapshotResponse
+    snapshot: MemorySnapshotResponse
+    allocations: list[AllocationDiffResponse]
+
+
+class SessionObjects(BaseModel):
+    sessions: int
+    identity_map_objects: int
+
+
+class LiveObjectsResponse(BaseModel):
+    # Live instances of every database model, by name
+    models: dict[str, int]
+    sessions: SessionObjects
@@ -1,7 +1,8 @@
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, create_model
 
 
 # Models for clan
@@ -50,3 +51,18 @@ class PlayerProfileResponse(BaseModel):
     inventory: Inventory
     clan: Clan
     custom_field: str
+
+
+@lru_cache(maxsize=256)
+def player_profile_projection(fields: frozenset[str]) -> type[BaseModel]:
+    """
+    Model of the player profile restricted to some fields of PlayerProfileResponse, built once per set of fields.
+    :raises KeyError: If a field is not a field of PlayerProfileResponse
+    """
+    return create_model(
+        'PlayerProfileProjection',
+        **{
+            name: (PlayerProfileResponse.model_fields[name].annotation, ...)
+            for name in sorted(fields)
+        },
+    )
@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+
+class WorkerStatsResponse(BaseModel):
+    # Counters of the in-process components of the worker, since it started
+    write_behind: dict[str, int]
+    match_cache: dict[str, float]
+    catalog_sync: dict[str, int]
+    invalidation: dict[str, int]
@@ -1,3 +1,20 @@
-from ._client_config import router as client_config_router
+from ._admin import router as diagnostics_router
+from ._campaign_api import HttpCampaignSource, catalog_sync
+from ._campaign_players import router as campaign_players_router
+from ._client_config import (
+    match_cache,
+    router as client_config_router,
+    shadow_runner,
+)
+from ._players import router as players_router
 
-__all__ = ['client_config_router']
+__all__ = [
+    'HttpCampaignSource',
+    'catalog_sync',
+    'campaign_players_router',
+    'client_config_router',
+    'diagnostics_router',
+    'match_cache',
+    'players_router',
+    'shadow_runner',
+]
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from ._memory import router as memory_router
+from ._security import require_admin
+from ._stats import router as stats_router
+
+router = APIRouter()
+router.include_router(memory_router)
+router.include_router(stats_router)
+
+__all__ = ['memory_router', 'require_admin', 'router', 'stats_router']
@@ -0,0 +1,122 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from profile_matcher.diagnostics import (
+    DiagnosticsException,
+    GroupBy,
+    MemorySnapshot,
+    memory_diagnostics,
+)
+from ._security import require_admin
+from ...models import (
+    AllocationDiffResponse,
+    ErrorResponse,
+    LiveObjectsResponse,
+    MemoryDiffResponse,
+    MemorySnapshotResponse,
+    MemoryTracingStatus,
+)
+
+# The snapshots, their comparison and the scan of the live objects take long on a large heap: their routes are not
+# async, so that they run in the threadpool instead of blocking the requests of the worker.
+router = APIRouter(
+    prefix='/admin/memory',
+    dependencies=[Depends(require_admin)],
+    responses={403: {'model': ErrorResponse, 'description': 'Admin token required'}},
+)
+
+
+@router.get('/tracing', response_model=MemoryTracingStatus)
+async def get_memory_tracing():
+    """
+    Whether the allocations are traced, the memory traced and the snapshots kept.
+    """
+    return memory_diagnostics.status()
+
+
+@router.post('/tracing/start', response_model=MemoryTracingStatus)
+async def start_memory_tracing(
+    frames: int = Query(
+        default=1, ge=1, le=50, description='Frames kept per allocation traceback'
+    ),
+):
+    """
+    Start tracing the allocations of the worker. Every allocation is slower while tracing: stop it once done.
+    """
+    memory_diagnostics.start(frames)
+    return memory_diagnostics.status()
+
+
+@router.post('/tracing/stop', response_model=MemoryTracingStatus)
+async def stop_memory_tracing():
+    """
+    Stop tracing the allocations, dropping the snapshots.
+    """
+    memory_diagnostics.stop()
+    return memory_diagnostics.status()
+
+
+@router.post(
+    '/snapshots',
+    response_model=MemorySnapshotResponse,
+    responses={409: {'model': ErrorResponse, 'description': 'Tracing not started'}},
+)
+def take_memory_snapshot():
+    """
+    Take a snapshot of the allocations traced, to compare the next ones with.
+    """
+    try:
+        return __snapshot_response(memory_diagnostics.take_snapshot())
+    except DiagnosticsException as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get(
+    '/diff',
+    response_model=MemoryDiffResponse,
+    responses={
+        409: {'model': ErrorResponse, 'description': 'Tracing not started'},
+        404: {'model': ErrorResponse, 'description': 'Snapshot not found'},
+    },
+)
+def get_memory_diff(
+    since: Optional[int] = Query(
+        default=None,
+        description='Id of the snapshot to compare with, the latest one by default',
+    ),
+    top: int = Query(default=20, ge=1, le=500),
+    group_by: GroupBy = Query(default='lineno'),
+):
+    """
+    Take a snapshot and return the top allocations that grew since the snapshot since, grouped by line or by file.
+    """
+    if not memory_diagnostics.tracing:
+        raise HTTPException(status_code=409, detail='Memory tracing is not started')
+    try:
+        baseline, current, allocations = memory_diagnostics.diff(since, top, group_by)
+    except DiagnosticsException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return MemoryDiffResponse(
+        since=__snapshot_response(baseline),
+        snapshot=__snapshot_response(current),
+        allocations=[
+            AllocationDiffResponse.model_validate(allocation, from_attributes=True)
+            for allocation in allocations
+        ],
+    )
+
+
+@router.get('/objects', response_model=LiveObjectsResponse)
+def get_live_objects():
+    """
+    Count the live instances of the database models, the live sessions and the objects in their identity maps. Runs
+    a full garbage collection.
+    """
+    return memory_diagnostics.live_objects()
+
+
+def __snapshot_response(snapshot: MemorySnapshot) -> MemorySnapshotResponse:
+    return MemorySnapshotResponse(
+        id=snapshot.id, taken_at=snapshot.taken_at, traced=snapshot.traced
+    )
@@ -0,0 +1,22 @@
+import os
+import secrets
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+
+async def require_admin(
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """
+    Let the request through only with the admin token (ADMIN_TOKEN) in the X-Admin-Token header. Without ADMIN_TOKEN,
+    the admin routes are closed.
+    :raises HTTPException: 403 If the token is missing or wrong
+    """
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if (
+        not admin_token
+        or x_admin_token is None
+        or not secrets.compare_digest(x_admin_token.encode(), admin_token.encode())
+    ):
+        raise HTTPException(status_code=403, detail='Admin token required')
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends
+
+from profile_matcher.database import (
+    active_campaigns_write_behind,
+    invalidation_listener,
+)
+from ._security import require_admin
+from .._campaign_api import catalog_sync
+from .._client_config import match_cache
+from ...models import ErrorResponse, WorkerStatsResponse
+
+router = APIRouter(
+    prefix='/admin',
+    dependencies=[Depends(require_admin)],
+    responses={403: {'model': ErrorResponse, 'description': 'Admin token required'}},
+)
+
+
+@router.get('/stats', response_model=WorkerStatsResponse)
+async def get_worker_stats():
+    """
+    Counters of the worker: the active campaigns write-behind (including the updates dropped as stale), the match
+    cache, the catalog sync and the invalidation listener.
+    """
+    return WorkerStatsResponse(
+        write_behind=active_campaigns_write_behind.stats(),
+        match_cache=match_cache.stats(),
+        catalog_sync=catalog_sync.stats(),
+        invalidation=invalidation_listener.stats(),
+    )
@@ -0,0 +1,120 @@
+import os
+from datetime import datetime
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from profile_matcher.catalog import (
+    CampaignSource,
+    CatalogDelta,
+    CatalogSnapshotReader,
+    CatalogSync,
+    CatalogSyncException,
+    PlayerFeaturesSample,
+)
+from ..models import (
+    ActiveCampaign,
+    CampaignChanges,
+    Matcher,
+    Level,
+    MatcherContent,
+)
+
+load_dotenv()
+
+
+def mock_campaign_api() -> list[ActiveCampaign]:
+    """
+    This mock the external api call to get all the active campaigns
+    """
+    campaign_level = Level(min=1, max=3)
+    has_content = MatcherContent(country=['US', 'RO', 'CA'], items=['item_1'])
+    does_not_have_content = MatcherContent(items=['item_4'])
+    campaign_matchers = Matcher(
+        level=campaign_level, has=has_content, does_not_have=does_not_have_content
+    )
+    campaign = ActiveCampaign(
+        game='mygame',
+        name='mycampaign',
+        priority=10.5,
+        matchers=campaign_matchers,
+        start_date=datetime(2022, 1, 25),
+        end_date=datetime(2022, 2, 25),
+        enabled=True,
+        last_updated=datetime(2021, 7, 13),
+    )
+    return [campaign]
+
+
+class HttpCampaignSource(CampaignSource):
+    """
+    The campaign service over HTTP. GET {url}/campaigns returns the catalog as
+    {"campaigns": [...], "removed": [{"name": ..., "removed_at": ...}]}; with updated_since (ISO 8601), only the
+    campaigns updated and the tombstones of the campaigns removed at or after that time.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 5.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.__url = url.rstrip('/')
+        self.__timeout = timeout
+        self.__transport = transport
+
+    async def fetch(self, updated_since: Optional[datetime] = None) -> CatalogDelta:
+        params = (
+            {}
+            if updated_since is None
+            else {'updated_since': updated_since.isoformat()}
+        )
+        try:
+            async with httpx.AsyncClient(
+                timeout=self.__timeout, transport=self.__transport
+            ) as client:
+                response = await client.get(f'{self.__url}/campaigns', params=params)
+                response.raise_for_status()
+            changes = CampaignChanges.model_validate_json(response.content)
+        except (httpx.HTTPError, ValidationError) as e:
+            raise CatalogSyncException(f'Cannot fetch the campaigns: {e}') from e
+        return CatalogDelta(
+            campaigns=changes.campaigns,
+            removed={
+                tombstone.name: tombstone.removed_at for tombstone in changes.removed
+            },
+            full=updated_since is None,
+        )
+
+
+# The rules of a new catalog version are ordered on the last players matched
+matched_players = PlayerFeaturesSample()
+
+# Campaign service to sync the catalog from in the background. Without it, the routes call the (mocked) campaign API
+# on every request.
+CAMPAIGN_API_URL = os.getenv('CAMPAIGN_API_URL')
+
+catalog_sync = CatalogSync(
+    HttpCampaignSource(CAMPAIGN_API_URL) if CAMPAIGN_API_URL else None,
+    refresh_interval=float(os.getenv('CAMPAIGN_SYNC_INTERVAL_S', '5')),
+    full_resync_interval=float(os.getenv('CAMPAIGN_FULL_RESYNC_INTERVAL_S', '3600')),
+    sample=matched_players,
+    notified_refresh_interval=float(
+        os.getenv('CAMPAIGN_SYNC_NOTIFIED_INTERVAL_S', '60')
+    ),
+)
+
+# Snapshot of the compiled catalog written by the loader (python -m profile_matcher.catalog) and mapped by every worker.
+# Without a campaign service, the routes match against it instead of calling the (mocked) campaign API.
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH')
+
+catalog_snapshots = (
+    CatalogSnapshotReader(
+        CATALOG_SNAPSHOT_PATH,
+        check_interval=float(os.getenv('CATALOG_SNAPSHOT_CHECK_INTERVAL_S', '1')),
+    )
+    if CATALOG_SNAPSHOT_PATH
+    else None
+)
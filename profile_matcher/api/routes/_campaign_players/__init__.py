@@ -0,0 +1,3 @@
+from ._export import router
+
+__all__ = ['router']
@@ -0,0 +1,255 @@
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import AsyncContextManager, AsyncIterator, Callable, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import ColumnElement, Select, and_, exists, false, or_, true
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from profile_matcher.catalog import (
+    CompiledCampaign,
+    compile_campaign,
+    mask_to_items,
+)
+from profile_matcher.database import get_db_session_factories
+from profile_matcher.database.models import Device, PlayerProfile, Inventory
+from ...models import ActiveCampaign, ErrorResponse
+from ...models import Inventory as InventoryResponse
+from .._campaign_api import (
+    catalog_snapshots,
+    catalog_sync,
+    mock_campaign_api as __mock_campaign_api,
+)
+
+router = APIRouter()
+
+logger = logging.getLogger('uvicorn')
+
+# Inventory fields sent for every player
+INVENTORY_FIELDS = tuple(InventoryResponse.model_fields)
+
+
+@router.get(
+    '/campaigns/{campaign_name}/players',
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            'content': {'application/x-ndjson': {}},
+            'description': 'One JSON document per line for every matching player',
+        },
+        404: {'model': ErrorResponse, 'description': 'Campaign not found'},
+        500: {'model': ErrorResponse, 'description': 'Internal server error'},
+        503: {'model': ErrorResponse, 'description': 'No campaign catalog yet'},
+    },
+)
+async def export_campaign_players(
+    campaign_name: str,
+    chunk_size: int = Query(
+        default=1000, ge=1, le=50_000, description='Players fetched and sent at a time'
+    ),
+    session_factories: list[Callable[[], AsyncContextManager[AsyncSession]]] = Depends(
+        get_db_session_factories
+    ),
+):
+    """
+    Stream, as NDJSON, the players matching the campaign (whether the campaign is running or not)
+    """
+    compiled_campaign = __compiled_campaign(campaign_name)
+    if compiled_campaign is None:
+        logger.debug(f'No campaign found with name {campaign_name}')
+        raise HTTPException(
+            status_code=404, detail=f'No campaign found with name {campaign_name}'
+        )
+
+    unsupported_rules = [
+        name for name, _ in compiled_campaign.rules if name not in __RULE_CLAUSES
+    ]
+    if unsupported_rules:
+        logger.error(
+            f'Campaign {campaign_name} cannot be exported: {unsupported_rules}'
+        )
+        raise HTTPException(
+            status_code=500,
+            detail='Something went wrong while exporting the campaign players.',
+        )
+
+    return StreamingResponse(
+        __stream_players(
+            session_factories,
+            __matching_players_statement(compiled_campaign),
+            campaign_name,
+            chunk_size,
+        ),
+        media_type='application/x-ndjson',
+    )
+
+
+def __compiled_campaign(campaign_name: str) -> Optional[CompiledCampaign]:
+    """
+    Get the compiled campaign of the synced catalog, or without a campaign service, of the catalog snapshot or of the
+    (mocked) campaign API. Only that campaign is read out of the snapshot.
+    :return: The campaign, or None if the catalog has no campaign with that name
+    :raises HTTPException: If the campaigns cannot be fetched, or the catalog is not synced or its snapshot not written
+    yet
+    """
+    if catalog_sync.index is not None:
+        return next(
+            (
+                campaign
+                for campaign in catalog_sync.index.compiled
+                if campaign.name == campaign_name
+            ),
+            None,
+        )
+    if catalog_sync.enabled:
+        logger.error('No synced campaign catalog to export from')
+        raise HTTPException(
+            status_code=503, detail='The campaign catalog is not available yet.'
+        )
+
+    if catalog_snapshots is not None:
+        snapshot = catalog_snapshots.current()
+        if snapshot is None:
+            logger.error('No campaign catalog snapshot to export from')
+            raise HTTPException(
+                status_code=503, detail='The campaign catalog is not available yet.'
+            )
+        return snapshot.find(campaign_name)
+
+    try:
+        active_campaigns: list[ActiveCampaign] = __mock_campaign_api()
+    # Here, we would except the specific exception that can be raised from the service. Since we do not raise a specific
+    # exception, we use "Exception"
+    except Exception as e:
+        logger.error(f'Error in getting active campaigns: {e}')
+        raise HTTPException(
+            status_code=500,
+            detail='Something went wrong while exporting the campaign players.',
+        )
+    campaign = next(
+        (campaign for campaign in active_campaigns if campaign.name == campaign_name),
+        None,
+    )
+    return None if campaign is None else compile_campaign(campaign)
+
+
+def __matching_players_statement(campaign: CompiledCampaign) -> Select:
+    """
+    Build the query returning the players matching the campaign, so that the whole matching is done by the database.
+    """
+    has_items = [
+        getattr(Inventory, item).is_not(None)
+        for item in mask_to_items(campaign.has_items)
+    ]
+    does_not_have_items = [
+        getattr(Inventory, item).is_(None)
+        for item in mask_to_items(campaign.does_not_have_items)
+    ]
+    return (
+        select(
+            PlayerProfile.player_id,
+            PlayerProfile.level,
+            PlayerProfile.country,
+            PlayerProfile.language,
+            *(getattr(Inventory, field) for field in INVENTORY_FIELDS),
+        )
+        .join(Inventory, Inventory.player_id == PlayerProfile.player_id)
+        .where(
+            PlayerProfile.level.between(campaign.level_min, campaign.level_max),
+            PlayerProfile.country.in_(campaign.countries),
+            or_(*has_items) if has_items else false(),
+            *does_not_have_items,
+            *(__RULE_CLAUSES[name](parameters) for name, parameters in campaign.rules),
+        )
+    )
+
+
+def __between(
+    column: ColumnElement, minimum: Optional[float], maximum: Optional[float]
+) -> ColumnElement:
+    return and_(
+        column >= minimum if minimum is not None else true(),
+        column <= maximum if maximum is not None else true(),
+    )
+
+
+def __last_purchase_clause(parameters: tuple) -> ColumnElement:
+    # The purchase dates are naive UTC datetimes. A player who never purchased does not match.
+    min_days, max_days = parameters
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return and_(
+        PlayerProfile.last_purchase.is_not(None),
+        __between(
+            PlayerProfile.last_purchase,
+            now - timedelta(days=max_days) if max_days is not None else None,
+            now - timedelta(days=min_days) if min_days is not None else None,
+        ),
+    )
+
+
+def __device_model_clause(parameters: tuple) -> ColumnElement:
+    return exists().where(
+        Device.player_id == PlayerProfile.player_id, Device.model.in_(parameters)
+    )
+
+
+# SQL translation of the rules of the registry that are not stored in the fields of a compiled campaign
+__RULE_CLAUSES: dict[str, Callable[[tuple], ColumnElement]] = {
+    'language': lambda parameters: PlayerProfile.language.in_(parameters),
+    'not_language': lambda parameters: PlayerProfile.language.not_in(parameters),
+    'gender': lambda parameters: PlayerProfile.gender.in_(parameters),
+    'not_gender': lambda parameters: PlayerProfile.gender.not_in(parameters),
+    'total_spent': lambda parameters: __between(PlayerProfile.total_spent, *parameters),
+    'last_purchase': __last_purchase_clause,
+    'device_model': __device_model_clause,
+    'not_device_model': lambda parameters: ~__device_model_clause(parameters),
+}
+
+
+async def __stream_players(
+    session_factories: list[Callable[[], AsyncContextManager[AsyncSession]]],
+    statement: Select,
+    campaign_name: str,
+    chunk_size: int,
+) -> AsyncIterator[bytes]:
+    """
+    Read the players from a server side cursor, chunk_size rows at a time, and send every chunk before fetching the
+    next one. The response is only pulled as fast as the client reads it, so memory does not depend on the number of
+    players. When the players are sharded, the shards are read one after the other.
+    """
+    start = time.perf_counter()
+    exported_players = 0
+    exported_bytes = 0
+    for session_factory in session_factories:
+        async with session_factory() as session:
+            result = await session.stream(
+                statement.execution_options(yield_per=chunk_size)
+            )
+            async for rows in result.partitions():
+                chunk = ''.join(
+                    json.dumps(
+                        {
+                            'player_id': player_id,
+                            'level': level,
+                            'country': country,
+                            'language': language,
+                            'inventory': dict(zip(INVENTORY_FIELDS, inventory)),
+                        },
+                        separators=(',', ':'),
+                    )
+                    + '\n'
+                    for player_id, level, country, language, *inventory in rows
+                ).encode()
+                exported_players += len(rows)
+                exported_bytes += len(chunk)
+                yield chunk
+
+    duration = time.perf_counter() - start
+    logger.info(
+        f'Exported {exported_players} players matching {campaign_name} in {duration:.3f}s '
+        f'({exported_players / duration if duration else 0:.0f} players/s, {exported_bytes} bytes)'
+    )
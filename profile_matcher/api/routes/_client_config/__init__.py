@@ -1,3 +1,3 @@
-from ._get import router
+from ._get import match_cache, router, shadow_runner
 
-__all__ = ['router']
+__all__ = ['match_cache', 'router', 'shadow_runner']
@@ -1,26 +1,91 @@
+import asyncio
 import logging
+import os
+from collections import Counter
 from datetime import datetime
+from typing import AbstractSet, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.exc import SQLAlchemyError
-from sqlmodel import select
-from sqlmodel.ext.asyncio.session import AsyncSession
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
-from profile_matcher.database import get_db_session
-from profile_matcher.database.models import PlayerProfile, Inventory
+from profile_matcher.catalog import (
+    CatalogIndexCache,
+    Clock,
+    CompiledCampaign,
+    MatchCache,
+    PlayerFeatures,
+    get_clock,
+    player_fields,
+    rule_registry,
+    to_timestamp,
+)
+from profile_matcher.concurrency import SingleFlight, enforce_deadline
+from profile_matcher.database.models import PlayerProfile
+from profile_matcher.matching import MATCHER_ENGINES, ShadowRunner
+from profile_matcher.repository import (
+    PlayerRepository,
+    RepositoryException,
+    get_player_repository,
+)
 from ...models import (
     ActiveCampaign,
-    Matcher,
-    Level,
-    MatcherContent,
     ErrorResponse,
     PlayerProfileResponse,
+    player_profile_projection,
+)
+from .._campaign_api import (
+    catalog_snapshots,
+    catalog_sync,
+    matched_players,
+    mock_campaign_api as __mock_campaign_api,
 )
 
 router = APIRouter()
 
 logger = logging.getLogger('uvicorn')
 
+load_dotenv()
+
+# Number of times the update of active_campaigns is retried when another writer updated the player first
+MAX_UPDATE_ATTEMPTS = 5
+
+# The player with its new active campaigns, and the fields of the player loaded (None for all of them)
+client_config_flights: SingleFlight[tuple[PlayerProfile, Optional[frozenset[str]]]] = (
+    SingleFlight()
+)
+
+catalog_indexes = CatalogIndexCache(sample=matched_players)
+
+# Campaigns matched per player fingerprint, for the running campaigns. 0 disables the cache.
+match_cache = MatchCache(int(os.getenv('MATCH_CACHE_SIZE', '65536')))
+
+# A sample of the players matched is also matched by the candidate engine (one of MATCHER_ENGINES) in the background,
+# and the results compared. Disabled without SHADOW_ENGINE.
+SHADOW_ENGINE = os.getenv('SHADOW_ENGINE') or None
+shadow_runner = ShadowRunner(
+    MATCHER_ENGINES[SHADOW_ENGINE]() if SHADOW_ENGINE else None,
+    sample_rate=float(os.getenv('SHADOW_SAMPLE_RATE', '0.01')),
+    max_pending=int(os.getenv('SHADOW_MAX_PENDING', '100')),
+)
+
+
+def __parse_game_campaign_limits(value: str) -> dict[str, int]:
+    """
+    Parse the maximum number of campaigns per game, formatted as "game=limit,other_game=limit".
+    """
+    limits = {}
+    for entry in value.split(','):
+        if entry.strip():
+            game, limit = entry.split('=')
+            limits[game.strip()] = int(limit)
+    return limits
+
+
+# Maximum number of active campaigns per game, e.g. "mygame=3,othergame=1". Games not listed are not limited.
+GAME_CAMPAIGN_LIMITS = __parse_game_campaign_limits(
+    os.getenv('GAME_CAMPAIGN_LIMITS', '')
+)
+
 
 @router.get(
     '/get_client_config/{player_id}',
@@ -28,136 +93,282 @@ logger = logging.getLogger('uvicorn')
     response_model_exclude_none=True,
     responses={
         404: {'model': ErrorResponse, 'description': 'Player not found'},
+        409: {
+            'model': ErrorResponse,
+            'description': 'Player updated concurrently too many times',
+        },
         500: {'model': ErrorResponse, 'description': 'Internal server error'},
+        503: {
+            'model': ErrorResponse,
+            'description': 'Overloaded, the request cannot be answered in time, or no campaign catalog yet',
+        },
     },
 )
 async def get_client_config(
-    player_id: str, session: AsyncSession = Depends(get_db_session)
+    player_id: str,
+    limit: Optional[int] = Query(
+        default=None,
+        ge=1,
+        description='Maximum number of active campaigns returned, the ones with the highest priority are kept. '
+        'Every campaign matched is saved',
+    ),
+    fields: Optional[str] = Query(
+        default=None,
+        description='Fields of the profile to return, e.g. "level,country,inventory". The active campaigns are always '
+        'returned. Only these fields (and the ones the matching needs) are loaded. All the fields by default',
+    ),
+    repository: PlayerRepository = Depends(get_player_repository),
+    clock: Clock = Depends(get_clock),
 ):
     """
     Return the player profile with the active campaign added
     """
-    statement = select(PlayerProfile).where(PlayerProfile.player_id == player_id)
-    result = await session.exec(statement)
-    player = result.first()
-    if player is None:
-        logger.debug(f'No player found with id {player_id}')
+    projection = __parse_fields(fields)
+
+    # Concurrent requests for the same player share a single computation instead of racing on active_campaigns, whatever
+    # their limit and fields. A request stops waiting for it at its deadline, the computation goes on for the others.
+    async with enforce_deadline():
+        player, loaded_fields = await client_config_flights.do(
+            player_id,
+            lambda: __get_client_config(player_id, projection, repository, clock),
+        )
+        active_campaigns = player.active_campaigns
+        fields_missing = loaded_fields is not None and (
+            projection is None or not projection <= loaded_fields
+        )
+        if fields_missing:
+            # The computation was shared with a request reading fewer fields: read the ones of this request
+            player = await __load_player(player_id, repository, projection)
+
+    # Every campaign matched is saved, the limit only applies to the response
+    if projection is None and limit is None and not fields_missing:
+        return player
+
+    # Only the requested fields are read and serialized
+    response = (
+        PlayerProfileResponse
+        if projection is None
+        else player_profile_projection(projection)
+    ).model_validate(player, from_attributes=True)
+    response.active_campaigns = active_campaigns[:limit]
+    return Response(
+        content=response.model_dump_json(exclude_none=True),
+        media_type='application/json',
+    )
+
+
+def __parse_fields(value: Optional[str]) -> Optional[frozenset[str]]:
+    """
+    Parse the fields of the profile requested, formatted as "field,other_field". The active campaigns are always
+    requested.
+    :raises HTTPException: If a field is not a field of the player profile
+    """
+    if value is None:
+        return None
+    fields = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = fields - PlayerProfileResponse.model_fields.keys()
+    if unknown:
         raise HTTPException(
-            status_code=404, detail=f'No player found with id {player_id}'
+            status_code=422, detail=f'Unknown fields: {", ".join(sorted(unknown))}'
         )
+    return frozenset(fields | {'active_campaigns'})
 
-    # Commit to avoid idle in transaction before (mocked) external call
 
-    await session.commit()
+async def __get_client_config(
+    player_id: str,
+    fields: Optional[frozenset[str]],
+    repository: PlayerRepository,
+    clock: Clock,
+) -> tuple[PlayerProfile, Optional[frozenset[str]]]:
+    """
+    Match the player and save its new active campaigns.
+    :return: The player, and the fields of the player loaded (None for all of them)
+    """
+    # The player and the running campaigns do not depend on each other: both stages run at the same time, and a failed
+    # stage cancels the other one (a missing player does not wait for the catalog). A failure is reported as if the
+    # stages had run in order: a failed catalog only once the player is loaded. The storage is only held while the
+    # player is loaded, not while the campaigns are fetched.
+    now = clock()
+    load_fields = None if fields is None else fields | __matching_fields()
+    try:
+        async with asyncio.TaskGroup() as stages:
+            player_stage = stages.create_task(
+                __load_player(player_id, repository, load_fields)
+            )
+            campaigns_stage = stages.create_task(
+                __fetch_running_campaigns_after(player_stage, now)
+            )
+    except ExceptionGroup as stage_errors:
+        # The first stage to fail, the other one was cancelled
+        raise stage_errors.exceptions[0]
+    player, running_campaigns = player_stage.result(), campaigns_stage.result()
+
+    # The catalog changed while the player was loaded, and its campaigns read fields that were not loaded
+    if load_fields is not None:
+        missing_fields = player_fields(running_campaigns) - load_fields
+        if missing_fields:
+            load_fields |= missing_fields
+            player = await __load_player(player_id, repository, load_fields)
 
+    # Save the new player info. The save only applies if the player was not modified since it was read (same
+    # version). Otherwise, another writer won: reload the player and match again.
     try:
-        active_campaigns: list[ActiveCampaign] = __mock_campaign_api()
-    # Here, we would except the specific exception that can be raised from the service. Since we do not raise a specific
-    # exception, we use "Exception"
-    except Exception as e:
-        logger.error(f'Error in getting active campaigns: {e}')
+        for attempt in range(1, MAX_UPDATE_ATTEMPTS + 1):
+            features = PlayerFeatures.from_player(player)
+            matched_players.add(features)
+            # Other requests bind their own running campaigns while this one waits: bind them again, with no await
+            # until the result is cached
+            match_cache.bind(running_campaigns)
+            player_campaigns = match_cache.match(
+                features,
+                None,
+                lambda: __select_active_campaigns(
+                    features, running_campaigns, to_timestamp(now)
+                ),
+            )
+            if player_campaigns == player.active_campaigns:
+                break
+
+            if await repository.save_active_campaigns(player, player_campaigns):
+                break
+
+            logger.debug(f'Player {player_id} was updated concurrently')
+            if attempt < MAX_UPDATE_ATTEMPTS:
+                player = await __load_player(player_id, repository, load_fields)
+        else:
+            logger.error(
+                f'Could not update player {player_id}: too many concurrent updates'
+            )
+            raise HTTPException(
+                status_code=409,
+                detail=f'Player {player_id} was updated concurrently, please retry.',
+            )
+    except RepositoryException as e:
+        logger.error(f'Error in saving the active campaigns: {e}')
         raise HTTPException(
             status_code=500,
             detail='Something went wrong while getting the client config.',
         )
 
-    # Refresh the database to recuperate the player
-    await session.refresh(player)
+    # Compared once per request, on the player as it was matched last
+    shadow_runner.submit(player_id, features, running_campaigns, to_timestamp(now))
+    return player, load_fields
 
-    player.active_campaigns = __remove_inactive_campaigns(
-        player.active_campaigns, active_campaigns
-    )
-
-    for active_campaign in active_campaigns:
-        # If the match is already present in the list and still a match, it stays there, if it was present and is no
-        # longer a match, it is removed. If it's valid and was not previously in the list, it is added.
-        is_a_match = __validate_player_and_campaign_match(player, active_campaign)
-        campaign_name = active_campaign.name
-
-        if is_a_match and campaign_name not in player.active_campaigns:
-            player.active_campaigns.append(campaign_name)
-        elif not is_a_match and campaign_name in player.active_campaigns:
-            player.active_campaigns.remove(campaign_name)
 
-    # Update the database with the new player info
+async def __load_player(
+    player_id: str,
+    repository: PlayerRepository,
+    fields: Optional[AbstractSet[str]] = None,
+) -> PlayerProfile:
+    """
+    Load the player from the repository, with the given fields only, or all of them if fields is None.
+    :raises HTTPException: If the player is not found or cannot be loaded
+    """
     try:
-        session.add(player)
-        await session.commit()
-        await session.refresh(player)
-    except SQLAlchemyError as e:
-        logger.error(f'Error in committing active campaign to database: {e}')
+        player = await repository.load_player(player_id, fields)
+    except RepositoryException as e:
+        logger.error(f'Error in loading the player: {e}')
         raise HTTPException(
             status_code=500,
             detail='Something went wrong while getting the client config.',
         )
-
+    if player is None:
+        logger.debug(f'No player found with id {player_id}')
+        raise HTTPException(
+            status_code=404, detail=f'No player found with id {player_id}'
+        )
     return player
 
 
-def __remove_inactive_campaigns(
-    player_campaign_list: list[str], active_campaigns: list[ActiveCampaign]
-) -> list[str]:
+def __matching_fields() -> frozenset[str]:
     """
-    This does a first pass to remove the campaigns that are not active anymore. This happens if the player has a
-    campaign in the database that is not returned by the external service.
+    Fields of the player profile needed to match the player against the latest catalog, or against any campaign before
+    the first catalog. The running campaigns are not known yet when the player is loaded.
     """
-    logger.debug(f'Removing inactive campaigns from {player_campaign_list}')
-    active_campaign_names = {campaign.name for campaign in active_campaigns}
+    index = catalog_sync.index
+    if index is None and catalog_snapshots is not None:
+        index = catalog_snapshots.current()
+    if index is None:
+        index = catalog_indexes.index
+    return rule_registry.fields() if index is None else index.player_fields
 
-    return [
-        campaign
-        for campaign in player_campaign_list
-        if campaign in active_campaign_names
-    ]
 
-
-def __validate_player_and_campaign_match(
-    player: PlayerProfileResponse, campaign: ActiveCampaign
-) -> bool:
+async def __fetch_running_campaigns(now: datetime) -> list[CompiledCampaign]:
     """
-    Match the player and campaign. The level of the player must be within the level range of the campaign, must have the
-    right country, the items required by the campaign, and must not have the items that are not allowed by the
-    campaign.
+    Get the campaigns and keep the enabled campaigns running at now, by descending priority. The others are removed from
+    the player.
+    :raises HTTPException: If the campaigns cannot be fetched, or the catalog is not synced or its snapshot not written
+    yet
     """
-    logger.debug(f'Validating player {player} with campaign {campaign}')
-    player_items = __parse_items(player.inventory)
+    # The catalog is synced in the background when the campaign service is configured
+    if catalog_sync.index is not None:
+        return catalog_sync.index.compiled_running_at(now)
+    if catalog_sync.enabled:
+        logger.error('No synced campaign catalog to match against')
+        raise HTTPException(
+            status_code=503, detail='The campaign catalog is not available yet.'
+        )
+
+    # Without a campaign service, the snapshot shared by the workers is read in place when one is configured
+    if catalog_snapshots is not None:
+        snapshot = catalog_snapshots.current()
+        if snapshot is None:
+            logger.error('No campaign catalog snapshot to match against')
+            raise HTTPException(
+                status_code=503, detail='The campaign catalog is not available yet.'
+            )
+        return snapshot.running_at(now)
 
-    return (
-        (
-            (campaign.matchers.level.min <= player.level <= campaign.matchers.level.max)
-            and (set(player_items).intersection(campaign.matchers.has.items))
+    # The campaign service would be called here. The fetch is shared by the requests of the player, out of their
+    # deadlines: each request stops waiting for it at its own.
+    try:
+        active_campaigns: list[ActiveCampaign] = __mock_campaign_api()
+    # Here, we would except the specific exception that can be raised from the service. Since we do not raise a specific
+    # exception, we use "Exception"
+    except Exception as e:
+        logger.error(f'Error in getting active campaigns: {e}')
+        raise HTTPException(
+            status_code=500,
+            detail='Something went wrong while getting the client config.',
         )
-        and (player.country in campaign.matchers.has.country)
-    ) and (not set(player_items).intersection(campaign.matchers.does_not_have.items))
+    return catalog_indexes.get(active_campaigns).compiled_running_at(now)
 
 
-def __parse_items(inventory: Inventory) -> list[str]:
+async def __fetch_running_campaigns_after(
+    player_stage: asyncio.Task, now: datetime
+) -> list[CompiledCampaign]:
     """
-    Parse the items from the inventory that are not None into a list of strings. Only the name (first element of the
-    tuple) is needed.
+    Fetch the running campaigns at now. If they cannot be fetched, wait for the player to be loaded before raising, so
+    that a missing player is reported first.
     """
-    logger.debug(f'Parsing items from inventory: {inventory}')
-    return [key for key, value in inventory.model_dump().items() if value is not None]
+    try:
+        return await __fetch_running_campaigns(now)
+    except Exception:
+        await asyncio.wait([player_stage])
+        raise
 
 
-def __mock_campaign_api() -> list[ActiveCampaign]:
+def __select_active_campaigns(
+    player: PlayerFeatures,
+    running_campaigns: list[CompiledCampaign],
+    now: float,
+) -> list[str]:
     """
-    This mock the external api call to get all the active campaigns
+    Compute the new list of active campaigns of the player, by descending priority. A game with a limit in
+    GAME_CAMPAIGN_LIMITS gets at most that many campaigns, its other campaigns are skipped without being evaluated.
     """
-    campaign_level = Level(min=1, max=3)
-    has_content = MatcherContent(country=['US', 'RO', 'CA'], items=['item_1'])
-    does_not_have_content = MatcherContent(items=['item_4'])
-    campaign_matchers = Matcher(
-        level=campaign_level, has=has_content, does_not_have=does_not_have_content
-    )
-    campaign = ActiveCampaign(
-        game='mygame',
-        name='mycampaign',
-        priority=10.5,
-        matchers=campaign_matchers,
-        start_date=datetime(2022, 1, 25),
-        end_date=datetime(2022, 2, 25),
-        enabled=True,
-        last_updated=datetime(2021, 7, 13),
-    )
-    return [campaign]
+    player_campaigns = []
+    campaigns_per_game = Counter()
+    for campaign in running_campaigns:
+        game_limit = GAME_CAMPAIGN_LIMITS.get(campaign.game)
+        if game_limit is not None and campaigns_per_game[campaign.game] >= game_limit:
+            continue
+
+        if campaign.name in player_campaigns:
+            continue
+
+        if campaign.matches(player, now):
+            player_campaigns.append(campaign.name)
+            campaigns_per_game[campaign.game] += 1
+
+    return player_campaigns
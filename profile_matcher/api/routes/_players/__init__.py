@@ -0,0 +1,3 @@
+from ._ingest import router
+
+__all__ = ['router']
@@ -0,0 +1,71 @@
+import logging
+from typing import AsyncContextManager, Callable
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from profile_matcher.database import get_db_connection_factory, sharded_session_manager
+from profile_matcher.ingestion import (
+    IngestionException,
+    IngestionFormat,
+    IngestionReport,
+    PlayerProfileIngestor,
+)
+from .._admin import require_admin
+from ...models import ErrorResponse
+
+router = APIRouter()
+
+logger = logging.getLogger('uvicorn')
+
+# Content types accepted by the ingestion
+CONTENT_TYPE_FORMATS = {
+    'application/x-ndjson': IngestionFormat.NDJSON,
+    'application/jsonlines': IngestionFormat.NDJSON,
+    'text/csv': IngestionFormat.CSV,
+}
+
+
+@router.post(
+    '/players/ingest',
+    response_model=IngestionReport,
+    dependencies=[Depends(require_admin)],
+    responses={
+        403: {'model': ErrorResponse, 'description': 'Admin token required'},
+        415: {'model': ErrorResponse, 'description': 'Unsupported content type'},
+        500: {'model': ErrorResponse, 'description': 'Internal server error'},
+    },
+)
+async def ingest_players(
+    request: Request,
+    batch_size: int = Query(
+        default=10_000, ge=1, le=100_000, description='Rows loaded per transaction'
+    ),
+    connect: Callable[[], AsyncContextManager[AsyncConnection]] = Depends(
+        get_db_connection_factory
+    ),
+):
+    """
+    Create or update the players (with their inventory and devices) sent in the body, as NDJSON (one player per line)
+    or CSV. The body is loaded while it is received, batch by batch, on the shard of every player when they are sharded.
+    Admin only (X-Admin-Token).
+    """
+    content_type = request.headers.get('content-type', '').split(';')[0].strip()
+    ingestion_format = CONTENT_TYPE_FORMATS.get(content_type)
+    if ingestion_format is None:
+        raise HTTPException(
+            status_code=415,
+            detail=f'Unsupported content type {content_type}, expected one of {", ".join(CONTENT_TYPE_FORMATS)}',
+        )
+
+    ingestor = PlayerProfileIngestor(
+        connect=connect, batch_size=batch_size, shards=sharded_session_manager
+    )
+    try:
+        return await ingestor.ingest(request.stream(), ingestion_format)
+    except IngestionException as e:
+        logger.error(f'Error in ingesting players: {e}')
+        raise HTTPException(
+            status_code=500,
+            detail='Something went wrong while ingesting the players.',
+        )
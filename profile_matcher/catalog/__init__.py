@@ -0,0 +1,73 @@
+from ._catalog_index import CatalogIndex, CatalogIndexCache
+from ._clock import Clock, get_clock, utc_now
+from ._compiled_catalog import (
+    CompiledCampaign,
+    CompiledCatalog,
+    ITEM_NAMES,
+    compile_campaign,
+    compile_catalog,
+    to_timestamp,
+    inventory_to_mask,
+    items_to_mask,
+    mask_to_items,
+    player_fields,
+)
+from ._decoding import JsonArrayStream, compile_catalog_stream
+from ._match_cache import MatchCache, feature_fingerprint
+from ._exception import (
+    CatalogDecodingException,
+    CatalogSnapshotException,
+    CatalogSyncException,
+)
+from ._player_features import PlayerFeatures, PlayerFeaturesSample
+from ._rules import (
+    CORE_RULES,
+    CampaignRule,
+    Predicate,
+    Rule,
+    RuleRegistry,
+    rule_registry,
+)
+from ._sync import CampaignSource, CatalogDelta, CatalogSync
+from ._snapshot import CatalogSnapshot, CatalogSnapshotReader, write_catalog_snapshot
+from ._timeline import CampaignTimeline
+
+__all__ = [
+    'CatalogIndex',
+    'CatalogIndexCache',
+    'Clock',
+    'get_clock',
+    'utc_now',
+    'CompiledCampaign',
+    'CompiledCatalog',
+    'ITEM_NAMES',
+    'compile_campaign',
+    'compile_catalog',
+    'to_timestamp',
+    'inventory_to_mask',
+    'items_to_mask',
+    'mask_to_items',
+    'player_fields',
+    'JsonArrayStream',
+    'compile_catalog_stream',
+    'MatchCache',
+    'feature_fingerprint',
+    'CatalogDecodingException',
+    'CatalogSnapshotException',
+    'CatalogSyncException',
+    'CampaignSource',
+    'CatalogDelta',
+    'CatalogSync',
+    'PlayerFeatures',
+    'PlayerFeaturesSample',
+    'CORE_RULES',
+    'CampaignRule',
+    'Predicate',
+    'Rule',
+    'RuleRegistry',
+    'rule_registry',
+    'CatalogSnapshot',
+    'CatalogSnapshotReader',
+    'write_catalog_snapshot',
+    'CampaignTimeline',
+]
@@ -0,0 +1,33 @@
+import argparse
+import pathlib
+
+from profile_matcher.api.models import ActiveCampaign
+from profile_matcher.catalog import compile_catalog_stream, write_catalog_snapshot
+
+# Loader for the catalog snapshot shared by the workers. It is meant to be run by a single process (a cron job or a
+# sidecar) every time the catalog changes, e.g.:
+#   python -m profile_matcher.catalog campaigns.json /var/run/profile_matcher/catalog.snapshot
+# The catalog is read and compiled campaign by campaign, so that a large catalog is never held in memory as a whole.
+
+CHUNK_SIZE = 1 << 16
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compile a campaign catalog (JSON list of campaigns) into a snapshot'
+    )
+    parser.add_argument('catalog', type=pathlib.Path, help='JSON catalog to compile')
+    parser.add_argument('snapshot', type=pathlib.Path, help='Snapshot file to write')
+    arguments = parser.parse_args()
+
+    with arguments.catalog.open('rb') as file:
+        catalog = compile_catalog_stream(
+            iter(lambda: file.read(CHUNK_SIZE), b''),
+            ActiveCampaign.model_validate_json,
+        )
+    write_catalog_snapshot(catalog, arguments.snapshot)
+    print(f'Wrote {len(catalog)} campaigns ({catalog.version}) to {arguments.snapshot}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+from datetime import datetime
+from typing import Iterable, Optional, Sequence, TYPE_CHECKING
+
+from ._compiled_catalog import (
+    CompiledCampaign,
+    CompiledCatalog,
+    campaign_fingerprint,
+    catalog_version,
+    compile_campaign,
+    compile_catalog,
+    format_version,
+    player_fields,
+)
+from ._player_features import PlayerFeatures, PlayerFeaturesSample
+from ._timeline import CampaignTimeline
+
+if TYPE_CHECKING:
+    from profile_matcher.api.models import ActiveCampaign
+
+
+class CatalogIndex:
+    """
+    One version of the campaign catalog, compiled, with the structures used to match players against it. An index built
+    from a compiled catalog only (a snapshot) has no campaigns, only the compiled ones.
+    """
+
+    def __init__(
+        self,
+        campaigns: list['ActiveCampaign'],
+        version: Optional[str] = None,
+        sample: Sequence[PlayerFeatures] = (),
+        compiled: Optional[CompiledCatalog] = None,
+    ):
+        self.campaigns = campaigns
+        self.compiled = compiled or compile_catalog(campaigns, version, sample)
+        self.version = self.compiled.version
+        self.timeline = CampaignTimeline(self.compiled)
+        # The fields of the player profile needed to match a player against any campaign of the catalog
+        self.player_fields = player_fields(self.compiled)
+
+    def apply(
+        self,
+        changed: Iterable['ActiveCampaign'],
+        removed: Iterable[str],
+        sample: Sequence[PlayerFeatures] = (),
+    ) -> 'CatalogIndex':
+        """
+        Return the index of the catalog with the changed campaigns added or replaced (campaigns are identified by name)
+        and the removed campaigns dropped. Only the campaigns that actually changed are compiled, the others are reused
+        as they are; the catalog keeps its order, new campaigns come last. The version is the one of the same campaigns
+        compiled whole (see catalog_version), but only the fingerprints of the changed campaigns are computed.
+        """
+        changed = {campaign.name: campaign for campaign in changed}
+        removed = set(removed) - changed.keys()
+        fingerprint_sum = int(self.version, 16)
+
+        campaigns = []
+        compiled_campaigns = []
+        for campaign, compiled in zip(self.campaigns, self.compiled.campaigns):
+            if campaign.name in removed:
+                fingerprint_sum -= campaign_fingerprint(campaign)
+                continue
+            update = changed.pop(campaign.name, None)
+            if update is not None and update != campaign:
+                fingerprint_sum -= campaign_fingerprint(campaign)
+                fingerprint_sum += campaign_fingerprint(update)
+                campaign, compiled = update, compile_campaign(update, sample)
+            campaigns.append(campaign)
+            compiled_campaigns.append(compiled)
+        for campaign in changed.values():
+            fingerprint_sum += campaign_fingerprint(campaign)
+            campaigns.append(campaign)
+            compiled_campaigns.append(compile_campaign(campaign, sample))
+
+        if len(campaigns) == len(self.campaigns) and all(
+            new is old for new, old in zip(compiled_campaigns, self.compiled.campaigns)
+        ):
+            return self
+        return CatalogIndex(
+            campaigns,
+            compiled=CompiledCatalog(
+                version=format_version(fingerprint_sum),
+                campaigns=tuple(compiled_campaigns),
+            ),
+        )
+
+    def running_at(self, now: datetime) -> list['ActiveCampaign']:
+        """
+        Return the enabled campaigns running at now, by descending priority.
+        """
+        return [self.campaigns[index] for index in self.timeline.running_at(now)]
+
+    def compiled_running_at(self, now: datetime) -> list[CompiledCampaign]:
+        """
+        Return the compiled enabled campaigns running at now, by descending priority.
+        """
+        campaigns = self.compiled.campaigns
+        return [campaigns[index] for index in self.timeline.running_at(now)]
+
+
+class CatalogIndexCache:
+    """
+    Keep the index of the latest catalog version, so that it is only built when the catalog changes. The rules of a new
+    version are ordered on the players of the sample, if given. The catalog is only hashed when its number of campaigns
+    or its latest update changes: the campaign service updates last_updated on every change of a campaign.
+    """
+
+    def __init__(self, sample: Optional[PlayerFeaturesSample] = None):
+        self.__index: Optional[CatalogIndex] = None
+        self.__key: Optional[tuple[int, Optional[datetime]]] = None
+        self.__sample = sample
+
+    @property
+    def index(self) -> Optional[CatalogIndex]:
+        """
+        The index of the latest catalog version, None before the first catalog.
+        """
+        return self.__index
+
+    def get(self, campaigns: list['ActiveCampaign']) -> CatalogIndex:
+        key = (
+            len(campaigns),
+            max((campaign.last_updated for campaign in campaigns), default=None),
+        )
+        index = self.__index
+        if index is not None and key == self.__key:
+            return index
+
+        version = catalog_version(campaigns)
+        if index is None or index.version != version:
+            sample = self.__sample.players() if self.__sample is not None else ()
+            index = self.__index = CatalogIndex(campaigns, version, sample)
+        self.__key = key
+        return index
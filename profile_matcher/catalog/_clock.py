@@ -0,0 +1,15 @@
+from datetime import datetime, timezone
+from typing import Callable
+
+Clock = Callable[[], datetime]
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def get_clock() -> Clock:
+    """
+    Dependency returning the clock used to know which campaigns are running. Tests override it to freeze time.
+    """
+    return utc_now
@@ -0,0 +1,208 @@
+import dataclasses
+import hashlib
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Sequence, TYPE_CHECKING
+
+from profile_matcher.database.models import Inventory
+from ._rules import CampaignRule, Predicate, rule_registry
+
+# The api package imports the routes, which use the catalog: only import the models for type checking
+if TYPE_CHECKING:
+    from profile_matcher.api.models import ActiveCampaign
+    from ._player_features import PlayerFeatures
+
+# Every column of the inventory table can be referenced by a campaign matcher. The position of a column in this tuple
+# is its bit in an item mask, so the order must never change once snapshots have been written.
+ITEM_NAMES: tuple[str, ...] = tuple(Inventory.model_fields)
+ITEM_BITS: dict[str, int] = {name: 1 << index for index, name in enumerate(ITEM_NAMES)}
+
+
+def items_to_mask(items: Optional[Iterable[str]]) -> int:
+    """
+    Encode a list of item names into a bitmask. Unknown items are ignored, since no player can ever hold them.
+    """
+    mask = 0
+    for item in items or ():
+        mask |= ITEM_BITS.get(item, 0)
+    return mask
+
+
+def mask_to_items(mask: int) -> list[str]:
+    """
+    Decode a bitmask into the list of item names.
+    """
+    return [name for name in ITEM_NAMES if mask & ITEM_BITS[name]]
+
+
+def inventory_to_mask(inventory: Optional[Inventory]) -> int:
+    """
+    Encode the items held by the player (the inventory columns that are not None) into a bitmask.
+    """
+    if inventory is None:
+        return 0
+    return items_to_mask(
+        name for name in ITEM_NAMES if getattr(inventory, name, None) is not None
+    )
+
+
+def to_timestamp(value: datetime) -> float:
+    """
+    Convert a datetime to a POSIX timestamp. Naive datetimes (as sent by the campaign API) are considered to be UTC.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledCampaign:
+    """
+    Flat representation of an ActiveCampaign, with the matchers precomputed for cheap evaluation.
+    """
+
+    name: str
+    game: str
+    priority: float
+    level_min: int
+    level_max: int
+    countries: frozenset[str]
+    has_items: int
+    does_not_have_items: int
+    start_ts: float
+    end_ts: float
+    last_updated_ts: float
+    enabled: bool
+    # The rules of the registry used by the campaign, besides the level, countries and items above
+    rules: tuple[CampaignRule, ...] = ()
+    # Every rule of the campaign compiled in a single predicate, built from the rules in their default order if not given
+    predicate: Optional[Predicate] = field(default=None, compare=False, repr=False)
+    # The fields of the player profile read by the rules of the campaign
+    player_fields: frozenset[str] = field(
+        default=frozenset(), init=False, compare=False, repr=False
+    )
+
+    def __post_init__(self):
+        if self.predicate is None:
+            object.__setattr__(
+                self, 'predicate', rule_registry.compile(self.all_rules())
+            )
+        object.__setattr__(
+            self, 'player_fields', rule_registry.fields(self.all_rules())
+        )
+
+    def all_rules(self) -> tuple[CampaignRule, ...]:
+        """
+        Return the rules of the campaign: level within range, allowed country, at least one of the required items,
+        none of the excluded items, then the other rules.
+        """
+        return (
+            ('level', (self.level_min, self.level_max)),
+            ('country', tuple(sorted(self.countries))),
+            ('has_items', (self.has_items,)),
+            ('does_not_have_items', (self.does_not_have_items,)),
+            *self.rules,
+        )
+
+    def matches(self, player: 'PlayerFeatures', now: Optional[float] = None) -> bool:
+        """
+        Match the player and the campaign at now (a POSIX timestamp, the current time by default).
+        """
+        return self.predicate(player, time.time() if now is None else now)
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledCatalog:
+    """
+    The whole campaign catalog, compiled once per catalog version.
+    """
+
+    version: str
+    campaigns: tuple[CompiledCampaign, ...]
+
+    def __len__(self) -> int:
+        return len(self.campaigns)
+
+    def __iter__(self):
+        return iter(self.campaigns)
+
+
+def player_fields(campaigns: Iterable[CompiledCampaign]) -> frozenset[str]:
+    """
+    Return the fields of the player profile needed to match a player against the campaigns.
+    """
+    return frozenset().union(*(campaign.player_fields for campaign in campaigns))
+
+
+def compile_campaign(
+    campaign: 'ActiveCampaign', sample: Sequence['PlayerFeatures'] = ()
+) -> CompiledCampaign:
+    """
+    Compile a single campaign. Missing country and item lists are considered empty, the other missing matchers do not
+    restrict the players. The rules are ordered by their cost and selectivity measured on the sample players.
+    """
+    matchers = campaign.matchers
+    compiled = CompiledCampaign(
+        name=campaign.name,
+        game=campaign.game,
+        priority=campaign.priority,
+        level_min=matchers.level.min,
+        level_max=matchers.level.max,
+        countries=frozenset(matchers.has.country or ()),
+        has_items=items_to_mask(matchers.has.items),
+        does_not_have_items=items_to_mask(matchers.does_not_have.items),
+        start_ts=to_timestamp(campaign.start_date),
+        end_ts=to_timestamp(campaign.end_date),
+        last_updated_ts=to_timestamp(campaign.last_updated),
+        enabled=campaign.enabled,
+        rules=rule_registry.extract(matchers),
+    )
+    if not sample:
+        return compiled
+    return dataclasses.replace(
+        compiled, predicate=rule_registry.compile(compiled.all_rules(), sample)
+    )
+
+
+# A catalog version is the sum of the fingerprints of its campaigns, modulo 2 ** VERSION_BITS, in hexadecimal
+VERSION_BITS = 128
+
+
+def campaign_fingerprint(campaign: 'ActiveCampaign') -> int:
+    """
+    Fingerprint of the content of a campaign, as summed in the catalog version.
+    """
+    digest = hashlib.blake2b(
+        campaign.model_dump_json().encode(), digest_size=VERSION_BITS // 8
+    )
+    return int.from_bytes(digest.digest())
+
+
+def format_version(fingerprint_sum: int) -> str:
+    """
+    Format the sum of the fingerprints of the campaigns of a catalog as its version.
+    """
+    return f'{fingerprint_sum % (1 << VERSION_BITS):0{VERSION_BITS // 4}x}'
+
+
+def catalog_version(campaigns: Iterable['ActiveCampaign']) -> str:
+    """
+    Fingerprint of the catalog content. Two catalogs with the same campaigns, in any order, have the same version: a
+    catalog changed campaign by campaign gets the version of the same catalog read whole.
+    """
+    return format_version(sum(campaign_fingerprint(campaign) for campaign in campaigns))
+
+
+def compile_catalog(
+    campaigns: list['ActiveCampaign'],
+    version: Optional[str] = None,
+    sample: Sequence['PlayerFeatures'] = (),
+) -> CompiledCatalog:
+    """
+    Compile the catalog returned by the campaign API, with the rules of every campaign ordered on the sample players.
+    """
+    return CompiledCatalog(
+        version=version or catalog_version(campaigns),
+        campaigns=tuple(compile_campaign(campaign, sample) for campaign in campaigns),
+    )
@@ -0,0 +1,149 @@
+import re
+from typing import Callable, Iterable, Sequence, TYPE_CHECKING
+
+from pydantic import ValidationError
+
+from ._compiled_catalog import (
+    CompiledCatalog,
+    campaign_fingerprint,
+    compile_campaign,
+    format_version,
+)
+from ._exception import CatalogDecodingException
+
+if TYPE_CHECKING:
+    from profile_matcher.api.models import ActiveCampaign
+    from ._player_features import PlayerFeatures
+
+# Anything but brackets, complete strings included (whatever they hold), then the next bracket, or the opening quote of
+# a string not received entirely yet
+_TOKEN = re.compile(rb'(?:[^"{}\[\]]++|"(?:[^"\\]++|\\.)*+")*+([{}\[\]"])', re.DOTALL)
+_WHITESPACE = b' \t\r\n'
+# Between the elements of the array
+_SEPARATORS = _WHITESPACE + b','
+
+
+class JsonArrayStream:
+    """
+    Split a JSON array of objects, received chunk by chunk, into the raw JSON of its elements as soon as each one is
+    complete. The elements are not decoded: only the brackets and the strings are scanned, and only the element being
+    received is kept in memory.
+    """
+
+    def __init__(self):
+        self.__buffer = bytearray()
+        # Position where the scan resumes, depth of the brackets there, start of the element being received
+        self.__position = 0
+        self.__depth = 0
+        self.__element_start = -1
+        self.finished = False
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """
+        Add the next chunk of the array.
+        :return: The raw JSON of the elements completed by the chunk
+        :raises CatalogDecodingException: If the payload is not an array of objects
+        """
+        if self.finished:
+            if chunk.strip(_WHITESPACE):
+                raise CatalogDecodingException('Unexpected data after the array')
+            return []
+        buffer = self.__buffer
+        buffer += chunk
+        if self.__depth == 0:
+            start = len(buffer) - len(buffer.lstrip(_WHITESPACE))
+            if start == len(buffer):
+                buffer.clear()
+                return []
+            if buffer[start : start + 1] != b'[':
+                raise CatalogDecodingException('Expected an array of campaigns')
+            self.__depth = 1
+            self.__position = start + 1
+
+        elements = []
+        depth = self.__depth
+        position = self.__position
+        while True:
+            # Anchored at the position scanned up to, never inside a string
+            token = _TOKEN.match(buffer, position)
+            if token is None:
+                if depth == 1 and buffer[position:].strip(_SEPARATORS):
+                    raise CatalogDecodingException('Expected an array of campaigns')
+                position = len(buffer)
+                break
+            bracket = token.group(1)
+            if bracket == b'"':
+                # Wait for the end of the string
+                position = token.start(1)
+                break
+            if depth == 1 and buffer[position : token.start(1)].strip(_SEPARATORS):
+                raise CatalogDecodingException('Expected an array of campaigns')
+            position = token.end()
+            if bracket == b'{':
+                if depth == 1:
+                    self.__element_start = token.start(1)
+                depth += 1
+            elif bracket == b'[':
+                if depth == 1:
+                    raise CatalogDecodingException('Expected an array of campaigns')
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1:
+                    elements.append(bytes(buffer[self.__element_start : position]))
+                    self.__element_start = -1
+                elif depth == 0:
+                    self.finished = True
+                    if buffer[position:].strip(_WHITESPACE):
+                        raise CatalogDecodingException(
+                            'Unexpected data after the array'
+                        )
+                    break
+
+        # Drop what was scanned, but the element being received
+        keep = self.__element_start if self.__element_start >= 0 else position
+        del buffer[:keep]
+        self.__position = position - keep
+        if self.__element_start >= 0:
+            self.__element_start = 0
+        self.__depth = depth
+        return elements
+
+    def close(self):
+        """
+        :raises CatalogDecodingException: If the array is not complete
+        """
+        if not self.finished:
+            raise CatalogDecodingException('Incomplete array of campaigns')
+
+
+def compile_catalog_stream(
+    chunks: Iterable[bytes],
+    validate: Callable[[bytes], 'ActiveCampaign'],
+    sample: Sequence['PlayerFeatures'] = (),
+) -> CompiledCatalog:
+    """
+    Compile a catalog received as a JSON array of campaigns, chunk by chunk: every campaign is validated from its raw
+    JSON (validate, e.g. ActiveCampaign.model_validate_json) and compiled as soon as it is received, then dropped. Only
+    the compiled catalog is kept, never the whole payload nor the validated campaigns. The version is the version
+    compile_catalog gives to the same campaigns.
+    :raises CatalogDecodingException: If the payload is not an array of valid campaigns
+    """
+    stream = JsonArrayStream()
+    fingerprint_sum = 0
+    campaigns = []
+    for chunk in chunks:
+        for element in stream.feed(chunk):
+            try:
+                campaign = validate(element)
+            except ValidationError as e:
+                raise CatalogDecodingException(
+                    f'Invalid campaign {len(campaigns)}: {e}'
+                ) from e
+            # As catalog_version
+            fingerprint_sum += campaign_fingerprint(campaign)
+            campaigns.append(compile_campaign(campaign, sample))
+    stream.close()
+    return CompiledCatalog(
+        version=format_version(fingerprint_sum), campaigns=tuple(campaigns)
+    )
@@ -0,0 +1,10 @@
+class CatalogSnapshotException(Exception):
+    pass
+
+
+class CatalogSyncException(Exception):
+    pass
+
+
+class CatalogDecodingException(Exception):
+    pass
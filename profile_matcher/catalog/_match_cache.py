@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from functools import lru_cache
+from operator import attrgetter
+from typing import Callable, Hashable, Iterable, Optional
+
+from ._compiled_catalog import CompiledCampaign, player_fields
+from ._player_features import PlayerFeatures
+
+# The feature built from each field of the player profile. The last purchase is matched against the current time: the
+# result of a player reading it cannot be reused later.
+FIELD_FEATURES: dict[str, Optional[str]] = {
+    'level': 'level',
+    'country': 'country',
+    'inventory': 'item_mask',
+    'language': 'language',
+    'gender': 'gender',
+    'total_spent': 'total_spent',
+    'devices': 'device_models',
+    'last_purchase': None,
+}
+
+Fingerprint = Callable[[PlayerFeatures], Hashable]
+
+
+@lru_cache(maxsize=64)
+def feature_fingerprint(fields: frozenset[str]) -> Optional[Fingerprint]:
+    """
+    Return the function giving the fingerprint of a player for the fields read by some campaigns: the features built
+    from these fields only, so that the players with the same fingerprint match the same campaigns. None if a field is
+    unknown or depends on the current time.
+    """
+    features = []
+    for field in sorted(fields):
+        feature = FIELD_FEATURES.get(field)
+        if feature is None:
+            return None
+        features.append(feature)
+    if not features:
+        return lambda player: ()
+    if len(features) == 1:
+        get = attrgetter(features[0])
+        return lambda player: (get(player),)
+    return attrgetter(*features)
+
+
+class MatchCache:
+    """
+    Bounded LRU cache of the campaigns matched by a player, keyed by the fingerprint of its features. Most players share
+    a few (level, country, items) combinations: their result is computed once. The results are only valid for the
+    running campaigns they were computed on (the scope, compiled once per catalog version): binding a new scope, on a
+    new catalog version or when a campaign starts or ends, drops them. The keys hold the scope they were made in, so a
+    result computed before another scope was bound is not stored: bind the campaigns of a result right before its key.
+    """
+
+    def __init__(self, size: int = 65536):
+        self.__results: OrderedDict[Hashable, tuple[str, ...]] = OrderedDict()
+        self.__size = size
+        self.__scope: Optional[tuple[CompiledCampaign, ...]] = None
+        # Incremented for every new scope, part of the keys
+        self.__generation = 0
+        self.__fingerprint: Optional[Fingerprint] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.invalidations = 0
+        self.stale_results = 0
+
+    def __len__(self) -> int:
+        return len(self.__results)
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.__results),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'bypasses': self.bypasses,
+            'invalidations': self.invalidations,
+            'stale_results': self.stale_results,
+        }
+
+    def bind(self, campaigns: Iterable[CompiledCampaign]):
+        """
+        Use the cache for the given running campaigns. The results of other campaigns are dropped.
+        """
+        # The compiled campaigns of a catalog version are compared by identity first: this is cheap on every request
+        scope = tuple(campaigns)
+        if scope == self.__scope:
+            return
+        if self.__scope is not None:
+            self.invalidations += 1
+        self.__results.clear()
+        self.__scope = scope
+        self.__generation += 1
+        self.__fingerprint = feature_fingerprint(player_fields(scope))
+
+    def key(
+        self, player: PlayerFeatures, variant: Hashable = None
+    ) -> Optional[Hashable]:
+        """
+        Return the key of the result of the player for the campaigns bound, variant holding the other inputs of the
+        selection (e.g. the limit of campaigns). None if the result cannot be cached: the cache is disabled, or the
+        campaigns depend on the current time.
+        """
+        if self.__fingerprint is None or not self.__size:
+            self.bypasses += 1
+            return None
+        return self.key_of(self.__fingerprint(player), variant)
+
+    def key_of(self, fingerprint: Hashable, variant: Hashable = None) -> Hashable:
+        """
+        Return the key of the result of a player with the given fingerprint, for the campaigns bound.
+        """
+        return self.__generation, variant, fingerprint
+
+    def get(self, key: Hashable) -> Optional[tuple[str, ...]]:
+        """
+        Return the campaigns matched for the key, None if they are not in the cache.
+        """
+        names = self.__results.get(key)
+        if names is None:
+            self.misses += 1
+            return None
+        self.__results.move_to_end(key)
+        self.hits += 1
+        return names
+
+    def put(self, key: Hashable, names: Iterable[str]):
+        """
+        Store the campaigns matched for the key, evicting the least recently used result when full. A result of
+        campaigns that are no longer bound is dropped.
+        """
+        if not self.__size:
+            return
+        if key[0] != self.__generation:
+            self.stale_results += 1
+            return
+        self.__results[key] = tuple(names)
+        self.__results.move_to_end(key)
+        if len(self.__results) > self.__size:
+            self.__results.popitem(last=False)
+
+    def match(
+        self,
+        player: PlayerFeatures,
+        variant: Hashable,
+        compute: Callable[[], list[str]],
+    ) -> list[str]:
+        """
+        Return the campaigns matched by the player, computed only if no player with the same fingerprint was matched.
+        """
+        key = self.key(player, variant)
+        if key is None:
+            return compute()
+        names = self.get(key)
+        if names is None:
+            names = compute()
+            self.put(key, names)
+        return list(names)
@@ -0,0 +1,98 @@
+import sys
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, Mapping, Optional
+
+from profile_matcher.database.models import PlayerProfile
+from ._compiled_catalog import (
+    ITEM_NAMES,
+    inventory_to_mask,
+    items_to_mask,
+    to_timestamp,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class PlayerFeatures:
+    """
+    What the matchers need to know about a player, built once per player instead of reading the model (and dumping
+    its inventory) for every campaign evaluated. The country, language, gender and device models are interned: the
+    players sharing a value share one string, compared by identity first.
+    """
+
+    level: int
+    country: str
+    item_mask: int
+    active_campaigns: frozenset[str]
+    language: str = ''
+    gender: str = ''
+    total_spent: float = 0.0
+    last_purchase_ts: Optional[float] = None
+    device_models: frozenset[str] = frozenset()
+
+    @classmethod
+    def from_player(cls, player: PlayerProfile) -> 'PlayerFeatures':
+        """
+        Build the features of a player loaded with its inventory and devices. A player loaded with only some of its
+        fields gets the default value of the features whose fields were not loaded (they are not in the instance
+        state): the campaigns it is matched against must not read them.
+        """
+        loaded = player.__dict__
+        return cls(
+            level=loaded.get('level', 0),
+            country=sys.intern(loaded.get('country', '')),
+            item_mask=inventory_to_mask(loaded.get('inventory')),
+            active_campaigns=frozenset(player.active_campaigns or ()),
+            language=sys.intern(loaded.get('language', '')),
+            gender=sys.intern(loaded.get('gender', '')),
+            total_spent=loaded.get('total_spent', 0.0),
+            last_purchase_ts=_timestamp(loaded.get('last_purchase')),
+            device_models=_interned(
+                device.model for device in loaded.get('devices', ())
+            ),
+        )
+
+    @classmethod
+    def from_record(cls, record: Mapping[str, Any]) -> 'PlayerFeatures':
+        """
+        Build the features of a player from a raw row (e.g. an asyncpg record) holding its level, country and active
+        campaigns, and the columns of its inventory under their names (None, or missing, for the items not held). The
+        language, gender, total spent, last purchase and device models (an array) are optional.
+        """
+        return cls(
+            level=record['level'],
+            country=sys.intern(record['country']),
+            item_mask=items_to_mask(
+                name for name in ITEM_NAMES if record.get(name) is not None
+            ),
+            active_campaigns=frozenset(record['active_campaigns'] or ()),
+            language=sys.intern(record.get('language') or ''),
+            gender=sys.intern(record.get('gender') or ''),
+            total_spent=record.get('total_spent') or 0.0,
+            last_purchase_ts=_timestamp(record.get('last_purchase')),
+            device_models=_interned(record.get('device_models') or ()),
+        )
+
+
+class PlayerFeaturesSample:
+    """
+    The features of the last players matched, on which the rules of a new catalog version are measured to order them.
+    """
+
+    def __init__(self, size: int = 128):
+        self.__players: deque[PlayerFeatures] = deque(maxlen=size)
+
+    def add(self, player: PlayerFeatures):
+        self.__players.append(player)
+
+    def players(self) -> list[PlayerFeatures]:
+        return list(self.__players)
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return None if value is None else to_timestamp(value)
+
+
+def _interned(values: Iterable[Optional[str]]) -> frozenset[str]:
+    return frozenset(sys.intern(value) for value in values if value is not None)
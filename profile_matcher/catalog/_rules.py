@@ -0,0 +1,358 @@
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from operator import attrgetter
+from typing import Any, Callable, Iterator, Optional, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from profile_matcher.api.models import Matcher
+    from ._player_features import PlayerFeatures
+
+# A rule of a campaign: the name of the rule in the registry and its parameters, a flat tuple of JSON scalars so that
+# it can be stored in a snapshot
+RuleParameters = tuple[Any, ...]
+CampaignRule = tuple[str, RuleParameters]
+# A compiled rule, called with the player and the current time (POSIX timestamp)
+Predicate = Callable[['PlayerFeatures', float], bool]
+
+DAY = 24 * 3600.0
+
+logger = getLogger('uvicorn')
+
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    """
+    A kind of matcher. evaluate is the reference implementation, used by the interpreter. compile specializes the rule
+    for the parameters of a campaign (sets, bounds, ... built once) and is optional: a rule without compiler, or whose
+    compiler fails, is interpreted. extract reads the parameters of the rule from the matchers of a campaign, None if
+    the campaign does not use the rule. cost is the estimated cost of an evaluation, relative to the other rules, used
+    until the rule is measured on real players. fields are the fields of the player profile the features read by the
+    rule come from, which must be loaded to match the player.
+    """
+
+    name: str
+    evaluate: Callable[[RuleParameters, 'PlayerFeatures', float], bool]
+    compile: Optional[Callable[[RuleParameters], Predicate]] = None
+    extract: Optional[Callable[['Matcher'], Optional[RuleParameters]]] = None
+    cost: float = 1.0
+    fields: tuple[str, ...] = ()
+
+
+class RuleRegistry:
+    """
+    The rules campaigns can be matched on. The rules of a campaign are compiled once per catalog version into a chain
+    of closures, ordered so that the cheap checks that reject the most players run first.
+    """
+
+    def __init__(self, rules: Sequence[Rule] = ()):
+        self.__rules: dict[str, Rule] = {}
+        for rule in rules:
+            self.register(rule)
+
+    def register(self, rule: Rule) -> Rule:
+        """
+        Add a rule, or replace the rule with the same name.
+        """
+        self.__rules[rule.name] = rule
+        return rule
+
+    def __getitem__(self, name: str) -> Rule:
+        return self.__rules[name]
+
+    def __iter__(self) -> Iterator[Rule]:
+        return iter(self.__rules.values())
+
+    def extract(self, matcher: 'Matcher') -> tuple[CampaignRule, ...]:
+        """
+        Return the rules used by the matchers of a campaign, for the rules that read their parameters from the matchers.
+        """
+        rules = []
+        for rule in self.__rules.values():
+            if rule.extract is not None:
+                parameters = rule.extract(matcher)
+                if parameters is not None:
+                    rules.append((rule.name, parameters))
+        return tuple(rules)
+
+    def fields(self, rules: Optional[Sequence[CampaignRule]] = None) -> frozenset[str]:
+        """
+        Return the fields of the player profile read by the rules, or by every registered rule if rules is None.
+        :raises KeyError: If a rule is not registered
+        """
+        if rules is None:
+            names = self.__rules
+        else:
+            names = [name for name, _ in rules]
+        return frozenset(field for name in names for field in self.__rules[name].fields)
+
+    def interpret(
+        self, rules: Sequence[CampaignRule], player: 'PlayerFeatures', now: float
+    ) -> bool:
+        """
+        Evaluate the rules of a campaign with the reference implementations, in the given order.
+        :raises KeyError: If a rule is not registered
+        """
+        return all(
+            self.__rules[name].evaluate(parameters, player, now)
+            for name, parameters in rules
+        )
+
+    def compile(
+        self,
+        rules: Sequence[CampaignRule],
+        sample: Sequence['PlayerFeatures'] = (),
+        now: Optional[float] = None,
+    ) -> Predicate:
+        """
+        Compile the rules of a campaign into a single predicate. The rules are ordered by their measured cost divided by
+        the share of the sample they reject, or by their estimated cost if the sample is empty.
+        :raises KeyError: If a rule is not registered
+        """
+        links = [self.__link(name, parameters) for name, parameters in rules]
+        if sample:
+            now = time.time() if now is None else now
+            ranks = [self.__measure(link, sample, now) for link in links]
+        else:
+            ranks = [self.__rules[name].cost for name, _ in rules]
+        ordered = [link for _, _, link in sorted(zip(ranks, range(len(links)), links))]
+        return _chain(ordered)
+
+    def __link(self, name: str, parameters: RuleParameters) -> Predicate:
+        rule = self.__rules[name]
+        if rule.compile is not None:
+            try:
+                return rule.compile(parameters)
+            except Exception as e:
+                logger.warning(f'Interpreting rule {name} {parameters}: {e}')
+
+        def interpreted(player: 'PlayerFeatures', now: float) -> bool:
+            return rule.evaluate(parameters, player, now)
+
+        return interpreted
+
+    @staticmethod
+    def __measure(
+        predicate: Predicate, sample: Sequence['PlayerFeatures'], now: float
+    ) -> float:
+        """
+        Rank of a rule: time spent per player rejected. A rule rejecting no player of the sample is ranked as if it
+        rejected one.
+        """
+        start = time.perf_counter()
+        passed = sum(1 for player in sample if predicate(player, now))
+        duration = time.perf_counter() - start
+        return duration / max(len(sample) - passed, 1)
+
+
+def _chain(links: Sequence[Predicate]) -> Predicate:
+    """
+    Chain predicates with a short-circuit and: the first one rejecting the player stops the evaluation.
+    """
+    if not links:
+        return lambda player, now: True
+    predicate = links[-1]
+    for link in reversed(links[:-1]):
+        predicate = _both(link, predicate)
+    return predicate
+
+
+def _both(first: Predicate, second: Predicate) -> Predicate:
+    def predicate(player: 'PlayerFeatures', now: float) -> bool:
+        return first(player, now) and second(player, now)
+
+    return predicate
+
+
+def _bounds(parameters: RuleParameters, scale: float = 1.0) -> tuple[float, float]:
+    minimum, maximum = parameters
+    return (
+        -float('inf') if minimum is None else minimum * scale,
+        float('inf') if maximum is None else maximum * scale,
+    )
+
+
+def _values(values: Optional[list[str]]) -> Optional[RuleParameters]:
+    return tuple(sorted(set(values))) if values is not None else None
+
+
+def _is_in(
+    attribute: str,
+    extract: Optional[Callable[['Matcher'], Optional[RuleParameters]]] = None,
+) -> Rule:
+    """
+    Rule passing if the attribute of the player is one of the parameters.
+    """
+
+    get = attrgetter(attribute)
+
+    def compile_rule(parameters: RuleParameters) -> Predicate:
+        values = frozenset(parameters)
+        if len(values) == 1:
+            (value,) = values
+            return lambda player, now: get(player) == value
+        return lambda player, now: get(player) in values
+
+    return Rule(
+        name=attribute,
+        evaluate=lambda parameters, player, now: getattr(player, attribute)
+        in parameters,
+        compile=compile_rule,
+        extract=extract,
+        fields=(attribute,),
+    )
+
+
+def _is_not_in(
+    attribute: str, extract: Callable[['Matcher'], Optional[RuleParameters]]
+) -> Rule:
+    """
+    Rule passing if the attribute of the player is none of the parameters.
+    """
+
+    get = attrgetter(attribute)
+
+    def compile_rule(parameters: RuleParameters) -> Predicate:
+        values = frozenset(parameters)
+        return lambda player, now: get(player) not in values
+
+    return Rule(
+        name=f'not_{attribute}',
+        evaluate=lambda parameters, player, now: getattr(player, attribute)
+        not in parameters,
+        compile=compile_rule,
+        extract=extract,
+        fields=(attribute,),
+    )
+
+
+def _compile_level(parameters: RuleParameters) -> Predicate:
+    minimum, maximum = parameters
+    return lambda player, now: minimum <= player.level <= maximum
+
+
+def _compile_has_items(parameters: RuleParameters) -> Predicate:
+    (mask,) = parameters
+    return lambda player, now: bool(player.item_mask & mask)
+
+
+def _compile_does_not_have_items(parameters: RuleParameters) -> Predicate:
+    (mask,) = parameters
+    return lambda player, now: not player.item_mask & mask
+
+
+def _compile_total_spent(parameters: RuleParameters) -> Predicate:
+    minimum, maximum = _bounds(parameters)
+    return lambda player, now: minimum <= player.total_spent <= maximum
+
+
+def _evaluate_last_purchase(
+    parameters: RuleParameters, player: 'PlayerFeatures', now: float
+) -> bool:
+    minimum, maximum = _bounds(parameters, DAY)
+    return (
+        player.last_purchase_ts is not None
+        and minimum <= now - player.last_purchase_ts <= maximum
+    )
+
+
+def _compile_last_purchase(parameters: RuleParameters) -> Predicate:
+    minimum, maximum = _bounds(parameters, DAY)
+
+    def predicate(player: 'PlayerFeatures', now: float) -> bool:
+        last_purchase_ts = player.last_purchase_ts
+        return (
+            last_purchase_ts is not None
+            and minimum <= now - last_purchase_ts <= maximum
+        )
+
+    return predicate
+
+
+def _compile_device_model(parameters: RuleParameters) -> Predicate:
+    models = frozenset(parameters)
+    return lambda player, now: not models.isdisjoint(player.device_models)
+
+
+def _compile_not_device_model(parameters: RuleParameters) -> Predicate:
+    models = frozenset(parameters)
+    return lambda player, now: models.isdisjoint(player.device_models)
+
+
+# The rules stored in the fields of a compiled campaign (and in the fixed size records of a snapshot), which every
+# campaign has. Their parameters do not come from extract.
+CORE_RULES = ('level', 'country', 'has_items', 'does_not_have_items')
+
+rule_registry = RuleRegistry(
+    [
+        Rule(
+            name='level',
+            evaluate=lambda parameters, player, now: parameters[0]
+            <= player.level
+            <= parameters[1],
+            compile=_compile_level,
+            fields=('level',),
+        ),
+        _is_in('country'),
+        Rule(
+            name='has_items',
+            evaluate=lambda parameters, player, now: bool(
+                player.item_mask & parameters[0]
+            ),
+            compile=_compile_has_items,
+            fields=('inventory',),
+        ),
+        Rule(
+            name='does_not_have_items',
+            evaluate=lambda parameters, player, now: not player.item_mask
+            & parameters[0],
+            compile=_compile_does_not_have_items,
+            fields=('inventory',),
+        ),
+        _is_in('language', lambda matcher: _values(matcher.has.language)),
+        _is_not_in('language', lambda matcher: _values(matcher.does_not_have.language)),
+        _is_in('gender', lambda matcher: _values(matcher.has.gender)),
+        _is_not_in('gender', lambda matcher: _values(matcher.does_not_have.gender)),
+        Rule(
+            name='total_spent',
+            evaluate=lambda parameters, player, now: _bounds(parameters)[0]
+            <= player.total_spent
+            <= _bounds(parameters)[1],
+            compile=_compile_total_spent,
+            extract=lambda matcher: None
+            if matcher.total_spent is None
+            else (matcher.total_spent.min, matcher.total_spent.max),
+            fields=('total_spent',),
+        ),
+        Rule(
+            name='last_purchase',
+            evaluate=_evaluate_last_purchase,
+            compile=_compile_last_purchase,
+            extract=lambda matcher: None
+            if matcher.last_purchase is None
+            else (matcher.last_purchase.min_days, matcher.last_purchase.max_days),
+            cost=2.0,
+            fields=('last_purchase',),
+        ),
+        Rule(
+            name='device_model',
+            evaluate=lambda parameters, player, now: any(
+                model in parameters for model in player.device_models
+            ),
+            compile=_compile_device_model,
+            extract=lambda matcher: _values(matcher.has.device_model),
+            cost=3.0,
+            fields=('devices',),
+        ),
+        Rule(
+            name='not_device_model',
+            evaluate=lambda parameters, player, now: not any(
+                model in parameters for model in player.device_models
+            ),
+            compile=_compile_not_device_model,
+            extract=lambda matcher: _values(matcher.does_not_have.device_model),
+            cost=3.0,
+            fields=('devices',),
+        ),
+    ]
+)
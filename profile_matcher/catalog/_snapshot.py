@@ -0,0 +1,473 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from datetime import datetime
+from logging import getLogger
+from typing import Iterator, Optional
+
+from ._compiled_catalog import (
+    CompiledCampaign,
+    CompiledCatalog,
+    ITEM_NAMES,
+    to_timestamp,
+)
+from ._rules import CampaignRule, Predicate, rule_registry
+from ._exception import CatalogSnapshotException
+from ._player_features import PlayerFeatures
+
+# Binary layout of a snapshot (little endian, no padding):
+#   header | records | country codes (u16 per entry) | string table (utf-8)
+# Records are fixed size, so record i is read in place at records_offset + i * record size. The country codes of a
+# record point into the country dictionary, which is stored in the string table with the catalog version and the
+# item vocabulary used to build the masks. The other rules of a campaign are stored as JSON in the string table.
+SNAPSHOT_MAGIC = b'PMCS'
+SNAPSHOT_FORMAT_VERSION = 2
+
+# magic, format version, reserved, record count, records offset, country codes offset,
+# string table offset, (offset, length) of the version, item vocabulary and country dictionary in the string table.
+# Every string offset (in the header and in the records) is relative to the string table.
+_HEADER = struct.Struct('<4sHH10I')
+# has mask, does not have mask, priority, start, end, last updated, level min, level max, name offset, game offset,
+# country codes index, rules offset, rules length, name length, game length, country count, enabled
+_RECORD = struct.Struct('<QQddddiiIIIIIHHHB')
+_COUNTRY_CODE = struct.Struct('<H')
+_SEPARATOR = '\n'
+# The rules every campaign has, stored in the record itself (see CompiledCampaign.all_rules)
+_CORE_RULES = (
+    ('level', ()),
+    ('country', ()),
+    ('has_items', ()),
+    ('does_not_have_items', ()),
+)
+
+logger = getLogger('uvicorn')
+
+
+def write_catalog_snapshot(catalog: CompiledCatalog, path: str | os.PathLike):
+    """
+    Write the compiled catalog to path. The file is written next to the destination, synced and then renamed over it,
+    so readers only ever see a complete snapshot.
+    :raises CatalogSnapshotException: If the catalog cannot be represented in the snapshot format
+    """
+    if len(ITEM_NAMES) > 64:
+        raise CatalogSnapshotException(
+            'Item masks larger than 64 bits are not supported'
+        )
+
+    country_dictionary = sorted(
+        {country for campaign in catalog for country in campaign.countries}
+    )
+    country_indexes = {
+        country: index for index, country in enumerate(country_dictionary)
+    }
+
+    strings = bytearray()
+
+    def add_string(value: str) -> tuple[int, int]:
+        encoded = value.encode()
+        position = len(strings)
+        strings.extend(encoded)
+        return position, len(encoded)
+
+    version = add_string(catalog.version)
+    vocabulary = add_string(_SEPARATOR.join(ITEM_NAMES))
+    countries = add_string(_SEPARATOR.join(country_dictionary))
+
+    records = bytearray()
+    country_codes = bytearray()
+    country_code_count = 0
+    for campaign in catalog:
+        name_offset, name_length = add_string(campaign.name)
+        game_offset, game_length = add_string(campaign.game)
+        if name_length > 0xFFFF or game_length > 0xFFFF:
+            raise CatalogSnapshotException(
+                f'Campaign {campaign.name} has a name too long'
+            )
+        codes = sorted(country_indexes[country] for country in campaign.countries)
+        rules_offset, rules_length = (
+            add_string(json.dumps(campaign.rules)) if campaign.rules else (0, 0)
+        )
+        records += _RECORD.pack(
+            campaign.has_items,
+            campaign.does_not_have_items,
+            campaign.priority,
+            campaign.start_ts,
+            campaign.end_ts,
+            campaign.last_updated_ts,
+            campaign.level_min,
+            campaign.level_max,
+            name_offset,
+            game_offset,
+            country_code_count,
+            rules_offset,
+            rules_length,
+            name_length,
+            game_length,
+            len(codes),
+            campaign.enabled,
+        )
+        for code in codes:
+            country_codes += _COUNTRY_CODE.pack(code)
+        country_code_count += len(codes)
+
+    records_offset = _HEADER.size
+    country_codes_offset = records_offset + len(records)
+    strings_offset = country_codes_offset + len(country_codes)
+    header = _HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_FORMAT_VERSION,
+        0,
+        len(catalog),
+        records_offset,
+        country_codes_offset,
+        strings_offset,
+        *version,
+        *vocabulary,
+        *countries,
+    )
+
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        prefix='.catalog-', suffix='.tmp', dir=directory
+    )
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(header)
+            file.write(records)
+            file.write(country_codes)
+            file.write(strings)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+    # Persist the rename itself
+    if hasattr(os, 'O_DIRECTORY'):
+        directory_descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_descriptor)
+        finally:
+            os.close(directory_descriptor)
+
+
+class CatalogSnapshot:
+    """
+    Read only view over a mapped snapshot. Nothing is copied out of the mapping except the small country dictionary
+    and the campaigns handed out by running_at and find, so the memory of a worker does not grow with the catalog: the
+    pages are shared with every other process mapping the same file.
+    """
+
+    __slots__ = (
+        '__buffer',
+        '__view',
+        '__country_codes',
+        '__countries',
+        '__records_offset',
+        '__codes_offset',
+        '__strings_offset',
+        '__length',
+        '__rule_predicates',
+        '__campaigns',
+        'version',
+        'player_fields',
+    )
+
+    def __init__(self, buffer: mmap.mmap):
+        self.__buffer = buffer
+        self.__view = memoryview(buffer)
+        # The other rules of the campaigns, compiled the first time a player passes the core rules of the campaign
+        self.__rule_predicates: dict[int, Predicate] = {}
+        # The campaigns materialized, only the ones returned by running_at or find
+        self.__campaigns: dict[int, CompiledCampaign] = {}
+        if len(buffer) < _HEADER.size:
+            raise CatalogSnapshotException('Snapshot is truncated')
+        (
+            magic,
+            format_version,
+            _reserved,
+            self.__length,
+            self.__records_offset,
+            self.__codes_offset,
+            self.__strings_offset,
+            version_offset,
+            version_length,
+            vocabulary_offset,
+            vocabulary_length,
+            countries_offset,
+            countries_length,
+        ) = _HEADER.unpack_from(buffer)
+        if magic != SNAPSHOT_MAGIC or format_version != SNAPSHOT_FORMAT_VERSION:
+            raise CatalogSnapshotException(
+                'Not a catalog snapshot, or unsupported format'
+            )
+        strings_end = max(
+            version_offset + version_length,
+            vocabulary_offset + vocabulary_length,
+            countries_offset + countries_length,
+        )
+        if (
+            self.__records_offset + self.__length * _RECORD.size > self.__codes_offset
+            or self.__strings_offset + strings_end > len(buffer)
+        ):
+            raise CatalogSnapshotException('Snapshot is truncated')
+
+        vocabulary = self.__string(vocabulary_offset, vocabulary_length)
+        if tuple(vocabulary.split(_SEPARATOR)) != ITEM_NAMES:
+            raise CatalogSnapshotException(
+                'Snapshot was written with a different item vocabulary'
+            )
+        self.version = self.__string(version_offset, version_length)
+        countries = self.__string(countries_offset, countries_length)
+        self.__countries = tuple(countries.split(_SEPARATOR)) if countries else ()
+        self.__country_codes = {
+            country: code for code, country in enumerate(self.__countries)
+        }
+        # The fields of the player profile needed to match a player against any campaign of the snapshot
+        self.player_fields = rule_registry.fields(
+            [
+                *_CORE_RULES,
+                *(
+                    rule
+                    for record in self.__records()
+                    for rule in self.__rules(record[11], record[12])
+                ),
+            ]
+        )
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def __string(self, offset: int, length: int) -> str:
+        offset += self.__strings_offset
+        return str(self.__view[offset : offset + length], 'utf-8')
+
+    def __record(self, index: int) -> tuple:
+        if not 0 <= index < self.__length:
+            raise IndexError(index)
+        return _RECORD.unpack_from(
+            self.__buffer, self.__records_offset + index * _RECORD.size
+        )
+
+    def __records(self) -> Iterator[tuple]:
+        return _RECORD.iter_unpack(
+            self.__view[
+                self.__records_offset : self.__records_offset
+                + self.__length * _RECORD.size
+            ]
+        )
+
+    def __codes(self, start: int, count: int) -> memoryview:
+        offset = self.__codes_offset + start * _COUNTRY_CODE.size
+        return self.__view[offset : offset + count * _COUNTRY_CODE.size].cast('H')
+
+    def name(self, index: int) -> str:
+        record = self.__record(index)
+        return self.__string(record[8], record[13])
+
+    def __rules(self, offset: int, length: int) -> tuple[CampaignRule, ...]:
+        if not length:
+            return ()
+        return tuple(
+            (name, tuple(parameters))
+            for name, parameters in json.loads(self.__string(offset, length))
+        )
+
+    def __rule_predicate(self, index: int, offset: int, length: int) -> Predicate:
+        predicate = self.__rule_predicates.get(index)
+        if predicate is None:
+            predicate = self.__rule_predicates[index] = rule_registry.compile(
+                self.__rules(offset, length)
+            )
+        return predicate
+
+    def campaign(self, index: int) -> CompiledCampaign:
+        """
+        Materialize one campaign. Matching does not need this, it reads the records in place.
+        """
+        (
+            has_items,
+            does_not_have_items,
+            priority,
+            start_ts,
+            end_ts,
+            last_updated_ts,
+            level_min,
+            level_max,
+            name_offset,
+            game_offset,
+            codes_start,
+            rules_offset,
+            rules_length,
+            name_length,
+            game_length,
+            country_count,
+            enabled,
+        ) = self.__record(index)
+        return CompiledCampaign(
+            name=self.__string(name_offset, name_length),
+            game=self.__string(game_offset, game_length),
+            priority=priority,
+            level_min=level_min,
+            level_max=level_max,
+            countries=frozenset(
+                self.__countries[code]
+                for code in self.__codes(codes_start, country_count)
+            ),
+            has_items=has_items,
+            does_not_have_items=does_not_have_items,
+            start_ts=start_ts,
+            end_ts=end_ts,
+            last_updated_ts=last_updated_ts,
+            enabled=bool(enabled),
+            rules=self.__rules(rules_offset, rules_length),
+        )
+
+    def __cached_campaign(self, index: int) -> CompiledCampaign:
+        campaign = self.__campaigns.get(index)
+        if campaign is None:
+            campaign = self.__campaigns[index] = self.campaign(index)
+        return campaign
+
+    def running_at(self, now: datetime) -> list[CompiledCampaign]:
+        """
+        Return the enabled campaigns running at now, by descending priority (catalog order for equal priorities). The
+        dates are read in place, only the running campaigns are materialized, once per snapshot.
+        """
+        timestamp = to_timestamp(now)
+        running = [
+            (index, record[2])
+            for index, record in enumerate(self.__records())
+            if record[16] and record[3] <= timestamp < record[4]
+        ]
+        running.sort(key=lambda entry: -entry[1])
+        return [self.__cached_campaign(index) for index, _ in running]
+
+    def find(self, name: str) -> Optional[CompiledCampaign]:
+        """
+        Return the campaign with the given name, or None if there is none. Only that campaign is materialized.
+        """
+        encoded = name.encode()
+        for index, record in enumerate(self.__records()):
+            offset = self.__strings_offset + record[8]
+            if self.__view[offset : offset + record[13]] == encoded:
+                return self.__cached_campaign(index)
+        return None
+
+    def to_catalog(self) -> CompiledCatalog:
+        return CompiledCatalog(
+            version=self.version,
+            campaigns=tuple(self.campaign(index) for index in range(self.__length)),
+        )
+
+    def matching_names(
+        self,
+        player: PlayerFeatures,
+        now: Optional[datetime] = None,
+    ) -> list[str]:
+        """
+        Return the names of the campaigns matching the player, in catalog order. Only the names of the matches are
+        decoded. If now is given, only the enabled campaigns running at now are evaluated.
+        """
+        level, item_mask = player.level, player.item_mask
+        code = self.__country_codes.get(player.country)
+        if code is None:
+            return []
+        timestamp = None if now is None else to_timestamp(now)
+        rules_now = time.time() if timestamp is None else timestamp
+        names = []
+        for index, (
+            has_items,
+            does_not_have_items,
+            _priority,
+            start_ts,
+            end_ts,
+            _last_updated_ts,
+            level_min,
+            level_max,
+            name_offset,
+            _game_offset,
+            codes_start,
+            rules_offset,
+            rules_length,
+            name_length,
+            _game_length,
+            country_count,
+            enabled,
+        ) in enumerate(self.__records()):
+            if timestamp is not None and not (
+                enabled and start_ts <= timestamp < end_ts
+            ):
+                continue
+            if (
+                level_min <= level <= level_max
+                and item_mask & has_items
+                and not item_mask & does_not_have_items
+                and code in self.__codes(codes_start, country_count)
+                and (
+                    not rules_length
+                    or self.__rule_predicate(index, rules_offset, rules_length)(
+                        player, rules_now
+                    )
+                )
+            ):
+                names.append(self.__string(name_offset, name_length))
+        return names
+
+
+class CatalogSnapshotReader:
+    """
+    Keep the latest snapshot written at path mapped. The file is checked at most every check_interval seconds, and a
+    new snapshot is swapped in by replacing a single reference, so readers never take a lock. A snapshot already handed
+    out stays valid (and mapped) for as long as the caller holds it.
+    """
+
+    def __init__(self, path: str | os.PathLike, check_interval: float = 1.0):
+        self.__path = path
+        self.__check_interval = check_interval
+        self.__snapshot: Optional[CatalogSnapshot] = None
+        self.__identity: Optional[tuple[int, int, int, int]] = None
+        self.__next_check = 0.0
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        """
+        Return the latest snapshot, or None if no snapshot has been written yet.
+        """
+        now = time.monotonic()
+        if now >= self.__next_check:
+            self.__next_check = now + self.__check_interval
+            self.reload()
+        return self.__snapshot
+
+    def reload(self):
+        """
+        Map the file at path if it changed since it was last mapped. A snapshot that cannot be read is logged and the
+        previous one is kept.
+        """
+        try:
+            with open(self.__path, 'rb') as file:
+                stat = os.fstat(file.fileno())
+                identity = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                if identity == self.__identity:
+                    return
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            # An empty file cannot be mapped
+            logger.error(f'Ignoring catalog snapshot {self.__path}: {e}')
+            return
+        try:
+            snapshot = CatalogSnapshot(buffer)
+        except CatalogSnapshotException as e:
+            logger.error(f'Ignoring catalog snapshot {self.__path}: {e}')
+            return
+        self.__identity = identity
+        self.__snapshot = snapshot
+        logger.info(
+            f'Mapped catalog snapshot {snapshot.version} ({len(snapshot)} campaigns)'
+        )
@@ -0,0 +1,244 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from logging import getLogger
+from typing import Awaitable, Callable, Optional, TYPE_CHECKING
+
+from ._catalog_index import CatalogIndex
+from ._compiled_catalog import to_timestamp
+from ._exception import CatalogSyncException
+from ._player_features import PlayerFeaturesSample
+
+if TYPE_CHECKING:
+    from profile_matcher.api.models import ActiveCampaign
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogDelta:
+    """
+    Campaigns changed since a point in time, and the names of the campaigns removed since then with their removal time,
+    if known (tombstones). A full delta holds the whole catalog: the campaigns it does not list are gone.
+    """
+
+    campaigns: list['ActiveCampaign']
+    removed: dict[str, Optional[datetime]] = field(default_factory=dict)
+    full: bool = False
+
+
+class CampaignSource(ABC):
+    """
+    Where the campaign catalog comes from (the campaign service).
+    """
+
+    @abstractmethod
+    async def fetch(self, updated_since: Optional[datetime] = None) -> CatalogDelta:
+        """
+        Fetch the campaigns updated, and the campaigns removed, at or after updated_since, or the whole catalog if
+        updated_since is None.
+        :raises CatalogSyncException: If the catalog cannot be fetched
+        """
+
+
+class CatalogSync:
+    """
+    Keep a local copy of the campaign catalog, refreshed every refresh_interval seconds with the changes since the
+    most recent update already seen (last_updated of the campaigns, removal time of the tombstones), applied to the
+    current index without rebuilding it. The whole catalog is fetched again every full_resync_interval seconds, so
+    that a missed change (e.g. a tombstone purged by the service) does not stay forever. A failed refresh keeps the
+    current index. Without source, the sync is disabled and index stays None.
+    The other workers can tell of a new version (notify_version): the catalog is then refreshed right away. While they
+    do (set_notified), the catalog is only polled every notified_refresh_interval seconds, the bound on the staleness
+    left when a notification is lost. on_new_version is awaited with every version the sync switches to unless notified
+    of it, to tell the other workers.
+    """
+
+    def __init__(
+        self,
+        source: Optional[CampaignSource],
+        refresh_interval: float = 5.0,
+        full_resync_interval: float = 3600.0,
+        sample: Optional[PlayerFeaturesSample] = None,
+        notified_refresh_interval: Optional[float] = None,
+    ):
+        self.__source = source
+        self.__refresh_interval = refresh_interval
+        self.__full_resync_interval = full_resync_interval
+        self.__sample = sample
+        self.__notified_refresh_interval = notified_refresh_interval
+        self.__notified = False
+        # A refresh asked by a notification is not told back
+        self.__notification_pending = False
+        self.__wakeup = asyncio.Event()
+        self.__next_full_resync = 0.0
+        self.__task: Optional[asyncio.Task] = None
+        self.__logger = getLogger('uvicorn')
+
+        self.index: Optional[CatalogIndex] = None
+        # Most recent update seen, changes are fetched from there
+        self.updated_since: Optional[datetime] = None
+        self.on_new_version: Optional[Callable[[str], Awaitable[None]]] = None
+
+        self.full_syncs = 0
+        self.delta_syncs = 0
+        self.failed_syncs = 0
+        self.notified_syncs = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.__source is not None
+
+    @property
+    def refresh_interval(self) -> float:
+        """
+        Seconds between two polls of the source: longer while the new versions are notified.
+        """
+        if self.__notified and self.__notified_refresh_interval is not None:
+            return self.__notified_refresh_interval
+        return self.__refresh_interval
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'campaigns': 0 if self.index is None else len(self.index.campaigns),
+            'full_syncs': self.full_syncs,
+            'delta_syncs': self.delta_syncs,
+            'failed_syncs': self.failed_syncs,
+            'notified_syncs': self.notified_syncs,
+        }
+
+    def notify_version(self, version: str):
+        """
+        Another worker switched to version: refresh the catalog now, unless it is the current one.
+        """
+        if self.index is not None and self.index.version == version:
+            return
+        self.__notification_pending = True
+        self.notified_syncs += 1
+        self.__wakeup.set()
+
+    def set_notified(self, notified: bool):
+        """
+        Tell whether the new versions are notified. Either way, the catalog is refreshed now: the versions notified
+        while the notifications were down are lost.
+        """
+        self.__notified = notified
+        self.__wakeup.set()
+
+    async def refresh(self) -> CatalogIndex:
+        """
+        Apply the changes since the last refresh, or fetch the whole catalog if none was fetched yet or the full resync
+        is due.
+        :raises CatalogSyncException: If the sync is disabled, or the changes cannot be fetched
+        """
+        if self.__source is None:
+            raise CatalogSyncException('No campaign source to sync the catalog from')
+        if self.index is None or time.monotonic() >= self.__next_full_resync:
+            return await self.resync()
+
+        delta = await self.__source.fetch(self.updated_since)
+        self.__apply(delta)
+        self.delta_syncs += 1
+        return self.index
+
+    async def resync(self) -> CatalogIndex:
+        """
+        Fetch the whole catalog. The campaigns that did not change are not compiled again.
+        :raises CatalogSyncException: If the sync is disabled, or the catalog cannot be fetched
+        """
+        if self.__source is None:
+            raise CatalogSyncException('No campaign source to sync the catalog from')
+        delta = await self.__source.fetch()
+        self.__apply(
+            CatalogDelta(
+                campaigns=delta.campaigns,
+                removed={}
+                if self.index is None
+                else dict.fromkeys(
+                    {campaign.name for campaign in self.index.campaigns}
+                    - {campaign.name for campaign in delta.campaigns}
+                ),
+                full=True,
+            )
+        )
+        self.__next_full_resync = time.monotonic() + self.__full_resync_interval
+        self.full_syncs += 1
+        return self.index
+
+    def __apply(self, delta: CatalogDelta):
+        # A campaign removed after its last update in the same delta stays removed
+        changed = [
+            campaign
+            for campaign in delta.campaigns
+            if campaign.name not in delta.removed
+            or delta.removed[campaign.name] is None
+            or to_timestamp(campaign.last_updated)
+            > to_timestamp(delta.removed[campaign.name])
+        ]
+        changed_names = {campaign.name for campaign in changed}
+        removed = [name for name in delta.removed if name not in changed_names]
+        sample = self.__sample.players() if self.__sample is not None else ()
+        if self.index is None:
+            self.index = CatalogIndex(changed, sample=sample)
+        else:
+            self.index = self.index.apply(changed, removed, sample)
+
+        timestamps = [campaign.last_updated for campaign in delta.campaigns]
+        timestamps += [
+            removed_at for removed_at in delta.removed.values() if removed_at
+        ]
+        if self.updated_since is not None:
+            timestamps.append(self.updated_since)
+        if timestamps:
+            self.updated_since = max(timestamps, key=to_timestamp)
+        self.__logger.debug(
+            f'Applied {"full" if delta.full else "delta"} catalog sync: {len(changed)} changed, {len(removed)} '
+            f'removed, version {self.index.version}'
+        )
+
+    async def start(self):
+        """
+        Fetch the catalog, then start the background refresh. A failed first fetch is retried by the refresh.
+        """
+        if self.__source is None or self.__task is not None:
+            return
+        await self.__refresh_or_log()
+        self.__task = asyncio.create_task(self.__run())
+
+    async def stop(self):
+        """
+        Stop the background refresh
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+            self.__task = None
+            self.__logger.info(f'Catalog sync stopped: {self.stats()}')
+
+    async def __refresh_or_log(self):
+        version = None if self.index is None else self.index.version
+        notified, self.__notification_pending = self.__notification_pending, False
+        try:
+            await self.refresh()
+        except CatalogSyncException as e:
+            self.failed_syncs += 1
+            self.__logger.error(f'Error in syncing the campaign catalog: {e}')
+            return
+        if (
+            self.on_new_version is not None
+            and not notified
+            and self.index.version != version
+        ):
+            await self.on_new_version(self.index.version)
+
+    async def __run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.__wakeup.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.__wakeup.clear()
+            await self.__refresh_or_log()
@@ -0,0 +1,80 @@
+import bisect
+from datetime import datetime
+from typing import Optional
+
+from ._compiled_catalog import CompiledCatalog, to_timestamp
+
+_ACTIVATION = 1
+_EXPIRY = 0
+
+
+class CampaignTimeline:
+    """
+    Sorted activation (start date) and expiry (end date) events of the enabled campaigns of a catalog. The set of
+    running campaigns is kept for the latest instant asked and moved forward by applying the events that happened
+    since, so asking for the current time on every request only costs the events in between. An earlier instant (the
+    timeline is shared by concurrent requests) only costs the events between it and the latest one, and does not move
+    the timeline back. Disabled campaigns never make it into the timeline. A campaign runs from its start date (included) to its end date (excluded).
+    The running campaigns are returned by descending priority (catalog order for equal priorities), so that callers
+    can stop at the first matches.
+    """
+
+    def __init__(self, catalog: CompiledCatalog):
+        campaigns = catalog.campaigns
+        # Position of every campaign once sorted by priority, used to order the running set
+        self.__rank = [0] * len(campaigns)
+        for rank, index in enumerate(
+            sorted(range(len(campaigns)), key=lambda index: -campaigns[index].priority)
+        ):
+            self.__rank[index] = rank
+
+        events = []
+        for index, campaign in enumerate(catalog):
+            if campaign.enabled and campaign.start_ts < campaign.end_ts:
+                events.append((campaign.start_ts, _ACTIVATION, index))
+                events.append((campaign.end_ts, _EXPIRY, index))
+        # At the same instant, expiries are applied before activations
+        events.sort()
+        self.__events = events
+        self.__timestamps = [event[0] for event in events]
+        self.__position = 0
+        self.__running: set[int] = set()
+        self.__running_indexes: tuple[int, ...] = ()
+
+    def running_at(self, now: datetime) -> tuple[int, ...]:
+        """
+        Return the indexes of the campaigns running at now, by descending priority.
+        """
+        timestamp = to_timestamp(now)
+        end = bisect.bisect_right(self.__timestamps, timestamp)
+        if end < self.__position:
+            # An instant before the latest one asked (a request that read the clock earlier, a bulk job in the past):
+            # the events in between are undone on a copy, the timeline stays at the latest instant
+            running = set(self.__running)
+            for _, kind, index in reversed(self.__events[end : self.__position]):
+                if kind == _ACTIVATION:
+                    running.discard(index)
+                else:
+                    running.add(index)
+            return self.__by_priority(running)
+
+        if end != self.__position:
+            for _, kind, index in self.__events[self.__position : end]:
+                if kind == _ACTIVATION:
+                    self.__running.add(index)
+                else:
+                    self.__running.discard(index)
+            self.__position = end
+            self.__running_indexes = self.__by_priority(self.__running)
+        return self.__running_indexes
+
+    def __by_priority(self, running: set[int]) -> tuple[int, ...]:
+        return tuple(sorted(running, key=self.__rank.__getitem__))
+
+    def next_change(self) -> Optional[float]:
+        """
+        Timestamp of the next activation or expiry, None if nothing else will change.
+        """
+        if self.__position < len(self.__timestamps):
+            return self.__timestamps[self.__position]
+        return None
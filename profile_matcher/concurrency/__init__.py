@@ -0,0 +1,33 @@
+from ._admission import (
+    AdmissionController,
+    AdmissionSlot,
+    admission_controller,
+    admission_scope,
+    current_admission_slot,
+)
+from ._deadline import (
+    Deadline,
+    check_deadline,
+    context_without_deadline,
+    current_deadline,
+    deadline_scope,
+    enforce_deadline,
+)
+from ._exception import DeadlineExceededException
+from ._single_flight import SingleFlight
+
+__all__ = [
+    'AdmissionController',
+    'AdmissionSlot',
+    'admission_controller',
+    'admission_scope',
+    'current_admission_slot',
+    'Deadline',
+    'check_deadline',
+    'context_without_deadline',
+    'current_deadline',
+    'deadline_scope',
+    'enforce_deadline',
+    'DeadlineExceededException',
+    'SingleFlight',
+]
@@ -0,0 +1,128 @@
+import contextlib
+import math
+import os
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class AdmissionController:
+    """
+    Decide whether a request can start, from the requests in flight and the recent latencies. A request is rejected
+    when too many requests are in flight, or when its estimated latency does not fit in its budget: it is better to
+    answer it right away than to let it wait for a connection and time out anyway.
+
+    The latency of a request is estimated as the recent service time, plus the time spent waiting for the requests
+    ahead of it: the recent pool wait, or the service time of the requests beyond the capacity, whichever is longer.
+    The capacity is the number of requests served at the same time, about the size of the connection pool.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 100,
+        capacity: int = 10,
+        smoothing: float = 0.2,
+    ):
+        self.max_in_flight = max_in_flight
+        self.capacity = capacity
+        self.__smoothing = smoothing
+        self.in_flight = 0
+        # Exponential moving averages, in seconds
+        self.service_time = 0.0
+        self.pool_wait = 0.0
+
+    def estimated_latency(self) -> float:
+        """
+        Estimate the latency of a request starting now.
+        """
+        queued = max(0, self.in_flight + 1 - self.capacity)
+        queue_wait = self.service_time * queued / self.capacity
+        return self.service_time + max(self.pool_wait, queue_wait)
+
+    def try_acquire(self, budget: float) -> bool:
+        """
+        Admit a request that must be answered within budget seconds. An admitted request must be released.
+        """
+        # With nothing in flight, the request is admitted whatever the estimate: it refreshes the averages once the
+        # slowdown that raised them is over
+        if self.in_flight > 0 and (
+            self.in_flight >= self.max_in_flight or self.estimated_latency() > budget
+        ):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, service_time: float):
+        self.in_flight -= 1
+        self.service_time = self.__average(self.service_time, service_time)
+
+    def record_pool_wait(self, wait: float):
+        self.pool_wait = self.__average(self.pool_wait, wait)
+
+    def retry_after(self) -> int:
+        """
+        Seconds after which a rejected request should be retried: the time needed to serve the requests in flight.
+        """
+        drain_time = self.service_time * self.in_flight / self.capacity
+        return max(1, math.ceil(drain_time))
+
+    def __average(self, average: float, value: float) -> float:
+        return average + self.__smoothing * (value - average)
+
+
+class AdmissionSlot:
+    """
+    Slot of an admitted request in the controller. Work started by the request and outliving it (a computation shared
+    with other requests) holds the slot, so that the request is still counted in flight until that work is done.
+    """
+
+    __slots__ = ('__controller', '__holders', '__service_time')
+
+    def __init__(self, controller: AdmissionController):
+        self.__controller = controller
+        self.__holders = 1
+        self.__service_time = 0.0
+
+    def hold(self):
+        self.__holders += 1
+
+    def release(self, service_time: Optional[float] = None):
+        """
+        Release a hold on the slot, the request one with its service_time. The slot is released from the controller
+        once nothing holds it anymore.
+        """
+        if service_time is not None:
+            self.__service_time = service_time
+        self.__holders -= 1
+        if not self.__holders:
+            self.__controller.release(self.__service_time)
+
+
+_current_slot: ContextVar[Optional[AdmissionSlot]] = ContextVar(
+    'current_admission_slot', default=None
+)
+
+
+def current_admission_slot() -> Optional[AdmissionSlot]:
+    return _current_slot.get()
+
+
+@contextlib.contextmanager
+def admission_scope(slot: AdmissionSlot) -> Iterator[AdmissionSlot]:
+    """
+    Set the admission slot of the work done in this scope (and in the tasks it starts).
+    """
+    token = _current_slot.set(slot)
+    try:
+        yield slot
+    finally:
+        _current_slot.reset(token)
+
+
+admission_controller = AdmissionController(
+    max_in_flight=int(os.getenv('MAX_IN_FLIGHT_REQUESTS', '100')),
+    capacity=int(os.getenv('ADMISSION_CAPACITY', '10')),
+)
@@ -0,0 +1,91 @@
+import asyncio
+import contextlib
+import time
+from contextvars import Context, ContextVar, copy_context
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator, Optional
+
+from ._exception import DeadlineExceededException
+
+_current_deadline: ContextVar[Optional['Deadline']] = ContextVar(
+    'current_deadline', default=None
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Deadline:
+    """
+    Point in time (on the monotonic clock) by which a request must be answered.
+    """
+
+    expires_at: float
+
+    @classmethod
+    def after(cls, timeout: float) -> 'Deadline':
+        return cls(time.monotonic() + timeout)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextlib.contextmanager
+def deadline_scope(timeout: float) -> Iterator[Deadline]:
+    """
+    Set the deadline of the work done in this scope (and in the tasks it starts). A scope cannot extend the deadline
+    of the enclosing one.
+    """
+    deadline = Deadline.after(timeout)
+    enclosing = _current_deadline.get()
+    if enclosing is not None and enclosing.expires_at < deadline.expires_at:
+        deadline = enclosing
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def context_without_deadline() -> Context:
+    """
+    Copy the current context, without its deadline: for work shared by requests that each have their own deadline.
+    """
+    context = copy_context()
+    context.run(_current_deadline.set, None)
+    return context
+
+
+def check_deadline():
+    """
+    :raises DeadlineExceededException: If the current deadline is expired
+    """
+    deadline = _current_deadline.get()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceededException('The deadline of the request is exceeded')
+
+
+@contextlib.asynccontextmanager
+async def enforce_deadline() -> AsyncIterator[None]:
+    """
+    Cancel the work done in this scope when the current deadline expires. Without a deadline, nothing is enforced.
+    :raises DeadlineExceededException: If the deadline expires before the scope ends
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        yield
+        return
+
+    timeout = asyncio.timeout(deadline.remaining())
+    try:
+        async with timeout:
+            yield
+    except TimeoutError:
+        if not timeout.expired():
+            raise
+        raise DeadlineExceededException('The deadline of the request is exceeded')
@@ -0,0 +1,2 @@
+class DeadlineExceededException(Exception):
+    pass
@@ -0,0 +1,98 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+from ._admission import current_admission_slot
+from ._deadline import Deadline, context_without_deadline, current_deadline
+from ._exception import DeadlineExceededException
+
+T = TypeVar('T')
+
+
+class _Flight(Generic[T]):
+    """
+    A computation in flight, bounded by the latest deadline of its callers (None when a caller has no deadline).
+    """
+
+    __slots__ = ('deadline', 'timeout', 'task')
+
+    def __init__(self, deadline: Optional[Deadline]):
+        self.deadline = deadline
+        self.timeout: Optional[asyncio.Timeout] = None
+        self.task: Optional[asyncio.Task[T]] = None
+
+    def extend(self, deadline: Optional[Deadline]):
+        """
+        Extend the deadline of the computation to the deadline of a new caller, if it is later.
+        """
+        if self.deadline is None:
+            return
+        if deadline is None or deadline.expires_at > self.deadline.expires_at:
+            self.deadline = deadline
+            if self.timeout is not None:
+                self.timeout.reschedule(_loop_time(deadline))
+
+
+def _loop_time(deadline: Optional[Deadline]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return asyncio.get_running_loop().time() + deadline.remaining()
+
+
+class SingleFlight(Generic[T]):
+    """
+    Deduplicate concurrent calls sharing the same key: the first caller starts the computation and every caller
+    arriving while it runs awaits the same result (or exception). Once it is done, the next call starts a new one.
+    Every caller only bounds its own wait, and the computation is cancelled once the latest deadline of its callers is
+    exceeded. The computation holds the admission slot of the caller that started it until it is done, so that it is
+    still counted in flight after that caller gave up.
+    """
+
+    def __init__(self):
+        self.__calls: dict[Hashable, _Flight[T]] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self.__calls
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[T]]) -> T:
+        deadline = current_deadline()
+        flight = self.__calls.get(key)
+        if flight is None:
+            flight = self.__calls[key] = _Flight(deadline)
+            slot = current_admission_slot()
+            if slot is not None:
+                slot.hold()
+            # Run in a task so that a cancelled caller (e.g. a client that disconnected) does not cancel the
+            # computation for everybody else.
+            task = flight.task = asyncio.get_running_loop().create_task(
+                self.__run(flight, function), context=context_without_deadline()
+            )
+
+            def done(_: asyncio.Task[T]):
+                self.__forget(key, flight)
+                if slot is not None:
+                    slot.release()
+
+            task.add_done_callback(done)
+        else:
+            flight.extend(deadline)
+        return await asyncio.shield(flight.task)
+
+    @staticmethod
+    async def __run(flight: _Flight[T], function: Callable[[], Awaitable[T]]) -> T:
+        """
+        :raises DeadlineExceededException: If the deadline of every caller is exceeded before the computation ends
+        """
+        timeout = flight.timeout = asyncio.timeout_at(_loop_time(flight.deadline))
+        try:
+            async with timeout:
+                return await function()
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            raise DeadlineExceededException(
+                'The deadline of every request waiting for the computation is exceeded'
+            )
+
+    def __forget(self, key: Hashable, flight: _Flight[T]):
+        if self.__calls.get(key) is flight:
+            del self.__calls[key]
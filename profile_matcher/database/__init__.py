@@ -1,7 +1,87 @@
 from profile_matcher.database._async_session_manager import (
     AsyncSessionManager,
+    DATABASE_SHARD_URLS,
+    SHARD_MAP_PATH,
+    ShardedSessionManager,
     session_manager,
+    session_manager_for,
+    sharded_session_manager,
     get_db_session,
+    get_db_session_factory,
+    get_db_session_factories,
+    get_db_connection_factory,
+)
+from profile_matcher.database._exception import (
+    ShardMapException,
+    ShardRebalanceException,
+)
+from profile_matcher.database._invalidation import (
+    CACHE_INVALIDATION,
+    CATALOG_CHANNEL,
+    PLAYER_CHANNEL,
+    PLAYER_INVALIDATION,
+    MAX_PAYLOAD_BYTES,
+    InvalidationListener,
+    connect_listener,
+    decode_player_ids,
+    invalidation_listener,
+    notify_catalog,
+    notify_players,
+    player_payloads,
+    publish_catalog_version,
+)
+from profile_matcher.database._query_stats import (
+    QueryStats,
+    count_queries,
+    current_query_stats,
+    instrument_engine,
+)
+from profile_matcher.database._rebalancer import RebalanceReport, ShardRebalancer
+from profile_matcher.database._shard_map import SHARD_SLOTS, ShardMap, player_slot
+from profile_matcher.database._unit_of_work import UnitOfWork, get_unit_of_work
+from profile_matcher.database._write_behind import (
+    ActiveCampaignsWriteBehind,
+    active_campaigns_write_behind,
 )
 
-__all__ = ['AsyncSessionManager', 'session_manager', 'get_db_session']
+__all__ = [
+    'AsyncSessionManager',
+    'DATABASE_SHARD_URLS',
+    'SHARD_MAP_PATH',
+    'ShardedSessionManager',
+    'session_manager',
+    'session_manager_for',
+    'sharded_session_manager',
+    'get_db_session',
+    'get_db_session_factory',
+    'get_db_session_factories',
+    'get_db_connection_factory',
+    'CACHE_INVALIDATION',
+    'CATALOG_CHANNEL',
+    'PLAYER_CHANNEL',
+    'PLAYER_INVALIDATION',
+    'MAX_PAYLOAD_BYTES',
+    'InvalidationListener',
+    'connect_listener',
+    'decode_player_ids',
+    'invalidation_listener',
+    'notify_catalog',
+    'notify_players',
+    'player_payloads',
+    'publish_catalog_version',
+    'QueryStats',
+    'count_queries',
+    'current_query_stats',
+    'instrument_engine',
+    'ShardMapException',
+    'ShardRebalanceException',
+    'RebalanceReport',
+    'ShardRebalancer',
+    'SHARD_SLOTS',
+    'ShardMap',
+    'player_slot',
+    'UnitOfWork',
+    'get_unit_of_work',
+    'ActiveCampaignsWriteBehind',
+    'active_campaigns_write_behind',
+]
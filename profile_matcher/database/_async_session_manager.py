@@ -1,7 +1,17 @@
+import asyncio
 import contextlib
 import os
 from logging import Logger
-from typing import AsyncIterator
+from typing import (
+    AsyncContextManager,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    Sequence,
+    TypeVar,
+)
 
 import asyncpg
 from dotenv import load_dotenv
@@ -11,22 +21,41 @@ from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     AsyncEngine,
 )
+from fastapi import Request
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ._exception import AsyncSessionManagerException
+from ._query_stats import instrument_engine
+from ._shard_map import ShardMap
 
 load_dotenv()  # This will load the .env variables
 POSTGRES_URL = os.getenv('DATABASE_URL')
+# Databases the players are sharded over (comma separated URLs), and the file of the map of the slots to the shards
+# (by default, the slots are spread evenly). Unset: every player is in the database of DATABASE_URL.
+DATABASE_SHARD_URLS = [
+    url.strip()
+    for url in os.getenv('DATABASE_SHARD_URLS', '').split(',')
+    if url.strip()
+]
+SHARD_MAP_PATH = os.getenv('SHARD_MAP_PATH')
+
+T = TypeVar('T')
 
 
 class AsyncSessionManager:
-    def __init__(self):
-        self.__engine = create_async_engine(POSTGRES_URL)
+    def __init__(self, url: Optional[str] = None):
+        self.__engine = create_async_engine(url or POSTGRES_URL)
+        instrument_engine(self.__engine)
         # We could also have two session makers, one for read and one for write. read_session_maker would
         # have autocommit=True
+        # The objects stay loaded after a commit: with asyncio, an expired attribute cannot be loaded implicitly, and
+        # the routes commit as soon as they are done reading
         self.__session_maker = async_sessionmaker(
-            autocommit=False, bind=self.__engine, class_=AsyncSession
+            autocommit=False,
+            bind=self.__engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
         )
         self.__loger = Logger('AsyncSessionManager')
 
@@ -116,10 +145,120 @@ class AsyncSessionManager:
             await conn.run_sync(SQLModel.metadata.create_all)
 
 
+class ShardedSessionManager:
+    """
+    One session manager per shard of the players. A player is routed to its shard by the hash of its id (see ShardMap),
+    the operations on every player (audience, batch jobs) are run on all the shards at once and their results gathered.
+    The map may use fewer shards than there are databases: the databases beyond are added shards, holding no player
+    until they are rebalanced to.
+    """
+
+    def __init__(self, urls: Sequence[str], shard_map: Optional[ShardMap] = None):
+        if not urls:
+            raise AsyncSessionManagerException('No database to shard the players over')
+        self.managers = [AsyncSessionManager(url) for url in urls]
+        self.shard_map = shard_map or ShardMap.uniform(len(urls))
+        if self.shard_map.shard_count > len(urls):
+            raise AsyncSessionManagerException(
+                f'The shard map has {self.shard_map.shard_count} shards, {len(urls)} databases are given'
+            )
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.managers)
+
+    def shard_of(self, player_id: str) -> int:
+        return self.shard_map.shard_of(player_id)
+
+    def for_player(self, player_id: str) -> AsyncSessionManager:
+        """
+        Return the session manager of the shard holding the player.
+        """
+        return self.managers[self.shard_of(player_id)]
+
+    def group(self, player_ids: Iterable[str]) -> dict[int, list[str]]:
+        """
+        Split the player ids by shard.
+        """
+        return self.shard_map.group(player_ids)
+
+    async def scatter(
+        self, operation: Callable[[AsyncSessionManager], Awaitable[T]]
+    ) -> list[T]:
+        """
+        Run the operation on every shard at once.
+        :return: The result of every shard, in the order of the shards
+        """
+        return list(
+            await asyncio.gather(*(operation(manager) for manager in self.managers))
+        )
+
+    async def create_database_if_not_exists(self):
+        await self.scatter(AsyncSessionManager.create_database_if_not_exists)
+
+    async def create_all(self):
+        await self.scatter(AsyncSessionManager.create_all)
+
+    async def close(self):
+        await self.scatter(AsyncSessionManager.close)
+
+
 # Create the session manager
 session_manager = AsyncSessionManager()
 
+# Until the map is saved (by the first rebalancing), the slots are spread evenly
+sharded_session_manager = (
+    ShardedSessionManager(
+        DATABASE_SHARD_URLS,
+        ShardMap.load(SHARD_MAP_PATH)
+        if SHARD_MAP_PATH and os.path.exists(SHARD_MAP_PATH)
+        else None,
+    )
+    if DATABASE_SHARD_URLS
+    else None
+)
+
 
-async def get_db_session():
-    async with session_manager.session() as session:
+def session_manager_for(player_id: Optional[str] = None) -> AsyncSessionManager:
+    """
+    Return the session manager of the shard of the player when the players are sharded, the session manager of
+    DATABASE_URL otherwise (or without player).
+    """
+    if sharded_session_manager is None or player_id is None:
+        return session_manager
+    return sharded_session_manager.for_player(player_id)
+
+
+async def get_db_session(request: Request):
+    """
+    Session of the database of the route: the shard of the player of a single-player route (player_id path parameter)
+    when the players are sharded.
+    """
+    manager = session_manager_for(request.path_params.get('player_id'))
+    async with manager.session() as session:
         yield session
+
+
+def get_db_session_factory() -> Callable[[], AsyncContextManager[AsyncSession]]:
+    """
+    Return a factory of sessions, for the routes that need a session outside of the dependency scope (e.g. while a
+    response is streamed, since the dependencies are closed before the response is sent).
+    """
+    return session_manager.session
+
+
+def get_db_session_factories() -> list[Callable[[], AsyncContextManager[AsyncSession]]]:
+    """
+    Return a factory of sessions per database holding players (every shard when the players are sharded), for the
+    routes reading all the players.
+    """
+    if sharded_session_manager is None:
+        return [session_manager.session]
+    return [manager.session for manager in sharded_session_manager.managers]
+
+
+def get_db_connection_factory() -> Callable[[], AsyncContextManager[AsyncConnection]]:
+    """
+    Return a factory of connections (each one in its own transaction), for the bulk operations that bypass the ORM.
+    """
+    return session_manager.connect
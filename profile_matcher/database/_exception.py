@@ -1,2 +1,10 @@
 class AsyncSessionManagerException(Exception):
     pass
+
+
+class ShardMapException(Exception):
+    pass
+
+
+class ShardRebalanceException(Exception):
+    pass
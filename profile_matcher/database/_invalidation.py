@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+from logging import getLogger
+from typing import Awaitable, Callable, Iterable, Optional
+
+import asyncpg
+from dotenv import load_dotenv
+from sqlalchemy import ARRAY, String, bindparam, make_url, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from ._async_session_manager import POSTGRES_URL, session_manager
+
+load_dotenv()
+
+# Writers notify the other workers of the changes they commit, so that the workers drop what they cached in process
+CACHE_INVALIDATION = os.getenv('CACHE_INVALIDATION', 'true').lower() == 'true'
+# The workers cache no player: the players changed are only notified for the consumers outside of the service
+PLAYER_INVALIDATION = os.getenv('PLAYER_INVALIDATION', 'false').lower() == 'true'
+
+# Payload: a JSON list of the ids of the players changed
+PLAYER_CHANNEL = 'player_profile_changed'
+# Payload: the version of the new campaign catalog
+CATALOG_CHANNEL = 'campaign_catalog_changed'
+
+# Postgres refuses a payload of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+# The notifications are only delivered when the transaction commits, and are dropped if it rolls back
+_NOTIFY = text(
+    'SELECT pg_notify(:channel, payload) FROM UNNEST(:payloads) AS payload'
+).bindparams(bindparam('payloads', type_=ARRAY(String)))
+
+
+def player_payloads(player_ids: Iterable[str]) -> list[str]:
+    """
+    Pack the player ids, each one once, in as few payloads as possible.
+    """
+    payloads = []
+    batch: list[str] = []
+    size = 2
+    for player_id in dict.fromkeys(player_ids):
+        # Quotes and separator included
+        id_size = len(json.dumps(player_id).encode()) + 1
+        if batch and size + id_size > MAX_PAYLOAD_BYTES:
+            payloads.append(json.dumps(batch, separators=(',', ':')))
+            batch, size = [], 2
+        batch.append(player_id)
+        size += id_size
+    if batch:
+        payloads.append(json.dumps(batch, separators=(',', ':')))
+    return payloads
+
+
+def decode_player_ids(payload: str) -> list[str]:
+    return json.loads(payload)
+
+
+async def notify_players(connection: AsyncConnection, player_ids: Iterable[str]):
+    """
+    Notify the changes of the players, in the transaction of connection: one statement for all the players of the
+    transaction, sent to the listeners when it commits. Only with CACHE_INVALIDATION and PLAYER_INVALIDATION.
+    """
+    if not CACHE_INVALIDATION or not PLAYER_INVALIDATION:
+        return
+    payloads = player_payloads(player_ids)
+    if payloads:
+        await connection.execute(
+            _NOTIFY, {'channel': PLAYER_CHANNEL, 'payloads': payloads}
+        )
+
+
+async def notify_catalog(connection: AsyncConnection, version: str):
+    """
+    Notify a new version of the campaign catalog, in the transaction of connection.
+    """
+    if CACHE_INVALIDATION:
+        await connection.execute(
+            _NOTIFY, {'channel': CATALOG_CHANNEL, 'payloads': [version]}
+        )
+
+
+async def publish_catalog_version(version: str):
+    """
+    Notify the other workers of the catalog version this one switched to, so that they refresh theirs right away.
+    """
+    try:
+        async with session_manager.connect() as connection:
+            await notify_catalog(connection, version)
+    except SQLAlchemyError as e:
+        getLogger('uvicorn').error(f'Error in notifying catalog version {version}: {e}')
+
+
+class InvalidationListener:
+    """
+    Listen to the invalidation channels on a dedicated connection, and call the callbacks of a channel with the payload
+    of every notification, as soon as it is received. When the connection is lost, it is opened again (after
+    reconnect_delay seconds, doubled at every failure up to max_reconnect_delay). The notifications sent meanwhile are
+    lost: the callbacks of on_connection_change are called with False when the connection is lost and True when it is
+    back, for the caches to fall back on their expiry (and refresh what they hold) until then.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Awaitable[asyncpg.Connection]],
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+    ):
+        self.__connect = connect
+        self.__reconnect_delay = reconnect_delay
+        self.__max_reconnect_delay = max_reconnect_delay
+        self.__callbacks: dict[str, list[Callable[[str], None]]] = {}
+        self.__connection_callbacks: list[Callable[[bool], None]] = []
+        self.__connection: Optional[asyncpg.Connection] = None
+        # The connection given to start belongs to the caller, the ones opened again belong to the listener
+        self.__owns_connection = False
+        self.__lost = asyncio.Event()
+        self.__task: Optional[asyncio.Task] = None
+        self.__logger = getLogger('uvicorn')
+
+        self.notifications = 0
+        self.failed_callbacks = 0
+        self.lost_connections = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.__connection is not None and not self.__connection.is_closed()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'connected': self.connected,
+            'notifications': self.notifications,
+            'failed_callbacks': self.failed_callbacks,
+            'lost_connections': self.lost_connections,
+        }
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]):
+        """
+        Call callback with the payload of every notification of channel. Subscribe before start. A callback subscribed
+        again is still called once.
+        """
+        callbacks = self.__callbacks.setdefault(channel, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def on_connection_change(self, callback: Callable[[bool], None]):
+        """
+        Call callback with True when the listener starts listening (again), with False when the connection is lost. A
+        callback registered again is still called once.
+        """
+        if callback not in self.__connection_callbacks:
+            self.__connection_callbacks.append(callback)
+
+    async def start(self, connection: Optional[asyncpg.Connection] = None):
+        """
+        Listen on connection (left open by stop), or on a new connection, then keep listening in the background.
+        A failed first connection is retried in the background.
+        """
+        if self.__task is not None:
+            return
+        self.__lost.clear()
+        if connection is not None:
+            await self.__listen(connection, owned=False)
+        self.__task = asyncio.create_task(self.__run())
+
+    async def stop(self):
+        """
+        Stop listening, and close the connection if it was opened by the listener.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+            self.__task = None
+        connection, self.__connection = self.__connection, None
+        if connection is None or connection.is_closed():
+            return
+        connection.remove_termination_listener(self.__on_termination)
+        for channel in self.__callbacks:
+            await connection.remove_listener(channel, self.__dispatch)
+        if self.__owns_connection:
+            await connection.close()
+        self.__logger.info(f'Invalidation listener stopped: {self.stats()}')
+
+    async def __listen(self, connection: asyncpg.Connection, owned: bool):
+        for channel in self.__callbacks:
+            await connection.add_listener(channel, self.__dispatch)
+        connection.add_termination_listener(self.__on_termination)
+        self.__connection = connection
+        self.__owns_connection = owned
+        self.__logger.info(f'Listening to {", ".join(self.__callbacks)}')
+        self.__notify_connection_change(True)
+
+    def __dispatch(
+        self, connection: asyncpg.Connection, pid: int, channel: str, payload: str
+    ):
+        self.notifications += 1
+        for callback in self.__callbacks.get(channel, ()):
+            # Never let a callback stop the others
+            try:
+                callback(payload)
+            except Exception as e:
+                self.failed_callbacks += 1
+                self.__logger.error(f'Error in invalidation callback of {channel}: {e}')
+
+    def __on_termination(self, connection: asyncpg.Connection):
+        if connection is self.__connection:
+            self.__lost.set()
+
+    def __notify_connection_change(self, connected: bool):
+        for callback in self.__connection_callbacks:
+            try:
+                callback(connected)
+            except Exception as e:
+                self.failed_callbacks += 1
+                self.__logger.error(f'Error in invalidation connection callback: {e}')
+
+    async def __run(self):
+        delay = self.__reconnect_delay
+        while True:
+            if self.__connection is None:
+                connection = None
+                try:
+                    connection = await self.__connect()
+                    await self.__listen(connection, owned=True)
+                except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                    if connection is not None:
+                        connection.terminate()
+                    self.__logger.error(
+                        f'Error in connecting the invalidation listener, retrying in {delay}s: {e}'
+                    )
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.__max_reconnect_delay)
+                    continue
+                delay = self.__reconnect_delay
+            await self.__lost.wait()
+            self.__lost.clear()
+            self.__connection = None
+            self.lost_connections += 1
+            self.__logger.warning('Invalidation listener connection lost, reconnecting')
+            self.__notify_connection_change(False)
+
+
+async def connect_listener() -> asyncpg.Connection:
+    """
+    Open a connection to the database of DATABASE_URL, outside of the pool: a listening connection is never released.
+    """
+    url = make_url(POSTGRES_URL).set(drivername='postgresql')
+    return await asyncpg.connect(url.render_as_string(hide_password=False))
+
+
+invalidation_listener = InvalidationListener(connect_listener)
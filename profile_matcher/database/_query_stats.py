@@ -0,0 +1,101 @@
+import contextlib
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+_current_query_stats: ContextVar[Optional['QueryStats']] = ContextVar(
+    'current_query_stats', default=None
+)
+
+
+@dataclass(slots=True)
+class QueryStats:
+    """
+    Statements executed, rows returned or affected and time spent in the database, within a count_queries scope. The
+    rows of a streamed query (server-side cursor) are not counted.
+    """
+
+    statements: int = 0
+    rows: int = 0
+    duration: float = 0.0
+    statement_counts: Counter = field(default_factory=Counter, repr=False)
+    parent: Optional['QueryStats'] = field(default=None, repr=False)
+
+    def repeated_statements(self, threshold: int) -> dict[str, int]:
+        """
+        Return the statements executed at least threshold times, a sign of N+1 queries.
+        """
+        return {
+            statement: count
+            for statement, count in self.statement_counts.items()
+            if count >= threshold
+        }
+
+    def server_timing(self) -> str:
+        """
+        Format the stats as a Server-Timing header entry.
+        """
+        return (
+            f'db;dur={self.duration * 1000:.1f};'
+            f'desc="{self.statements} statements, {self.rows} rows"'
+        )
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    return _current_query_stats.get()
+
+
+@contextlib.contextmanager
+def count_queries() -> Iterator[QueryStats]:
+    """
+    Count the statements executed in this scope (and in the tasks it starts) by the instrumented engines. Scopes nest:
+    what is counted in a scope is also counted in the enclosing ones.
+    """
+    stats = QueryStats(parent=_current_query_stats.get())
+    token = _current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_query_stats.reset(token)
+
+
+def __before_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    if _current_query_stats.get() is not None:
+        connection.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+
+def __after_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    stats = _current_query_stats.get()
+    start_times = connection.info.get('query_start_times')
+    if stats is None or not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    # From the command status (SELECT, INSERT, UPDATE, DELETE), -1 when unknown: a streamed query has not fetched yet
+    rows = max(cursor.rowcount, 0)
+    while stats is not None:
+        stats.statements += 1
+        stats.rows += rows
+        stats.duration += duration
+        stats.statement_counts[statement] += 1
+        stats = stats.parent
+
+
+def instrument_engine(engine: Engine | AsyncEngine):
+    """
+    Count the statements of the engine in the active count_queries scope. Instrumenting an engine twice has no effect.
+    """
+    if isinstance(engine, AsyncEngine):
+        engine = engine.sync_engine
+    if not event.contains(engine, 'before_cursor_execute', __before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', __before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', __after_cursor_execute)
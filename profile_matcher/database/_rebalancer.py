@@ -0,0 +1,245 @@
+import os
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Optional
+
+from sqlalchemy import Select, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from ._async_session_manager import ShardedSessionManager
+from ._exception import ShardRebalanceException
+from ._shard_map import ShardMap, player_slot
+from .models import Clan, Device, Inventory, PlayerProfile
+
+_PLAYERS = PlayerProfile.__table__
+_CLANS = Clan.__table__
+_INVENTORIES = Inventory.__table__
+_DEVICES = Device.__table__
+# The inventory ids come from a sequence of every shard: a copied inventory gets a new id
+_INVENTORY_COLUMNS = [column for column in _INVENTORIES.columns if column.name != 'id']
+
+
+@dataclass
+class RebalanceReport:
+    moved_slots: int = 0
+    moved_players: int = 0
+    # Players moved from a shard to another, by (source, destination)
+    moves: dict[tuple[int, int], int] = field(default_factory=dict)
+
+
+class ShardRebalancer:
+    """
+    Move the players between the shards to match a new shard map, in three steps, so that a player can always be read:
+    1. the players of the slots moved are copied to their new shard (clan, player, inventory and devices), batch_size
+       at a time, each batch in its own transaction on the destination. A copy can be run again, it overwrites the
+       player on the destination;
+    2. the new map is switched to (and saved to map_path, if given): the players are read from their new shard by the
+       workers that load it. rebalance stops there, the players moved are left on their old shard too;
+    3. once every worker reads the new map (restarted), delete_moved deletes the players from the shards they are no
+       longer on.
+    Until they restart, the workers reading the previous map keep writing the players moved (ingested profiles,
+    active campaigns) to their old shard, and can add new players there. Every write bumps the version of the player:
+    before deleting them, delete_moved copies again the players that are at a higher version on their old shard than
+    on their new one, or missing from it. A player written on both shards after its copy keeps the write of the
+    highest version.
+    """
+
+    def __init__(
+        self,
+        shards: ShardedSessionManager,
+        batch_size: int = 1000,
+        map_path: Optional[str | os.PathLike] = None,
+    ):
+        self.__shards = shards
+        self.__batch_size = batch_size
+        self.__map_path = map_path
+        self.__logger = getLogger('uvicorn')
+
+    async def rebalance(self, target: ShardMap) -> RebalanceReport:
+        """
+        Copy the players to the shards of target, then switch to it. The players moved are not deleted from their old
+        shard, where the workers still reading the previous map find them: see delete_moved.
+        :raises ShardRebalanceException: If target uses more shards than there are databases, or a copy fails. A
+            failed copy leaves the current map in place (the players copied are left on both shards, to be overwritten
+            by the next run).
+        """
+        current = self.__shards.shard_map
+        if target.shard_count > self.__shards.shard_count:
+            raise ShardRebalanceException(
+                f'The shard map has {target.shard_count} shards, there are {self.__shards.shard_count} databases'
+            )
+        moved_slots = current.moved_slots(target)
+        report = RebalanceReport(moved_slots=len(moved_slots))
+        if not moved_slots:
+            return report
+
+        slots = len(current.assignments)
+        moves: dict[tuple[int, int], list[str]] = {}
+        try:
+            for source in {source for source, _ in moved_slots.values()}:
+                for player_ids in await self.__player_ids(source):
+                    for player_id in player_ids:
+                        move = moved_slots.get(player_slot(player_id, slots))
+                        if move is not None:
+                            moves.setdefault(move, []).append(player_id)
+
+            for (source, destination), player_ids in moves.items():
+                for start in range(0, len(player_ids), self.__batch_size):
+                    await self.__copy(
+                        source,
+                        destination,
+                        player_ids[start : start + self.__batch_size],
+                    )
+                report.moves[(source, destination)] = len(player_ids)
+                report.moved_players += len(player_ids)
+        except SQLAlchemyError as e:
+            raise ShardRebalanceException(f'Could not copy the players: {e}') from e
+
+        self.__shards.shard_map = target
+        if self.__map_path is not None:
+            target.save(self.__map_path)
+        self.__logger.info(
+            f'Switched to {target}, copied {report.moved_players} players ({report.moved_slots} slots): delete them '
+            f'from their old shard once every worker reads the new map'
+        )
+        return report
+
+    async def delete_moved(self) -> dict[int, int]:
+        """
+        Delete from every shard the players that are on another shard in the current map, batch_size at a time. A
+        player written on its old shard since it was copied (at a higher version than on its new shard, or missing
+        from it) is copied again first. Only run once every worker reads the current map: the ones still reading the
+        previous map would not find the players moved anymore, and their writes would be lost.
+        :return: The number of players deleted, by shard
+        :raises ShardRebalanceException: If a copy or a deletion fails. The players not deleted yet are left where they
+            are not read, the deletion can be run again.
+        """
+        shard_map = self.__shards.shard_map
+        deleted: dict[int, int] = {}
+        copied = 0
+        try:
+            for shard in range(self.__shards.shard_count):
+                for player_ids in await self.__player_ids(shard):
+                    moves: dict[int, list[str]] = {}
+                    for player_id in player_ids:
+                        destination = shard_map.shard_of(player_id)
+                        if destination != shard:
+                            moves.setdefault(destination, []).append(player_id)
+                    for destination, moved in moves.items():
+                        versions = await self.__versions(shard, moved)
+                        copies = await self.__versions(destination, moved)
+                        outdated = [
+                            player_id
+                            for player_id in moved
+                            if versions[player_id] > copies.get(player_id, -1)
+                        ]
+                        if outdated:
+                            await self.__copy(shard, destination, outdated)
+                            copied += len(outdated)
+                        await self.__delete(shard, moved)
+                        deleted[shard] = deleted.get(shard, 0) + len(moved)
+        except SQLAlchemyError as e:
+            raise ShardRebalanceException(
+                f'Could not delete the players moved: {e}'
+            ) from e
+        self.__logger.info(
+            f'Deleted the players moved from their old shard: {deleted} ({copied} written since their copy, copied '
+            f'again)'
+        )
+        return deleted
+
+    async def __versions(self, shard: int, player_ids: list[str]) -> dict[str, int]:
+        """
+        Version of the players of the shard, for the ones it has.
+        """
+        async with self.__shards.managers[shard].connect() as connection:
+            result = await connection.execute(
+                select(_PLAYERS.c.player_id, _PLAYERS.c.version).where(
+                    _PLAYERS.c.player_id.in_(player_ids)
+                )
+            )
+            return dict(result.all())
+
+    async def __player_ids(self, shard: int) -> list[list[str]]:
+        """
+        Ids of the players of the shard, by chunks.
+        """
+        async with self.__shards.managers[shard].connect() as connection:
+            result = await connection.stream(
+                select(_PLAYERS.c.player_id).execution_options(
+                    yield_per=self.__batch_size
+                )
+            )
+            return [
+                [player_id for (player_id,) in rows]
+                async for rows in result.partitions()
+            ]
+
+    async def __copy(self, source: int, destination: int, player_ids: list[str]):
+        async with self.__shards.managers[source].connect() as connection:
+            players = await self.__rows(
+                connection, select(_PLAYERS).where(_PLAYERS.c.player_id.in_(player_ids))
+            )
+            clans = await self.__rows(
+                connection,
+                select(_CLANS).where(
+                    _CLANS.c.id.in_({player['clan_id'] for player in players})
+                ),
+            )
+            inventories = await self.__rows(
+                connection,
+                select(*_INVENTORY_COLUMNS).where(
+                    _INVENTORIES.c.player_id.in_(player_ids)
+                ),
+            )
+            devices = await self.__rows(
+                connection, select(_DEVICES).where(_DEVICES.c.player_id.in_(player_ids))
+            )
+
+        async with self.__shards.managers[destination].connect() as connection:
+            if clans:
+                await connection.execute(
+                    insert(_CLANS).on_conflict_do_nothing(index_elements=['id']),
+                    clans,
+                )
+            if players:
+                statement = insert(_PLAYERS)
+                await connection.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=['player_id'],
+                        set_={
+                            column.name: statement.excluded[column.name]
+                            for column in _PLAYERS.columns
+                            if column.name != 'player_id'
+                        },
+                    ),
+                    players,
+                )
+            await self.__delete_children(connection, player_ids)
+            if inventories:
+                await connection.execute(insert(_INVENTORIES), inventories)
+            if devices:
+                await connection.execute(insert(_DEVICES), devices)
+
+    async def __delete(self, shard: int, player_ids: list[str]):
+        async with self.__shards.managers[shard].connect() as connection:
+            await self.__delete_children(connection, player_ids)
+            await connection.execute(
+                delete(_PLAYERS).where(_PLAYERS.c.player_id.in_(player_ids))
+            )
+
+    @staticmethod
+    async def __rows(connection: AsyncConnection, statement: Select) -> list[dict]:
+        result = await connection.execute(statement)
+        return [dict(row) for row in result.mappings()]
+
+    @staticmethod
+    async def __delete_children(connection: AsyncConnection, player_ids: list[str]):
+        await connection.execute(
+            delete(_INVENTORIES).where(_INVENTORIES.c.player_id.in_(player_ids))
+        )
+        await connection.execute(
+            delete(_DEVICES).where(_DEVICES.c.player_id.in_(player_ids))
+        )
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+from typing import Iterable, Sequence
+
+from ._exception import ShardMapException
+
+# Number of slots the players are hashed into. A slot is the unit moved between shards: it must never change once
+# players are stored, and is large enough to spread the players evenly over many more shards than we will ever have.
+SHARD_SLOTS = 1024
+
+
+def player_slot(player_id: str, slots: int = SHARD_SLOTS) -> int:
+    """
+    Slot of the player: a stable hash of the player id (the same in every process, unlike hash()).
+    """
+    digest = hashlib.blake2b(player_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % slots
+
+
+class ShardMap:
+    """
+    Which shard holds the players of every slot. The players are hashed into a fixed number of slots, and the slots
+    are assigned to the shards: moving players between shards is moving slots, only the players of the slots moved
+    change shard.
+    """
+
+    def __init__(self, assignments: Sequence[int], shard_count: int):
+        if not assignments:
+            raise ShardMapException('A shard map needs at least one slot')
+        if any(shard < 0 or shard >= shard_count for shard in assignments):
+            raise ShardMapException(
+                f'Slot assigned to a shard outside 0..{shard_count - 1}'
+            )
+        self.assignments = tuple(assignments)
+        self.shard_count = shard_count
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, ShardMap)
+            and self.assignments == other.assignments
+            and self.shard_count == other.shard_count
+        )
+
+    def __repr__(self) -> str:
+        return f'ShardMap(shard_count={self.shard_count}, slots={self.slot_counts()})'
+
+    @classmethod
+    def uniform(cls, shard_count: int, slots: int = SHARD_SLOTS) -> 'ShardMap':
+        """
+        Spread the slots evenly over shard_count shards.
+        """
+        return cls([slot % shard_count for slot in range(slots)], shard_count)
+
+    def shard_of(self, player_id: str) -> int:
+        return self.assignments[player_slot(player_id, len(self.assignments))]
+
+    def group(self, player_ids: Iterable[str]) -> dict[int, list[str]]:
+        """
+        Split the player ids by shard.
+        """
+        groups: dict[int, list[str]] = {}
+        for player_id in player_ids:
+            groups.setdefault(self.shard_of(player_id), []).append(player_id)
+        return groups
+
+    def slot_counts(self) -> list[int]:
+        """
+        Number of slots of every shard.
+        """
+        counts = Counter(self.assignments)
+        return [counts[shard] for shard in range(self.shard_count)]
+
+    def rebalanced(self, shard_count: int) -> 'ShardMap':
+        """
+        Map of the slots over shard_count shards (more or fewer than now), moving as few slots as possible: the slots
+        of the shards removed and the slots beyond the fair share of a shard go to the shards below their share.
+        """
+        slots = len(self.assignments)
+        share, extra = divmod(slots, shard_count)
+        # The first shards take the remaining slots
+        targets = [share + (shard < extra) for shard in range(shard_count)]
+        kept = [0] * shard_count
+        assignments = list(self.assignments)
+        homeless = []
+        for slot, shard in enumerate(assignments):
+            if shard < shard_count and kept[shard] < targets[shard]:
+                kept[shard] += 1
+            else:
+                homeless.append(slot)
+        receivers = (
+            shard
+            for shard in range(shard_count)
+            for _ in range(targets[shard] - kept[shard])
+        )
+        for slot, shard in zip(homeless, receivers):
+            assignments[slot] = shard
+        return ShardMap(assignments, shard_count)
+
+    def moved_slots(self, target: 'ShardMap') -> dict[int, tuple[int, int]]:
+        """
+        Slots assigned to another shard in target, with their shard here and in target.
+        :raises ShardMapException: If the maps do not have the same slots
+        """
+        if len(target.assignments) != len(self.assignments):
+            raise ShardMapException('The shard maps do not have the same slots')
+        return {
+            slot: (source, destination)
+            for slot, (source, destination) in enumerate(
+                zip(self.assignments, target.assignments)
+            )
+            if source != destination
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {'shard_count': self.shard_count, 'assignments': self.assignments}
+        )
+
+    @classmethod
+    def from_json(cls, document: str | bytes) -> 'ShardMap':
+        """
+        :raises ShardMapException: If the document is not a shard map
+        """
+        try:
+            data = json.loads(document)
+            return cls(data['assignments'], data['shard_count'])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ShardMapException(f'Invalid shard map: {e}') from e
+
+    def save(self, path: str | os.PathLike):
+        """
+        Write the map to path, replaced in one rename so that a reader never sees a partial map.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(
+            'w', dir=directory, delete=False, suffix='.tmp'
+        ) as file:
+            file.write(self.to_json())
+        os.replace(file.name, path)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> 'ShardMap':
+        """
+        :raises ShardMapException: If the file cannot be read or is not a shard map
+        """
+        try:
+            with open(path, 'rb') as file:
+                return cls.from_json(file.read())
+        except OSError as e:
+            raise ShardMapException(f'Cannot read the shard map {path}: {e}') from e
@@ -0,0 +1,58 @@
+import contextlib
+import time
+from typing import AsyncContextManager, AsyncIterator, Callable, Optional
+
+from fastapi import Request
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from profile_matcher.concurrency import admission_controller, enforce_deadline
+from ._async_session_manager import session_manager_for
+
+
+class UnitOfWork:
+    """
+    Database work of a request, split in stages. A stage gets a session, and a pooled connection, for its own duration
+    only: the transaction is committed (or rolled back) and the connection is back in the pool as soon as the stage
+    ends, instead of being held while the request waits on something else (an external call, the matching). The
+    objects loaded in a stage stay usable afterwards.
+
+    A stage is cancelled when the deadline of the request expires. The time spent waiting for a connection is reported
+    to on_pool_wait.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]],
+        on_pool_wait: Optional[Callable[[float], None]] = None,
+    ):
+        self.__session_factory = session_factory
+        self.__on_pool_wait = on_pool_wait
+
+    @contextlib.asynccontextmanager
+    async def stage(self) -> AsyncIterator[AsyncSession]:
+        """
+        Run a database stage in its own transaction, committed when the stage ends without error.
+        :raises DeadlineExceededException: If the deadline of the request expires during the stage
+        """
+        async with self.__session_factory() as session, enforce_deadline():
+            try:
+                start = time.perf_counter()
+                await session.connection()
+                if self.__on_pool_wait is not None:
+                    self.__on_pool_wait(time.perf_counter() - start)
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+
+def get_unit_of_work(request: Request) -> UnitOfWork:
+    """
+    Unit of work on the database of the route: the shard of the player of a single-player route (player_id path
+    parameter) when the players are sharded.
+    """
+    return UnitOfWork(
+        session_manager_for(request.path_params.get('player_id')).session,
+        on_pool_wait=admission_controller.record_pool_wait,
+    )
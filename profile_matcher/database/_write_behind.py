@@ -0,0 +1,235 @@
+import asyncio
+import json
+import os
+from logging import getLogger
+from typing import AsyncContextManager, Callable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import ARRAY, Integer, String, bindparam, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from ._async_session_manager import (
+    ShardedSessionManager,
+    session_manager,
+    sharded_session_manager,
+)
+from ._invalidation import notify_players
+
+load_dotenv()
+
+# One statement for the whole batch. The campaign lists are sent as JSON documents, since Postgres cannot unnest an
+# array of arrays of different lengths. As for a single update, a player is only updated if it is still at the version
+# its campaigns were matched on: the players updated meanwhile are left out of the returned ids.
+_UPDATE_ACTIVE_CAMPAIGNS = text("""
+    UPDATE "player-profile" AS player
+    SET active_campaigns = ARRAY(
+            SELECT campaign.value
+            FROM jsonb_array_elements_text(batch.active_campaigns::jsonb)
+                WITH ORDINALITY AS campaign(value, position)
+            ORDER BY campaign.position
+        ),
+        version = player.version + 1
+    FROM UNNEST(:player_ids, :versions, :active_campaigns)
+        AS batch(player_id, version, active_campaigns)
+    WHERE player.player_id = batch.player_id AND player.version = batch.version
+    RETURNING player.player_id
+""").bindparams(
+    bindparam('player_ids', type_=ARRAY(String)),
+    bindparam('versions', type_=ARRAY(Integer)),
+    bindparam('active_campaigns', type_=ARRAY(String)),
+)
+
+
+class ActiveCampaignsWriteBehind:
+    """
+    Write-behind queue for the active campaigns of the players. Updates are merged per player (the last one wins) and
+    applied by a background task every flush_interval seconds, or as soon as batch_size players are waiting, in a
+    single UPDATE. The queue is bounded: when it is full, submit refuses the update and the caller writes it itself.
+    With shards, the batch is split by shard and every shard is updated at once. An update is dropped, and counted as
+    stale, if the player was updated since the version it was read at.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        flush_interval: float = 0.005,
+        batch_size: int = 500,
+        max_queue_size: int = 10_000,
+        connect: Optional[Callable[[], AsyncContextManager[AsyncConnection]]] = None,
+        shards: Optional[ShardedSessionManager] = None,
+    ):
+        self.enabled = enabled
+        self.__flush_interval = flush_interval
+        self.__batch_size = batch_size
+        self.__max_queue_size = max_queue_size
+        self.__connect = connect or session_manager.connect
+        self.__shards = shards
+        # Version the player was read at and its new active campaigns, per player
+        self.__pending: dict[str, tuple[int, list[str]]] = {}
+        # Batch being written, still more recent than the database until the write is done
+        self.__in_flight: dict[str, tuple[int, list[str]]] = {}
+        self.__wakeup = asyncio.Event()
+        self.__task: Optional[asyncio.Task] = None
+        self.__logger = getLogger('uvicorn')
+
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.merged_updates = 0
+        self.rejected_updates = 0
+        self.stale_updates = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.__pending)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'queue_depth': self.queue_depth,
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+            'failed_flushes': self.failed_flushes,
+            'merged_updates': self.merged_updates,
+            'rejected_updates': self.rejected_updates,
+            'stale_updates': self.stale_updates,
+        }
+
+    def pending(self, player_id: str) -> Optional[list[str]]:
+        """
+        Return the active campaigns waiting to be written for the player, if any. They are more recent than the
+        database.
+        """
+        update = self.__pending.get(player_id, self.__in_flight.get(player_id))
+        return None if update is None else list(update[1])
+
+    def submit(self, player_id: str, version: int, active_campaigns: list[str]) -> bool:
+        """
+        Queue the new active campaigns of the player, matched on the player at version.
+        :return: False if the queue is disabled or full, in which case the update must be written by the caller
+        """
+        if not self.enabled:
+            return False
+        if player_id in self.__pending:
+            self.merged_updates += 1
+        elif len(self.__pending) >= self.__max_queue_size:
+            self.rejected_updates += 1
+            return False
+        self.__pending[player_id] = (version, list(active_campaigns))
+        if len(self.__pending) >= self.__batch_size:
+            self.__wakeup.set()
+        return True
+
+    async def start(self):
+        """
+        Start the background flusher
+        """
+        if self.enabled and self.__task is None:
+            self.__task = asyncio.create_task(self.__run())
+
+    async def stop(self):
+        """
+        Stop the background flusher and write everything still queued
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+            self.__task = None
+        while self.__pending:
+            if not await self.flush():
+                break
+        self.__logger.info(f'Active campaigns write-behind stopped: {self.stats()}')
+
+    async def flush(self) -> bool:
+        """
+        Write the queued updates in one statement.
+        :return: False if the write failed, the updates are then queued again unless a newer one arrived meanwhile
+        """
+        if not self.__pending:
+            return True
+        batch, self.__pending = self.__pending, {}
+        self.__in_flight = batch
+        try:
+            if self.__shards is None:
+                written = await self.__write(self.__connect, batch)
+            else:
+                # A shard failing gets the whole batch queued again: an update already written is stale the second time
+                written = sum(
+                    await asyncio.gather(
+                        *(
+                            self.__write(
+                                self.__shards.managers[shard].connect,
+                                {
+                                    player_id: batch[player_id]
+                                    for player_id in player_ids
+                                },
+                            )
+                            for shard, player_ids in self.__shards.group(batch).items()
+                        )
+                    )
+                )
+        except BaseException as e:
+            for player_id, update in batch.items():
+                self.__pending.setdefault(player_id, update)
+            if not isinstance(e, Exception):
+                raise
+            self.failed_flushes += 1
+            self.__logger.error(f'Error in writing active campaigns: {e}')
+            return False
+        finally:
+            self.__in_flight = {}
+
+        self.flushes += 1
+        self.flushed_rows += written
+        stale = len(batch) - written
+        if stale:
+            self.stale_updates += stale
+            self.__logger.warning(
+                f'Dropped the active campaigns of {stale} players updated since they were matched'
+            )
+        self.__logger.debug(f'Wrote active campaigns of {written} players')
+        return True
+
+    @staticmethod
+    async def __write(
+        connect: Callable[[], AsyncContextManager[AsyncConnection]],
+        batch: dict[str, tuple[int, list[str]]],
+    ) -> int:
+        """
+        Write the batch in one statement.
+        :return: The number of players written, the others were updated since they were read
+        """
+        async with connect() as connection:
+            result = await connection.execute(
+                _UPDATE_ACTIVE_CAMPAIGNS,
+                {
+                    'player_ids': list(batch),
+                    'versions': [version for version, _ in batch.values()],
+                    'active_campaigns': [
+                        json.dumps(campaigns) for _, campaigns in batch.values()
+                    ],
+                },
+            )
+            written = result.scalars().all()
+            await notify_players(connection, written)
+        return len(written)
+
+    async def __run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.__wakeup.wait(), self.__flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.__wakeup.clear()
+            await self.flush()
+
+
+active_campaigns_write_behind = ActiveCampaignsWriteBehind(
+    enabled=os.getenv('ACTIVE_CAMPAIGNS_WRITE_BEHIND', 'false').lower() == 'true',
+    flush_interval=float(os.getenv('ACTIVE_CAMPAIGNS_FLUSH_INTERVAL_MS', '5')) / 1000,
+    batch_size=int(os.getenv('ACTIVE_CAMPAIGNS_FLUSH_BATCH_SIZE', '500')),
+    max_queue_size=int(os.getenv('ACTIVE_CAMPAIGNS_MAX_QUEUE_SIZE', '10000')),
+    shards=sharded_session_manager,
+)
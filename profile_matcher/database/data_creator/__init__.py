@@ -1,3 +1,3 @@
-from ._initial_data_creator import InitialDataCreator
+from ._initial_data_creator import INITIAL_PLAYER_ID, InitialDataCreator
 
-__all__ = ['InitialDataCreator']
+__all__ = ['INITIAL_PLAYER_ID', 'InitialDataCreator']
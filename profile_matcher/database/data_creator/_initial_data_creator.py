@@ -10,6 +10,8 @@ from profile_matcher.database.models import Device, Inventory, PlayerProfile, Cl
 # This is for the test purpose (in order to seed the database with the test data)
 # In a normal scenario, this data would be coming from the client application.
 
+INITIAL_PLAYER_ID = '97983be2-98b7-11e7-90cf-082e5f28d836'
+
 
 class InitialDataCreator:
     def __init__(self):
@@ -26,7 +28,7 @@ class InitialDataCreator:
         )
 
         player_profile = PlayerProfile(
-            player_id='97983be2-98b7-11e7-90cf-082e5f28d836',
+            player_id=INITIAL_PLAYER_ID,
             credential='apple_credential',
             created=datetime(2021, 1, 10, 13, 37, 17),
             modified=datetime(2021, 1, 23, 13, 37, 17),
@@ -49,7 +51,7 @@ class InitialDataCreator:
 
         test_inventory = Inventory(
             id=1,
-            player_id='97983be2-98b7-11e7-90cf-082e5f28d836',
+            player_id=INITIAL_PLAYER_ID,
             cash=123,
             coins=123,
             item_1=1,
@@ -59,7 +61,7 @@ class InitialDataCreator:
 
         test_device = Device(
             id=1,
-            player_id='97983be2-98b7-11e7-90cf-082e5f28d836',
+            player_id=INITIAL_PLAYER_ID,
             model='apple iphone 11',
             carrier='vodafone',
             firmware='123',
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional, List
 
-from sqlalchemy import Column, String
+from sqlalchemy import Column, Index, String
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlmodel import SQLModel, Field, Relationship
 
@@ -19,6 +19,8 @@ class Clan(SQLModel, table=True):
 # Models for player profile
 class PlayerProfile(SQLModel, table=True):
     __tablename__ = 'player-profile'
+    # Audience queries filter the players by country, then by level range
+    __table_args__ = (Index('ix_player-profile_country_level', 'country', 'level'),)
     player_id: str = Field(
         description='Player ID', primary_key=True
     )  # This should be a uuid, but for the test purpose, it is set as a string
@@ -58,6 +60,10 @@ class PlayerProfile(SQLModel, table=True):
     custom_field: Optional[str] = Field(
         default=None, description='Custom field for player profile'
     )
+    version: int = Field(
+        default=1,
+        description='Row version, incremented on every update of the active campaigns (optimistic concurrency)',
+    )
     inventory: 'Inventory' = Relationship(
         back_populates='player', sa_relationship_kwargs={'lazy': 'selectin'}
     )
@@ -77,6 +83,7 @@ class Inventory(SQLModel, table=True):
         default=None,
         description='Player ID linked to the inventory',
         foreign_key='player-profile.player_id',
+        index=True,
     )
     cash: float = Field(
         default=0.0, description='Total amount of cash in player inventory'
@@ -102,6 +109,7 @@ class Device(SQLModel, table=True):
     player_id: str = Field(
         description='Player ID linked to the device',
         foreign_key='player-profile.player_id',
+        index=True,
     )
     model: str = Field(description='Device model')
     carrier: str = Field(description='Carrier name')
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import pathlib
+
+from profile_matcher.database import (
+    SHARD_MAP_PATH,
+    ShardMap,
+    ShardMapException,
+    ShardRebalancer,
+    sharded_session_manager,
+)
+
+# Move the players between the shards of DATABASE_SHARD_URLS, e.g. after adding a database at the end of the list:
+#   python -m profile_matcher.database.rebalance --shards 3 --dry-run
+#   python -m profile_matcher.database.rebalance --shards 3
+# then, once every worker is restarted on the new map, delete the players moved from their old shard:
+#   python -m profile_matcher.database.rebalance --delete-moved
+# To remove the last databases, rebalance to fewer shards first, then remove them from DATABASE_SHARD_URLS.
+
+
+async def rebalance(
+    shard_count: int, map_path: pathlib.Path, batch_size: int, dry_run: bool
+):
+    target = sharded_session_manager.shard_map.rebalanced(shard_count)
+    moved_slots = sharded_session_manager.shard_map.moved_slots(target)
+    print(
+        f'{sharded_session_manager.shard_map} -> {target}: {len(moved_slots)} slots moved'
+    )
+    if dry_run:
+        return
+    try:
+        report = await ShardRebalancer(
+            sharded_session_manager, batch_size=batch_size, map_path=map_path
+        ).rebalance(target)
+    finally:
+        await sharded_session_manager.close()
+    print(
+        f'{report.moved_players} players copied: '
+        + ', '.join(
+            f'{count} from shard {source} to shard {destination}'
+            for (source, destination), count in sorted(report.moves.items())
+        )
+    )
+    print(
+        f'Saved {target} to {map_path}. Restart every worker, then delete the players moved from their old shard with '
+        '--delete-moved'
+    )
+
+
+async def delete_moved(batch_size: int):
+    try:
+        deleted = await ShardRebalancer(
+            sharded_session_manager, batch_size=batch_size
+        ).delete_moved()
+    finally:
+        await sharded_session_manager.close()
+    print(
+        f'{sum(deleted.values())} players deleted from their old shard: '
+        + ', '.join(
+            f'{count} from shard {shard}' for shard, count in sorted(deleted.items())
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Move the players between the shard databases to spread them over a number of shards'
+    )
+    step = parser.add_mutually_exclusive_group(required=True)
+    step.add_argument(
+        '--shards',
+        type=int,
+        help='Shards to spread the players over, the first ones of DATABASE_SHARD_URLS',
+    )
+    step.add_argument(
+        '--delete-moved',
+        action='store_true',
+        help='Delete the players moved from their old shard, once every worker reads the new shard map',
+    )
+    parser.add_argument(
+        '--map',
+        type=pathlib.Path,
+        default=SHARD_MAP_PATH,
+        help='File the new shard map is saved to (read from with --delete-moved), SHARD_MAP_PATH by default',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=1000,
+        help='Players copied or deleted per transaction',
+    )
+    parser.add_argument(
+        '--dry-run', action='store_true', help='Only print the slots that would move'
+    )
+    arguments = parser.parse_args()
+
+    if sharded_session_manager is None:
+        parser.error('DATABASE_SHARD_URLS is not set: the players are not sharded')
+    if arguments.map is None:
+        parser.error(
+            'The shard map must be saved for the service to read the players moved: set SHARD_MAP_PATH or --map'
+        )
+    if arguments.delete_moved:
+        # The players are deleted from the shards they are not on in the saved map, the one the workers read
+        try:
+            sharded_session_manager.shard_map = ShardMap.load(arguments.map)
+        except ShardMapException as e:
+            parser.error(f'No shard map to delete the players moved from: {e}')
+        asyncio.run(delete_moved(arguments.batch_size))
+        return
+    if not 0 < arguments.shards <= sharded_session_manager.shard_count:
+        parser.error(
+            f'--shards must be between 1 and {sharded_session_manager.shard_count}, the databases of DATABASE_SHARD_URLS'
+        )
+    asyncio.run(
+        rebalance(
+            arguments.shards, arguments.map, arguments.batch_size, arguments.dry_run
+        )
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+from ._exception import DiagnosticsException
+from ._memory import (
+    AllocationDiff,
+    GroupBy,
+    MemoryDiagnostics,
+    MemorySnapshot,
+    memory_diagnostics,
+)
+
+__all__ = [
+    'DiagnosticsException',
+    'AllocationDiff',
+    'GroupBy',
+    'MemoryDiagnostics',
+    'MemorySnapshot',
+    'memory_diagnostics',
+]
@@ -0,0 +1,2 @@
+class DiagnosticsException(Exception):
+    pass
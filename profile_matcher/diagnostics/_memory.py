@@ -0,0 +1,204 @@
+import gc
+import itertools
+import os
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Literal, Optional
+
+from sqlalchemy.orm import Session
+from sqlmodel import SQLModel
+
+from ._exception import DiagnosticsException
+
+# Group the allocations by line of code, or by file
+GroupBy = Literal['lineno', 'filename']
+
+# Allocations made by the tracing itself, or while importing modules, are not leaks of the service
+IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+@dataclass(frozen=True, slots=True)
+class MemorySnapshot:
+    id: int
+    taken_at: datetime
+    snapshot: tracemalloc.Snapshot
+    # Memory traced when the snapshot was taken, in bytes
+    traced: int
+
+
+@dataclass(frozen=True, slots=True)
+class AllocationDiff:
+    """
+    Memory allocated by a line (or a file) between two snapshots, positive if it grew.
+    """
+
+    filename: str
+    lineno: Optional[int]
+    size: int
+    size_diff: int
+    count: int
+    count_diff: int
+
+
+class MemoryDiagnostics:
+    """
+    Find what keeps memory in a worker: trace the allocations with tracemalloc, take snapshots, and compare them by
+    line (or file) of code. The latest max_snapshots snapshots are kept. Also counts the live ORM objects (models
+    of the database and sessions, with the objects in their identity maps), to spot the ones that pile up.
+    Tracing slows every allocation down: start it for an investigation only. The calls can be made from several threads,
+    they run one at a time.
+    """
+
+    def __init__(self, max_snapshots: int = 5):
+        self.__snapshots: OrderedDict[int, MemorySnapshot] = OrderedDict()
+        self.__max_snapshots = max_snapshots
+        self.__ids = itertools.count(1)
+        self.__lock = threading.RLock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    @property
+    def snapshots(self) -> list[MemorySnapshot]:
+        return list(self.__snapshots.values())
+
+    def status(self) -> dict[str, object]:
+        current, peak = tracemalloc.get_traced_memory() if self.tracing else (0, 0)
+        return {
+            'tracing': self.tracing,
+            'frames': tracemalloc.get_traceback_limit() if self.tracing else 0,
+            'traced': current,
+            'peak': peak,
+            'snapshots': [snapshot.id for snapshot in self.__snapshots.values()],
+        }
+
+    def start(self, frames: int = 1):
+        """
+        Start tracing the allocations, keeping frames frames of their traceback. The snapshots of a previous tracing
+        are dropped.
+        """
+        with self.__lock:
+            if self.tracing:
+                return
+            self.__snapshots.clear()
+            tracemalloc.start(frames)
+
+    def stop(self):
+        """
+        Stop tracing and drop the snapshots, which keep the traces in memory.
+        """
+        with self.__lock:
+            self.__snapshots.clear()
+            tracemalloc.stop()
+
+    def take_snapshot(self) -> MemorySnapshot:
+        """
+        Take a snapshot of the allocations traced, evicting the oldest one beyond max_snapshots.
+        :raises DiagnosticsException: If the allocations are not traced
+        """
+        with self.__lock:
+            if not self.tracing:
+                raise DiagnosticsException('Memory tracing is not started')
+            snapshot = MemorySnapshot(
+                id=next(self.__ids),
+                taken_at=datetime.now(timezone.utc),
+                snapshot=tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES),
+                traced=tracemalloc.get_traced_memory()[0],
+            )
+            self.__snapshots[snapshot.id] = snapshot
+            while len(self.__snapshots) > self.__max_snapshots:
+                self.__snapshots.popitem(last=False)
+            return snapshot
+
+    def diff(
+        self,
+        since: Optional[int] = None,
+        top: int = 20,
+        group_by: GroupBy = 'lineno',
+    ) -> tuple[MemorySnapshot, MemorySnapshot, list[AllocationDiff]]:
+        """
+        Take a snapshot and compare it with the snapshot since (the latest one by default), the allocations that grew
+        the most first.
+        :return: The two snapshots compared, and the top allocation diffs
+        :raises DiagnosticsException: If the allocations are not traced, or there is no such snapshot
+        """
+        with self.__lock:
+            if since is None:
+                if not self.__snapshots:
+                    raise DiagnosticsException('No snapshot to compare with')
+                since = next(reversed(self.__snapshots))
+            baseline = self.__snapshots.get(since)
+            if baseline is None:
+                raise DiagnosticsException(f'No snapshot {since}')
+
+            current = self.take_snapshot()
+            statistics = current.snapshot.compare_to(baseline.snapshot, group_by)
+            return (
+                baseline,
+                current,
+                [
+                    AllocationDiff(
+                        filename=_relative(statistic.traceback[0].filename),
+                        lineno=statistic.traceback[0].lineno
+                        if group_by == 'lineno'
+                        else None,
+                        size=statistic.size,
+                        size_diff=statistic.size_diff,
+                        count=statistic.count,
+                        count_diff=statistic.count_diff,
+                    )
+                    for statistic in statistics[:top]
+                ],
+            )
+
+    @staticmethod
+    def live_objects() -> dict[str, dict[str, int]]:
+        """
+        Count the live instances of every database model, the live sessions and the objects in their identity maps,
+        after a garbage collection (what is counted is really referenced).
+        """
+        gc.collect()
+        models = {
+            mapper.class_: mapper.class_.__name__
+            for mapper in SQLModel._sa_registry.mappers
+        }
+        instances = Counter()
+        sessions = 0
+        identity_map_objects = 0
+        for obj in gc.get_objects():
+            name = models.get(type(obj))
+            if name is not None:
+                instances[name] += 1
+            elif isinstance(obj, Session):
+                sessions += 1
+                identity_map_objects += len(obj.identity_map)
+        return {
+            'models': {name: instances[name] for name in sorted(models.values())},
+            'sessions': {
+                'sessions': sessions,
+                'identity_map_objects': identity_map_objects,
+            },
+        }
+
+
+def _relative(filename: str) -> str:
+    """
+    Path of a file relative to the working directory, if it is under it.
+    """
+    try:
+        relative = os.path.relpath(filename)
+    except ValueError:
+        return filename
+    return filename if relative.startswith('..') else relative
+
+
+memory_diagnostics = MemoryDiagnostics()
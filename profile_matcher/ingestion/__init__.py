@@ -0,0 +1,17 @@
+from ._exception import IngestionException
+from ._ingestor import (
+    IngestionFormat,
+    IngestionReport,
+    PlayerProfileIngestor,
+)
+from ._records import DeviceRecord, InventoryRecord, PlayerProfileRecord
+
+__all__ = [
+    'IngestionException',
+    'IngestionFormat',
+    'IngestionReport',
+    'PlayerProfileIngestor',
+    'DeviceRecord',
+    'InventoryRecord',
+    'PlayerProfileRecord',
+]
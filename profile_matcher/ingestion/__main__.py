@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import pathlib
+from typing import AsyncIterator
+
+from profile_matcher.database import session_manager, sharded_session_manager
+from profile_matcher.ingestion import IngestionFormat, PlayerProfileIngestor
+
+# Bulk loader of player profiles, e.g.:
+#   python -m profile_matcher.ingestion players.ndjson
+#   python -m profile_matcher.ingestion players.csv --batch-size 50000
+
+READ_SIZE = 1 << 20
+
+
+async def read_file(path: pathlib.Path) -> AsyncIterator[bytes]:
+    with path.open('rb') as file:
+        while chunk := file.read(READ_SIZE):
+            yield chunk
+
+
+async def ingest(
+    path: pathlib.Path, ingestion_format: IngestionFormat, batch_size: int
+):
+    ingestor = PlayerProfileIngestor(
+        batch_size=batch_size, shards=sharded_session_manager
+    )
+    try:
+        report = await ingestor.ingest(read_file(path), ingestion_format)
+    finally:
+        await session_manager.close()
+        if sharded_session_manager is not None:
+            await sharded_session_manager.close()
+    print(report.model_dump_json(indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load player profiles (with inventory and devices) from a NDJSON or CSV file'
+    )
+    parser.add_argument('path', type=pathlib.Path, help='File to load')
+    parser.add_argument(
+        '--format',
+        type=IngestionFormat,
+        help='Format of the file (ndjson or csv), guessed from its extension by default',
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=10_000, help='Rows loaded per transaction'
+    )
+    arguments = parser.parse_args()
+
+    ingestion_format = arguments.format or (
+        IngestionFormat.CSV
+        if arguments.path.suffix.lower() == '.csv'
+        else IngestionFormat.NDJSON
+    )
+    asyncio.run(ingest(arguments.path, ingestion_format, arguments.batch_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+import asyncio
+import csv
+import json
+import time
+from enum import Enum
+from logging import getLogger
+from operator import attrgetter
+from typing import AsyncContextManager, AsyncIterable, AsyncIterator, Callable, Optional
+
+from asyncpg import PostgresError
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from profile_matcher.database import (
+    ShardedSessionManager,
+    notify_players,
+    session_manager,
+)
+from profile_matcher.database.models import Device, Inventory, PlayerProfile
+from ._exception import IngestionException
+from ._records import PlayerProfileRecord
+
+# Columns loaded from the ingested rows. The active campaigns and the row version belong to the service.
+PLAYER_COLUMNS: tuple[str, ...] = tuple(
+    name
+    for name in PlayerProfile.model_fields
+    if name not in ('active_campaigns', 'version')
+)
+INVENTORY_COLUMNS: tuple[str, ...] = tuple(
+    name for name in Inventory.model_fields if name != 'id'
+)
+DEVICE_COLUMNS: tuple[str, ...] = tuple(Device.model_fields)
+
+_PLAYER_STAGING_COLUMNS = (*PLAYER_COLUMNS, 'clan_name')
+
+# The staging tables are created once per connection and emptied at every commit. Recreating them for every batch
+# would invalidate the statements prepared on the connection.
+_CREATE_STAGING_TABLES = (
+    f"""
+    CREATE TEMP TABLE IF NOT EXISTS staging_player_profile ON COMMIT DELETE ROWS AS
+    SELECT {', '.join(PLAYER_COLUMNS)}, NULL::varchar AS clan_name FROM "player-profile" WITH NO DATA
+    """,
+    f"""
+    CREATE TEMP TABLE IF NOT EXISTS staging_inventory ON COMMIT DELETE ROWS AS
+    SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory WITH NO DATA
+    """,
+    f"""
+    CREATE TEMP TABLE IF NOT EXISTS staging_device ON COMMIT DELETE ROWS AS
+    SELECT {', '.join(DEVICE_COLUMNS)} FROM device WITH NO DATA
+    """,
+)
+
+# Merges run one at a time: batches of concurrent ingestions could otherwise lock the same players in a different order,
+# and the inventory ids sequence is resynchronised before every insert.
+_LOCK_MERGE = "SELECT pg_advisory_xact_lock(hashtext('player-profile-ingestion'))"
+
+_MERGE_CLANS = """
+    INSERT INTO clan (id, name)
+    SELECT DISTINCT ON (clan_id) clan_id, clan_name
+    FROM staging_player_profile
+    WHERE clan_name IS NOT NULL
+    ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name
+"""
+
+# The version of an updated player is bumped, so that active campaigns matched on its previous profile are not saved
+_MERGE_PLAYERS = f"""
+    INSERT INTO "player-profile" ({', '.join(PLAYER_COLUMNS)}, active_campaigns, version)
+    SELECT {', '.join(PLAYER_COLUMNS)}, ARRAY[]::varchar[], 1
+    FROM staging_player_profile
+    ON CONFLICT (player_id) DO UPDATE SET
+        {', '.join(f'{name} = EXCLUDED.{name}' for name in PLAYER_COLUMNS[1:])},
+        version = "player-profile".version + 1
+"""
+
+# The inventory is one row per player, but player_id is not a key of the table: update the existing rows, then insert
+# the missing ones.
+_UPDATE_INVENTORIES = f"""
+    UPDATE inventory
+    SET {', '.join(f'{name} = staging.{name}' for name in INVENTORY_COLUMNS[1:])}
+    FROM staging_inventory AS staging
+    WHERE inventory.player_id = staging.player_id
+"""
+
+# Rows created through the ORM carry explicit ids, which the sequence does not know about
+_SYNC_INVENTORY_IDS = """
+    SELECT setval(
+        pg_get_serial_sequence('inventory', 'id'),
+        GREATEST(
+            (SELECT COALESCE(MAX(id), 0) FROM inventory),
+            COALESCE(pg_sequence_last_value(pg_get_serial_sequence('inventory', 'id')::regclass), 0),
+            1
+        )
+    )
+"""
+
+_INSERT_INVENTORIES = f"""
+    INSERT INTO inventory ({', '.join(INVENTORY_COLUMNS)})
+    SELECT {', '.join(INVENTORY_COLUMNS)}
+    FROM staging_inventory AS staging
+    WHERE NOT EXISTS (SELECT 1 FROM inventory WHERE inventory.player_id = staging.player_id)
+"""
+
+_MERGE_DEVICES = f"""
+    INSERT INTO device ({', '.join(DEVICE_COLUMNS)})
+    SELECT {', '.join(DEVICE_COLUMNS)}
+    FROM staging_device
+    ON CONFLICT (id) DO UPDATE SET
+        {', '.join(f'{name} = EXCLUDED.{name}' for name in DEVICE_COLUMNS[1:])}
+"""
+
+# Sent as a single script, so the whole merge runs in one round trip while the next batch is being validated
+_MERGE = ';'.join(
+    (
+        _LOCK_MERGE,
+        _MERGE_CLANS,
+        _MERGE_PLAYERS,
+        _UPDATE_INVENTORIES,
+        _SYNC_INVENTORY_IDS,
+        _INSERT_INVENTORIES,
+        _MERGE_DEVICES,
+    )
+)
+
+_RECORD = TypeAdapter(PlayerProfileRecord)
+_RECORDS = TypeAdapter(list[PlayerProfileRecord])
+
+_player_values = attrgetter(*_PLAYER_STAGING_COLUMNS)
+_inventory_values = attrgetter(*INVENTORY_COLUMNS[1:])
+
+# CSV columns holding the inventory are prefixed, the devices are a JSON list
+_CSV_INVENTORY_PREFIX = 'inventory.'
+_CSV_DEVICES = 'devices'
+
+
+class IngestionFormat(str, Enum):
+    NDJSON = 'ndjson'
+    CSV = 'csv'
+
+
+class IngestionReport(BaseModel):
+    received_rows: int = 0
+    ingested_rows: int = 0
+    rejected_rows: int = 0
+    batches: int = 0
+    duration: float = 0.0
+    rows_per_second: float = 0.0
+    errors: list[str] = []
+
+
+class PlayerProfileIngestor:
+    """
+    Load player profiles, with their inventory and devices, from a NDJSON or CSV stream. The stream is read and
+    validated batch_size rows at a time, every batch is copied to staging tables (COPY) and merged into the tables with
+    upserts, in its own transaction. The next batch is validated while the previous one is loaded, so at most two
+    batches are held in memory. Invalid rows are rejected and reported, the others are loaded.
+    With shards, every batch is split by the shard of its players and loaded on all the shards at once (connect is not
+    used).
+    """
+
+    def __init__(
+        self,
+        connect: Optional[Callable[[], AsyncContextManager[AsyncConnection]]] = None,
+        batch_size: int = 10_000,
+        max_errors: int = 100,
+        shards: Optional[ShardedSessionManager] = None,
+    ):
+        self.__connect = connect or session_manager.connect
+        self.__shards = shards
+        self.__batch_size = batch_size
+        self.__max_errors = max_errors
+        self.__logger = getLogger('uvicorn')
+
+    async def ingest(
+        self, chunks: AsyncIterable[bytes], ingestion_format: IngestionFormat
+    ) -> IngestionReport:
+        """
+        Ingest the stream, given as chunks of bytes split anywhere. The first record of a CSV stream is its header.
+        :raises IngestionException: If a batch cannot be loaded. The batches loaded before stay loaded.
+        """
+        report = IngestionReport()
+        start = time.perf_counter()
+        header: Optional[list[str]] = None
+        loading: Optional[asyncio.Task] = None
+        try:
+            async for line_numbers, batch in self.__batches(
+                chunks, quoted_newlines=ingestion_format is IngestionFormat.CSV
+            ):
+                if ingestion_format is IngestionFormat.CSV:
+                    if header is None:
+                        header = next(csv.reader([batch[0].decode()]))
+                        line_numbers, batch = line_numbers[1:], batch[1:]
+                        if not batch:
+                            continue
+                    records = self.__validate_csv(header, line_numbers, batch, report)
+                else:
+                    records = self.__validate_ndjson(line_numbers, batch, report)
+                report.received_rows += len(batch)
+
+                if loading is not None:
+                    report.ingested_rows += await loading
+                loading = asyncio.create_task(self.__load(line_numbers[0], records))
+                report.batches += 1
+            if loading is not None:
+                report.ingested_rows += await loading
+                loading = None
+        finally:
+            if loading is not None:
+                loading.cancel()
+
+        report.duration = time.perf_counter() - start
+        report.rows_per_second = (
+            report.ingested_rows / report.duration if report.duration else 0.0
+        )
+        self.__logger.info(
+            f'Ingested {report.ingested_rows} players ({report.rejected_rows} rejected) in {report.duration:.3f}s '
+            f'({report.rows_per_second:.0f} rows/s)'
+        )
+        return report
+
+    @staticmethod
+    async def __lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[list[bytes]]:
+        """
+        Split the chunks into lines, yielding the complete lines of every chunk at once.
+        """
+        remainder = b''
+        async for chunk in chunks:
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            yield lines
+        if remainder:
+            yield [remainder]
+
+    async def __batches(
+        self, chunks: AsyncIterable[bytes], quoted_newlines: bool
+    ) -> AsyncIterator[tuple[list[int], list[bytes]]]:
+        """
+        Group the records of the stream by batch_size, with the line number where every record starts. Blank lines are
+        skipped. With quoted_newlines (CSV), a record continues on the next line while one of its quoted fields is open.
+        """
+        line_numbers: list[int] = []
+        batch: list[bytes] = []
+        line_number = record_line_number = 0
+        record = b''
+        async for lines in self.__lines(chunks):
+            for line in lines:
+                line_number += 1
+                if record:
+                    line = record + b'\n' + line
+                else:
+                    record_line_number = line_number
+                if quoted_newlines and line.count(b'"') % 2:
+                    record = line
+                    continue
+                record = b''
+                if not line.strip():
+                    continue
+                line_numbers.append(record_line_number)
+                batch.append(line)
+                if len(batch) >= self.__batch_size:
+                    yield line_numbers, batch
+                    line_numbers, batch = [], []
+        if record:
+            # Quoted field never closed, left to the parser to reject
+            line_numbers.append(record_line_number)
+            batch.append(record)
+        if batch:
+            yield line_numbers, batch
+
+    def __validate_ndjson(
+        self, line_numbers: list[int], batch: list[bytes], report: IngestionReport
+    ) -> list[PlayerProfileRecord]:
+        try:
+            # The whole batch is parsed and validated in a single pass, outside of the interpreter
+            return _RECORDS.validate_json(b'[' + b','.join(batch) + b']')
+        except ValidationError:
+            pass
+        records = []
+        for line_number, line in zip(line_numbers, batch):
+            try:
+                records.append(_RECORD.validate_json(line))
+            except ValidationError as e:
+                self.__reject(report, line_number, e)
+        return records
+
+    def __validate_csv(
+        self,
+        header: list[str],
+        line_numbers: list[int],
+        batch: list[bytes],
+        report: IngestionReport,
+    ) -> list[PlayerProfileRecord]:
+        documents = []
+        document_line_numbers = []
+        for line_number, line in zip(line_numbers, batch):
+            try:
+                values = next(csv.reader([line.decode()]))
+                documents.append(self.__csv_document(header, values))
+                document_line_numbers.append(line_number)
+            except (ValueError, csv.Error) as e:
+                self.__reject(report, line_number, e)
+        try:
+            return _RECORDS.validate_python(documents)
+        except ValidationError:
+            pass
+        records = []
+        for line_number, document in zip(document_line_numbers, documents):
+            try:
+                records.append(_RECORD.validate_python(document))
+            except ValidationError as e:
+                self.__reject(report, line_number, e)
+        return records
+
+    @staticmethod
+    def __csv_document(header: list[str], values: list[str]) -> dict:
+        """
+        Build the document of a CSV row. Empty cells are missing values.
+        :raises ValueError: If the row does not have as many cells as the header, or the devices are not valid JSON
+        """
+        if len(values) != len(header):
+            raise ValueError(f'Expected {len(header)} columns, got {len(values)}')
+        document = {}
+        inventory = {}
+        for column, value in zip(header, values):
+            if value == '':
+                continue
+            if column.startswith(_CSV_INVENTORY_PREFIX):
+                inventory[column[len(_CSV_INVENTORY_PREFIX) :]] = value
+            elif column == _CSV_DEVICES:
+                document[column] = json.loads(value)
+            else:
+                document[column] = value
+        if inventory:
+            document['inventory'] = inventory
+        return document
+
+    def __reject(self, report: IngestionReport, line_number: int, error: Exception):
+        report.rejected_rows += 1
+        if len(report.errors) < self.__max_errors:
+            if isinstance(error, ValidationError):
+                message = '; '.join(
+                    f'{".".join(str(part) for part in detail["loc"]) or "row"}: {detail["msg"]}'
+                    for detail in error.errors()
+                )
+            else:
+                message = str(error)
+            report.errors.append(f'Line {line_number}: {message}')
+
+    async def __load(self, first_line: int, records: list[PlayerProfileRecord]) -> int:
+        """
+        Copy the records to the staging tables and merge them, on the shard of every player when they are sharded.
+        :return: The number of players loaded
+        :raises IngestionException: If the batch cannot be loaded
+        """
+        # A player sent twice in the same batch would be updated twice by the same statement: the last one wins
+        players = {record.player_id: record for record in records}
+        if not players:
+            return 0
+        if self.__shards is None:
+            await self.__load_players(self.__connect, first_line, players)
+        else:
+            await asyncio.gather(
+                *(
+                    self.__load_players(
+                        self.__shards.managers[shard].connect,
+                        first_line,
+                        {player_id: players[player_id] for player_id in player_ids},
+                    )
+                    for shard, player_ids in self.__shards.group(players).items()
+                )
+            )
+        return len(players)
+
+    async def __load_players(
+        self,
+        connect: Callable[[], AsyncContextManager[AsyncConnection]],
+        first_line: int,
+        players: dict[str, PlayerProfileRecord],
+    ):
+        """
+        :raises IngestionException: If the players cannot be loaded
+        """
+        player_rows = [_player_values(record) for record in players.values()]
+        inventory_rows = [
+            (record.player_id, *_inventory_values(record.inventory))
+            for record in players.values()
+            if record.inventory is not None
+        ]
+        device_rows = {
+            device.id: (
+                device.id,
+                record.player_id,
+                device.model,
+                device.carrier,
+                device.firmware,
+            )
+            for record in players.values()
+            for device in record.devices
+        }
+
+        try:
+            async with connect() as connection:
+                # Also begins the transaction the driver connection is used in
+                for statement in _CREATE_STAGING_TABLES:
+                    await connection.execute(text(statement))
+                raw_connection = await connection.get_raw_connection()
+                driver_connection = raw_connection.driver_connection
+                await driver_connection.copy_records_to_table(
+                    'staging_player_profile',
+                    records=player_rows,
+                    columns=_PLAYER_STAGING_COLUMNS,
+                )
+                if inventory_rows:
+                    await driver_connection.copy_records_to_table(
+                        'staging_inventory',
+                        records=inventory_rows,
+                        columns=INVENTORY_COLUMNS,
+                    )
+                if device_rows:
+                    await driver_connection.copy_records_to_table(
+                        'staging_device',
+                        records=device_rows.values(),
+                        columns=DEVICE_COLUMNS,
+                    )
+
+                await driver_connection.execute(_MERGE)
+                await notify_players(connection, players)
+        except (SQLAlchemyError, PostgresError) as e:
+            self.__logger.error(
+                f'Error in loading the batch starting at line {first_line}: {e}'
+            )
+            raise IngestionException(
+                f'The batch starting at line {first_line} could not be loaded: {e}'
+            ) from e
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from typing import Annotated, Optional
+
+from pydantic import AfterValidator, BaseModel
+
+
+def __to_naive_utc(value: datetime) -> datetime:
+    """
+    The timestamps are stored without time zone, in UTC. Aware datetimes are converted, naive ones are kept as is.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+UtcDatetime = Annotated[datetime, AfterValidator(__to_naive_utc)]
+
+
+# Models for the ingested rows. They mirror the database models, without the columns computed by the service
+# (active campaigns, row version) and with the inventory and devices nested in the player, as sent by the client.
+class InventoryRecord(BaseModel):
+    cash: float = 0.0
+    coins: int = 0
+    item_1: Optional[int] = None
+    item_4: Optional[int] = None
+    item_34: Optional[int] = None
+    item_55: Optional[int] = None
+    item_100: Optional[int] = None
+
+
+class DeviceRecord(BaseModel):
+    id: int
+    model: str
+    carrier: str
+    firmware: str
+
+
+class PlayerProfileRecord(BaseModel):
+    player_id: str
+    credential: str
+    created: UtcDatetime
+    modified: UtcDatetime
+    last_session: Optional[UtcDatetime] = None
+    total_spent: float = 0.0
+    total_refund: float = 0.0
+    total_transactions: int = 0
+    last_purchase: Optional[UtcDatetime] = None
+    level: int = 1
+    xp: int = 0
+    total_playtime: int = 0
+    country: str
+    language: str
+    birthdate: UtcDatetime
+    gender: str
+    clan_id: int
+    # If given, the clan is created (or renamed). Otherwise, the clan must already exist.
+    clan_name: Optional[str] = None
+    custom_field: Optional[str] = None
+    inventory: Optional[InventoryRecord] = None
+    devices: list[DeviceRecord] = []
@@ -0,0 +1,23 @@
+from ._catalog_parsing import (
+    CatalogParsingReport,
+    ParsingResult,
+    benchmark_catalog_parsing,
+    generate_catalog,
+)
+from ._load_generator import (
+    KeyDistribution,
+    LoadGenerator,
+    LoadReport,
+    player_id_sampler,
+)
+
+__all__ = [
+    'CatalogParsingReport',
+    'ParsingResult',
+    'benchmark_catalog_parsing',
+    'generate_catalog',
+    'KeyDistribution',
+    'LoadGenerator',
+    'LoadReport',
+    'player_id_sampler',
+]
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import logging
+import pathlib
+import sys
+from typing import Optional
+
+import httpx
+
+from profile_matcher.loadtest import (
+    KeyDistribution,
+    LoadGenerator,
+    LoadReport,
+    player_id_sampler,
+)
+
+# End-to-end load test of /get_client_config, e.g.:
+#   python -m profile_matcher.loadtest --player-ids players.txt --concurrency 50 --duration 30 --distribution zipf
+#   python -m profile_matcher.loadtest --url http://127.0.0.1:8000 --baseline baseline.json
+# Without --url, the app of main.py is served in-process (its lifespan included) through httpx.ASGITransport.
+
+# The player created with the initial data
+DEFAULT_PLAYER_ID = '97983be2-98b7-11e7-90cf-082e5f28d836'
+
+
+async def run(arguments: argparse.Namespace, player_ids: list[str]) -> LoadReport:
+    next_player_id = player_id_sampler(
+        player_ids, arguments.distribution, arguments.zipf_s, arguments.seed
+    )
+    params = {}
+    if arguments.fields:
+        params['fields'] = arguments.fields
+    if arguments.limit:
+        params['limit'] = str(arguments.limit)
+
+    # One log line per request would cost more than the requests
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    limits = httpx.Limits(max_connections=arguments.concurrency)
+    if arguments.url:
+        async with httpx.AsyncClient(base_url=arguments.url, limits=limits) as client:
+            return await generate_load(arguments, client, next_player_id, params)
+
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url='http://in-process',
+            limits=limits,
+        ) as client:
+            return await generate_load(arguments, client, next_player_id, params)
+
+
+async def generate_load(
+    arguments: argparse.Namespace, client: httpx.AsyncClient, next_player_id, params
+) -> LoadReport:
+    return await LoadGenerator(
+        client,
+        next_player_id,
+        concurrency=arguments.concurrency,
+        duration=arguments.duration,
+        params=params,
+        distribution=arguments.distribution,
+    ).run()
+
+
+def read_player_ids(path: Optional[pathlib.Path]) -> list[str]:
+    if path is None:
+        return [DEFAULT_PLAYER_ID]
+    with path.open() as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test /get_client_config and report throughput, latency percentiles and errors as JSON'
+    )
+    parser.add_argument(
+        '--url', help='Server to load, the app is run in-process by default'
+    )
+    parser.add_argument(
+        '--player-ids',
+        type=pathlib.Path,
+        help='File of the player ids to request, one per line, the most requested first for zipf',
+    )
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=10.0, help='In seconds')
+    parser.add_argument(
+        '--distribution', type=KeyDistribution, default=KeyDistribution.UNIFORM
+    )
+    parser.add_argument(
+        '--zipf-s', type=float, default=1.1, help='Skew of the zipf distribution'
+    )
+    parser.add_argument('--seed', type=int, help='Seed of the player id sampler')
+    parser.add_argument('--fields', help='Sparse fieldset requested, e.g. level')
+    parser.add_argument('--limit', type=int, help='Maximum number of campaigns')
+    parser.add_argument(
+        '--output', type=pathlib.Path, help='Also write the report to this file'
+    )
+    parser.add_argument(
+        '--baseline',
+        type=pathlib.Path,
+        help='Report of a previous run: exit with status 1 if this run regressed',
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.1,
+        help='Relative regression tolerated against the baseline',
+    )
+    arguments = parser.parse_args()
+
+    report = asyncio.run(run(arguments, read_player_ids(arguments.player_ids)))
+    report_json = report.model_dump_json(indent=2)
+    print(report_json)
+    if arguments.output:
+        arguments.output.write_text(report_json)
+
+    if arguments.baseline:
+        baseline = LoadReport.model_validate_json(arguments.baseline.read_text())
+        regressions = report.regressions(baseline, arguments.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
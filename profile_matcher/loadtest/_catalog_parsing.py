@@ -0,0 +1,182 @@
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from profile_matcher.api.models import ActiveCampaign, active_campaigns_adapter
+from profile_matcher.catalog import (
+    CompiledCatalog,
+    ITEM_NAMES,
+    JsonArrayStream,
+    compile_catalog,
+    compile_catalog_stream,
+)
+
+T = TypeVar('T')
+
+COUNTRIES = ['CA', 'US', 'RO', 'FR', 'DE', 'JP', 'BR', 'IN', 'GB', 'ES']
+
+
+class ParsingResult(BaseModel):
+    method: str
+    # Best time of the runs to decode the campaigns only, and to compile the catalog from the payload, and the memory
+    # allocated at most during a compilation (the payload aside)
+    decode_seconds: float
+    seconds: float
+    campaigns_per_s: float
+    peak_kib: float
+
+
+class CatalogParsingReport(BaseModel):
+    """
+    Time and memory taken to turn a JSON catalog into the compiled catalog, by every decoding path.
+    """
+
+    campaigns: int
+    payload_bytes: int
+    repeat: int
+    results: list[ParsingResult]
+
+
+def generate_catalog(count: int, seed: Optional[int] = None) -> bytes:
+    """
+    JSON array of count random campaigns, as sent by the campaign API.
+    """
+    generator = random.Random(seed)
+    start = datetime(2022, 1, 1)
+    campaigns = []
+    for index in range(count):
+        level_min = generator.randint(1, 50)
+        campaign_start = start + timedelta(days=generator.randint(0, 60))
+        campaigns.append(
+            {
+                'game': f'game_{index % 10}',
+                'name': f'campaign_{index}',
+                'priority': round(generator.uniform(0, 100), 2),
+                'matchers': {
+                    'level': {
+                        'min': level_min,
+                        'max': level_min + generator.randint(0, 50),
+                    },
+                    'has': {
+                        'country': generator.sample(COUNTRIES, generator.randint(1, 5)),
+                        'items': generator.sample(ITEM_NAMES, 2),
+                        'language': ['fr', 'en'] if index % 3 == 0 else None,
+                    },
+                    'does_not_have': {'items': generator.sample(ITEM_NAMES, 1)},
+                    'total_spent': {'min': 10.0} if index % 4 == 0 else None,
+                },
+                'start_date': campaign_start.isoformat(),
+                'end_date': (campaign_start + timedelta(days=30)).isoformat(),
+                'enabled': index % 10 != 0,
+                'last_updated': start.isoformat(),
+            }
+        )
+    return json.dumps(campaigns).encode()
+
+
+def benchmark_catalog_parsing(
+    payload: bytes, repeat: int = 5, chunk_size: int = 1 << 16
+) -> CatalogParsingReport:
+    """
+    Decode, then compile, the JSON catalog payload repeat times with every decoding path:
+    - json_loads: json.loads, then every campaign validated from the Python objects
+    - type_adapter: the whole payload validated at once from the raw bytes by the cached TypeAdapter
+    - stream: the payload read by chunks of chunk_size, every campaign validated from its raw bytes and compiled as
+      soon as it is received
+    :raises ValueError: If the paths do not give the same catalog
+    """
+
+    view = memoryview(payload)
+
+    def chunks() -> Iterator[bytes]:
+        for offset in range(0, len(payload), chunk_size):
+            yield bytes(view[offset : offset + chunk_size])
+
+    def decode_json_loads() -> list[ActiveCampaign]:
+        return [
+            ActiveCampaign.model_validate(campaign) for campaign in json.loads(payload)
+        ]
+
+    def decode_type_adapter() -> list[ActiveCampaign]:
+        return active_campaigns_adapter.validate_json(payload)
+
+    def decode_stream() -> int:
+        # Every campaign dropped once validated
+        stream = JsonArrayStream()
+        count = 0
+        for chunk in chunks():
+            for element in stream.feed(chunk):
+                ActiveCampaign.model_validate_json(element)
+                count += 1
+        stream.close()
+        return count
+
+    def json_loads() -> CompiledCatalog:
+        return compile_catalog(decode_json_loads())
+
+    def type_adapter() -> CompiledCatalog:
+        return compile_catalog(decode_type_adapter())
+
+    def stream() -> CompiledCatalog:
+        return compile_catalog_stream(chunks(), ActiveCampaign.model_validate_json)
+
+    results = []
+    versions = set()
+    campaigns = 0
+    for decode, method in (
+        (decode_json_loads, json_loads),
+        (decode_type_adapter, type_adapter),
+        (decode_stream, stream),
+    ):
+        _, decode_seconds = _best_time(decode, repeat)
+        catalog, seconds = _best_time(method, repeat)
+        versions.add(catalog.version)
+        campaigns = len(catalog)
+        results.append(
+            ParsingResult(
+                method=method.__name__,
+                decode_seconds=round(decode_seconds, 6),
+                seconds=round(seconds, 6),
+                campaigns_per_s=round(campaigns / seconds, 1) if seconds else 0.0,
+                peak_kib=round(_peak_memory(method) / 1024, 1),
+            )
+        )
+    if len(versions) != 1:
+        raise ValueError('The decoding paths gave different catalogs')
+    return CatalogParsingReport(
+        campaigns=campaigns,
+        payload_bytes=len(payload),
+        repeat=repeat,
+        results=results,
+    )
+
+
+def _best_time(method: Callable[[], T], repeat: int) -> tuple[T, float]:
+    best = float('inf')
+    catalog = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        catalog = method()
+        best = min(best, time.perf_counter() - start)
+    return catalog, best
+
+
+def _peak_memory(method: Callable[[], CompiledCatalog]) -> int:
+    """
+    Memory allocated at most by a run, in bytes. Measured apart from the timing, tracing slows the allocations down.
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    method()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    if not tracing:
+        tracemalloc.stop()
+    return peak
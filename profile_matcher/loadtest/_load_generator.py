@@ -0,0 +1,172 @@
+import asyncio
+import bisect
+import itertools
+import random
+import time
+from collections import Counter
+from enum import Enum
+from typing import Callable, Optional, Sequence
+
+import httpx
+import numpy as np
+from pydantic import BaseModel
+
+
+class KeyDistribution(str, Enum):
+    UNIFORM = 'uniform'
+    # A few hot players get most of the requests: the k-th most requested player gets a share proportional to 1 / k^s
+    ZIPF = 'zipf'
+
+
+def player_id_sampler(
+    player_ids: Sequence[str],
+    distribution: KeyDistribution = KeyDistribution.UNIFORM,
+    zipf_s: float = 1.1,
+    seed: Optional[int] = None,
+) -> Callable[[], str]:
+    """
+    Return a function drawing the player id of the next request. With the zipf distribution, the players are ranked in
+    the given order.
+    :raises ValueError: If there is no player id
+    """
+    if not player_ids:
+        raise ValueError('No player id to request')
+    generator = random.Random(seed)
+    if distribution is KeyDistribution.UNIFORM:
+        return lambda: generator.choice(player_ids)
+
+    cumulative_weights = list(
+        itertools.accumulate(1 / rank**zipf_s for rank in range(1, len(player_ids) + 1))
+    )
+    total = cumulative_weights[-1]
+    return lambda: player_ids[
+        bisect.bisect_left(cumulative_weights, generator.random() * total)
+    ]
+
+
+class LoadReport(BaseModel):
+    """
+    Outcome of a load test. The latencies are in milliseconds, an error is a request that failed or got a status other
+    than 2xx.
+    """
+
+    target: str
+    distribution: KeyDistribution
+    concurrency: int
+    duration_s: float
+    requests: int
+    errors: int
+    error_rate: float
+    status_codes: dict[str, int]
+    throughput_rps: float
+    latency_ms: dict[str, float]
+
+    def regressions(self, baseline: 'LoadReport', tolerance: float = 0.1) -> list[str]:
+        """
+        Compare the report with a baseline run: a throughput lower, or a latency percentile or error rate higher, by
+        more than tolerance (relative).
+        :return: A description of every regression, empty if none
+        """
+        regressions = []
+        if self.throughput_rps < baseline.throughput_rps * (1 - tolerance):
+            regressions.append(
+                f'throughput {self.throughput_rps} rps < baseline {baseline.throughput_rps} rps'
+            )
+        for name in ('p50', 'p95', 'p99'):
+            value, reference = self.latency_ms.get(name), baseline.latency_ms.get(name)
+            if value is not None and reference is not None:
+                if value > reference * (1 + tolerance):
+                    regressions.append(
+                        f'{name} latency {value} ms > baseline {reference} ms'
+                    )
+        if self.error_rate > baseline.error_rate * (1 + tolerance) + 1e-9:
+            regressions.append(
+                f'error rate {self.error_rate} > baseline {baseline.error_rate}'
+            )
+        return regressions
+
+
+class LoadGenerator:
+    """
+    Closed-loop load on /get_client_config: concurrency workers send a request, wait for the response and send the next
+    one, until duration seconds have passed. The client decides the target: the app in-process (httpx.ASGITransport)
+    or a server over a socket.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        next_player_id: Callable[[], str],
+        concurrency: int = 10,
+        duration: float = 10.0,
+        params: Optional[dict[str, str]] = None,
+        distribution: KeyDistribution = KeyDistribution.UNIFORM,
+        path: str = '/get_client_config/{player_id}',
+    ):
+        self.__client = client
+        self.__next_player_id = next_player_id
+        self.__concurrency = concurrency
+        self.__duration = duration
+        self.__params = params or {}
+        self.__distribution = distribution
+        self.__path = path
+
+    async def run(self) -> LoadReport:
+        latencies: list[float] = []
+        status_codes: Counter[str] = Counter()
+        start = time.perf_counter()
+        deadline = start + self.__duration
+        await asyncio.gather(
+            *(
+                self.__worker(deadline, latencies, status_codes)
+                for _ in range(self.__concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+        requests = len(latencies)
+        errors = sum(
+            count
+            for status, count in status_codes.items()
+            if not status.startswith('2')
+        )
+        return LoadReport(
+            target=str(self.__client.base_url),
+            distribution=self.__distribution,
+            concurrency=self.__concurrency,
+            duration_s=round(elapsed, 3),
+            requests=requests,
+            errors=errors,
+            error_rate=round(errors / requests, 6) if requests else 0.0,
+            status_codes=dict(sorted(status_codes.items())),
+            throughput_rps=round(requests / elapsed, 2),
+            latency_ms=_latency_percentiles(latencies),
+        )
+
+    async def __worker(
+        self, deadline: float, latencies: list[float], status_codes: Counter[str]
+    ):
+        while time.perf_counter() < deadline:
+            url = self.__path.format(player_id=self.__next_player_id())
+            start = time.perf_counter()
+            try:
+                response = await self.__client.get(url, params=self.__params)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            status_codes[status] += 1
+
+
+def _latency_percentiles(latencies: Sequence[float]) -> dict[str, float]:
+    if not latencies:
+        return {}
+    values = np.fromiter(latencies, dtype=float) * 1000
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {
+        'mean': round(float(values.mean()), 3),
+        'p50': round(float(p50), 3),
+        'p95': round(float(p95), 3),
+        'p99': round(float(p99), 3),
+        'max': round(float(values.max()), 3),
+    }
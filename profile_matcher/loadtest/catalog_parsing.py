@@ -0,0 +1,47 @@
+import argparse
+import pathlib
+
+from profile_matcher.loadtest import benchmark_catalog_parsing, generate_catalog
+
+# Benchmark of the campaign catalog decoding paths (json.loads, cached TypeAdapter, streaming), e.g.:
+#   python -m profile_matcher.loadtest.catalog_parsing --campaigns 20000
+#   python -m profile_matcher.loadtest.catalog_parsing --catalog campaigns.json --output parsing.json
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the decoding of a campaign catalog into the compiled catalog and report it as JSON'
+    )
+    parser.add_argument(
+        '--catalog',
+        type=pathlib.Path,
+        help='JSON catalog to decode, a random one is generated by default',
+    )
+    parser.add_argument(
+        '--campaigns', type=int, default=10_000, help='Campaigns generated'
+    )
+    parser.add_argument('--seed', type=int, help='Seed of the generated catalog')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per path')
+    parser.add_argument(
+        '--chunk-size', type=int, default=1 << 16, help='Chunks of the stream, in bytes'
+    )
+    parser.add_argument(
+        '--output', type=pathlib.Path, help='Also write the report to this file'
+    )
+    arguments = parser.parse_args()
+
+    payload = (
+        arguments.catalog.read_bytes()
+        if arguments.catalog
+        else generate_catalog(arguments.campaigns, arguments.seed)
+    )
+    report = benchmark_catalog_parsing(
+        payload, arguments.repeat, arguments.chunk_size
+    ).model_dump_json(indent=2)
+    print(report)
+    if arguments.output:
+        arguments.output.write_text(report)
+
+
+if __name__ == '__main__':
+    main()
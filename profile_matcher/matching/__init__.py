@@ -0,0 +1,26 @@
+from ._bulk import BulkMatcher
+from ._exception import BulkMatcherException
+from ._shadow import (
+    MATCHER_ENGINES,
+    CompiledEngine,
+    InterpretedEngine,
+    MatcherEngine,
+    ShadowMismatch,
+    ShadowRunner,
+    VectorizedEngine,
+)
+from ._vectorized import PlayerColumns, VectorizedMatcher
+
+__all__ = [
+    'BulkMatcher',
+    'BulkMatcherException',
+    'MATCHER_ENGINES',
+    'CompiledEngine',
+    'InterpretedEngine',
+    'MatcherEngine',
+    'ShadowMismatch',
+    'ShadowRunner',
+    'VectorizedEngine',
+    'PlayerColumns',
+    'VectorizedMatcher',
+]
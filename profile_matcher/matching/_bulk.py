@@ -0,0 +1,257 @@
+from datetime import datetime
+from logging import getLogger
+from typing import AsyncContextManager, AsyncIterator, Callable, Hashable, Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from profile_matcher.catalog import (
+    CatalogIndex,
+    ITEM_NAMES,
+    MatchCache,
+    PlayerFeatures,
+    to_timestamp,
+)
+from profile_matcher.database import (
+    ActiveCampaignsWriteBehind,
+    AsyncSessionManager,
+    ShardedSessionManager,
+)
+from profile_matcher.database.models import Device, Inventory, PlayerProfile
+from ._exception import BulkMatcherException
+from ._vectorized import PlayerColumns, VectorizedMatcher
+
+
+class BulkMatcher:
+    """
+    Match every player of the database against the campaigns running at now, chunk by chunk, with the vectorized
+    matcher. Used for audience sizing and full re-matches, where calling the matcher once per player and campaign is
+    too slow.
+    """
+
+    def __init__(
+        self,
+        index: CatalogIndex,
+        now: datetime,
+        game_limits: Optional[dict[str, int]] = None,
+        chunk_size: int = 10_000,
+        match_cache_size: int = 65536,
+    ):
+        self.__now = to_timestamp(now)
+        # Running campaigns come by descending priority (catalog order for equal priorities), so do the columns of the
+        # match matrix. They are filtered on their dates: the timeline of the index is kept for the requests, a job at
+        # another instant would move it.
+        self.matcher = VectorizedMatcher(
+            sorted(
+                (
+                    campaign
+                    for campaign in index.compiled
+                    if campaign.enabled
+                    and campaign.start_ts <= self.__now < campaign.end_ts
+                ),
+                key=lambda campaign: -campaign.priority,
+            )
+        )
+        self.match_cache = MatchCache(match_cache_size)
+        self.match_cache.bind(self.matcher.campaigns)
+        self.__game_limits = game_limits or {}
+        self.__chunk_size = chunk_size
+        self.__logger = getLogger('uvicorn')
+
+    async def iter_chunks(self, session: AsyncSession) -> AsyncIterator[PlayerColumns]:
+        """
+        Stream the players (with their inventory) from a server side cursor, chunk_size players at a time. The other
+        features of the players are only read if some campaigns need them.
+        """
+        columns = [
+            PlayerProfile.player_id,
+            PlayerProfile.level,
+            PlayerProfile.country,
+            PlayerProfile.active_campaigns,
+            PlayerProfile.version,
+            *(getattr(Inventory, name) for name in ITEM_NAMES),
+        ]
+        needs_features = self.matcher.needs_features
+        if needs_features:
+            columns += [
+                PlayerProfile.language,
+                PlayerProfile.gender,
+                PlayerProfile.total_spent,
+                PlayerProfile.last_purchase,
+                select(func.array_agg(Device.model))
+                .where(Device.player_id == PlayerProfile.player_id)
+                .scalar_subquery()
+                .label('device_models'),
+            ]
+        statement = (
+            select(*columns)
+            .outerjoin(Inventory, Inventory.player_id == PlayerProfile.player_id)
+            .execution_options(yield_per=self.__chunk_size)
+        )
+        result = await session.stream(statement)
+        async for rows in result.partitions():
+            # The feature columns come after the items, build_columns only reads the items
+            player_ids, levels, countries, active_campaigns, versions, *items = zip(
+                *rows
+            )
+            features = (
+                [PlayerFeatures.from_record(row._mapping) for row in rows]
+                if needs_features
+                else None
+            )
+            yield self.matcher.build_columns(
+                list(player_ids),
+                levels,
+                countries,
+                items,
+                list(active_campaigns),
+                features,
+                list(versions),
+            )
+
+    async def audience_sizes(self, session: AsyncSession) -> dict[str, int]:
+        """
+        Count the players matching every running campaign.
+        """
+        counts = np.zeros(len(self.matcher.campaigns), dtype=np.int64)
+        async for players in self.iter_chunks(session):
+            counts += self.matcher.match_matrix(players, self.__now).sum(axis=0)
+        return {
+            campaign.name: int(count)
+            for campaign, count in zip(self.matcher.campaigns, counts)
+        }
+
+    async def audience_sizes_across(
+        self, shards: ShardedSessionManager
+    ) -> dict[str, int]:
+        """
+        Count the players matching every running campaign on all the shards at once, and add the counts up.
+        """
+
+        async def shard_sizes(manager: AsyncSessionManager) -> dict[str, int]:
+            async with manager.session() as session:
+                return await self.audience_sizes(session)
+
+        totals = dict.fromkeys(
+            (campaign.name for campaign in self.matcher.campaigns), 0
+        )
+        for sizes in await shards.scatter(shard_sizes):
+            for name, count in sizes.items():
+                totals[name] += count
+        return totals
+
+    def select_active_campaigns(self, matches: np.ndarray) -> list[str]:
+        """
+        Turn a row of the match matrix into the active campaigns of the player, with the same rules as
+        get_client_config: by descending priority, at most the game limit per game. Every campaign matched is saved,
+        like the route does (its limit only applies to the response).
+        """
+        names = []
+        campaigns_per_game = {}
+        for index in np.flatnonzero(matches):
+            campaign = self.matcher.campaigns[index]
+            game_count = campaigns_per_game.get(campaign.game, 0)
+            game_limit = self.__game_limits.get(campaign.game)
+            if (game_limit is not None and game_count >= game_limit) or (
+                campaign.name in names
+            ):
+                continue
+            names.append(campaign.name)
+            campaigns_per_game[campaign.game] = game_count + 1
+        return names
+
+    def active_campaigns(self, players: PlayerColumns) -> list[list[str]]:
+        """
+        Compute the active campaigns of a chunk of players. The players whose fingerprint is in the match cache reuse
+        its result, the others are matched once per distinct fingerprint.
+        """
+        keys = self.__fingerprints(players)
+        if keys is None:
+            matrix = self.matcher.match_matrix(players, self.__now)
+            return [self.select_active_campaigns(matches) for matches in matrix]
+
+        results = [self.match_cache.get(key) for key in keys]
+        # First row of every fingerprint missing from the cache
+        pending: dict[Hashable, int] = {}
+        for row, (key, names) in enumerate(zip(keys, results)):
+            if names is None:
+                pending.setdefault(key, row)
+        if pending:
+            matrix = self.matcher.match_matrix(
+                players.take(list(pending.values())), self.__now
+            )
+            computed = {}
+            for key, matches in zip(pending, matrix):
+                computed[key] = tuple(self.select_active_campaigns(matches))
+                self.match_cache.put(key, computed[key])
+            results = [
+                computed[key] if names is None else names
+                for key, names in zip(keys, results)
+            ]
+        return [list(names) for names in results]
+
+    def __fingerprints(self, players: PlayerColumns) -> Optional[list[Hashable]]:
+        """
+        Fingerprints of the players of the chunk, None if their results cannot be cached.
+        """
+        if players.features is None:
+            # The campaigns only read the level, country and items of the players
+            return [
+                self.match_cache.key_of(fingerprint)
+                for fingerprint in zip(
+                    players.level.tolist(),
+                    players.country.tolist(),
+                    players.item_mask.tolist(),
+                )
+            ]
+        keys = [self.match_cache.key(player) for player in players.features]
+        return None if None in keys else keys
+
+    async def rematch(
+        self,
+        session: AsyncSession,
+        connect: Optional[Callable[[], AsyncContextManager[AsyncConnection]]] = None,
+    ) -> int:
+        """
+        Recompute the active campaigns of every player and write the ones that changed, one batched update per chunk.
+        :return: The number of players updated
+        :raises BulkMatcherException: If the update of a chunk fails
+        """
+        writer = ActiveCampaignsWriteBehind(
+            enabled=True,
+            batch_size=self.__chunk_size,
+            max_queue_size=self.__chunk_size,
+            connect=connect,
+        )
+        async for players in self.iter_chunks(session):
+            for row, active_campaigns in enumerate(self.active_campaigns(players)):
+                player_id = players.player_ids[row]
+                if active_campaigns != players.active_campaigns[row]:
+                    writer.submit(player_id, players.versions[row], active_campaigns)
+            if not await writer.flush():
+                raise BulkMatcherException(
+                    'Error in writing the active campaigns of the players'
+                )
+        # The players updated since they were read are left as they are
+        updated = writer.flushed_rows
+        self.__logger.info(
+            f'Re-matched all players, {updated} updated, match cache: {self.match_cache.stats()}'
+        )
+        return updated
+
+    async def rematch_across(self, shards: ShardedSessionManager) -> int:
+        """
+        Re-match the players of all the shards at once, every shard written with its own connections. The match cache
+        is shared by the shards.
+        :return: The number of players updated
+        :raises BulkMatcherException: If the update of a chunk fails on a shard
+        """
+
+        async def rematch_shard(manager: AsyncSessionManager) -> int:
+            async with manager.session() as session:
+                return await self.rematch(session, manager.connect)
+
+        return sum(await shards.scatter(rematch_shard))
@@ -0,0 +1,2 @@
+class BulkMatcherException(Exception):
+    pass
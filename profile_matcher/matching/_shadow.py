@@ -0,0 +1,322 @@
+import asyncio
+import dataclasses
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+from profile_matcher.catalog import CompiledCampaign, PlayerFeatures, rule_registry
+from ._vectorized import VectorizedMatcher
+
+
+class MatcherEngine(ABC):
+    """
+    A way of matching a player against the running campaigns. Every engine must give the same result: the names of
+    the campaigns matching the player, in the order of the campaigns.
+    """
+
+    name: str
+
+    @abstractmethod
+    def match(
+        self, player: PlayerFeatures, campaigns: Sequence[CompiledCampaign], now: float
+    ) -> list[str]:
+        """
+        Return the names of the campaigns matching the player at now (a POSIX timestamp).
+        """
+
+
+class CompiledEngine(MatcherEngine):
+    """
+    The engine of get_client_config: the compiled predicate of every campaign.
+    """
+
+    name = 'compiled'
+
+    def match(
+        self, player: PlayerFeatures, campaigns: Sequence[CompiledCampaign], now: float
+    ) -> list[str]:
+        return [
+            campaign.name for campaign in campaigns if campaign.matches(player, now)
+        ]
+
+
+class InterpretedEngine(MatcherEngine):
+    """
+    The reference implementations of the rules, evaluated in their default order.
+    """
+
+    name = 'interpreted'
+
+    def match(
+        self, player: PlayerFeatures, campaigns: Sequence[CompiledCampaign], now: float
+    ) -> list[str]:
+        return [
+            campaign.name
+            for campaign in campaigns
+            if rule_registry.interpret(campaign.all_rules(), player, now)
+        ]
+
+
+class VectorizedEngine(MatcherEngine):
+    """
+    The vectorized matcher of the bulk jobs, on a single player. The matcher is built once per list of campaigns.
+    """
+
+    name = 'vectorized'
+
+    def __init__(self):
+        self.__campaigns: tuple[CompiledCampaign, ...] = ()
+        self.__matcher = VectorizedMatcher(())
+
+    def match(
+        self, player: PlayerFeatures, campaigns: Sequence[CompiledCampaign], now: float
+    ) -> list[str]:
+        campaigns = tuple(campaigns)
+        if campaigns != self.__campaigns:
+            self.__campaigns = campaigns
+            self.__matcher = VectorizedMatcher(campaigns)
+        matches = self.__matcher.match_matrix(
+            self.__matcher.columns_from_features([''], [player]), now
+        )[0]
+        return [campaigns[index].name for index in np.flatnonzero(matches)]
+
+
+MATCHER_ENGINES: dict[str, type[MatcherEngine]] = {
+    engine.name: engine
+    for engine in (CompiledEngine, InterpretedEngine, VectorizedEngine)
+}
+
+
+@dataclass(frozen=True, slots=True)
+class ShadowMismatch:
+    """
+    A player for which the candidate engine did not give the result of the reference engine, with everything needed
+    to replay the comparison: the features of the player, the running campaigns (compiled) and the time of the match.
+    """
+
+    player_id: str
+    player: PlayerFeatures
+    campaigns: tuple[CompiledCampaign, ...]
+    now: float
+    expected: list[str]
+    actual: Optional[list[str]]
+    error: Optional[str] = None
+
+    def replay(self, engine: MatcherEngine) -> list[str]:
+        """
+        Match the player again with the engine, on the same inputs.
+        """
+        return engine.match(self.player, self.campaigns, self.now)
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        JSON-serializable form of the mismatch, the campaigns reduced to their name, game and rules.
+        """
+        return {
+            'player_id': self.player_id,
+            'player': {
+                name: sorted(value) if isinstance(value, frozenset) else value
+                for name, value in (
+                    (field.name, getattr(self.player, field.name))
+                    for field in dataclasses.fields(self.player)
+                )
+            },
+            'campaigns': [
+                {
+                    'name': campaign.name,
+                    'game': campaign.game,
+                    'rules': campaign.all_rules(),
+                }
+                for campaign in self.campaigns
+            ],
+            'now': self.now,
+            'expected': self.expected,
+            'actual': self.actual,
+            'error': self.error,
+        }
+
+
+class ShadowRunner:
+    """
+    Compare a candidate engine with the reference engine on real traffic. A sample_rate fraction of the players matched
+    is submitted; the engines run in a background thread, one comparison after the other, so that neither the response
+    nor the other requests wait for them on the event loop (the engines need not be thread-safe). Both engines are
+    timed on the same inputs. At most max_pending comparisons wait at a time, the players submitted beyond are dropped.
+    Without candidate, the runner is disabled.
+    """
+
+    def __init__(
+        self,
+        candidate: Optional[MatcherEngine],
+        reference: Optional[MatcherEngine] = None,
+        sample_rate: float = 0.01,
+        max_pending: int = 100,
+        max_mismatches: int = 100,
+        latency_window: int = 10_000,
+    ):
+        self.candidate = candidate
+        self.reference = reference or CompiledEngine()
+        self.__sample_rate = sample_rate
+        self.__max_pending = max_pending
+        self.__tasks: set[asyncio.Task] = set()
+        # Started with the first comparison, shut down by stop
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__random = random.Random()
+        self.__logger = getLogger('uvicorn')
+
+        # Latest mismatches, and durations of the latest comparisons (seconds)
+        self.mismatches: deque[ShadowMismatch] = deque(maxlen=max_mismatches)
+        self.reference_durations: deque[float] = deque(maxlen=latency_window)
+        self.candidate_durations: deque[float] = deque(maxlen=latency_window)
+
+        self.compared = 0
+        self.mismatched = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.candidate is not None and self.__sample_rate > 0
+
+    @property
+    def pending(self) -> int:
+        return len(self.__tasks)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'candidate': None if self.candidate is None else self.candidate.name,
+            'reference': self.reference.name,
+            'compared': self.compared,
+            'mismatched': self.mismatched,
+            'dropped': self.dropped,
+            'pending': self.pending,
+            'reference_latency_ms': _percentiles(self.reference_durations),
+            'candidate_latency_ms': _percentiles(self.candidate_durations),
+        }
+
+    def submit(
+        self,
+        player_id: str,
+        player: PlayerFeatures,
+        campaigns: Sequence[CompiledCampaign],
+        now: float,
+    ) -> bool:
+        """
+        Submit a player matched against the running campaigns at now, compared later if it is sampled. Never waits.
+        :return: True if the comparison is scheduled
+        """
+        if not self.enabled or self.__random.random() >= self.__sample_rate:
+            return False
+        if len(self.__tasks) >= self.__max_pending:
+            self.dropped += 1
+            return False
+
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='shadow-matching'
+            )
+        task = asyncio.get_running_loop().create_task(
+            self.__compare(player_id, player, tuple(campaigns), now)
+        )
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+        return True
+
+    async def drain(self):
+        """
+        Wait for the pending comparisons.
+        """
+        while self.__tasks:
+            await asyncio.gather(*self.__tasks, return_exceptions=True)
+
+    async def stop(self):
+        """
+        Cancel the pending comparisons.
+        """
+        for task in list(self.__tasks):
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
+        if self.enabled:
+            self.__logger.info(f'Shadow matching stopped: {self.stats()}')
+
+    async def __compare(
+        self,
+        player_id: str,
+        player: PlayerFeatures,
+        campaigns: tuple[CompiledCampaign, ...],
+        now: float,
+    ):
+        (
+            expected,
+            reference_duration,
+            actual,
+            error,
+            candidate_duration,
+        ) = await asyncio.get_running_loop().run_in_executor(
+            self.__executor, self.__run_engines, player, campaigns, now
+        )
+        self.reference_durations.append(reference_duration)
+        self.candidate_durations.append(candidate_duration)
+
+        self.compared += 1
+        if error is None and actual == expected:
+            return
+        self.mismatched += 1
+        mismatch = ShadowMismatch(
+            player_id=player_id,
+            player=player,
+            campaigns=campaigns,
+            now=now,
+            expected=expected,
+            actual=actual,
+            error=error,
+        )
+        self.mismatches.append(mismatch)
+        self.__logger.warning(
+            f'Shadow engine {self.candidate.name} mismatch: {mismatch.to_dict()}'
+        )
+
+    def __run_engines(
+        self,
+        player: PlayerFeatures,
+        campaigns: tuple[CompiledCampaign, ...],
+        now: float,
+    ) -> tuple[list[str], float, Optional[list[str]], Optional[str], float]:
+        """
+        Match the player with both engines, in the thread of the runner.
+        :return: The result and duration of the reference, the result or error and duration of the candidate
+        """
+        start = time.perf_counter()
+        expected = self.reference.match(player, campaigns, now)
+        reference_duration = time.perf_counter() - start
+
+        actual, error = None, None
+        start = time.perf_counter()
+        try:
+            actual = self.candidate.match(player, campaigns, now)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        return expected, reference_duration, actual, error, time.perf_counter() - start
+
+
+def _percentiles(durations: Sequence[float]) -> dict[str, float]:
+    """
+    Median, 90th and 99th percentiles of durations in seconds, in milliseconds.
+    """
+    if not durations:
+        return {}
+    p50, p90, p99 = np.percentile(np.fromiter(durations, dtype=float), (50, 90, 99))
+    return {
+        'p50': round(p50 * 1000, 4),
+        'p90': round(p90 * 1000, 4),
+        'p99': round(p99 * 1000, 4),
+    }
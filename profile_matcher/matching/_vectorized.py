@@ -0,0 +1,201 @@
+import time
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from profile_matcher.catalog import (
+    CompiledCampaign,
+    ITEM_NAMES,
+    PlayerFeatures,
+    items_to_mask,
+)
+
+# Code of the countries that no campaign targets
+UNKNOWN_COUNTRY = 0
+
+
+class PlayerColumns:
+    """
+    A chunk of players stored by column: the matching-relevant features of player i are level[i], country[i] (encoded
+    with the country codes of the matcher) and item_mask[i]. features[i], if given, holds every feature of player i,
+    for the campaigns with rules that are not vectorized. versions[i], if given, is the version player i was read at.
+    """
+
+    __slots__ = (
+        'player_ids',
+        'level',
+        'country',
+        'item_mask',
+        'active_campaigns',
+        'features',
+        'versions',
+    )
+
+    def __init__(
+        self,
+        player_ids: list[str],
+        level: np.ndarray,
+        country: np.ndarray,
+        item_mask: np.ndarray,
+        active_campaigns: Optional[list[Optional[list[str]]]] = None,
+        features: Optional[Sequence[PlayerFeatures]] = None,
+        versions: Optional[list[int]] = None,
+    ):
+        self.player_ids = player_ids
+        self.level = level
+        self.country = country
+        self.item_mask = item_mask
+        self.active_campaigns = active_campaigns
+        self.features = features
+        self.versions = versions
+
+    def __len__(self) -> int:
+        return len(self.player_ids)
+
+    def take(self, rows: Sequence[int]) -> 'PlayerColumns':
+        """
+        Return the columns of the players at the given rows.
+        """
+        return PlayerColumns(
+            [self.player_ids[row] for row in rows],
+            self.level[rows],
+            self.country[rows],
+            self.item_mask[rows],
+            None
+            if self.active_campaigns is None
+            else [self.active_campaigns[row] for row in rows],
+            None if self.features is None else [self.features[row] for row in rows],
+            None if self.versions is None else [self.versions[row] for row in rows],
+        )
+
+
+class VectorizedMatcher:
+    """
+    Match a whole chunk of players against a list of compiled campaigns with array operations: every matcher of a
+    campaign becomes a comparison between the player columns and the campaign columns, giving a players x campaigns
+    boolean matrix. The other rules of a campaign (language, devices, ...) are then evaluated on the features of the
+    players matching the level, country and items of the campaign only.
+    """
+
+    def __init__(self, campaigns: Sequence[CompiledCampaign]):
+        self.campaigns = tuple(campaigns)
+        # Campaigns with rules that are not vectorized
+        self.__refined = [
+            index for index, campaign in enumerate(campaigns) if campaign.rules
+        ]
+        countries = sorted(
+            {country for campaign in campaigns for country in campaign.countries}
+        )
+        self.country_codes = {
+            country: code for code, country in enumerate(countries, 1)
+        }
+
+        self.__level_min = np.array([c.level_min for c in campaigns], dtype=np.int64)
+        self.__level_max = np.array([c.level_max for c in campaigns], dtype=np.int64)
+        self.__has_items = np.array([c.has_items for c in campaigns], dtype=np.uint64)
+        self.__does_not_have_items = np.array(
+            [c.does_not_have_items for c in campaigns], dtype=np.uint64
+        )
+        # allowed_countries[code, campaign] is True if the campaign targets the country
+        self.__allowed_countries = np.zeros(
+            (len(countries) + 1, len(campaigns)), dtype=bool
+        )
+        for index, campaign in enumerate(campaigns):
+            for country in campaign.countries:
+                self.__allowed_countries[self.country_codes[country], index] = True
+
+    def encode_countries(self, countries: Sequence[Optional[str]]) -> np.ndarray:
+        """
+        Encode player countries with the codes of this matcher. Only the distinct countries are looked up.
+        """
+        unique, inverse = np.unique(
+            np.array([country or '' for country in countries], dtype=object),
+            return_inverse=True,
+        )
+        codes = np.array(
+            [self.country_codes.get(country, UNKNOWN_COUNTRY) for country in unique],
+            dtype=np.intp,
+        )
+        return codes[inverse.reshape(-1)]
+
+    def build_columns(
+        self,
+        player_ids: list[str],
+        levels: Sequence[int],
+        countries: Sequence[Optional[str]],
+        items: Iterable[Sequence],
+        active_campaigns: Optional[list[Optional[list[str]]]] = None,
+        features: Optional[Sequence[PlayerFeatures]] = None,
+        versions: Optional[list[int]] = None,
+    ) -> PlayerColumns:
+        """
+        Build the columns of a chunk of players. items holds, in the order of ITEM_NAMES, one column per inventory
+        field (None when the player does not have the item, or has no inventory).
+        """
+        item_mask = np.zeros(len(player_ids), dtype=np.uint64)
+        for name, column in zip(ITEM_NAMES, items):
+            held = np.array([value is not None for value in column], dtype=bool)
+            item_mask[held] |= np.uint64(items_to_mask([name]))
+        return PlayerColumns(
+            player_ids,
+            np.asarray(levels, dtype=np.int64),
+            self.encode_countries(countries),
+            item_mask,
+            active_campaigns,
+            features,
+            versions,
+        )
+
+    def columns_from_features(
+        self, player_ids: list[str], features: Sequence[PlayerFeatures]
+    ) -> PlayerColumns:
+        """
+        Build the columns of a chunk of players from their features, already reduced to an item mask.
+        """
+        return PlayerColumns(
+            player_ids,
+            np.fromiter((player.level for player in features), dtype=np.int64),
+            self.encode_countries([player.country for player in features]),
+            np.fromiter((player.item_mask for player in features), dtype=np.uint64),
+            [sorted(player.active_campaigns) for player in features],
+            features,
+        )
+
+    @property
+    def needs_features(self) -> bool:
+        """
+        Whether some campaigns have rules that need the features of the players.
+        """
+        return bool(self.__refined)
+
+    def match_matrix(
+        self, players: PlayerColumns, now: Optional[float] = None
+    ) -> np.ndarray:
+        """
+        Return the players x campaigns matrix of matches at now (a POSIX timestamp, the current time by default).
+        :raises ValueError: If some campaigns need the features of the players and the columns do not have them
+        """
+        level = players.level[:, None]
+        item_mask = players.item_mask[:, None]
+        matches = (level >= self.__level_min) & (level <= self.__level_max)
+        matches &= (item_mask & self.__has_items) != 0
+        matches &= (item_mask & self.__does_not_have_items) == 0
+        matches &= self.__allowed_countries[players.country]
+        if self.__refined:
+            if players.features is None:
+                raise ValueError('The campaigns need the features of the players')
+            now = time.time() if now is None else now
+            for index in self.__refined:
+                campaign = self.campaigns[index]
+                for row in np.flatnonzero(matches[:, index]):
+                    matches[row, index] = campaign.matches(players.features[row], now)
+        return matches
+
+    def matching_players(self, players: PlayerColumns) -> list[np.ndarray]:
+        """
+        Return, for every campaign, the indexes of the players of the chunk matching it.
+        """
+        matrix = self.match_matrix(players)
+        return [
+            np.flatnonzero(matrix[:, index]) for index in range(len(self.campaigns))
+        ]
@@ -0,0 +1,24 @@
+from ._exception import RepositoryException
+from ._in_memory import InMemoryPlayerRepository, PlayerSnapshotRecord
+from ._orm import OrmPlayerRepository
+from ._player_repository import PlayerRepository
+from ._selection import (
+    PLAYER_REPOSITORY_BACKEND,
+    PLAYER_SNAPSHOT_PATH,
+    RepositoryBackend,
+    get_player_repository,
+    in_memory_player_repository,
+)
+
+__all__ = [
+    'RepositoryException',
+    'InMemoryPlayerRepository',
+    'PlayerSnapshotRecord',
+    'OrmPlayerRepository',
+    'PlayerRepository',
+    'PLAYER_REPOSITORY_BACKEND',
+    'PLAYER_SNAPSHOT_PATH',
+    'RepositoryBackend',
+    'get_player_repository',
+    'in_memory_player_repository',
+]
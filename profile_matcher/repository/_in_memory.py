@@ -0,0 +1,192 @@
+import os
+from typing import AbstractSet, Any, Iterable, Optional, TypeVar
+
+from pydantic import ValidationError
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.orm.attributes import set_committed_value
+
+from profile_matcher.database.models import Clan, Device, Inventory, PlayerProfile
+from profile_matcher.ingestion import PlayerProfileRecord
+from ._exception import RepositoryException
+from ._player_repository import PlayerRepository
+
+# Order of the values in the records
+PLAYER_FIELDS: tuple[str, ...] = tuple(
+    name
+    for name in PlayerProfileRecord.model_fields
+    if name not in ('clan_name', 'inventory', 'devices')
+)
+INVENTORY_FIELDS: tuple[str, ...] = tuple(
+    name for name in Inventory.model_fields if name not in ('id', 'player_id')
+)
+DEVICE_FIELDS: tuple[str, ...] = ('id', 'model', 'carrier', 'firmware')
+
+T = TypeVar('T')
+
+
+class PlayerSnapshotRecord(PlayerProfileRecord):
+    """
+    Line of a players snapshot: an ingested player, with the columns computed by the service.
+    """
+
+    active_campaigns: list[str] = []
+    version: int = 1
+
+
+class _PlayerRecord:
+    """
+    Compact storage of a player: tuples of values instead of objects, the clan name is stored once per clan.
+    """
+
+    __slots__ = ('values', 'inventory', 'devices', 'active_campaigns', 'version')
+
+    def __init__(
+        self,
+        values: tuple,
+        inventory: Optional[tuple],
+        devices: tuple[tuple, ...],
+        active_campaigns: tuple[str, ...],
+        version: int,
+    ):
+        self.values = values
+        self.inventory = inventory
+        self.devices = devices
+        self.active_campaigns = active_campaigns
+        self.version = version
+
+
+class InMemoryPlayerRepository(PlayerRepository):
+    """
+    Players kept in memory, in dictionaries of compact records, for the deployments without a database (edge, low
+    latency, benchmarks). The players are seeded from a snapshot, the active campaigns saved are lost on restart.
+    A call never awaits: loading and saving a player are atomic.
+    """
+
+    def __init__(self):
+        self.__players: dict[str, _PlayerRecord] = {}
+        self.__clans: dict[int, str] = {}
+        # The relationships are set up by the first query, which never happens without a database
+        configure_mappers()
+
+    def __len__(self) -> int:
+        return len(self.__players)
+
+    def add(self, record: PlayerSnapshotRecord):
+        """
+        Add (or replace) a player.
+        :raises RepositoryException: If the clan of the player has no name
+        """
+        if record.clan_name is not None:
+            self.__clans[record.clan_id] = record.clan_name
+        elif record.clan_id not in self.__clans:
+            raise RepositoryException(
+                f'Unknown clan {record.clan_id} for player {record.player_id}'
+            )
+
+        self.__players[record.player_id] = _PlayerRecord(
+            values=tuple(getattr(record, name) for name in PLAYER_FIELDS),
+            inventory=None
+            if record.inventory is None
+            else tuple(getattr(record.inventory, name) for name in INVENTORY_FIELDS),
+            devices=tuple(
+                tuple(getattr(device, name) for name in DEVICE_FIELDS)
+                for device in record.devices
+            ),
+            active_campaigns=tuple(record.active_campaigns),
+            version=record.version,
+        )
+
+    def load_snapshot(self, lines: Iterable[str | bytes]) -> int:
+        """
+        Add the players of a NDJSON snapshot, one player per line.
+        :return: The number of players added
+        :raises RepositoryException: If a line is not a valid player
+        """
+        count = 0
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                self.add(PlayerSnapshotRecord.model_validate_json(line))
+            except ValidationError as e:
+                raise RepositoryException(f'Line {line_number}: {e}')
+            count += 1
+        return count
+
+    def load_snapshot_file(self, path: str | os.PathLike) -> int:
+        """
+        Add the players of a NDJSON snapshot file.
+        :return: The number of players added
+        :raises RepositoryException: If a line is not a valid player
+        """
+        with open(path, 'rb') as file:
+            return self.load_snapshot(file)
+
+    async def load_player(
+        self, player_id: str, fields: Optional[AbstractSet[str]] = None
+    ) -> Optional[PlayerProfile]:
+        # Every column is in the record, only the relationships not requested are skipped
+        record = self.__players.get(player_id)
+        if record is None:
+            return None
+
+        player = _instance(
+            PlayerProfile,
+            zip(PLAYER_FIELDS, record.values),
+            active_campaigns=list(record.active_campaigns),
+            version=record.version,
+        )
+        if fields is None or 'inventory' in fields:
+            set_committed_value(
+                player,
+                'inventory',
+                None
+                if record.inventory is None
+                else _instance(
+                    Inventory,
+                    zip(INVENTORY_FIELDS, record.inventory),
+                    id=None,
+                    player_id=player_id,
+                ),
+            )
+        if fields is None or 'devices' in fields:
+            set_committed_value(
+                player,
+                'devices',
+                [
+                    _instance(Device, zip(DEVICE_FIELDS, device), player_id=player_id)
+                    for device in record.devices
+                ],
+            )
+        if fields is None or 'clan' in fields:
+            set_committed_value(
+                player,
+                'clan',
+                _instance(
+                    Clan, (), id=player.clan_id, name=self.__clans[player.clan_id]
+                ),
+            )
+        return player
+
+    async def save_active_campaigns(
+        self, player: PlayerProfile, active_campaigns: list[str]
+    ) -> bool:
+        record = self.__players.get(player.player_id)
+        if record is None or record.version != player.version:
+            return False
+
+        record.active_campaigns = tuple(active_campaigns)
+        record.version += 1
+        set_committed_value(player, 'active_campaigns', list(active_campaigns))
+        set_committed_value(player, 'version', record.version)
+        return True
+
+
+def _instance(model: type[T], values: Iterable[tuple[str, Any]], **more_values) -> T:
+    """
+    Build a model instance the way the ORM does when it loads a row: the values are set as is, without the validation
+    and the attribute events of the constructor, which cost more than the rest of the load.
+    """
+    instance = model.__mapper__.class_manager.new_instance()
+    instance.__dict__.update(values, **more_values)
+    return instance
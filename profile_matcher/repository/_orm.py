@@ -0,0 +1,131 @@
+from typing import AbstractSet, Optional
+
+from sqlalchemy import Update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, load_only, raiseload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import select, update
+from sqlmodel.sql.expression import SelectOfScalar
+
+from profile_matcher.database import ActiveCampaignsWriteBehind, UnitOfWork
+from profile_matcher.database.models import Clan, PlayerProfile
+from ._exception import RepositoryException
+from ._player_repository import PlayerRepository
+
+# The columns needed to save the active campaigns, loaded whatever the fields requested
+KEY_COLUMNS = ('player_id', 'version', 'active_campaigns')
+
+
+class OrmPlayerRepository(PlayerRepository):
+    """
+    Players stored in Postgres, through the ORM. Each call is a stage of the unit of work of the request. When the
+    write-behind queue accepts them, the active campaigns are written later, in batch, and are read from the queue
+    until then.
+    """
+
+    def __init__(
+        self, unit_of_work: UnitOfWork, write_behind: ActiveCampaignsWriteBehind
+    ):
+        self.__unit_of_work = unit_of_work
+        self.__write_behind = write_behind
+
+    async def load_player(
+        self, player_id: str, fields: Optional[AbstractSet[str]] = None
+    ) -> Optional[PlayerProfile]:
+        try:
+            async with self.__unit_of_work.stage() as session:
+                result = await session.exec(player_statement(player_id, fields))
+                player = result.first()
+        except SQLAlchemyError as e:
+            raise RepositoryException(f'Could not load player {player_id}: {e}')
+
+        # Active campaigns still waiting in the write-behind queue are more recent than the database
+        pending_campaigns = (
+            None if player is None else self.__write_behind.pending(player_id)
+        )
+        if pending_campaigns is not None:
+            set_committed_value(player, 'active_campaigns', pending_campaigns)
+        return player
+
+    async def save_active_campaigns(
+        self, player: PlayerProfile, active_campaigns: list[str]
+    ) -> bool:
+        # Read before the stage: a rollback expires the player
+        player_id, version = player.player_id, player.version
+        if self.__write_behind.submit(player_id, version, active_campaigns):
+            set_committed_value(player, 'active_campaigns', active_campaigns)
+            return True
+
+        try:
+            async with self.__unit_of_work.stage() as session:
+                result = await session.exec(
+                    update_statement(player_id, version, active_campaigns)
+                )
+        except SQLAlchemyError as e:
+            raise RepositoryException(
+                f'Could not save the active campaigns of player {player_id}: {e}'
+            )
+        if result.rowcount != 1:
+            return False
+
+        set_committed_value(player, 'active_campaigns', active_campaigns)
+        set_committed_value(player, 'version', version + 1)
+        return True
+
+
+def player_statement(
+    player_id: str, fields: Optional[AbstractSet[str]] = None
+) -> SelectOfScalar[PlayerProfile]:
+    """
+    Build the query loading the player. The inventory and the clan are joined, the devices (a collection) come with a
+    second statement, instead of one statement per relationship. The players of the clan are never needed: loading
+    them would read the whole clan. A player already in the session is overwritten with the current state.
+    With fields, only the columns and relationships listed (and the key columns) are loaded: reading another one
+    raises instead of querying the database again.
+    """
+    statement = (
+        select(PlayerProfile)
+        .where(PlayerProfile.player_id == player_id)
+        .execution_options(populate_existing=True)
+    )
+    if fields is None:
+        return statement.options(
+            joinedload(PlayerProfile.inventory),
+            joinedload(PlayerProfile.clan).raiseload(Clan.players),
+            selectinload(PlayerProfile.devices),
+        )
+
+    columns = [
+        getattr(PlayerProfile, name)
+        for name in PlayerProfile.__table__.columns.keys()
+        if name in fields or name in KEY_COLUMNS
+    ]
+    return statement.options(
+        load_only(*columns, raiseload=True),
+        joinedload(PlayerProfile.inventory)
+        if 'inventory' in fields
+        else raiseload(PlayerProfile.inventory),
+        joinedload(PlayerProfile.clan).raiseload(Clan.players)
+        if 'clan' in fields
+        else raiseload(PlayerProfile.clan),
+        selectinload(PlayerProfile.devices)
+        if 'devices' in fields
+        else raiseload(PlayerProfile.devices),
+    )
+
+
+def update_statement(
+    player_id: str, version: int, active_campaigns: list[str]
+) -> Update:
+    """
+    Build the update of the active campaigns of the player, applied only if the player is still at version.
+    """
+    return (
+        update(PlayerProfile)
+        .where(
+            PlayerProfile.player_id == player_id,
+            PlayerProfile.version == version,
+        )
+        .values(active_campaigns=active_campaigns, version=version + 1)
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,35 @@
+from abc import ABC, abstractmethod
+from typing import AbstractSet, Optional
+
+from profile_matcher.database.models import PlayerProfile
+
+
+class PlayerRepository(ABC):
+    """
+    Storage of the players, as needed by the matching: load a player snapshot (with its inventory, devices and clan)
+    and save its active campaigns. The players returned are not bound to any storage, they can be read and serialized
+    after the call.
+    """
+
+    @abstractmethod
+    async def load_player(
+        self, player_id: str, fields: Optional[AbstractSet[str]] = None
+    ) -> Optional[PlayerProfile]:
+        """
+        Load the player with the given fields (columns, and the inventory, devices and clan relationships), or with all
+        of them if fields is None. The player id, the version and the active campaigns are always loaded. The other
+        fields may be left unloaded, and must not be read.
+        :return: The player, or None if it does not exist
+        :raises RepositoryException: If the storage fails
+        """
+
+    @abstractmethod
+    async def save_active_campaigns(
+        self, player: PlayerProfile, active_campaigns: list[str]
+    ) -> bool:
+        """
+        Save the active campaigns of the player, only if it was not modified since it was loaded (same version). On
+        success, the player gets the new active campaigns and version.
+        :return: False if another writer modified the player first
+        :raises RepositoryException: If the storage fails
+        """
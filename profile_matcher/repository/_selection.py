@@ -0,0 +1,38 @@
+import os
+from enum import Enum
+
+from dotenv import load_dotenv
+from fastapi import Depends
+
+from profile_matcher.database import (
+    UnitOfWork,
+    active_campaigns_write_behind,
+    get_unit_of_work,
+)
+from ._in_memory import InMemoryPlayerRepository
+from ._orm import OrmPlayerRepository
+from ._player_repository import PlayerRepository
+
+load_dotenv()
+
+
+class RepositoryBackend(str, Enum):
+    ORM = 'orm'
+    MEMORY = 'memory'
+
+
+# Storage of the players, chosen at startup
+PLAYER_REPOSITORY_BACKEND = RepositoryBackend(os.getenv('PLAYER_REPOSITORY', 'orm'))
+
+# NDJSON snapshot the in-memory players are loaded from at startup
+PLAYER_SNAPSHOT_PATH = os.getenv('PLAYER_SNAPSHOT_PATH')
+
+in_memory_player_repository = InMemoryPlayerRepository()
+
+
+def get_player_repository(
+    unit_of_work: UnitOfWork = Depends(get_unit_of_work),
+) -> PlayerRepository:
+    if PLAYER_REPOSITORY_BACKEND is RepositoryBackend.MEMORY:
+        return in_memory_player_repository
+    return OrmPlayerRepository(unit_of_work, active_campaigns_write_behind)
@@ -0,0 +1,163 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from profile_matcher.database.models import Clan
+from profile_matcher.diagnostics import memory_diagnostics
+
+ADMIN_HEADERS = {'X-Admin-Token': 'admin_token'}
+
+
+class TestMemoryRoutes:
+    @pytest.fixture(autouse=True)
+    def setup_data(self, monkeypatch):
+        monkeypatch.setenv('ADMIN_TOKEN', 'admin_token')
+        yield
+        memory_diagnostics.stop()
+
+    @pytest.mark.asyncio
+    async def test_admin_only(self, async_client, monkeypatch):
+        """
+        Test that the diagnostics are refused without the admin token, with a wrong one, or when no admin token is
+        configured.
+        """
+        # Act
+        missing = await async_client.get('/admin/memory/objects')
+        wrong = await async_client.get(
+            '/admin/memory/objects', headers={'X-Admin-Token': 'wrong'}
+        )
+        monkeypatch.delenv('ADMIN_TOKEN')
+        unconfigured = await async_client.get(
+            '/admin/memory/objects', headers=ADMIN_HEADERS
+        )
+
+        # Assert
+        assert missing.status_code == 403
+        assert wrong.status_code == 403
+        assert unconfigured.status_code == 403
+        assert not memory_diagnostics.tracing
+
+    @pytest.mark.asyncio
+    async def test_allocation_diff(self, async_client):
+        """
+        Test that the allocations made between a snapshot and the diff are reported by line, the largest growth first,
+        and that the snapshots are refused once tracing is stopped.
+        """
+        # Arrange
+        started = await async_client.post(
+            '/admin/memory/tracing/start', params={'frames': 2}, headers=ADMIN_HEADERS
+        )
+        snapshot = await async_client.post(
+            '/admin/memory/snapshots', headers=ADMIN_HEADERS
+        )
+        leak = [bytearray(1024) for _ in range(2_000)]
+
+        # Act
+        diff = await async_client.get(
+            '/admin/memory/diff',
+            params={'since': snapshot.json()['id'], 'top': 5},
+            headers=ADMIN_HEADERS,
+        )
+        by_file = await async_client.get(
+            '/admin/memory/diff', params={'group_by': 'filename'}, headers=ADMIN_HEADERS
+        )
+        unknown = await async_client.get(
+            '/admin/memory/diff', params={'since': 1_000}, headers=ADMIN_HEADERS
+        )
+        stopped = await async_client.post(
+            '/admin/memory/tracing/stop', headers=ADMIN_HEADERS
+        )
+        refused = await async_client.post(
+            '/admin/memory/snapshots', headers=ADMIN_HEADERS
+        )
+
+        # Assert
+        assert started.status_code == 200
+        assert started.json()['tracing'] and started.json()['frames'] == 2
+        assert snapshot.status_code == 200
+        assert diff.status_code == 200
+        allocations = diff.json()['allocations']
+        assert len(allocations) <= 5
+        assert allocations[0]['filename'].endswith('test_memory_routes.py')
+        assert allocations[0]['size_diff'] >= 2_000 * 1024
+        assert allocations[0]['count_diff'] >= 2_000
+        assert diff.json()['since']['id'] == snapshot.json()['id']
+        assert by_file.status_code == 200
+        assert by_file.json()['allocations'][0]['lineno'] is None
+        assert unknown.status_code == 404
+        assert stopped.json() == {
+            'tracing': False,
+            'frames': 0,
+            'traced': 0,
+            'peak': 0,
+            'snapshots': [],
+        }
+        assert refused.status_code == 409
+        assert len(leak) == 2_000
+
+    @pytest.mark.asyncio
+    async def test_live_objects(self, async_client, async_session):
+        """
+        Test that the live instances of the database models are counted, with the objects in the sessions identity
+        maps.
+        """
+        # Arrange
+        clans = [Clan(id=index, name=f'clan_{index}') for index in range(1, 4)]
+        async_session.add_all(clans)
+        await async_session.flush()
+
+        # Act
+        response = await async_client.get(
+            '/admin/memory/objects', headers=ADMIN_HEADERS
+        )
+
+        # Assert
+        assert response.status_code == 200
+        objects = response.json()
+        assert set(objects['models']) == {
+            'Clan',
+            'Device',
+            'Inventory',
+            'PlayerProfile',
+        }
+        assert objects['models']['Clan'] >= 3
+        assert objects['sessions']['sessions'] >= 1
+        assert objects['sessions']['identity_map_objects'] >= 3
+
+    @pytest.mark.asyncio
+    async def test_off_event_loop(self, async_client):
+        """
+        Test that the snapshots and the scan of the live objects do not run on the thread of the event loop.
+        """
+        # Arrange
+        threads = []
+        live_objects = memory_diagnostics.live_objects
+        take_snapshot = memory_diagnostics.take_snapshot
+
+        def record(function):
+            def recorded(*args, **kwargs):
+                threads.append(threading.get_ident())
+                return function(*args, **kwargs)
+
+            return recorded
+
+        await async_client.post('/admin/memory/tracing/start', headers=ADMIN_HEADERS)
+
+        # Act
+        with (
+            patch.object(memory_diagnostics, 'live_objects', record(live_objects)),
+            patch.object(memory_diagnostics, 'take_snapshot', record(take_snapshot)),
+        ):
+            objects = await async_client.get(
+                '/admin/memory/objects', headers=ADMIN_HEADERS
+            )
+            snapshot = await async_client.post(
+                '/admin/memory/snapshots', headers=ADMIN_HEADERS
+            )
+
+        # Assert
+        assert objects.status_code == 200
+        assert snapshot.status_code == 200
+        assert len(threads) == 2
+        assert threading.get_ident() not in threads
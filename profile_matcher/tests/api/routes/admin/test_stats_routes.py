@@ -0,0 +1,30 @@
+import pytest
+
+from profile_matcher.database import active_campaigns_write_behind
+
+ADMIN_HEADERS = {'X-Admin-Token': 'admin_token'}
+
+
+class TestStatsRoutes:
+    @pytest.fixture(autouse=True)
+    def setup_data(self, monkeypatch):
+        monkeypatch.setenv('ADMIN_TOKEN', 'admin_token')
+
+    @pytest.mark.asyncio
+    async def test_worker_stats(self, async_client):
+        """
+        Test that the counters of the worker are returned to the admin only, with the stale updates of the write-behind.
+        """
+        # Act
+        refused = await async_client.get('/admin/stats')
+        response = await async_client.get('/admin/stats', headers=ADMIN_HEADERS)
+
+        # Assert
+        assert refused.status_code == 403
+        assert response.status_code == 200
+        data = response.json()
+        assert data['write_behind'] == active_campaigns_write_behind.stats()
+        assert 'stale_updates' in data['write_behind']
+        assert {'hits', 'misses'} <= data['match_cache'].keys()
+        assert 'full_syncs' in data['catalog_sync']
+        assert 'notifications' in data['invalidation']
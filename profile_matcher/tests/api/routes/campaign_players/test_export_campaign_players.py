@@ -0,0 +1,213 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch, Mock
+
+import pytest
+
+from profile_matcher.api import HttpCampaignSource
+from profile_matcher.api.models import (
+    Matcher,
+    Level,
+    MatcherContent,
+    ActiveCampaign,
+    Range,
+    Recency,
+)
+from profile_matcher.api.routes._campaign_players import _export
+from profile_matcher.catalog import CatalogSync
+from profile_matcher.database.models import PlayerProfile, Clan, Device, Inventory
+
+
+class TestExportCampaignPlayers:
+    @pytest.fixture(autouse=True)
+    def setup_data(self, async_client, async_session):
+        self.__campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+
+    @pytest.mark.asyncio
+    async def test_export_campaign_players(self, async_client, async_session):
+        """
+        Test that only the players matching the campaign are streamed, one JSON document per line, across several
+        chunks.
+        """
+        # Arrange
+        # (level, country, item_1, item_4): only the first two players match
+        players = [
+            (2, 'CA', 1, None),
+            (3, 'US', 5, None),
+            (4, 'CA', 1, None),
+            (2, 'FR', 1, None),
+            (2, 'CA', None, None),
+            (2, 'CA', 1, 1),
+        ]
+        async_session.add(Clan(id=1, name='clan'))
+        for index, (level, country, item_1, item_4) in enumerate(players):
+            async_session.add(self.create_player(f'player_{index}', level, country))
+        await async_session.flush()
+        for index, (level, country, item_1, item_4) in enumerate(players):
+            async_session.add(
+                Inventory(
+                    id=index + 1,
+                    player_id=f'player_{index}',
+                    cash=10,
+                    coins=20,
+                    item_1=item_1,
+                    item_4=item_4,
+                )
+            )
+        await async_session.commit()
+
+        with patch(
+            'profile_matcher.api.routes._campaign_players._export.__mock_campaign_api',
+            new_callable=Mock,
+        ) as mock_campaign_api:
+            mock_campaign_api.return_value = [self.__campaign]
+
+            # Act
+            response = await async_client.get(
+                '/campaigns/mocked_campaign/players', params={'chunk_size': 1}
+            )
+
+        # Assert
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(line['player_id'] for line in lines) == ['player_0', 'player_1']
+        assert lines[0]['inventory']['item_1'] is not None
+        assert lines[0]['inventory']['cash'] == 10
+
+    @pytest.mark.asyncio
+    async def test_export_other_rules(self, async_client, async_session):
+        """
+        Test that the language, total spent, last purchase and device model rules of the campaign are applied by the
+        query.
+        """
+        # Arrange
+        campaign = self.__campaign.model_copy(deep=True)
+        campaign.matchers.has.language = ['fr']
+        campaign.matchers.does_not_have.device_model = ['old phone']
+        campaign.matchers.total_spent = Range(min=10)
+        campaign.matchers.last_purchase = Recency(max_days=30)
+        recent_purchase = datetime.utcnow() - timedelta(days=2)
+        # (language, total_spent, last_purchase, device model): only the first player matches
+        players = [
+            ('fr', 50, recent_purchase, 'pixel'),
+            ('en', 50, recent_purchase, 'pixel'),
+            ('fr', 5, recent_purchase, 'pixel'),
+            ('fr', 50, datetime(2021, 1, 1), 'pixel'),
+            ('fr', 50, None, 'pixel'),
+            ('fr', 50, recent_purchase, 'old phone'),
+        ]
+        async_session.add(Clan(id=1, name='clan'))
+        for index, (language, total_spent, last_purchase, _) in enumerate(players):
+            player = self.create_player(f'player_{index}', 2, 'CA')
+            player.language = language
+            player.total_spent = total_spent
+            player.last_purchase = last_purchase
+            async_session.add(player)
+        await async_session.flush()
+        for index, (_, _, _, model) in enumerate(players):
+            async_session.add(
+                Inventory(
+                    id=index + 1,
+                    player_id=f'player_{index}',
+                    cash=10,
+                    coins=20,
+                    item_1=1,
+                )
+            )
+            async_session.add(
+                Device(
+                    id=index + 1,
+                    player_id=f'player_{index}',
+                    model=model,
+                    carrier='vodafone',
+                    firmware='1',
+                )
+            )
+        await async_session.commit()
+
+        with patch(
+            'profile_matcher.api.routes._campaign_players._export.__mock_campaign_api',
+            new_callable=Mock,
+        ) as mock_campaign_api:
+            mock_campaign_api.return_value = [campaign]
+
+            # Act
+            response = await async_client.get('/campaigns/mocked_campaign/players')
+
+        # Assert
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line['player_id'] for line in lines] == ['player_0']
+
+    @pytest.mark.asyncio
+    async def test_campaign_not_found(self, async_client, async_session):
+        """
+        Test that 404 is returned if the campaign is not in the catalog.
+        """
+        with patch(
+            'profile_matcher.api.routes._campaign_players._export.__mock_campaign_api',
+            new_callable=Mock,
+        ) as mock_campaign_api:
+            mock_campaign_api.return_value = [self.__campaign]
+
+            # Act
+            response = await async_client.get('/campaigns/unknown_campaign/players')
+
+        # Assert
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_catalog_not_synced(self, async_client, async_session):
+        """
+        Test that 503 is returned while the catalog synced from the campaign service is not fetched yet, instead of
+        exporting from the mocked campaign API.
+        """
+        with (
+            patch.object(
+                _export,
+                'catalog_sync',
+                CatalogSync(HttpCampaignSource('http://campaigns')),
+            ),
+            patch(
+                'profile_matcher.api.routes._campaign_players._export.__mock_campaign_api',
+                new_callable=Mock,
+            ) as mock_campaign_api,
+        ):
+            mock_campaign_api.return_value = [self.__campaign]
+
+            # Act
+            response = await async_client.get('/campaigns/mocked_campaign/players')
+
+        # Assert
+        assert response.status_code == 503
+        mock_campaign_api.assert_not_called()
+
+    @staticmethod
+    def create_player(player_id: str, level: int, country: str) -> PlayerProfile:
+        return PlayerProfile(
+            player_id=player_id,
+            credential='apple_credential',
+            created=datetime(2021, 1, 10, 13, 37, 17),
+            modified=datetime(2021, 1, 23, 13, 37, 17),
+            active_campaigns=[],
+            level=level,
+            country=country,
+            language='fr',
+            birthdate=datetime(2000, 1, 10, 13, 37, 17),
+            gender='male',
+            clan_id=1,
+        )
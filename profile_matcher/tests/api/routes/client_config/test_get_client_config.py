@@ -1,27 +1,91 @@
-from datetime import datetime
+import asyncio
+import time
+from datetime import datetime, timezone
 from unittest.mock import patch, Mock, AsyncMock
 
 import pytest
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession as SQLModelAsyncSession
 
+from profile_matcher.api import HttpCampaignSource
 from profile_matcher.api.models import (
     Matcher,
     Level,
     MatcherContent,
     ActiveCampaign,
 )
+from profile_matcher.api.routes._client_config import _get
+from profile_matcher.catalog import (
+    CatalogIndex,
+    CatalogIndexCache,
+    CatalogSnapshotReader,
+    CatalogSync,
+    MatchCache,
+    compile_catalog,
+    get_clock,
+    write_catalog_snapshot,
+)
+from profile_matcher.concurrency import admission_controller
+from profile_matcher.database import UnitOfWork, count_queries, get_unit_of_work
 from profile_matcher.database.models import PlayerProfile, Clan, Inventory, Device
+from profile_matcher.matching import ShadowRunner, VectorizedEngine
+from profile_matcher.repository import (
+    InMemoryPlayerRepository,
+    PlayerSnapshotRecord,
+    get_player_repository,
+)
+from main import app
+
+# The mocked campaigns run from 2022-01-25 to 2022-02-25
+CAMPAIGN_RUNNING_AT = datetime(2022, 2, 1, tzinfo=timezone.utc)
+
+# Statements of a request that has nothing to write: the player, with its inventory and clan joined, and its devices
+HOT_PATH_STATEMENT_BUDGET = 2
+
+# Artificial duration of each stage of the route
+STAGE_DELAY = 0.2
+
+# Requests served at the same time by a pool of POOL_SIZE connections
+CONCURRENT_REQUESTS = 20
+POOL_SIZE = 2
+
+
+class ConflictingPlayerRepository(InMemoryPlayerRepository):
+    """
+    In-memory repository on which the first conflicts saves of the active campaigns lose to another writer.
+    """
+
+    def __init__(self, conflicts: int):
+        super().__init__()
+        self.conflicts = conflicts
+        self.saves = 0
+        self.loads = 0
+
+    async def load_player(self, player_id, fields=None):
+        self.loads += 1
+        return await super().load_player(player_id, fields)
+
+    async def save_active_campaigns(self, player, active_campaigns):
+        self.saves += 1
+        if self.saves <= self.conflicts:
+            return False
+        return await super().save_active_campaigns(player, active_campaigns)
 
 
 class TestGetClientConfig:
     @pytest.fixture(autouse=True)
-    def setup_data(self, async_client, async_session):
+    def setup_data(self, async_client, async_session, monkeypatch):
         # For the setup, this can either be done in every test (in order to keep them separate from each other) or
         # in the setup to reduce repetition. Here, since the player data doesn't change from one test to the other,
         # and there is a lot of data and repetition, it has been put in setup_data.
         # Note: we do not reuse the datacreator, as it is not something that would usually be in the project.
+        app.dependency_overrides[get_clock] = lambda: lambda: CAMPAIGN_RUNNING_AT
+        # Every test starts without cached match results, nor the catalog of another test
+        monkeypatch.setattr(_get, 'match_cache', MatchCache())
+        monkeypatch.setattr(_get, 'catalog_indexes', CatalogIndexCache())
+
         self.__test_clan = Clan(
             id=123456,
             name='Hello world clan',
@@ -463,6 +527,214 @@ class TestGetClientConfig:
         # Assert that the data is correctly updated in the database
         assert player_from_database.active_campaigns == []
 
+    @pytest.mark.asyncio
+    async def test_campaign_not_running(self, async_client, async_session):
+        """
+        Test that disabled campaigns and campaigns outside of their time window are never matched, and are removed
+        from the player if they were present.
+        """
+        self.__player_profile.active_campaigns = ['mocked_expired_campaign']
+        # Arrange
+        matchers = Matcher(
+            level=Level(min=1, max=3),
+            has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+            does_not_have=MatcherContent(items=['item_4']),
+        )
+        mock_expired_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_expired_campaign',
+            priority=10.5,
+            matchers=matchers,
+            start_date=datetime(2021, 12, 1),
+            end_date=datetime(2022, 1, 1),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        mock_future_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_future_campaign',
+            priority=10.5,
+            matchers=matchers,
+            start_date=datetime(2022, 3, 1),
+            end_date=datetime(2022, 4, 1),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        mock_disabled_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_disabled_campaign',
+            priority=10.5,
+            matchers=matchers,
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=False,
+            last_updated=datetime(2021, 7, 13),
+        )
+
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+
+        with patch(
+            'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+            new_callable=Mock,
+        ) as mock_campaign_api:
+            mock_campaign_api.return_value = [
+                mock_expired_campaign,
+                mock_future_campaign,
+                mock_disabled_campaign,
+            ]
+            # Act
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+
+        # Assert
+        assert response.status_code == 200
+        data = response.json()
+        assert data['active_campaigns'] == []
+
+    @pytest.mark.asyncio
+    async def test_campaigns_by_priority_with_limit(self, async_client, async_session):
+        """
+        Test that the active campaigns are stored by descending priority, and that only the limit campaigns with the
+        highest priority are returned when a limit is given, every campaign matched being stored.
+        """
+        # Arrange
+        mock_campaigns = [
+            ActiveCampaign(
+                game='mygame',
+                name=f'mocked_campaign_{priority}',
+                priority=priority,
+                matchers=Matcher(
+                    level=Level(min=1, max=3),
+                    has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                    does_not_have=MatcherContent(items=['item_4']),
+                ),
+                start_date=datetime(2022, 1, 25),
+                end_date=datetime(2022, 2, 25),
+                enabled=True,
+                last_updated=datetime(2021, 7, 13),
+            )
+            for priority in [1, 30, 10, 20]
+        ]
+
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+
+        with patch(
+            'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+            new_callable=Mock,
+        ) as mock_campaign_api:
+            mock_campaign_api.return_value = mock_campaigns
+            # Act
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+            limited_response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}',
+                params={'limit': 2},
+            )
+
+        # Get the player from the database to confirm that it has been updated
+        statement = select(PlayerProfile).where(
+            PlayerProfile.player_id == self.__player_id
+        )
+        result = await async_session.exec(statement)
+        player_from_database = result.first()
+        await async_session.refresh(player_from_database)
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json()['active_campaigns'] == [
+            'mocked_campaign_30',
+            'mocked_campaign_20',
+            'mocked_campaign_10',
+            'mocked_campaign_1',
+        ]
+        assert limited_response.status_code == 200
+        assert limited_response.json()['active_campaigns'] == [
+            'mocked_campaign_30',
+            'mocked_campaign_20',
+        ]
+        assert player_from_database.active_campaigns == [
+            'mocked_campaign_30',
+            'mocked_campaign_20',
+            'mocked_campaign_10',
+            'mocked_campaign_1',
+        ]
+
+    @pytest.mark.asyncio
+    async def test_campaign_limit_per_game(self, async_client, async_session):
+        """
+        Test that a game with a campaign limit only gets its campaigns with the highest priority, without limiting
+        the other games.
+        """
+        # Arrange
+        mock_campaigns = [
+            ActiveCampaign(
+                game=game,
+                name=f'{game}_campaign_{priority}',
+                priority=priority,
+                matchers=Matcher(
+                    level=Level(min=1, max=3),
+                    has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                    does_not_have=MatcherContent(items=['item_4']),
+                ),
+                start_date=datetime(2022, 1, 25),
+                end_date=datetime(2022, 2, 25),
+                enabled=True,
+                last_updated=datetime(2021, 7, 13),
+            )
+            for game, priority in [
+                ('limited', 1),
+                ('limited', 3),
+                ('unlimited', 2),
+                ('unlimited', 4),
+            ]
+        ]
+
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+
+        with (
+            patch(
+                'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+                new_callable=Mock,
+            ) as mock_campaign_api,
+            patch.dict(
+                'profile_matcher.api.routes._client_config._get.GAME_CAMPAIGN_LIMITS',
+                {'limited': 1},
+            ),
+        ):
+            mock_campaign_api.return_value = mock_campaigns
+            # Act
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json()['active_campaigns'] == [
+            'unlimited_campaign_4',
+            'limited_campaign_3',
+            'unlimited_campaign_2',
+        ]
+
     @pytest.mark.asyncio
     async def test_player_not_found(self, async_client, async_session):
         """
@@ -481,6 +753,101 @@ class TestGetClientConfig:
         response = await async_client.get(f'/get_client_config/{wrong_player_id}')
         assert response.status_code == 404
 
+    @pytest.mark.asyncio
+    async def test_player_not_found_and_campaign_raise(
+        self, async_client, async_session
+    ):
+        """
+        Test that 404 is returned if the player is not found, even if the campaign API fails at the same time.
+        """
+        # Arrange
+        wrong_player_id = '66983be2-98b7-11e7-90cf-082e5f28d866'
+
+        with patch(
+            'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+            side_effect=Exception,
+        ):
+            # Act
+            response = await async_client.get(f'/get_client_config/{wrong_player_id}')
+
+        # Assert
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_player_not_found_cancels_campaign_fetch(
+        self, async_client, async_session
+    ):
+        """
+        Test that 404 is returned as soon as the player is not found, without waiting for the campaigns, and that their
+        fetch is cancelled.
+        """
+        # Arrange
+        wrong_player_id = '66983be2-98b7-11e7-90cf-082e5f28d866'
+        fetch_cancelled = asyncio.Event()
+
+        async def slow_fetch_running_campaigns(*args):
+            try:
+                await asyncio.sleep(STAGE_DELAY)
+            except asyncio.CancelledError:
+                fetch_cancelled.set()
+                raise
+            return []
+
+        with patch.object(
+            _get, '__fetch_running_campaigns', slow_fetch_running_campaigns
+        ):
+            # Act
+            start = time.perf_counter()
+            response = await async_client.get(f'/get_client_config/{wrong_player_id}')
+            duration = time.perf_counter() - start
+
+        # Assert
+        assert response.status_code == 404
+        assert duration < STAGE_DELAY
+        assert fetch_cancelled.is_set()
+
+    @pytest.mark.asyncio
+    async def test_stages_run_concurrently(self, async_client, async_session):
+        """
+        Test that the player is loaded while the campaigns are fetched: the request takes as long as the slowest
+        stage, not as long as both.
+        """
+        # Arrange
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+        load_player = getattr(_get, '__load_player')
+        fetch_running_campaigns = getattr(_get, '__fetch_running_campaigns')
+
+        async def slow_load_player(*args):
+            await asyncio.sleep(STAGE_DELAY)
+            return await load_player(*args)
+
+        async def slow_fetch_running_campaigns(*args):
+            await asyncio.sleep(STAGE_DELAY)
+            return await fetch_running_campaigns(*args)
+
+        with (
+            patch.object(_get, '__load_player', slow_load_player),
+            patch.object(
+                _get, '__fetch_running_campaigns', slow_fetch_running_campaigns
+            ),
+        ):
+            # Act
+            start = time.perf_counter()
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+            duration = time.perf_counter() - start
+
+        # Assert
+        assert response.status_code == 200
+        assert STAGE_DELAY <= duration < 2 * STAGE_DELAY
+
     @pytest.mark.asyncio
     async def test_get_campaign_raise(self, async_client, async_session):
         """
@@ -554,6 +921,836 @@ class TestGetClientConfig:
 
         assert response.status_code == 500
 
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_same_player(self, async_client, async_session):
+        """
+        Test that hundreds of concurrent requests for the same player share the computation, all return the same
+        result, and that the player is updated only once.
+        """
+        # Arrange
+        mock_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        number_of_requests = 300
+
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+
+        with patch(
+            'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+            new_callable=Mock,
+        ) as mock_campaign_api:
+            mock_campaign_api.return_value = [mock_campaign]
+
+            # Act
+            responses = await asyncio.gather(
+                *(
+                    async_client.get(
+                        f'/get_client_config/{self.__player_profile.player_id}'
+                    )
+                    for _ in range(number_of_requests)
+                )
+            )
+
+        statement = select(PlayerProfile).where(
+            PlayerProfile.player_id == self.__player_id
+        )
+        result = await async_session.exec(statement)
+        player_from_database = result.first()
+        await async_session.refresh(player_from_database)
+
+        # Assert
+        assert all(response.status_code == 200 for response in responses)
+        assert all(
+            response.json()['active_campaigns'] == ['mocked_campaign']
+            for response in responses
+        )
+        assert mock_campaign_api.call_count < number_of_requests
+        assert player_from_database.active_campaigns == ['mocked_campaign']
+        # A single write happened, the following computations had nothing to update
+        assert player_from_database.version == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_limits_and_fields(self, async_client):
+        """
+        Test that concurrent requests for the same player share the computation whatever their limit and fields, that
+        each one gets its own limit and fields, and that every campaign matched is saved. The requests reading fields
+        the computation did not load read the player again.
+        """
+        # Arrange
+        mock_campaigns = [
+            ActiveCampaign(
+                game='mygame',
+                name=f'mocked_campaign_{priority}',
+                priority=priority,
+                matchers=Matcher(
+                    level=Level(min=1, max=3),
+                    has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                    does_not_have=MatcherContent(items=['item_4']),
+                ),
+                start_date=datetime(2022, 1, 25),
+                end_date=datetime(2022, 2, 25),
+                enabled=True,
+                last_updated=datetime(2021, 7, 13),
+            )
+            for priority in [10, 20]
+        ]
+        repository = ConflictingPlayerRepository(conflicts=0)
+        repository.add(
+            PlayerSnapshotRecord(
+                **self.__player_profile.model_dump(
+                    exclude={'active_campaigns', 'version'}
+                ),
+                clan_name=self.__test_clan.name,
+                inventory=self.__test_inventory.model_dump(),
+                devices=[self.__test_device.model_dump()],
+            )
+        )
+        app.dependency_overrides[get_player_repository] = lambda: repository
+        fetch_running_campaigns = getattr(_get, '__fetch_running_campaigns')
+
+        async def slow_fetch_running_campaigns(*args):
+            # Every request joins the computation before it ends
+            await asyncio.sleep(STAGE_DELAY)
+            return await fetch_running_campaigns(*args)
+
+        def get(params: dict):
+            return async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}', params=params
+            )
+
+        with (
+            patch.object(
+                _get, '__fetch_running_campaigns', slow_fetch_running_campaigns
+            ),
+            patch(
+                'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+                new_callable=Mock,
+            ) as mock_campaign_api,
+        ):
+            mock_campaign_api.return_value = mock_campaigns
+
+            # Act
+            # The computation is started by the request reading the level only
+            first = asyncio.ensure_future(get({'fields': 'level'}))
+            while not _get.client_config_flights.in_flight(self.__player_id):
+                await asyncio.sleep(0.01)
+            responses = await asyncio.gather(
+                first,
+                get({}),
+                get({'limit': 1}),
+                get({'fields': 'level,country', 'limit': 1}),
+            )
+
+        # Assert
+        all_campaigns = ['mocked_campaign_20', 'mocked_campaign_10']
+        full_response = responses[1].json()
+        assert [response.status_code for response in responses] == [200] * 4
+        assert responses[0].json() == {'level': 3, 'active_campaigns': all_campaigns}
+        assert full_response['active_campaigns'] == all_campaigns
+        assert full_response['clan'] == {'id': 123456, 'name': 'Hello world clan'}
+        assert responses[2].json() == full_response | {
+            'active_campaigns': ['mocked_campaign_20']
+        }
+        assert responses[3].json() == {
+            'level': 3,
+            'country': 'CA',
+            'active_campaigns': ['mocked_campaign_20'],
+        }
+        assert mock_campaign_api.call_count == 1
+        assert repository.saves == 1
+        # The computation loaded the player once, the two requests of the whole profile read it again
+        assert repository.loads == 3
+        player = await repository.load_player(self.__player_id)
+        assert player.active_campaigns == all_campaigns
+
+    @pytest.mark.asyncio
+    async def test_query_budget(self, async_client, async_session):
+        """
+        Test the number of statements of the hot path (the player's active campaigns are up to date, nothing is
+        written), and that they are reported in the Server-Timing header.
+        """
+        # Arrange
+        self.__player_profile.active_campaigns = ['mocked_campaign']
+        mock_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+        # Start from an empty identity map, as a request does
+        async_session.expunge_all()
+
+        with patch(
+            'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+            new_callable=Mock,
+        ) as mock_campaign_api:
+            mock_campaign_api.return_value = [mock_campaign]
+
+            # Act
+            with count_queries() as stats:
+                response = await async_client.get(
+                    f'/get_client_config/{self.__player_profile.player_id}'
+                )
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json()['active_campaigns'] == ['mocked_campaign']
+        assert stats.statements <= HOT_PATH_STATEMENT_BUDGET
+        assert stats.repeated_statements(2) == {}
+        assert f'{stats.statements} statements' in response.headers['server-timing']
+
+    @pytest.mark.asyncio
+    async def test_connections_released_during_campaign_fetch(
+        self, async_client, async_session, create_test_database_and_tables
+    ):
+        """
+        Test that the requests do not hold a pooled connection while the campaigns are fetched: many more requests than
+        connections are served while the campaign API is slow, and no connection is checked out during the call.
+        """
+        # Arrange
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+        # One player per request, so that the requests are not merged into a single one
+        player_ids = [
+            self.__player_id,
+            *(f'player_{index}' for index in range(1, CONCURRENT_REQUESTS)),
+        ]
+        async_session.add_all(
+            PlayerProfile(
+                **self.__player_profile.model_dump(exclude={'player_id', 'version'}),
+                player_id=player_id,
+            )
+            for player_id in player_ids[1:]
+        )
+        await async_session.flush()
+        async_session.add_all(
+            Inventory(
+                **self.__test_inventory.model_dump(exclude={'id', 'player_id'}),
+                id=index + 1,
+                player_id=player_id,
+            )
+            for index, player_id in enumerate(player_ids[1:], start=1)
+        )
+        await async_session.commit()
+        engine = create_async_engine(
+            create_test_database_and_tables.url,
+            pool_size=POOL_SIZE,
+            max_overflow=0,
+            pool_timeout=5 * STAGE_DELAY,
+        )
+        session_factory = async_sessionmaker(
+            engine, class_=SQLModelAsyncSession, expire_on_commit=False
+        )
+        app.dependency_overrides[get_unit_of_work] = lambda: UnitOfWork(session_factory)
+
+        load_player = getattr(_get, '__load_player')
+        fetch_running_campaigns = getattr(_get, '__fetch_running_campaigns')
+        loaded_players = 0
+        all_players_loaded = asyncio.Event()
+        checked_out_connections = []
+
+        async def counted_load_player(*args):
+            nonlocal loaded_players
+            player = await load_player(*args)
+            loaded_players += 1
+            if loaded_players == CONCURRENT_REQUESTS:
+                all_players_loaded.set()
+            return player
+
+        async def slow_fetch_running_campaigns(*args):
+            # The campaign API answers once every request is waiting on it
+            await asyncio.wait_for(all_players_loaded.wait(), timeout=5)
+            checked_out_connections.append(engine.pool.checkedout())
+            await asyncio.sleep(STAGE_DELAY)
+            return await fetch_running_campaigns(*args)
+
+        with (
+            patch.object(_get, '__load_player', counted_load_player),
+            patch.object(
+                _get, '__fetch_running_campaigns', slow_fetch_running_campaigns
+            ),
+        ):
+            # Act
+            responses = await asyncio.gather(
+                *(
+                    async_client.get(f'/get_client_config/{player_id}')
+                    for player_id in player_ids
+                )
+            )
+        await engine.dispose()
+
+        # Assert
+        assert [response.status_code for response in responses] == [
+            200
+        ] * CONCURRENT_REQUESTS
+        assert len(checked_out_connections) == CONCURRENT_REQUESTS
+        assert max(checked_out_connections) == 0
+
+    @pytest.mark.asyncio
+    async def test_deadline_exceeded(self, async_client, async_session):
+        """
+        Test that 503 is returned with a Retry-After header once the deadline asked by the client is exceeded, without
+        waiting for the slow campaign service.
+        """
+        # Arrange
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+        fetch_running_campaigns = getattr(_get, '__fetch_running_campaigns')
+
+        async def slow_fetch_running_campaigns(*args):
+            await asyncio.sleep(STAGE_DELAY)
+            return await fetch_running_campaigns(*args)
+
+        with patch.object(
+            _get, '__fetch_running_campaigns', slow_fetch_running_campaigns
+        ):
+            # Act
+            start = time.perf_counter()
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}',
+                headers={'X-Request-Timeout': str(STAGE_DELAY * 1000 / 4)},
+            )
+            duration = time.perf_counter() - start
+
+            # The computation goes on without the request: let it end before the tables are dropped
+            while _get.client_config_flights.in_flight(self.__player_profile.player_id):
+                await asyncio.sleep(0.01)
+
+        # Assert
+        assert response.status_code == 503
+        assert int(response.headers['retry-after']) >= 1
+        assert duration < STAGE_DELAY
+
+    @pytest.mark.asyncio
+    async def test_overloaded(self, async_client, async_session):
+        """
+        Test that 503 is returned with a Retry-After header, without reaching the database or the campaign service, when
+        too many requests are in flight.
+        """
+        # Arrange
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+
+        with (
+            patch.multiple(
+                admission_controller, in_flight=10, max_in_flight=10, service_time=1.5
+            ),
+            patch(
+                'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+                new_callable=Mock,
+            ) as mock_campaign_api,
+        ):
+            # Act
+            with count_queries() as stats:
+                response = await async_client.get(
+                    f'/get_client_config/{self.__player_profile.player_id}'
+                )
+
+        # Assert
+        assert response.status_code == 503
+        assert response.headers['retry-after'] == '2'
+        assert response.json()['detail']
+        assert stats.statements == 0
+        mock_campaign_api.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_in_memory_repository(self, async_client):
+        """
+        Test that the route matches and saves a player of the in-memory repository, without any database statement.
+        """
+        # Arrange
+        mock_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        repository = InMemoryPlayerRepository()
+        repository.add(
+            PlayerSnapshotRecord(
+                **self.__player_profile.model_dump(
+                    exclude={'active_campaigns', 'version'}
+                ),
+                clan_name=self.__test_clan.name,
+                inventory=self.__test_inventory.model_dump(),
+                devices=[self.__test_device.model_dump()],
+            )
+        )
+        app.dependency_overrides[get_player_repository] = lambda: repository
+
+        with patch(
+            'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+            new_callable=Mock,
+        ) as mock_campaign_api:
+            mock_campaign_api.return_value = [mock_campaign]
+
+            # Act
+            with count_queries() as stats:
+                response = await async_client.get(
+                    f'/get_client_config/{self.__player_profile.player_id}'
+                )
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json()['active_campaigns'] == ['mocked_campaign']
+        assert response.json()['clan'] == {'id': 123456, 'name': 'Hello world clan'}
+        assert stats.statements == 0
+        player = await repository.load_player(self.__player_profile.player_id)
+        assert player.active_campaigns == ['mocked_campaign']
+        assert player.version == 2
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        'conflicts, expected_status',
+        [(_get.MAX_UPDATE_ATTEMPTS - 1, 200), (_get.MAX_UPDATE_ATTEMPTS, 409)],
+    )
+    async def test_concurrent_updates(self, async_client, conflicts, expected_status):
+        """
+        Test that a save lost to another writer is retried on the reloaded player, that the route answers 409 once
+        every attempt was lost, and that the player saved is compared with the shadow engine once.
+        """
+        # Arrange
+        repository = ConflictingPlayerRepository(conflicts)
+        repository.add(
+            PlayerSnapshotRecord(
+                **self.__player_profile.model_dump(
+                    exclude={'active_campaigns', 'version'}
+                ),
+                clan_name=self.__test_clan.name,
+                inventory=self.__test_inventory.model_dump(),
+                devices=[self.__test_device.model_dump()],
+            )
+        )
+        app.dependency_overrides[get_player_repository] = lambda: repository
+        shadow_runner = ShadowRunner(VectorizedEngine(), sample_rate=1.0)
+
+        with patch.object(_get, 'shadow_runner', shadow_runner):
+            # Act
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+            await shadow_runner.drain()
+
+        # Assert
+        assert response.status_code == expected_status
+        assert shadow_runner.compared == (1 if expected_status == 200 else 0)
+        assert repository.saves == _get.MAX_UPDATE_ATTEMPTS
+        # The player is reloaded after every save lost, except the last one
+        assert repository.loads == _get.MAX_UPDATE_ATTEMPTS
+        player = await repository.load_player(self.__player_profile.player_id)
+        if expected_status == 200:
+            assert response.json()['active_campaigns'] == ['mycampaign']
+            assert player.active_campaigns == ['mycampaign']
+        else:
+            assert response.json()['detail'] == (
+                f'Player {self.__player_id} was updated concurrently, please retry.'
+            )
+            assert player.active_campaigns == []
+
+    @pytest.mark.asyncio
+    async def test_synced_catalog(self, async_client, async_session):
+        """
+        Test that the campaigns are matched from the catalog synced in the background, without calling the campaign
+        API, once the sync fetched the catalog, and that the route is unavailable until then.
+        """
+        # Arrange
+        mock_campaign = ActiveCampaign(
+            game='mygame',
+            name='synced_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+
+        catalog_sync = CatalogSync(HttpCampaignSource('http://campaigns'))
+
+        with (
+            patch.object(_get, 'catalog_sync', catalog_sync),
+            patch(
+                'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+                new_callable=Mock,
+            ) as mock_campaign_api,
+        ):
+            # Act
+            not_synced_response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+            catalog_sync.index = CatalogIndex([mock_campaign])
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+
+        # Assert
+        assert not_synced_response.status_code == 503
+        assert response.status_code == 200
+        assert response.json()['active_campaigns'] == ['synced_campaign']
+        mock_campaign_api.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_catalog_snapshot(self, async_client, async_session, tmp_path):
+        """
+        Test that the campaigns are matched from the catalog snapshot when one is configured, without calling the
+        campaign API, and that the route is unavailable until the snapshot is written.
+        """
+        # Arrange
+        mock_campaign = ActiveCampaign(
+            game='mygame',
+            name='snapshot_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+        path = tmp_path / 'catalog.snapshot'
+        reader = CatalogSnapshotReader(path, check_interval=0)
+
+        with (
+            patch.object(_get, 'catalog_snapshots', reader),
+            patch(
+                'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+                new_callable=Mock,
+            ) as mock_campaign_api,
+        ):
+            # Act
+            missing_response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+            write_catalog_snapshot(compile_catalog([mock_campaign]), path)
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+
+        # Assert
+        assert missing_response.status_code == 503
+        assert response.status_code == 200
+        assert response.json()['active_campaigns'] == ['snapshot_campaign']
+        mock_campaign_api.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_match_cache(self, async_client, async_session):
+        """
+        Test that a player with the same matching features as a player already matched reuses its result, without
+        evaluating the campaigns.
+        """
+        # Arrange
+        mock_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+        select_active_campaigns = Mock(wraps=getattr(_get, '__select_active_campaigns'))
+
+        with (
+            patch.object(_get.catalog_sync, 'index', CatalogIndex([mock_campaign])),
+            patch.object(_get, '__select_active_campaigns', select_active_campaigns),
+        ):
+            # Act
+            first_response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+
+        # Assert
+        assert first_response.json()['active_campaigns'] == ['mocked_campaign']
+        assert response.json()['active_campaigns'] == ['mocked_campaign']
+        assert select_active_campaigns.call_count == 1
+        assert _get.match_cache.stats()['hit_rate'] == 0.5
+
+    @pytest.mark.asyncio
+    async def test_shadow_matching(self, async_client, async_session):
+        """
+        Test that the player matched is compared with the candidate engine after the response, on the same inputs.
+        """
+        # Arrange
+        mock_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+        shadow_runner = ShadowRunner(VectorizedEngine(), sample_rate=1.0)
+
+        with (
+            patch.object(_get.catalog_sync, 'index', CatalogIndex([mock_campaign])),
+            patch.object(_get, 'shadow_runner', shadow_runner),
+        ):
+            # Act
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+            await shadow_runner.drain()
+
+        # Assert
+        assert response.json()['active_campaigns'] == ['mocked_campaign']
+        assert (shadow_runner.compared, shadow_runner.mismatched) == (1, 0)
+
+    @pytest.mark.asyncio
+    async def test_sparse_fieldsets(self, async_client, async_session):
+        """
+        Test that only the requested fields and the active campaigns are returned, and that the relationships neither
+        requested nor needed by the matching are not loaded: the inventory is joined for the matching, the clan and the
+        devices are not read.
+        """
+        # Arrange
+        self.__player_profile.active_campaigns = ['mocked_campaign']
+        mock_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        await self.create_data(
+            async_session,
+            self.__player_profile,
+            self.__test_inventory,
+            self.__test_device,
+            self.__test_clan,
+        )
+        async_session.expunge_all()
+
+        with patch.object(_get.catalog_sync, 'index', CatalogIndex([mock_campaign])):
+            # Act
+            with count_queries() as stats:
+                response = await async_client.get(
+                    f'/get_client_config/{self.__player_profile.player_id}',
+                    params={'fields': 'level, custom_field'},
+                )
+            full_response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}'
+            )
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json() == {
+            'active_campaigns': ['mocked_campaign'],
+            'custom_field': 'mycustom',
+            'level': 3,
+        }
+        assert stats.statements == 1
+        assert len(response.content) < len(full_response.content)
+        assert full_response.json()['clan'] == {
+            'id': 123456,
+            'name': 'Hello world clan',
+        }
+
+    @pytest.mark.asyncio
+    async def test_sparse_fieldsets_matching_fields(self, async_client):
+        """
+        Test that the fields read by the rules of the campaigns are loaded for the matching even if they are not
+        requested, including when the catalog changed since the fields to load were chosen.
+        """
+        # Arrange
+        device_campaign = ActiveCampaign(
+            game='mygame',
+            name='device_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(
+                    country=['US', 'RO', 'CA'],
+                    items=['item_1'],
+                    device_model=['apple iphone 11'],
+                ),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        core_campaign = device_campaign.model_copy(
+            update={
+                'name': 'core_campaign',
+                'matchers': device_campaign.matchers.model_copy(
+                    update={
+                        'has': MatcherContent(
+                            country=['US', 'RO', 'CA'], items=['item_1']
+                        )
+                    }
+                ),
+            }
+        )
+        repository = InMemoryPlayerRepository()
+        repository.add(
+            PlayerSnapshotRecord(
+                **self.__player_profile.model_dump(
+                    exclude={'active_campaigns', 'version'}
+                ),
+                clan_name=self.__test_clan.name,
+                inventory=self.__test_inventory.model_dump(),
+                devices=[self.__test_device.model_dump()],
+            )
+        )
+        app.dependency_overrides[get_player_repository] = lambda: repository
+
+        # The latest catalog only needs the core fields, the catalog served needs the devices
+        with (
+            patch.object(_get.catalog_sync, 'index', None),
+            patch.object(
+                _get.catalog_indexes,
+                'get',
+                Mock(return_value=CatalogIndex([device_campaign])),
+            ),
+            patch(
+                'profile_matcher.api.routes._client_config._get.__matching_fields',
+                Mock(return_value=CatalogIndex([core_campaign]).player_fields),
+            ),
+            patch(
+                'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+                new_callable=Mock,
+            ),
+        ):
+            # Act
+            response = await async_client.get(
+                f'/get_client_config/{self.__player_profile.player_id}',
+                params={'fields': 'level'},
+            )
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json() == {
+            'active_campaigns': ['device_campaign'],
+            'level': 3,
+        }
+
+    @pytest.mark.asyncio
+    async def test_unknown_field(self, async_client):
+        """
+        Test that requesting a field that is not a field of the player profile is rejected.
+        """
+        # Act
+        response = await async_client.get(
+            f'/get_client_config/{self.__player_profile.player_id}',
+            params={'fields': 'level,password'},
+        )
+
+        # Assert
+        assert response.status_code == 422
+        assert response.json()['detail'] == 'Unknown fields: password'
+
     @staticmethod
     async def create_data(
         async_session: AsyncSession,
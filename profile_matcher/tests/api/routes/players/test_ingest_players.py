@@ -0,0 +1,230 @@
+import json
+from datetime import datetime
+
+import pytest
+from sqlmodel import select
+
+from profile_matcher.database.models import PlayerProfile, Clan, Inventory, Device
+
+ADMIN_HEADERS = {'X-Admin-Token': 'admin_token'}
+
+
+class TestIngestPlayers:
+    @pytest.fixture(autouse=True)
+    def setup_data(self, async_client, async_session, monkeypatch):
+        monkeypatch.setenv('ADMIN_TOKEN', 'admin_token')
+        self.__player = {
+            'player_id': 'player_1',
+            'credential': 'apple_credential',
+            'created': '2021-01-10T13:37:17',
+            'modified': '2021-01-23T13:37:17',
+            'level': 3,
+            'country': 'CA',
+            'language': 'fr',
+            'birthdate': '2000-01-10T13:37:17Z',
+            'gender': 'male',
+            'clan_id': 1,
+            'clan_name': 'clan',
+            'inventory': {'cash': 123, 'coins': 12, 'item_1': 1, 'item_34': 3},
+            'devices': [
+                {
+                    'id': 1,
+                    'model': 'apple iphone 11',
+                    'carrier': 'vodafone',
+                    'firmware': '123',
+                }
+            ],
+        }
+
+    @pytest.mark.asyncio
+    async def test_ingest_ndjson(self, async_client, async_session):
+        """
+        Test that the players of a NDJSON body are created with their clan, inventory and devices, across several
+        batches, and that the invalid rows are rejected without stopping the ingestion.
+        """
+        # Arrange
+        second_player = {
+            **self.__player,
+            'player_id': 'player_2',
+            'inventory': None,
+            'devices': [],
+        }
+        body = '\n'.join(
+            [
+                json.dumps(self.__player),
+                '',
+                json.dumps({'player_id': 'player_3'}),
+                json.dumps(second_player),
+            ]
+        )
+
+        # Act
+        response = await async_client.post(
+            '/players/ingest',
+            params={'batch_size': 1},
+            content=body,
+            headers={'content-type': 'application/x-ndjson', **ADMIN_HEADERS},
+        )
+
+        # Assert
+        assert response.status_code == 200
+        report = response.json()
+        assert report['received_rows'] == 3
+        assert report['ingested_rows'] == 2
+        assert report['rejected_rows'] == 1
+        assert report['errors'][0].startswith('Line 3: credential: Field required')
+
+        players = (
+            await async_session.exec(
+                select(PlayerProfile).order_by(PlayerProfile.player_id)
+            )
+        ).all()
+        assert [player.player_id for player in players] == ['player_1', 'player_2']
+        assert players[0].active_campaigns == []
+        assert players[0].version == 1
+        assert players[0].birthdate == datetime(2000, 1, 10, 13, 37, 17)
+        assert players[0].clan.name == 'clan'
+        assert players[0].inventory.item_34 == 3
+        assert [device.model for device in players[0].devices] == ['apple iphone 11']
+        assert players[1].inventory is None
+
+    @pytest.mark.asyncio
+    async def test_ingest_updates_existing_players(self, async_client, async_session):
+        """
+        Test that the players already in the database are updated, without touching their active campaigns, and that
+        their inventory is updated in place.
+        """
+        # Arrange
+        async_session.add(Clan(id=1, name='old clan'))
+        async_session.add(
+            PlayerProfile(
+                player_id='player_1',
+                credential='old_credential',
+                created=datetime(2021, 1, 10, 13, 37, 17),
+                modified=datetime(2021, 1, 10, 13, 37, 17),
+                active_campaigns=['mycampaign'],
+                level=1,
+                country='US',
+                language='en',
+                birthdate=datetime(2000, 1, 10, 13, 37, 17),
+                gender='male',
+                clan_id=1,
+            )
+        )
+        await async_session.flush()
+        async_session.add(Inventory(id=1, player_id='player_1', cash=1, coins=1))
+        async_session.add(
+            Device(
+                id=1,
+                player_id='player_1',
+                model='old model',
+                carrier='vodafone',
+                firmware='1',
+            )
+        )
+        await async_session.commit()
+
+        # Act
+        response = await async_client.post(
+            '/players/ingest',
+            content=json.dumps(self.__player),
+            headers={'content-type': 'application/x-ndjson', **ADMIN_HEADERS},
+        )
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json()['ingested_rows'] == 1
+        async_session.expunge_all()
+        player = (
+            await async_session.exec(
+                select(PlayerProfile).where(PlayerProfile.player_id == 'player_1')
+            )
+        ).one()
+        assert player.credential == 'apple_credential'
+        assert player.level == 3
+        assert player.active_campaigns == ['mycampaign']
+        assert player.clan.name == 'clan'
+        assert player.inventory.id == 1
+        assert player.inventory.cash == 123
+        assert [device.model for device in player.devices] == ['apple iphone 11']
+
+    @pytest.mark.asyncio
+    async def test_ingest_csv(self, async_client, async_session):
+        """
+        Test that a CSV body is ingested, with the inventory in prefixed columns, the devices as JSON and quoted
+        fields spanning several lines.
+        """
+        # Arrange
+        body = (
+            'player_id,credential,created,modified,level,country,language,birthdate,gender,clan_id,clan_name,'
+            'custom_field,inventory.cash,inventory.coins,inventory.item_1,devices\n'
+            'player_1,apple_credential,2021-01-10T13:37:17,2021-01-23T13:37:17,3,CA,fr,2000-01-10,male,1,clan,'
+            '"first line\nsecond, line",123,12,1,"[{""id"": 1, ""model"": ""pixel"", ""carrier"": ""bell"", '
+            '""firmware"": ""1""}]"\n'
+            'player_2,apple_credential,2021-01-10T13:37:17,2021-01-23T13:37:17,not_a_level,CA,fr,2000-01-10,male,1,'
+            'clan,,,,,\n'
+            'player_3,apple_credential,2021-01-10T13:37:17,2021-01-23T13:37:17,5,RO,ro,2000-01-10,female,1,clan,'
+            ',,,,\n'
+        )
+
+        # Act
+        response = await async_client.post(
+            '/players/ingest',
+            content=body,
+            headers={'content-type': 'text/csv; charset=utf-8', **ADMIN_HEADERS},
+        )
+
+        # Assert
+        assert response.status_code == 200
+        report = response.json()
+        assert report['ingested_rows'] == 2
+        assert report['errors'] == [
+            'Line 4: level: Input should be a valid integer, unable to parse string as an integer'
+        ]
+        players = (
+            await async_session.exec(
+                select(PlayerProfile).order_by(PlayerProfile.player_id)
+            )
+        ).all()
+        assert [player.player_id for player in players] == ['player_1', 'player_3']
+        assert players[0].custom_field == 'first line\nsecond, line'
+        assert players[0].inventory.item_1 == 1
+        assert players[0].devices[0].model == 'pixel'
+        assert players[1].inventory is None
+
+    @pytest.mark.asyncio
+    async def test_unsupported_content_type(self, async_client, async_session):
+        """
+        Test that 415 is returned for a body that is neither NDJSON nor CSV.
+        """
+        # Act
+        response = await async_client.post(
+            '/players/ingest',
+            content=json.dumps([self.__player]),
+            headers={'content-type': 'application/json', **ADMIN_HEADERS},
+        )
+
+        # Assert
+        assert response.status_code == 415
+
+    @pytest.mark.asyncio
+    async def test_admin_token_required(self, async_client, async_session):
+        """
+        Test that the players are not ingested without the admin token, or with a wrong one.
+        """
+        # Arrange
+        body = json.dumps(self.__player)
+
+        # Act
+        responses = [
+            await async_client.post(
+                '/players/ingest',
+                content=body,
+                headers={'content-type': 'application/x-ndjson'} | headers,
+            )
+            for headers in ({}, {'X-Admin-Token': 'wrong_token'})
+        ]
+
+        # Assert
+        assert [response.status_code for response in responses] == [403, 403]
+        assert (await async_session.exec(select(PlayerProfile))).all() == []
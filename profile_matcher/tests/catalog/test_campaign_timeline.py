@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+
+from profile_matcher.api.models import (
+    Matcher,
+    Level,
+    MatcherContent,
+    ActiveCampaign,
+)
+from profile_matcher.catalog import CampaignTimeline, compile_catalog
+
+
+class TestCampaignTimeline:
+    def test_running_campaigns_follow_the_clock(self):
+        """
+        Test that campaigns start and expire as the clock moves forward, that disabled campaigns never run, and that
+        an earlier instant can still be asked.
+        """
+        # Arrange
+        catalog = compile_catalog(
+            [
+                self.create_campaign(
+                    'january', datetime(2022, 1, 1), datetime(2022, 2, 1)
+                ),
+                self.create_campaign(
+                    'february', datetime(2022, 2, 1), datetime(2022, 3, 1)
+                ),
+                self.create_campaign('q1', datetime(2022, 1, 1), datetime(2022, 4, 1)),
+                self.create_campaign(
+                    'disabled',
+                    datetime(2022, 1, 1),
+                    datetime(2022, 4, 1),
+                    enabled=False,
+                ),
+            ]
+        )
+        timeline = CampaignTimeline(catalog)
+
+        # Act
+        running = [
+            timeline.running_at(datetime(year, month, day, tzinfo=timezone.utc))
+            for year, month, day in [
+                (2021, 12, 31),
+                (2022, 1, 15),
+                (2022, 2, 1),
+                (2022, 3, 15),
+                (2022, 5, 1),
+                (2022, 1, 15),
+            ]
+        ]
+
+        # Assert
+        assert running == [(), (0, 2), (1, 2), (2,), (), (0, 2)]
+
+    def test_earlier_instant_keeps_latest(self):
+        """
+        Test that asking for an instant before the latest one (out of order requests) returns the campaigns running
+        then, without moving the timeline back: the latest instant does not replay the events again.
+        """
+        # Arrange
+        catalog = compile_catalog(
+            [
+                self.create_campaign(
+                    'january', datetime(2022, 1, 1), datetime(2022, 2, 1)
+                ),
+                self.create_campaign(
+                    'february', datetime(2022, 2, 1), datetime(2022, 3, 1)
+                ),
+                self.create_campaign('q1', datetime(2022, 1, 1), datetime(2022, 4, 1)),
+            ]
+        )
+        timeline = CampaignTimeline(catalog)
+        latest = datetime(2022, 2, 15, tzinfo=timezone.utc)
+        latest_running = timeline.running_at(latest)
+        next_change = timeline.next_change()
+
+        # Act
+        earlier_running = [
+            timeline.running_at(datetime(year, month, day, tzinfo=timezone.utc))
+            for year, month, day in [(2022, 1, 15), (2021, 12, 1), (2022, 2, 1)]
+        ]
+
+        # Assert
+        assert latest_running == (1, 2)
+        assert earlier_running == [(0, 2), (), (1, 2)]
+        assert timeline.next_change() == next_change
+        assert timeline.running_at(latest) is latest_running
+
+    @staticmethod
+    def create_campaign(
+        name: str, start_date: datetime, end_date: datetime, enabled: bool = True
+    ) -> ActiveCampaign:
+        return ActiveCampaign(
+            game='mygame',
+            name=name,
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=start_date,
+            end_date=end_date,
+            enabled=enabled,
+            last_updated=datetime(2021, 7, 13),
+        )
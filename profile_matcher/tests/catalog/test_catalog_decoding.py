@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from profile_matcher.api.models import ActiveCampaign, active_campaigns_adapter
+from profile_matcher.catalog import (
+    CatalogDecodingException,
+    JsonArrayStream,
+    compile_catalog,
+    compile_catalog_stream,
+)
+from profile_matcher.loadtest import generate_catalog
+
+
+class TestCatalogDecoding:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__payload = generate_catalog(50, seed=1)
+
+    @pytest.mark.parametrize('chunk_size', [1, 7, 100, 1 << 16])
+    def test_array_stream(self, chunk_size):
+        """
+        Test that the elements of an array are split out whatever the chunks, brackets and quotes in strings included.
+        """
+        # Arrange
+        payload = b' [ {"a": [1, {"b": "x}]"}]} ,\n{"c": "\\"[{"}, {}] '
+        stream = JsonArrayStream()
+
+        # Act
+        elements = []
+        for offset in range(0, len(payload), chunk_size):
+            elements += stream.feed(payload[offset : offset + chunk_size])
+        stream.close()
+
+        # Assert
+        assert elements == [b'{"a": [1, {"b": "x}]"}]}', b'{"c": "\\"[{"}', b'{}']
+        assert [json.loads(element) for element in elements] == json.loads(payload)
+
+    @pytest.mark.parametrize(
+        'payload',
+        [b'{"name": "campaign"}', b'[{}, 1]', b'[[]]', b'[{}] {}', b'[{"a": 1}'],
+    )
+    def test_array_stream_invalid(self, payload):
+        """
+        Test that a payload that is not a complete array of objects is rejected.
+        """
+        # Arrange
+        stream = JsonArrayStream()
+
+        # Act / Assert
+        with pytest.raises(CatalogDecodingException):
+            stream.feed(payload)
+            stream.close()
+
+    def test_compile_catalog_stream(self):
+        """
+        Test that the catalog compiled from the stream is the catalog compiled from the campaigns validated at once.
+        """
+        # Arrange
+        chunks = (
+            self.__payload[offset : offset + 1000]
+            for offset in range(0, len(self.__payload), 1000)
+        )
+
+        # Act
+        catalog = compile_catalog_stream(chunks, ActiveCampaign.model_validate_json)
+
+        # Assert
+        assert catalog == compile_catalog(
+            active_campaigns_adapter.validate_json(self.__payload)
+        )
+        assert len(catalog) == 50
+
+    def test_compile_catalog_stream_invalid_campaign(self):
+        """
+        Test that an invalid campaign is reported with its position.
+        """
+        # Arrange
+        campaigns = json.loads(self.__payload)
+        del campaigns[3]['matchers']
+
+        # Act / Assert
+        with pytest.raises(CatalogDecodingException, match='Invalid campaign 3'):
+            compile_catalog_stream(
+                [json.dumps(campaigns).encode()], ActiveCampaign.model_validate_json
+            )
@@ -0,0 +1,99 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from profile_matcher.api.models import (
+    ActiveCampaign,
+    Level,
+    Matcher,
+    MatcherContent,
+)
+from profile_matcher.catalog import CatalogIndex, CatalogIndexCache
+from profile_matcher.catalog import _catalog_index
+
+
+def create_campaign(
+    name: str, last_updated: datetime, level_max: int = 3
+) -> ActiveCampaign:
+    return ActiveCampaign(
+        game='mygame',
+        name=name,
+        priority=10.5,
+        matchers=Matcher(
+            level=Level(min=1, max=level_max),
+            has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+            does_not_have=MatcherContent(items=['item_4']),
+        ),
+        start_date=datetime(2022, 1, 25),
+        end_date=datetime(2022, 2, 25),
+        enabled=True,
+        last_updated=last_updated,
+    )
+
+
+class TestCatalogIndex:
+    def test_applied_version(self):
+        """
+        Test that an index changed campaign by campaign has the version of an index of the same campaigns built whole,
+        whatever their order, and that a catalog changed back gets its version back.
+        """
+        # Arrange
+        campaigns = [
+            create_campaign('campaign_1', datetime(2021, 7, 13)),
+            create_campaign('campaign_2', datetime(2021, 7, 14)),
+            create_campaign('campaign_3', datetime(2021, 7, 15)),
+        ]
+        updated = create_campaign('campaign_2', datetime(2021, 7, 16), level_max=5)
+        added = create_campaign('campaign_4', datetime(2021, 7, 17))
+        index = CatalogIndex(campaigns)
+
+        # Act
+        applied = index.apply([added, updated], ['campaign_1'])
+        reverted = applied.apply([campaigns[0], campaigns[1]], ['campaign_4'])
+
+        # Assert
+        assert applied.version == CatalogIndex([added, campaigns[2], updated]).version
+        assert applied.version != index.version
+        assert [campaign.name for campaign in applied.campaigns] == [
+            'campaign_2',
+            'campaign_3',
+            'campaign_4',
+        ]
+        assert reverted.version == index.version
+
+
+class TestCatalogIndexCache:
+    def test_hashed_only_when_changed(self):
+        """
+        Test that the catalog is only hashed again when a campaign is added, removed or updated, and that the index is
+        only rebuilt when the content changed.
+        """
+        # Arrange
+        cache = CatalogIndexCache()
+        campaigns = [
+            create_campaign('campaign_1', datetime(2021, 7, 13)),
+            create_campaign('campaign_2', datetime(2021, 7, 14)),
+        ]
+        updated = [
+            campaigns[0],
+            create_campaign('campaign_2', datetime(2021, 7, 15), level_max=5),
+        ]
+
+        # Act
+        with patch.object(
+            _catalog_index,
+            'catalog_version',
+            wraps=_catalog_index.catalog_version,
+        ) as catalog_version:
+            first = cache.get(campaigns)
+            same = [cache.get(list(campaigns)) for _ in range(10)]
+            hashes_before_update = catalog_version.call_count
+            changed = cache.get(updated)
+            removed = cache.get(updated[:1])
+
+        # Assert
+        assert hashes_before_update == 1
+        assert catalog_version.call_count == 3
+        assert all(index is first for index in same)
+        assert changed is not first
+        assert changed.campaigns == updated
+        assert removed.campaigns == updated[:1]
@@ -0,0 +1,186 @@
+from datetime import datetime
+
+import pytest
+
+from profile_matcher.api.models import (
+    Matcher,
+    Level,
+    MatcherContent,
+    ActiveCampaign,
+)
+from profile_matcher.catalog import (
+    CatalogIndex,
+    CatalogSnapshotReader,
+    PlayerFeatures,
+    compile_catalog,
+    inventory_to_mask,
+    write_catalog_snapshot,
+)
+from profile_matcher.database.models import Inventory
+
+
+class TestCatalogSnapshot:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__campaigns = [
+            self.create_campaign(
+                'low_level', Level(min=1, max=3), ['US', 'CA'], ['item_1'], ['item_4']
+            ),
+            self.create_campaign(
+                'high_level', Level(min=10, max=20), ['CA'], ['item_1'], []
+            ),
+            self.create_campaign(
+                'romania', Level(min=1, max=50), ['RO'], ['item_34', 'item_55'], []
+            ),
+            self.create_campaign(
+                'no_item_4', Level(min=1, max=50), ['CA', 'RO'], ['item_55'], ['item_4']
+            ),
+        ]
+
+    def test_snapshot_round_trip(self, tmp_path):
+        """
+        Test that a catalog read back from a snapshot is identical to the compiled catalog.
+        """
+        # Arrange
+        catalog = compile_catalog(self.__campaigns)
+        path = tmp_path / 'catalog.snapshot'
+
+        # Act
+        write_catalog_snapshot(catalog, path)
+        snapshot = CatalogSnapshotReader(path).current()
+
+        # Assert
+        assert snapshot.version == catalog.version
+        assert len(snapshot) == len(catalog)
+        assert snapshot.to_catalog() == catalog
+
+    @pytest.mark.parametrize(
+        'level, country, items, expected',
+        [
+            (3, 'CA', {'item_1': 1, 'item_55': 1}, ['low_level', 'no_item_4']),
+            (15, 'CA', {'item_1': 1, 'item_4': 1}, ['high_level']),
+            (5, 'RO', {'item_34': 2, 'item_4': 1}, ['romania']),
+            (5, 'FR', {'item_1': 1, 'item_55': 1}, []),
+        ],
+    )
+    def test_snapshot_matching(self, tmp_path, level, country, items, expected):
+        """
+        Test that matching in place on the snapshot gives the same result as the compiled campaigns.
+        """
+        # Arrange
+        catalog = compile_catalog(self.__campaigns)
+        path = tmp_path / 'catalog.snapshot'
+        write_catalog_snapshot(catalog, path)
+        inventory = Inventory(id=1, player_id='player', cash=0, coins=0, **items)
+        player = PlayerFeatures(
+            level=level,
+            country=country,
+            item_mask=inventory_to_mask(inventory),
+            active_campaigns=frozenset(),
+        )
+
+        # Act
+        names = CatalogSnapshotReader(path).current().matching_names(player)
+
+        # Assert
+        assert names == expected
+        assert names == [
+            campaign.name for campaign in catalog if campaign.matches(player)
+        ]
+
+    def test_reader_swaps_to_new_snapshot(self, tmp_path):
+        """
+        Test that the reader picks up a new snapshot written over the old one, while the old snapshot stays readable.
+        """
+        # Arrange
+        path = tmp_path / 'catalog.snapshot'
+        write_catalog_snapshot(compile_catalog(self.__campaigns[:1]), path)
+        reader = CatalogSnapshotReader(path, check_interval=0)
+        old_snapshot = reader.current()
+
+        # Act
+        write_catalog_snapshot(compile_catalog(self.__campaigns), path)
+        new_snapshot = reader.current()
+
+        # Assert
+        assert new_snapshot is not old_snapshot
+        assert len(new_snapshot) == len(self.__campaigns)
+        assert old_snapshot.name(0) == 'low_level'
+        assert reader.current() is new_snapshot
+
+    def test_snapshot_running_at(self, tmp_path):
+        """
+        Test that the running campaigns read in place are the ones of the compiled catalog, by descending priority, and
+        that only them are materialized.
+        """
+        # Arrange
+        campaigns = [
+            campaign.model_copy(update={'priority': priority})
+            for campaign, priority in zip(self.__campaigns, [1, 5, 3, 5])
+        ]
+        campaigns[2] = campaigns[2].model_copy(update={'enabled': False})
+        campaigns[3] = campaigns[3].model_copy(
+            update={'end_date': datetime(2022, 2, 1)}
+        )
+        catalog = compile_catalog(campaigns)
+        path = tmp_path / 'catalog.snapshot'
+        write_catalog_snapshot(catalog, path)
+        snapshot = CatalogSnapshotReader(path).current()
+        now = datetime(2022, 2, 10)
+
+        # Act
+        running = snapshot.running_at(now)
+
+        # Assert
+        assert [campaign.name for campaign in running] == ['high_level', 'low_level']
+        assert running == CatalogIndex([], compiled=catalog).compiled_running_at(now)
+        assert snapshot.running_at(now)[0] is running[0]
+        assert snapshot.find('romania') == catalog.campaigns[2]
+        assert snapshot.find('unknown') is None
+        assert (
+            snapshot.player_fields == CatalogIndex([], compiled=catalog).player_fields
+        )
+
+    def test_reader_keeps_snapshot_on_empty_file(self, tmp_path):
+        """
+        Test that an empty or truncated file written over the snapshot is ignored, and the previous snapshot kept.
+        """
+        # Arrange
+        path = tmp_path / 'catalog.snapshot'
+        write_catalog_snapshot(compile_catalog(self.__campaigns), path)
+        reader = CatalogSnapshotReader(path, check_interval=0)
+        snapshot = reader.current()
+        content = path.read_bytes()
+
+        # Act
+        path.write_bytes(b'')
+        after_empty = reader.current()
+        path.write_bytes(content[: len(content) // 2])
+        after_truncated = reader.current()
+
+        # Assert
+        assert after_empty is snapshot
+        assert after_truncated is snapshot
+
+    @staticmethod
+    def create_campaign(
+        name: str,
+        level: Level,
+        countries: list[str],
+        has_items: list[str],
+        does_not_have_items: list[str],
+    ) -> ActiveCampaign:
+        return ActiveCampaign(
+            game='mygame',
+            name=name,
+            priority=10.5,
+            matchers=Matcher(
+                level=level,
+                has=MatcherContent(country=countries, items=has_items),
+                does_not_have=MatcherContent(items=does_not_have_items),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
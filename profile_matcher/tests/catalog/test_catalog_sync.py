@@ -0,0 +1,215 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+import httpx
+import pytest
+from fastapi import FastAPI, Response
+
+from profile_matcher.api import HttpCampaignSource
+from profile_matcher.api.models import (
+    ActiveCampaign,
+    CampaignChanges,
+    CampaignTombstone,
+    Level,
+    Matcher,
+    MatcherContent,
+)
+from profile_matcher.catalog import CatalogSync, CatalogSyncException
+
+
+class StandInCampaignServer:
+    """
+    Local stand-in for the campaign service: the catalog, the tombstones of the removed campaigns and the requests
+    received.
+    """
+
+    def __init__(self):
+        self.campaigns: dict[str, ActiveCampaign] = {}
+        self.tombstones: dict[str, datetime] = {}
+        self.requests: list[Optional[datetime]] = []
+        self.available = True
+        self.app = FastAPI()
+        self.app.get('/campaigns')(self.get_campaigns)
+
+    async def get_campaigns(self, updated_since: Optional[datetime] = None):
+        if not self.available:
+            return Response(status_code=503)
+        self.requests.append(updated_since)
+        return CampaignChanges(
+            campaigns=[
+                campaign
+                for campaign in self.campaigns.values()
+                if updated_since is None or campaign.last_updated >= updated_since
+            ],
+            removed=[]
+            if updated_since is None
+            else [
+                CampaignTombstone(name=name, removed_at=removed_at)
+                for name, removed_at in self.tombstones.items()
+                if removed_at >= updated_since
+            ],
+        )
+
+    def upsert(self, campaign: ActiveCampaign):
+        self.campaigns[campaign.name] = campaign
+        self.tombstones.pop(campaign.name, None)
+
+    def remove(self, name: str, removed_at: datetime):
+        del self.campaigns[name]
+        self.tombstones[name] = removed_at
+
+
+class TestCatalogSync:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__server = StandInCampaignServer()
+        for index in range(3):
+            self.__server.upsert(
+                self.create_campaign(f'campaign_{index}', datetime(2022, 1, 1 + index))
+            )
+        self.__source = HttpCampaignSource(
+            'http://campaigns.test',
+            transport=httpx.ASGITransport(app=self.__server.app),
+        )
+
+    @pytest.mark.asyncio
+    async def test_delta_sync(self):
+        """
+        Test that after the first full fetch, only the changes since the most recent update are requested, and that
+        they are applied without compiling the unchanged campaigns again.
+        """
+        # Arrange
+        sync = CatalogSync(self.__source)
+        first_index = await sync.refresh()
+        unchanged = first_index.compiled.campaigns[0]
+        self.__server.upsert(
+            self.create_campaign('campaign_1', datetime(2022, 1, 10), level_max=10)
+        )
+        self.__server.upsert(self.create_campaign('campaign_3', datetime(2022, 1, 11)))
+        self.__server.remove('campaign_2', datetime(2022, 1, 12))
+
+        # Act
+        index = await sync.refresh()
+
+        # Assert
+        assert self.__server.requests == [None, datetime(2022, 1, 3)]
+        assert [campaign.name for campaign in index.campaigns] == [
+            'campaign_0',
+            'campaign_1',
+            'campaign_3',
+        ]
+        assert index.compiled.campaigns[0] is unchanged
+        assert index.compiled.campaigns[1].level_max == 10
+        assert index.version != first_index.version
+        assert sync.updated_since == datetime(2022, 1, 12)
+        assert (sync.full_syncs, sync.delta_syncs) == (1, 1)
+
+        # Nothing changed since: the same index is kept
+        assert await sync.refresh() is index
+        assert self.__server.requests[-1] == datetime(2022, 1, 12)
+
+    @pytest.mark.asyncio
+    async def test_full_resync(self):
+        """
+        Test that a removal without tombstone is only seen by the periodic full resync, and that a full resync is done
+        on every refresh once due.
+        """
+        # Arrange
+        sync = CatalogSync(self.__source)
+        await sync.refresh()
+        del self.__server.campaigns['campaign_0']
+        delta_index = await sync.refresh()
+        always_full_sync = CatalogSync(self.__source, full_resync_interval=0)
+        await always_full_sync.refresh()
+
+        # Act
+        index = await sync.resync()
+        always_full_index = await always_full_sync.refresh()
+
+        # Assert
+        assert len(delta_index.campaigns) == 3
+        assert [campaign.name for campaign in index.campaigns] == [
+            'campaign_1',
+            'campaign_2',
+        ]
+        assert [campaign.name for campaign in always_full_index.campaigns] == [
+            'campaign_1',
+            'campaign_2',
+        ]
+        assert (always_full_sync.full_syncs, always_full_sync.delta_syncs) == (2, 0)
+
+    @pytest.mark.asyncio
+    async def test_unavailable_service(self):
+        """
+        Test that a failed refresh raises and keeps the current index.
+        """
+        # Arrange
+        sync = CatalogSync(self.__source)
+        index = await sync.refresh()
+        self.__server.available = False
+
+        # Act
+        with pytest.raises(CatalogSyncException):
+            await sync.refresh()
+
+        # Assert
+        assert sync.index is index
+
+    @pytest.mark.asyncio
+    async def test_notified_version(self):
+        """
+        Test that a version notified by another worker is fetched right away, without waiting for the poll, and is not
+        told back, while a version found by the poll is told to the other workers.
+        """
+        # Arrange
+        published = []
+
+        async def on_new_version(version: str):
+            published.append(version)
+
+        sync = CatalogSync(
+            self.__source, refresh_interval=0.05, notified_refresh_interval=3600
+        )
+        sync.on_new_version = on_new_version
+        await sync.start()
+        first_version = sync.index.version
+        sync.set_notified(True)
+        await asyncio.sleep(0.01)
+        self.__server.upsert(self.create_campaign('campaign_3', datetime(2022, 1, 11)))
+
+        # Act
+        sync.notify_version('version_of_another_worker')
+        await asyncio.sleep(0.1)
+        notified_version = sync.index.version
+        sync.notify_version(notified_version)
+        self.__server.upsert(self.create_campaign('campaign_4', datetime(2022, 1, 12)))
+        sync.set_notified(False)
+        await asyncio.sleep(0.1)
+        await sync.stop()
+
+        # Assert
+        assert notified_version != first_version
+        assert sync.notified_syncs == 1
+        assert sync.refresh_interval == 0.05
+        assert len(sync.index.campaigns) == 5
+        assert published == [first_version, sync.index.version]
+
+    @staticmethod
+    def create_campaign(
+        name: str, last_updated: datetime, level_max: int = 3
+    ) -> ActiveCampaign:
+        return ActiveCampaign(
+            game='mygame',
+            name=name,
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=level_max),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=last_updated,
+        )
@@ -0,0 +1,167 @@
+from datetime import datetime
+
+import pytest
+
+from profile_matcher.api.models import (
+    ActiveCampaign,
+    Level,
+    Matcher,
+    MatcherContent,
+    Recency,
+)
+from profile_matcher.catalog import (
+    MatchCache,
+    PlayerFeatures,
+    compile_catalog,
+    items_to_mask,
+)
+
+
+class TestMatchCache:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__computed = []
+
+    def test_same_fingerprint(self):
+        """
+        Test that the players with the same matching features share a result, whatever their other features, and
+        that the variant is part of the key.
+        """
+        # Arrange
+        cache = MatchCache()
+        cache.bind(compile_catalog([self.create_campaign('campaign_1')]))
+        player = self.create_player(language='fr')
+        same_player = self.create_player(language='en')
+        other_player = self.create_player(level=10)
+
+        # Act
+        results = [
+            cache.match(player, None, self.compute(player)),
+            cache.match(same_player, None, self.compute(same_player)),
+            cache.match(other_player, None, self.compute(other_player)),
+            cache.match(player, 1, self.compute(player)),
+        ]
+
+        # Assert
+        assert results == [['campaign_1'], ['campaign_1'], [], ['campaign_1']]
+        assert self.__computed == [player, other_player, player]
+        assert cache.stats() == {
+            'entries': 3,
+            'hits': 1,
+            'misses': 3,
+            'hit_rate': 0.25,
+            'bypasses': 0,
+            'invalidations': 0,
+            'stale_results': 0,
+        }
+
+    def test_invalidation(self):
+        """
+        Test that the results are dropped when the running campaigns change, and kept when the same campaigns are bound
+        again.
+        """
+        # Arrange
+        cache = MatchCache()
+        player = self.create_player()
+        catalog = compile_catalog([self.create_campaign('campaign_1')])
+        cache.bind(catalog)
+        cache.match(player, None, self.compute(player))
+
+        # Act
+        cache.bind(list(catalog))
+        kept = len(cache)
+        cache.bind(compile_catalog([self.create_campaign('campaign_2')]))
+
+        # Assert
+        assert kept == 1
+        assert len(cache) == 0
+        assert cache.invalidations == 1
+
+    def test_result_of_other_scope(self):
+        """
+        Test that a result computed for campaigns that were replaced while it was computed is not stored, and that its
+        key does not find the results of the new campaigns.
+        """
+        # Arrange
+        cache = MatchCache()
+        player = self.create_player()
+        cache.bind(compile_catalog([self.create_campaign('campaign_1')]))
+        key = cache.key(player)
+
+        # Act
+        cache.bind(compile_catalog([self.create_campaign('campaign_2')]))
+        cache.put(key, ['campaign_1'])
+        new_result = cache.match(player, None, lambda: ['campaign_2'])
+
+        # Assert
+        assert new_result == ['campaign_2']
+        assert cache.get(key) is None
+        assert cache.stale_results == 1
+        assert len(cache) == 1
+
+    def test_bypass(self):
+        """
+        Test that the results are not cached when the campaigns match on the current time, or when the cache is
+        disabled, and that the least recently used result is evicted when full.
+        """
+        # Arrange
+        time_cache = MatchCache()
+        time_cache.bind(
+            compile_catalog(
+                [self.create_campaign('campaign_1', last_purchase=Recency(max_days=5))]
+            )
+        )
+        disabled_cache = MatchCache(0)
+        disabled_cache.bind(compile_catalog([self.create_campaign('campaign_1')]))
+        small_cache = MatchCache(2)
+        small_cache.bind(compile_catalog([self.create_campaign('campaign_1')]))
+        players = [self.create_player(level=level) for level in (1, 2, 3)]
+
+        # Act
+        for cache in (time_cache, disabled_cache, small_cache):
+            for player in players:
+                cache.match(player, None, self.compute(player))
+        small_cache.match(players[0], None, self.compute(players[0]))
+
+        # Assert
+        assert time_cache.bypasses == 3
+        assert len(time_cache) == 0
+        assert disabled_cache.bypasses == 3
+        assert len(disabled_cache) == 0
+        assert len(small_cache) == 2
+        assert small_cache.misses == 4
+
+    def compute(self, player: PlayerFeatures):
+        def compute():
+            self.__computed.append(player)
+            return ['campaign_1'] if player.level <= 3 else []
+
+        return compute
+
+    @staticmethod
+    def create_player(level: int = 2, language: str = 'fr') -> PlayerFeatures:
+        return PlayerFeatures(
+            level=level,
+            country='CA',
+            item_mask=items_to_mask(['item_1']),
+            active_campaigns=frozenset(),
+            language=language,
+        )
+
+    @staticmethod
+    def create_campaign(name: str, last_purchase: Recency = None) -> ActiveCampaign:
+        return ActiveCampaign(
+            game='mygame',
+            name=name,
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+                last_purchase=last_purchase,
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from profile_matcher.catalog import PlayerFeatures, items_to_mask
+from profile_matcher.database.models import PlayerProfile, Clan, Device, Inventory
+
+
+class TestPlayerFeatures:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__player = PlayerProfile(
+            player_id='player_1',
+            credential='apple_credential',
+            created=datetime(2021, 1, 10, 13, 37, 17),
+            modified=datetime(2021, 1, 23, 13, 37, 17),
+            active_campaigns=['mycampaign'],
+            level=3,
+            country='CA',
+            language='fr',
+            birthdate=datetime(2000, 1, 10, 13, 37, 17),
+            gender='male',
+            clan_id=1,
+            total_spent=12.5,
+            last_purchase=datetime(2021, 1, 20, 8, 0, 0),
+        )
+        self.__inventory = Inventory(
+            id=1, player_id='player_1', cash=123, coins=12, item_1=1, item_34=3
+        )
+
+    @pytest.mark.asyncio
+    async def test_same_features_from_model_and_record(self, async_session):
+        """
+        Test that the features built from the model and from a raw asyncpg record of the same player are equal.
+        """
+        # Arrange
+        self.__player.inventory = self.__inventory
+        self.__player.devices = [
+            Device(
+                id=1,
+                player_id='player_1',
+                model='apple iphone 11',
+                carrier='vodafone',
+                firmware='123',
+            )
+        ]
+        async_session.add(Clan(id=1, name='clan'))
+        async_session.add(self.__player)
+        await async_session.commit()
+        connection = await async_session.connection()
+        raw_connection = await connection.get_raw_connection()
+
+        # Act
+        record = await raw_connection.driver_connection.fetchrow(
+            """
+            SELECT player.level, player.country, player.active_campaigns, player.language, player.gender,
+                player.total_spent, player.last_purchase,
+                ARRAY(SELECT model FROM device WHERE device.player_id = player.player_id) AS device_models,
+                inventory.*
+            FROM "player-profile" AS player
+            LEFT JOIN inventory ON inventory.player_id = player.player_id
+            WHERE player.player_id = $1
+            """,
+            'player_1',
+        )
+        from_record = PlayerFeatures.from_record(record)
+        from_model = PlayerFeatures.from_player(self.__player)
+
+        # Assert
+        assert from_record == from_model
+        assert from_model.level == 3
+        assert from_model.active_campaigns == frozenset({'mycampaign'})
+        assert from_model.device_models == frozenset({'apple iphone 11'})
+        assert (
+            from_model.last_purchase_ts
+            == datetime(2021, 1, 20, 8).replace(tzinfo=timezone.utc).timestamp()
+        )
+        assert from_model.item_mask == items_to_mask(
+            ['id', 'player_id', 'cash', 'coins', 'item_1', 'item_34']
+        )
+
+    def test_compact_record(self):
+        """
+        Test that the features are immutable, without instance dictionary, and share the country string of the other
+        players of the country.
+        """
+        # Arrange
+        self.__player.inventory = self.__inventory
+        self.__player.devices = []
+        # Built at runtime, so that it is not the same constant as 'CA'
+        other_player_country = ''.join(['C', 'A'])
+
+        # Act
+        features = PlayerFeatures.from_player(self.__player)
+        other_features = PlayerFeatures.from_record(
+            {'level': 1, 'country': other_player_country, 'active_campaigns': None}
+        )
+
+        # Assert
+        assert not hasattr(features, '__dict__')
+        with pytest.raises(AttributeError):
+            features.level = 4
+        assert features.country is other_features.country
+        assert other_features.item_mask == 0
+        assert other_features.active_campaigns == frozenset()
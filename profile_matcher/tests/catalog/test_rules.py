@@ -0,0 +1,209 @@
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from profile_matcher.api.models import (
+    ActiveCampaign,
+    Level,
+    Matcher,
+    MatcherContent,
+    Range,
+    Recency,
+)
+from profile_matcher.catalog import (
+    CatalogSnapshotReader,
+    PlayerFeatures,
+    Rule,
+    RuleRegistry,
+    compile_catalog,
+    items_to_mask,
+    rule_registry,
+    write_catalog_snapshot,
+)
+
+NOW_DATE = datetime(2022, 2, 1, tzinfo=timezone.utc)
+NOW = NOW_DATE.timestamp()
+DAY = 24 * 3600
+ITEMS = ['item_1', 'item_4', 'item_34']
+COUNTRIES = ['CA', 'US', 'RO']
+LANGUAGES = ['fr', 'en', 'ro']
+GENDERS = ['male', 'female', 'other']
+DEVICE_MODELS = ['pixel', 'iphone', 'galaxy']
+
+
+class TestRules:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__random = random.Random(1234)
+
+    def test_compiled_and_interpreted_parity(self, tmp_path):
+        """
+        Test on random players and campaigns using every rule that the compiled campaigns, ordered or not, the
+        interpreter and the snapshot (materialized or read in place) give the same matches.
+        """
+        # Arrange
+        players = [self.create_player() for _ in range(300)]
+        campaigns = [self.create_campaign(index) for index in range(40)]
+        path = tmp_path / 'catalog.snapshot'
+        write_catalog_snapshot(compile_catalog(campaigns), path)
+        snapshot = CatalogSnapshotReader(path).current()
+
+        # Act
+        catalog = compile_catalog(campaigns)
+        ordered_catalog = compile_catalog(campaigns, sample=players[:100])
+        interpreted = [
+            [
+                rule_registry.interpret(campaign.all_rules(), player, NOW)
+                for campaign in catalog
+            ]
+            for player in players
+        ]
+
+        # Assert
+        assert all(campaign.rules for campaign in catalog)
+        assert 0 < sum(map(sum, interpreted)) < len(players) * len(campaigns)
+        for player, expected in zip(players, interpreted):
+            assert [campaign.matches(player, NOW) for campaign in catalog] == expected
+            assert [
+                campaign.matches(player, NOW) for campaign in ordered_catalog
+            ] == expected
+            assert [
+                campaign.matches(player, NOW) for campaign in snapshot.to_catalog()
+            ] == expected
+            assert snapshot.matching_names(player, NOW_DATE) == [
+                campaign.name for campaign, matches in zip(catalog, expected) if matches
+            ]
+
+    def test_selective_rules_first(self):
+        """
+        Test that the rules are ordered by their estimated cost without sample, and that the rule rejecting most of the
+        sample runs first once measured.
+        """
+        # Arrange
+        evaluated = []
+        registry = RuleRegistry(
+            [
+                self.create_rule('broad', lambda player: player.level > 1, evaluated),
+                self.create_rule('costly', lambda player: True, evaluated, cost=5),
+                self.create_rule(
+                    'selective', lambda player: player.level == 1, evaluated
+                ),
+            ]
+        )
+        rules = [('broad', ()), ('costly', ()), ('selective', ())]
+        sample = [self.create_player(level=index % 10) for index in range(100)]
+        player = self.create_player(level=7)
+
+        # Act
+        registry.compile(rules)(player, NOW)
+        default_order = list(evaluated)
+        predicate = registry.compile(rules, sample, NOW)
+        evaluated.clear()
+        predicate(player, NOW)
+        measured_order = list(evaluated)
+
+        # Assert
+        assert default_order == ['broad', 'selective']
+        assert measured_order == ['selective']
+
+    def test_fallback_interpreter(self):
+        """
+        Test that a rule without compiler, or whose compiler fails, is interpreted.
+        """
+
+        # Arrange
+        def fail(parameters):
+            raise ValueError(f'Unsupported parameters {parameters}')
+
+        registry = RuleRegistry(
+            [
+                Rule(
+                    name='level_above',
+                    evaluate=lambda parameters, player, now: player.level
+                    > parameters[0],
+                ),
+                Rule(
+                    name='country',
+                    evaluate=lambda parameters, player, now: player.country
+                    in parameters,
+                    compile=fail,
+                ),
+            ]
+        )
+        rules = [('level_above', (5,)), ('country', ('CA', 'US'))]
+
+        # Act
+        predicate = registry.compile(rules)
+
+        # Assert
+        for level, country, expected in [
+            (6, 'CA', True),
+            (5, 'CA', False),
+            (6, 'RO', False),
+        ]:
+            player = self.create_player(level=level, country=country)
+            assert predicate(player, NOW) is expected
+            assert registry.interpret(rules, player, NOW) is expected
+
+    @staticmethod
+    def create_rule(name: str, check, evaluated: list[str], cost: float = 1) -> Rule:
+        def evaluate(parameters, player, now):
+            evaluated.append(name)
+            return check(player)
+
+        return Rule(name=name, evaluate=evaluate, cost=cost)
+
+    def create_player(self, level: int = None, country: str = None) -> PlayerFeatures:
+        last_purchase_days = self.__random.choice([None, 1, 10, 100])
+        return PlayerFeatures(
+            level=self.__random.randint(1, 20) if level is None else level,
+            country=country or self.__random.choice(COUNTRIES + ['JP']),
+            item_mask=items_to_mask(
+                item for item in ITEMS if self.__random.random() < 0.5
+            ),
+            active_campaigns=frozenset(),
+            language=self.__random.choice(LANGUAGES),
+            gender=self.__random.choice(GENDERS),
+            total_spent=self.__random.choice([0.0, 5.0, 50.0, 500.0]),
+            last_purchase_ts=None
+            if last_purchase_days is None
+            else NOW - last_purchase_days * DAY,
+            device_models=frozenset(
+                model for model in DEVICE_MODELS if self.__random.random() < 0.4
+            ),
+        )
+
+    def create_campaign(self, index: int) -> ActiveCampaign:
+        def some(values: list[str]) -> list[str]:
+            return self.__random.sample(values, self.__random.randint(1, 2))
+
+        def maybe(value):
+            return value if self.__random.random() < 0.5 else None
+
+        return ActiveCampaign(
+            game='mygame',
+            name=f'campaign_{index}',
+            priority=index,
+            matchers=Matcher(
+                level=Level(min=1, max=self.__random.randint(5, 20)),
+                has=MatcherContent(
+                    country=COUNTRIES,
+                    items=some(ITEMS),
+                    language=maybe(some(LANGUAGES)),
+                    device_model=maybe(some(DEVICE_MODELS)),
+                ),
+                does_not_have=MatcherContent(
+                    gender=some(GENDERS),
+                    device_model=maybe(some(DEVICE_MODELS)),
+                ),
+                total_spent=maybe(Range(min=self.__random.choice([None, 5, 50]))),
+                last_purchase=maybe(
+                    Recency(max_days=self.__random.choice([5, 50, None]))
+                ),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
@@ -0,0 +1,62 @@
+from profile_matcher.concurrency import AdmissionController
+
+
+class TestAdmissionController:
+    def test_reject_when_latency_exceeds_budget(self):
+        """
+        Test that requests are admitted while their estimated latency fits in the budget, and rejected once the
+        requests in flight beyond the capacity would make them wait too long.
+        """
+        # Arrange
+        controller = AdmissionController(max_in_flight=100, capacity=2, smoothing=1.0)
+        for _ in range(5):
+            assert controller.try_acquire(budget=1.0)
+            controller.release(service_time=0.5)
+
+        # Act
+        admitted = [controller.try_acquire(budget=1.0) for _ in range(10)]
+
+        # Assert
+        # 0.5 s of service, plus 0.5 s per capacity of requests ahead
+        assert admitted == [True] * 4 + [False] * 6
+        assert controller.in_flight == 4
+        assert controller.retry_after() == 1
+
+    def test_reject_at_max_in_flight(self):
+        """
+        Test that requests are rejected once max_in_flight requests are in flight, whatever their budget, and admitted
+        again once a request is released.
+        """
+        # Arrange
+        controller = AdmissionController(max_in_flight=3, capacity=10)
+
+        # Act
+        admitted = [controller.try_acquire(budget=10.0) for _ in range(4)]
+        controller.release(service_time=0.01)
+        admitted_after_release = controller.try_acquire(budget=10.0)
+
+        # Assert
+        assert admitted == [True, True, True, False]
+        assert admitted_after_release
+
+    def test_admit_when_idle(self):
+        """
+        Test that a request is admitted when nothing is in flight, even with a slow history, so that the controller
+        recovers once the slowdown is over.
+        """
+        # Arrange
+        controller = AdmissionController(capacity=1, smoothing=0.5)
+        controller.record_pool_wait(10.0)
+
+        # Act
+        admitted_when_idle = controller.try_acquire(budget=1.0)
+        admitted_when_busy = controller.try_acquire(budget=1.0)
+        controller.release(service_time=0.01)
+        for _ in range(10):
+            controller.record_pool_wait(0.0)
+        admitted_after_recovery = controller.try_acquire(budget=1.0)
+
+        # Assert
+        assert admitted_when_idle
+        assert not admitted_when_busy
+        assert admitted_after_recovery
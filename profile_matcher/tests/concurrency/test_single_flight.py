@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from profile_matcher.concurrency import (
+    AdmissionController,
+    AdmissionSlot,
+    DeadlineExceededException,
+    admission_scope,
+    SingleFlight,
+    check_deadline,
+    current_deadline,
+    deadline_scope,
+    enforce_deadline,
+)
+
+
+class TestSingleFlight:
+    @pytest.mark.asyncio
+    async def test_shared_call(self):
+        """
+        Test that the calls made while a call with the same key runs share its result, and that the next call runs
+        again.
+        """
+        # Arrange
+        flight: SingleFlight[int] = SingleFlight()
+        calls = 0
+
+        async def compute() -> int:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        # Act
+        results = await asyncio.gather(*(flight.do('key', compute) for _ in range(3)))
+        next_result = await flight.do('key', compute)
+
+        # Assert
+        assert results == [1, 1, 1]
+        assert next_result == 2
+        assert not flight.in_flight('key')
+
+    @pytest.mark.asyncio
+    async def test_deadline_of_each_caller(self):
+        """
+        Test that the call does not run under the deadline of the caller that started it: when that caller's deadline
+        expires, a caller with a later deadline still gets the result.
+        """
+        # Arrange
+        flight: SingleFlight[str] = SingleFlight()
+        deadlines_seen = []
+
+        async def compute() -> str:
+            deadlines_seen.append(current_deadline())
+            await asyncio.sleep(0.1)
+            check_deadline()
+            return 'result'
+
+        async def call(timeout: float) -> str:
+            with deadline_scope(timeout):
+                async with enforce_deadline():
+                    return await flight.do('key', compute)
+
+        # Act
+        leader = asyncio.create_task(call(0.02))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(call(1.0))
+        with pytest.raises(DeadlineExceededException):
+            await leader
+        result = await follower
+
+        # Assert
+        assert result == 'result'
+        assert deadlines_seen == [None]
+
+    @pytest.mark.asyncio
+    async def test_cancelled_after_every_deadline(self):
+        """
+        Test that the call is cancelled once the latest deadline of its callers is exceeded, instead of running on with
+        nobody waiting for it.
+        """
+        # Arrange
+        flight: SingleFlight[str] = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def compute() -> str:
+            try:
+                await asyncio.sleep(1.0)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return 'result'
+
+        async def call(timeout: float) -> str:
+            with deadline_scope(timeout):
+                async with enforce_deadline():
+                    return await flight.do('key', compute)
+
+        # Act
+        leader = asyncio.create_task(call(0.02))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(call(0.05))
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 0.5)
+
+        # Assert
+        assert all(isinstance(result, DeadlineExceededException) for result in results)
+        assert not flight.in_flight('key')
+
+    @pytest.mark.asyncio
+    async def test_admission_slot_held(self):
+        """
+        Test that the call holds the admission slot of the caller that started it until it is done, even once that
+        caller stopped waiting.
+        """
+        # Arrange
+        controller = AdmissionController()
+        flight: SingleFlight[str] = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute() -> str:
+            await release.wait()
+            return 'result'
+
+        async def call() -> str:
+            assert controller.try_acquire(budget=1.0)
+            slot = AdmissionSlot(controller)
+            try:
+                with admission_scope(slot):
+                    return await asyncio.wait_for(flight.do('key', compute), 0.02)
+            finally:
+                slot.release(service_time=0.02)
+
+        # Act
+        with pytest.raises(TimeoutError):
+            await call()
+        in_flight_while_running = controller.in_flight
+        release.set()
+        await asyncio.sleep(0.01)
+
+        # Assert
+        assert in_flight_while_running == 1
+        assert controller.in_flight == 0
+        assert not flight.in_flight('key')
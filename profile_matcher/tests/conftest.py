@@ -1,7 +1,9 @@
 import asyncio
+import contextlib
 import os
 import random
 from typing import AsyncIterator, AsyncGenerator
+from unittest.mock import patch
 
 import asyncpg
 import pytest
@@ -14,7 +16,16 @@ from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from profile_matcher.database import get_db_session
+from profile_matcher.concurrency import admission_controller
+from profile_matcher.database import (
+    get_db_connection_factory,
+    get_db_session,
+    get_db_session_factory,
+    get_db_session_factories,
+    get_unit_of_work,
+    instrument_engine,
+    UnitOfWork,
+)
 
 load_dotenv()
 
@@ -36,6 +47,7 @@ DB_NAME = f'{"TestDatabase"}_{TEST_DB_ID}'
 MOCK_DB_URL = DATABASE_URL.replace('TestDatabase', DB_NAME)
 
 ENGINE = create_async_engine(MOCK_DB_URL)
+instrument_engine(ENGINE)
 
 
 @pytest.fixture(scope='session')
@@ -72,13 +84,39 @@ async def override_get_db_session(async_session):
     async def _get_test_db_session():
         yield async_session
 
+    @contextlib.asynccontextmanager
+    async def _test_db_session_factory():
+        yield async_session
+
     app.dependency_overrides[get_db_session] = _get_test_db_session
+    app.dependency_overrides[get_db_session_factory] = lambda: _test_db_session_factory
+    app.dependency_overrides[get_db_session_factories] = lambda: [
+        _test_db_session_factory
+    ]
+    app.dependency_overrides[get_db_connection_factory] = lambda: ENGINE.begin
+    app.dependency_overrides[get_unit_of_work] = lambda: UnitOfWork(
+        _test_db_session_factory
+    )
     yield
     app.dependency_overrides.clear()
 
     await ENGINE.dispose()
 
 
+@pytest.fixture(scope='function', autouse=True)
+def reset_admission_controller():
+    # Every test starts without latency history. The limit of requests in flight is raised for the tests sending
+    # hundreds of requests at once.
+    with patch.multiple(
+        admission_controller,
+        max_in_flight=1_000,
+        in_flight=0,
+        service_time=0.0,
+        pool_wait=0.0,
+    ):
+        yield
+
+
 async def create_database_if_not_exists(database_url: URL, db_name: str):
     """Create the database if it does not exist."""
     asyncpg_url = f'postgres://{database_url.username}:{database_url.password}@{database_url.host}:{database_url.port}/postgres'
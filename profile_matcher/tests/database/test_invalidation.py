@@ -0,0 +1,176 @@
+import asyncio
+import json
+from datetime import datetime
+
+import asyncpg
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert
+
+from profile_matcher.database import (
+    PLAYER_CHANNEL,
+    ActiveCampaignsWriteBehind,
+    InvalidationListener,
+    MAX_PAYLOAD_BYTES,
+    decode_player_ids,
+    notify_players,
+    player_payloads,
+)
+from profile_matcher.database import _invalidation
+from profile_matcher.database.models import Clan, PlayerProfile
+
+
+class TestInvalidationListener:
+    @pytest_asyncio.fixture(autouse=True)
+    async def setup_data(self, create_test_database_and_tables, monkeypatch):
+        monkeypatch.setattr(_invalidation, 'PLAYER_INVALIDATION', True)
+        self.__engine = create_test_database_and_tables
+        url = self.__engine.url
+        self.__dsn = url.set(drivername='postgresql').render_as_string(
+            hide_password=False
+        )
+        self.__invalidated: list[str] = []
+        self.__received = asyncio.Event()
+        self.__connection_changes: list[bool] = []
+        self.__listener = InvalidationListener(
+            lambda: asyncpg.connect(self.__dsn), reconnect_delay=0.05
+        )
+        # Subscribed twice, called once
+        for _ in range(2):
+            self.__listener.subscribe(PLAYER_CHANNEL, self.on_players)
+            self.__listener.on_connection_change(self.__connection_changes.append)
+        yield
+        await self.__listener.stop()
+
+    def on_players(self, payload: str):
+        self.__invalidated += decode_player_ids(payload)
+        self.__received.set()
+
+    async def wait_for_notification(self):
+        await asyncio.wait_for(self.__received.wait(), 5)
+        self.__received.clear()
+
+    def test_player_payloads(self):
+        """
+        Test that the player ids are sent once each, in payloads Postgres accepts.
+        """
+        # Arrange
+        player_ids = [f'player_{index}' for index in range(1_000)] + [
+            f'player_{index:0>100}' for index in range(1_000, 1_100)
+        ]
+
+        # Act
+        payloads = player_payloads(player_ids + player_ids[:10])
+
+        # Assert
+        assert len(payloads) > 1
+        assert all(len(payload.encode()) <= MAX_PAYLOAD_BYTES for payload in payloads)
+        assert [
+            player_id for payload in payloads for player_id in json.loads(payload)
+        ] == player_ids
+
+    @pytest.mark.asyncio
+    async def test_notified_on_commit(self):
+        """
+        Test that the players written by the write-behind are notified once the batch commits, in one notification,
+        and that a rolled back transaction notifies nothing.
+        """
+        # Arrange
+        async with self.__engine.begin() as connection:
+            await connection.execute(insert(Clan).values(id=1, name='clan'))
+            await connection.execute(
+                insert(PlayerProfile),
+                [
+                    {
+                        'player_id': player_id,
+                        'credential': 'apple_credential',
+                        'created': datetime(2021, 1, 10),
+                        'modified': datetime(2021, 1, 23),
+                        'active_campaigns': [],
+                        'level': 3,
+                        'country': 'CA',
+                        'language': 'fr',
+                        'birthdate': datetime(2000, 1, 10),
+                        'gender': 'male',
+                        'clan_id': 1,
+                    }
+                    for player_id in ('player_1', 'player_2')
+                ],
+            )
+        await self.__listener.start()
+        for _ in range(100):
+            if self.__listener.connected:
+                break
+            await asyncio.sleep(0.01)
+        write_behind = ActiveCampaignsWriteBehind(
+            enabled=True, connect=self.__engine.begin
+        )
+        for player_id in ('player_1', 'player_2', 'player_1'):
+            write_behind.submit(player_id, 1, ['mycampaign'])
+
+        # Act
+        async with self.__engine.connect() as connection:
+            await notify_players(connection, ['rolled_back'])
+            await connection.rollback()
+        assert await write_behind.flush()
+        await self.wait_for_notification()
+
+        # Assert
+        assert self.__invalidated == ['player_1', 'player_2']
+        assert self.__listener.notifications == 1
+        assert self.__connection_changes == [True]
+
+    @pytest.mark.asyncio
+    async def test_players_not_notified_by_default(self, monkeypatch):
+        """
+        Test that the players changed are not notified without PLAYER_INVALIDATION, since no worker listens to them.
+        """
+        # Arrange
+        monkeypatch.setattr(_invalidation, 'PLAYER_INVALIDATION', False)
+        await self.__listener.start()
+        for _ in range(100):
+            if self.__listener.connected:
+                break
+            await asyncio.sleep(0.01)
+
+        # Act
+        async with self.__engine.begin() as connection:
+            await notify_players(connection, ['player_1'])
+        await asyncio.sleep(0.1)
+
+        # Assert
+        assert self.__invalidated == []
+        assert self.__listener.notifications == 0
+
+    @pytest.mark.asyncio
+    async def test_reconnect(self):
+        """
+        Test that the listener started on a given connection listens again on a new one when it is lost, and that the
+        caches are told when the notifications are down and back.
+        """
+        # Arrange
+        connection = await asyncpg.connect(self.__dsn)
+        await self.__listener.start(connection)
+        admin = await asyncpg.connect(self.__dsn)
+
+        # Act
+        try:
+            await admin.execute(
+                'SELECT pg_terminate_backend($1)', connection.get_server_pid()
+            )
+            for _ in range(100):
+                if self.__listener.connected and self.__listener.lost_connections:
+                    break
+                await asyncio.sleep(0.05)
+            await admin.execute(
+                'SELECT pg_notify($1, $2)', PLAYER_CHANNEL, '["player_3"]'
+            )
+            await self.wait_for_notification()
+        finally:
+            await admin.close()
+            await connection.close()
+
+        # Assert
+        assert self.__connection_changes == [True, False, True]
+        assert self.__listener.lost_connections == 1
+        assert self.__invalidated == ['player_3']
@@ -0,0 +1,136 @@
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import Executable, text
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+
+from profile_matcher.api.models import ActiveCampaign, Level, Matcher, MatcherContent
+from profile_matcher.api.routes._campaign_players import _export
+from profile_matcher.catalog import compile_campaign
+from profile_matcher.database import _write_behind
+from profile_matcher.database.models import Device
+from profile_matcher.repository import _orm
+
+PLAYER_COUNT = 20_000
+# A campaign targets a few countries and levels out of many
+COUNTRIES = ['CA', 'US', 'RO', *(f'C{index}' for index in range(47))]
+LEVELS = 100
+
+# Tables that grow with the number of players: a hot query must never scan them
+PLAYER_TABLES = {'player-profile', 'inventory', 'device'}
+
+SEED_STATEMENTS = [
+    "INSERT INTO clan (id, name) SELECT g, 'clan_' || g FROM generate_series(1, 100) AS g",
+    f"""
+    INSERT INTO "player-profile" (
+        player_id, credential, created, modified, total_spent, total_refund, total_transactions, active_campaigns,
+        level, xp, total_playtime, country, language, birthdate, gender, clan_id, version
+    )
+    SELECT 'player_' || g, 'credential', now(), now(), 0, 0, 0, ARRAY[]::varchar[],
+        1 + g % {LEVELS}, 0, 0, (ARRAY{COUNTRIES})[1 + g % {len(COUNTRIES)}], 'en', now(), 'male', 1 + g % 100, 1
+    FROM generate_series(1, {PLAYER_COUNT}) AS g
+    """,
+    f"""
+    INSERT INTO inventory (player_id, cash, coins, item_1, item_4)
+    SELECT 'player_' || g, 0, 0, CASE WHEN g % 2 = 0 THEN 1 END, CASE WHEN g % 7 = 0 THEN 1 END
+    FROM generate_series(1, {PLAYER_COUNT}) AS g
+    """,
+    f"""
+    INSERT INTO device (id, player_id, model, carrier, firmware)
+    SELECT g, 'player_' || (1 + g % {PLAYER_COUNT}), 'model', 'carrier', '1'
+    FROM generate_series(1, {2 * PLAYER_COUNT}) AS g
+    """,
+    'ANALYZE',
+]
+
+CAMPAIGN = ActiveCampaign(
+    game='mygame',
+    name='mocked_campaign',
+    priority=10.5,
+    matchers=Matcher(
+        level=Level(min=1, max=3),
+        has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+        does_not_have=MatcherContent(items=['item_4']),
+    ),
+    start_date=datetime(2022, 1, 25),
+    end_date=datetime(2022, 2, 25),
+    enabled=True,
+    last_updated=datetime(2021, 7, 13),
+)
+
+
+def load_player() -> Executable:
+    return _orm.player_statement('player_42')
+
+
+def load_devices() -> Executable:
+    # Same query as the selectin load of the devices issued with load_player
+    return select(Device).where(Device.player_id.in_(['player_42']))
+
+
+def update_active_campaigns() -> Executable:
+    return _orm.update_statement('player_42', 1, ['mocked_campaign'])
+
+
+def write_behind_flush() -> Executable:
+    return _write_behind._UPDATE_ACTIVE_CAMPAIGNS.bindparams(
+        player_ids=['player_42', 'player_43'],
+        versions=[1, 1],
+        active_campaigns=[json.dumps(['mocked_campaign']), json.dumps([])],
+    )
+
+
+def export_campaign_players() -> Executable:
+    return getattr(_export, '__matching_players_statement')(compile_campaign(CAMPAIGN))
+
+
+class TestQueryPlans:
+    @pytest.fixture(autouse=True)
+    async def seed_data(self, async_session):
+        for statement in SEED_STATEMENTS:
+            await async_session.exec(text(statement))
+        await async_session.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        'build_statement, max_cost',
+        # About 2.5 times the cost estimated on the seeded dataset
+        [
+            (load_player, 50),
+            (load_devices, 50),
+            (update_active_campaigns, 25),
+            (write_behind_flush, 50),
+            (export_campaign_players, 1_000),
+        ],
+    )
+    async def test_query_plan(self, async_session, build_statement, max_cost):
+        """
+        Test that the hot queries are served by indexes on the player tables, and that their estimated cost stays under
+        the threshold.
+        """
+        # Arrange
+        sql = build_statement().compile(
+            dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}
+        )
+
+        # Act
+        result = await async_session.exec(text(f'EXPLAIN (FORMAT JSON) {sql}'))
+        plan = result.one()[0][0]['Plan']
+
+        # Assert
+        sequential_scans = [
+            node['Relation Name']
+            for node in self.plan_nodes(plan)
+            if node['Node Type'] == 'Seq Scan'
+            and node['Relation Name'] in PLAYER_TABLES
+        ]
+        assert sequential_scans == [], json.dumps(plan, indent=2)
+        assert plan['Total Cost'] <= max_cost, json.dumps(plan, indent=2)
+
+    @classmethod
+    def plan_nodes(cls, plan: dict):
+        yield plan
+        for child in plan.get('Plans', ()):
+            yield from cls.plan_nodes(child)
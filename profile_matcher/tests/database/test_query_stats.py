@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import update
+from sqlmodel import select
+
+from profile_matcher.database import count_queries, current_query_stats
+from profile_matcher.database.models import PlayerProfile, Clan
+
+
+class TestQueryStats:
+    @pytest.mark.asyncio
+    async def test_nested_scopes(self, async_session):
+        """
+        Test that the statements are counted in the scope where they run and in the enclosing scopes, with the rows
+        they return or update, and that the repeated statements are reported.
+        """
+        # Arrange
+        async_session.add(Clan(id=1, name='clan'))
+        await async_session.commit()
+
+        # Act
+        with count_queries() as outer_stats:
+            await async_session.exec(select(Clan.name))
+            await async_session.exec(update(Clan).values(name='renamed_clan'))
+            with count_queries() as inner_stats:
+                for _ in range(3):
+                    await async_session.exec(
+                        select(PlayerProfile).where(PlayerProfile.player_id == 'id')
+                    )
+
+        # Assert
+        assert current_query_stats() is None
+        assert outer_stats.statements == 5
+        assert outer_stats.rows == 2
+        assert inner_stats.statements == 3
+        assert inner_stats.rows == 0
+        assert list(inner_stats.repeated_statements(3).values()) == [3]
+        assert outer_stats.repeated_statements(4) == {}
@@ -0,0 +1,80 @@
+import pytest
+
+from profile_matcher.database import (
+    SHARD_SLOTS,
+    ShardMap,
+    ShardMapException,
+    player_slot,
+)
+
+
+class TestShardMap:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__player_ids = [f'player_{index}' for index in range(10_000)]
+
+    def test_routing(self):
+        """
+        Test that a player is always routed to the same shard, and that the players are spread evenly over the shards.
+        """
+        # Arrange
+        shard_map = ShardMap.uniform(4)
+
+        # Act
+        groups = shard_map.group(self.__player_ids)
+
+        # Assert
+        assert player_slot('player_1') == player_slot('player_1')
+        assert ShardMap.uniform(4).shard_of('player_1') == shard_map.shard_of(
+            'player_1'
+        )
+        assert sorted(groups) == [0, 1, 2, 3]
+        for player_ids in groups.values():
+            assert 2_000 <= len(player_ids) <= 3_000
+            assert {shard_map.shard_of(player_id) for player_id in player_ids} == {
+                shard_map.shard_of(player_ids[0])
+            }
+
+    def test_rebalanced_moves_few_slots(self):
+        """
+        Test that adding a shard only moves the slots the new shard takes, and that removing it moves only its slots
+        back.
+        """
+        # Arrange
+        shard_map = ShardMap.uniform(2)
+
+        # Act
+        grown = shard_map.rebalanced(3)
+        shrunk = grown.rebalanced(2)
+
+        # Assert
+        assert grown.slot_counts() == [342, 341, 341]
+        moved = shard_map.moved_slots(grown)
+        assert len(moved) == 341
+        assert {destination for _, destination in moved.values()} == {2}
+        assert shrunk.slot_counts() == [512, 512]
+        assert set(grown.moved_slots(shrunk)) == {
+            slot for slot, shard in enumerate(grown.assignments) if shard == 2
+        }
+
+    def test_save_and_load(self, tmp_path):
+        """
+        Test that a saved map is loaded as it was, and that an invalid map is refused.
+        """
+        # Arrange
+        shard_map = ShardMap.uniform(2).rebalanced(3)
+        path = tmp_path / 'shard_map.json'
+        invalid_path = tmp_path / 'invalid.json'
+        invalid_path.write_text('{"shard_count": 2, "assignments": [0, 3]}')
+
+        # Act
+        shard_map.save(path)
+        loaded = ShardMap.load(path)
+
+        # Assert
+        assert loaded == shard_map
+        assert len(loaded.assignments) == SHARD_SLOTS
+        with pytest.raises(ShardMapException):
+            ShardMap.load(invalid_path)
+        with pytest.raises(ShardMapException):
+            ShardMap.load(tmp_path / 'missing.json')
@@ -0,0 +1,326 @@
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator
+from unittest.mock import patch
+
+import asyncpg
+import pytest
+import pytest_asyncio
+from sqlalchemy import func
+from sqlmodel import select, update
+
+from profile_matcher.api.models import (
+    ActiveCampaign,
+    Level,
+    Matcher,
+    MatcherContent,
+)
+from profile_matcher.catalog import CatalogIndex
+from profile_matcher.database import (
+    ActiveCampaignsWriteBehind,
+    ShardMap,
+    ShardRebalancer,
+    ShardedSessionManager,
+    session_manager_for,
+)
+from profile_matcher.database.models import Device, Inventory, PlayerProfile
+from profile_matcher.ingestion import IngestionFormat, PlayerProfileIngestor
+from profile_matcher.matching import BulkMatcher
+
+PLAYER_COUNT = 300
+SHARD_DATABASES = 3
+
+
+class TestSharding:
+    @pytest_asyncio.fixture(autouse=True)
+    async def setup_data(self, create_test_database_and_tables):
+        # One database per shard, next to the test database. The players are spread over the first two, the third one
+        # is a shard added to rebalance to.
+        url = create_test_database_and_tables.url
+        self.__shard_names = [
+            f'{url.database}_shard{shard}' for shard in range(SHARD_DATABASES)
+        ]
+        self.__shards = ShardedSessionManager(
+            [
+                url.set(database=name).render_as_string(hide_password=False)
+                for name in self.__shard_names
+            ],
+            ShardMap.uniform(2),
+        )
+        await self.__shards.create_database_if_not_exists()
+        await self.__shards.create_all()
+        self.__player_ids = [f'player_{index}' for index in range(PLAYER_COUNT)]
+
+        yield
+
+        await self.__shards.close()
+        connection = await asyncpg.connect(
+            f'postgres://{url.username}:{url.password}@{url.host}:{url.port}/postgres'
+        )
+        try:
+            for name in self.__shard_names:
+                await connection.execute(
+                    'SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+                    'WHERE datname = $1 AND pid <> pg_backend_pid()',
+                    name,
+                )
+                await connection.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        finally:
+            await connection.close()
+
+    async def ingest_players(self):
+        """
+        Load the players on their shard. The odd players have item_1.
+        """
+        rows = b''.join(
+            json.dumps(
+                {
+                    'player_id': player_id,
+                    'credential': 'apple_credential',
+                    'created': '2021-01-10T13:37:17',
+                    'modified': '2021-01-23T13:37:17',
+                    'level': 3,
+                    'country': 'CA',
+                    'language': 'fr',
+                    'birthdate': '2000-01-10T13:37:17',
+                    'gender': 'male',
+                    'clan_id': 1,
+                    'clan_name': 'clan',
+                    'inventory': {'cash': 10, 'coins': 20}
+                    | ({'item_1': 1} if index % 2 else {}),
+                    'devices': [
+                        {
+                            'id': index,
+                            'model': 'pixel',
+                            'carrier': 'bell',
+                            'firmware': '1',
+                        }
+                    ],
+                }
+            ).encode()
+            + b'\n'
+            for index, player_id in enumerate(self.__player_ids)
+        )
+
+        async def chunks() -> AsyncIterator[bytes]:
+            yield rows
+
+        ingestor = PlayerProfileIngestor(batch_size=100, shards=self.__shards)
+        return await ingestor.ingest(chunks(), IngestionFormat.NDJSON)
+
+    async def player_ids_by_shard(self) -> list[set[str]]:
+        async def player_ids(manager) -> set[str]:
+            async with manager.session() as session:
+                return set(await session.exec(select(PlayerProfile.player_id)))
+
+        return await self.__shards.scatter(player_ids)
+
+    @staticmethod
+    def create_campaign() -> ActiveCampaign:
+        return ActiveCampaign(
+            game='mygame',
+            name='item_1_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+
+    @pytest.mark.asyncio
+    async def test_players_routed_to_their_shard(self):
+        """
+        Test that the ingestion loads every player on its shard only, and that a single-player route gets the session
+        manager of the shard of its player.
+        """
+        # Arrange
+        expected = self.__shards.group(self.__player_ids)
+
+        # Act
+        report = await self.ingest_players()
+        player_ids_by_shard = await self.player_ids_by_shard()
+
+        # Assert
+        assert report.ingested_rows == PLAYER_COUNT
+        assert player_ids_by_shard == [set(expected[0]), set(expected[1]), set()]
+        with patch(
+            'profile_matcher.database._async_session_manager.sharded_session_manager',
+            self.__shards,
+        ):
+            for shard, player_ids in expected.items():
+                assert (
+                    session_manager_for(player_ids[0]) is self.__shards.managers[shard]
+                )
+
+    @pytest.mark.asyncio
+    async def test_scatter_gather(self):
+        """
+        Test that the audience of a campaign is the sum of its audience on every shard, and that a re-match updates the
+        players of every shard.
+        """
+        # Arrange
+        await self.ingest_players()
+        bulk_matcher = BulkMatcher(
+            CatalogIndex([self.create_campaign()]),
+            datetime(2022, 2, 1, tzinfo=timezone.utc),
+            chunk_size=50,
+        )
+
+        # Act
+        audience_sizes = await bulk_matcher.audience_sizes_across(self.__shards)
+        updated = await bulk_matcher.rematch_across(self.__shards)
+
+        # Assert
+        assert audience_sizes == {'item_1_campaign': PLAYER_COUNT // 2}
+        assert updated == PLAYER_COUNT // 2
+        for manager in self.__shards.managers[:2]:
+            async with manager.session() as session:
+                players = (await session.exec(select(PlayerProfile))).all()
+                assert players
+                for player in players:
+                    index = int(player.player_id.split('_')[1])
+                    assert player.active_campaigns == (
+                        ['item_1_campaign'] if index % 2 else []
+                    )
+
+    @pytest.mark.asyncio
+    async def test_write_behind_by_shard(self):
+        """
+        Test that the write-behind queue writes the active campaigns of every player on its shard.
+        """
+        # Arrange
+        await self.ingest_players()
+        write_behind = ActiveCampaignsWriteBehind(
+            enabled=True, batch_size=PLAYER_COUNT, shards=self.__shards
+        )
+        for player_id in self.__player_ids:
+            write_behind.submit(player_id, 1, [f'campaign_of_{player_id}'])
+
+        # Act
+        flushed = await write_behind.flush()
+
+        # Assert
+        assert flushed
+        assert write_behind.queue_depth == 0
+        for manager in self.__shards.managers[:2]:
+            async with manager.session() as session:
+                for player in (await session.exec(select(PlayerProfile))).all():
+                    assert player.active_campaigns == [
+                        f'campaign_of_{player.player_id}'
+                    ]
+
+    @pytest.mark.asyncio
+    async def test_rebalance_to_added_shard(self, tmp_path):
+        """
+        Test that rebalancing to an added shard copies only the players of the slots it takes, with their inventory and
+        devices, saves the new map and keeps them on their old shard for the workers still reading the previous map,
+        until the players moved are deleted.
+        """
+        # Arrange
+        await self.ingest_players()
+        before = await self.player_ids_by_shard()
+        target = self.__shards.shard_map.rebalanced(3)
+        map_path = tmp_path / 'shard_map.json'
+        rebalancer = ShardRebalancer(self.__shards, batch_size=20, map_path=map_path)
+
+        # Act
+        report = await rebalancer.rebalance(target)
+        copied = await self.player_ids_by_shard()
+        deleted = await rebalancer.delete_moved()
+        after = await self.player_ids_by_shard()
+
+        # Assert
+        expected = target.group(self.__player_ids)
+        assert copied[:2] == before[:2]
+        assert copied[2] == after[2]
+        assert after == [set(expected.get(shard, [])) for shard in range(3)]
+        assert after[2]
+        assert report.moved_players == len(after[2])
+        assert set(report.moves) <= {(0, 2), (1, 2)}
+        assert deleted == {
+            shard: len(before[shard] - after[shard])
+            for shard in range(2)
+            if before[shard] - after[shard]
+        }
+        assert sum(deleted.values()) == report.moved_players
+        assert after[0] <= before[0] and after[1] <= before[1]
+        assert self.__shards.shard_map == target
+        assert ShardMap.load(map_path) == target
+        async with self.__shards.managers[2].session() as session:
+            for model in (Inventory, Device):
+                count = await session.exec(select(func.count()).select_from(model))
+                assert count.one() == len(after[2])
+            items = await session.exec(
+                select(PlayerProfile.player_id, Inventory.item_1).join(
+                    Inventory, Inventory.player_id == PlayerProfile.player_id
+                )
+            )
+            for player_id, item_1 in items:
+                index = int(player_id.split('_')[1])
+                assert item_1 == (1 if index % 2 else None)
+
+    @pytest.mark.asyncio
+    async def test_delete_moved_keeps_later_writes(self):
+        """
+        Test that a player written on its old shard after its copy, by a worker still reading the previous map, is
+        copied again before being deleted, while a player written on its new shard keeps that write.
+        """
+        # Arrange
+        await self.ingest_players()
+        before = await self.player_ids_by_shard()
+        rebalancer = ShardRebalancer(self.__shards, batch_size=20)
+        await rebalancer.rebalance(self.__shards.shard_map.rebalanced(3))
+        moved = await self.player_ids_by_shard()
+        stale_id, fresh_id = sorted(moved[2])[:2]
+        old_shard = 0 if stale_id in before[0] else 1
+        fresh_old_shard = 0 if fresh_id in before[0] else 1
+        async with self.__shards.managers[old_shard].session() as session:
+            await session.exec(
+                update(PlayerProfile)
+                .where(PlayerProfile.player_id == stale_id)
+                .values(level=20, version=PlayerProfile.version + 1)
+            )
+            await session.commit()
+        async with self.__shards.managers[2].session() as session:
+            await session.exec(
+                update(PlayerProfile)
+                .where(PlayerProfile.player_id == fresh_id)
+                .values(
+                    active_campaigns=['campaign'], version=PlayerProfile.version + 1
+                )
+            )
+            await session.commit()
+        async with self.__shards.managers[fresh_old_shard].session() as session:
+            await session.exec(
+                update(PlayerProfile)
+                .where(PlayerProfile.player_id == fresh_id)
+                .values(level=30)
+            )
+            await session.commit()
+
+        # Act
+        await rebalancer.delete_moved()
+
+        # Assert
+        async with self.__shards.managers[2].session() as session:
+            stale = await session.get(PlayerProfile, stale_id)
+            fresh = await session.get(PlayerProfile, fresh_id)
+            inventory_count = await session.exec(
+                select(func.count())
+                .select_from(Inventory)
+                .where(Inventory.player_id == stale_id)
+            )
+            assert stale.level == 20
+            assert inventory_count.one() == 1
+            assert fresh.level == 3
+            assert fresh.active_campaigns == ['campaign']
+        assert await self.player_ids_by_shard() == [
+            before[0] - moved[2],
+            before[1] - moved[2],
+            moved[2],
+        ]
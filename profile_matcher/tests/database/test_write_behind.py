@@ -0,0 +1,184 @@
+from datetime import datetime, timezone
+from unittest.mock import patch, Mock
+
+import pytest
+from sqlalchemy import update
+from sqlmodel import select
+
+from profile_matcher.api.models import (
+    Matcher,
+    Level,
+    MatcherContent,
+    ActiveCampaign,
+)
+from profile_matcher.catalog import CatalogIndexCache, get_clock
+from profile_matcher.database import ActiveCampaignsWriteBehind
+from profile_matcher.database.models import PlayerProfile, Clan, Inventory
+from main import app
+
+
+class TestActiveCampaignsWriteBehind:
+    @pytest.fixture(autouse=True)
+    def setup_data(self, create_test_database_and_tables):
+        self.__engine = create_test_database_and_tables
+        app.dependency_overrides[get_clock] = lambda: lambda: datetime(
+            2022, 2, 1, tzinfo=timezone.utc
+        )
+        self.__player_id = '97983be2-98b7-11e7-90cf-082e5f28d836'
+        self.__test_clan = Clan(id=123456, name='Hello world clan')
+        self.__player_profile = PlayerProfile(
+            player_id=self.__player_id,
+            credential='apple_credential',
+            created=datetime(2021, 1, 10, 13, 37, 17),
+            modified=datetime(2021, 1, 23, 13, 37, 17),
+            last_session=datetime(2021, 1, 23, 13, 37, 17),
+            active_campaigns=[],
+            level=3,
+            country='CA',
+            language='fr',
+            birthdate=datetime(2000, 1, 10, 13, 37, 17),
+            gender='male',
+            clan_id=self.__test_clan.id,
+            custom_field='mycustom',
+        )
+        self.__test_inventory = Inventory(
+            id=1, player_id=self.__player_id, cash=123, coins=123, item_1=1
+        )
+
+    @pytest.mark.asyncio
+    async def test_route_queues_update(self, async_client, async_session):
+        """
+        Test that with the write-behind enabled, the route returns the new active campaigns right away and the
+        database is updated by the next flush.
+        """
+        # Arrange
+        mock_campaign = ActiveCampaign(
+            game='mygame',
+            name='mocked_campaign',
+            priority=10.5,
+            matchers=Matcher(
+                level=Level(min=1, max=3),
+                has=MatcherContent(country=['US', 'RO', 'CA'], items=['item_1']),
+                does_not_have=MatcherContent(items=['item_4']),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
+        write_behind = ActiveCampaignsWriteBehind(
+            enabled=True, connect=self.__engine.begin
+        )
+        async_session.add(self.__test_clan)
+        async_session.add(self.__player_profile)
+        await async_session.flush()
+        async_session.add(self.__test_inventory)
+        await async_session.commit()
+
+        with (
+            patch(
+                'profile_matcher.api.routes._client_config._get.__mock_campaign_api',
+                new_callable=Mock,
+            ) as mock_campaign_api,
+            patch(
+                'profile_matcher.repository._selection.active_campaigns_write_behind',
+                write_behind,
+            ),
+            patch(
+                'profile_matcher.api.routes._client_config._get.catalog_indexes',
+                CatalogIndexCache(),
+            ),
+        ):
+            mock_campaign_api.return_value = [mock_campaign]
+
+            # Act
+            response = await async_client.get(f'/get_client_config/{self.__player_id}')
+            player_before_flush = await self.get_player(async_session)
+            campaigns_before_flush = list(player_before_flush.active_campaigns)
+            await write_behind.flush()
+            player_after_flush = await self.get_player(async_session)
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json()['active_campaigns'] == ['mocked_campaign']
+        assert campaigns_before_flush == []
+        assert player_after_flush.active_campaigns == ['mocked_campaign']
+        assert player_after_flush.version == 2
+        assert write_behind.stats()['flushes'] == 1
+        assert write_behind.queue_depth == 0
+
+    def test_submit_merges_and_bounds_queue(self):
+        """
+        Test that updates of the same player are merged and that the queue refuses new players once full.
+        """
+        # Arrange
+        write_behind = ActiveCampaignsWriteBehind(enabled=True, max_queue_size=2)
+
+        # Act
+        accepted = [
+            write_behind.submit('player_1', 1, ['campaign_1']),
+            write_behind.submit('player_1', 1, ['campaign_2']),
+            write_behind.submit('player_2', 1, []),
+            write_behind.submit('player_3', 1, ['campaign_1']),
+        ]
+
+        # Assert
+        assert accepted == [True, True, True, False]
+        assert write_behind.pending('player_1') == ['campaign_2']
+        assert write_behind.pending('player_3') is None
+        assert write_behind.stats() == {
+            'queue_depth': 2,
+            'flushes': 0,
+            'flushed_rows': 0,
+            'failed_flushes': 0,
+            'merged_updates': 1,
+            'rejected_updates': 1,
+            'stale_updates': 0,
+        }
+
+    @pytest.mark.asyncio
+    async def test_stale_update_dropped(self, async_session):
+        """
+        Test that an update of a player written by another writer since it was read is dropped and counted, and that
+        the others of the batch are written.
+        """
+        # Arrange
+        other_player = PlayerProfile(
+            **self.__player_profile.model_dump(exclude={'player_id'}),
+            player_id='other_player',
+        )
+        async_session.add(self.__test_clan)
+        async_session.add_all([self.__player_profile, other_player])
+        await async_session.commit()
+        write_behind = ActiveCampaignsWriteBehind(
+            enabled=True, connect=self.__engine.begin
+        )
+        write_behind.submit(self.__player_id, 1, ['stale_campaign'])
+        write_behind.submit('other_player', 1, ['mycampaign'])
+        async with self.__engine.begin() as connection:
+            await connection.execute(
+                update(PlayerProfile)
+                .where(PlayerProfile.player_id == self.__player_id)
+                .values(active_campaigns=['concurrent_campaign'], version=2)
+            )
+
+        # Act
+        flushed = await write_behind.flush()
+        player = await self.get_player(async_session)
+
+        # Assert
+        assert flushed
+        assert player.active_campaigns == ['concurrent_campaign']
+        assert player.version == 2
+        assert write_behind.stats()['flushed_rows'] == 1
+        assert write_behind.stats()['stale_updates'] == 1
+        assert write_behind.queue_depth == 0
+
+    async def get_player(self, async_session) -> PlayerProfile:
+        statement = (
+            select(PlayerProfile)
+            .where(PlayerProfile.player_id == self.__player_id)
+            .execution_options(populate_existing=True)
+        )
+        result = await async_session.exec(statement)
+        return result.first()
@@ -0,0 +1,39 @@
+import pytest
+
+from profile_matcher.diagnostics import DiagnosticsException, MemoryDiagnostics
+
+
+class TestMemoryDiagnostics:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__diagnostics = MemoryDiagnostics(max_snapshots=2)
+        yield
+        self.__diagnostics.stop()
+
+    def test_snapshots_bounded(self):
+        """
+        Test that only the latest snapshots are kept, and that an evicted snapshot can no longer be compared with.
+        """
+        # Arrange
+        self.__diagnostics.start()
+
+        # Act
+        first = self.__diagnostics.take_snapshot()
+        self.__diagnostics.take_snapshot()
+        self.__diagnostics.take_snapshot()
+
+        # Assert
+        assert [snapshot.id for snapshot in self.__diagnostics.snapshots] == [2, 3]
+        with pytest.raises(DiagnosticsException):
+            self.__diagnostics.diff(since=first.id)
+
+    def test_not_tracing(self):
+        """
+        Test that no snapshot is taken while the allocations are not traced.
+        """
+        # Act / Assert
+        with pytest.raises(DiagnosticsException):
+            self.__diagnostics.take_snapshot()
+        self.__diagnostics.start()
+        with pytest.raises(DiagnosticsException):
+            self.__diagnostics.diff()
@@ -0,0 +1,28 @@
+from profile_matcher.loadtest import benchmark_catalog_parsing, generate_catalog
+
+
+class TestCatalogParsing:
+    def test_benchmark(self):
+        """
+        Test that every decoding path is timed and measured on the same catalog.
+        """
+        # Arrange
+        payload = generate_catalog(20, seed=1)
+
+        # Act
+        report = benchmark_catalog_parsing(payload, repeat=1, chunk_size=512)
+
+        # Assert
+        assert report.campaigns == 20
+        assert report.payload_bytes == len(payload)
+        assert [result.method for result in report.results] == [
+            'json_loads',
+            'type_adapter',
+            'stream',
+        ]
+        assert all(
+            result.seconds >= result.decode_seconds > 0
+            and result.campaigns_per_s > 0
+            and result.peak_kib > 0
+            for result in report.results
+        )
@@ -0,0 +1,128 @@
+from collections import Counter
+
+import httpx
+import pytest
+from fastapi import FastAPI, Response
+
+from profile_matcher.loadtest import (
+    KeyDistribution,
+    LoadGenerator,
+    LoadReport,
+    player_id_sampler,
+)
+
+PLAYER_IDS = [f'player_{index}' for index in range(100)]
+
+
+class TestLoadGenerator:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        # Stand-in for the service: player_0 does not exist, the others are found
+        self.__requested = Counter()
+        self.__app = FastAPI()
+
+        @self.__app.get('/get_client_config/{player_id}')
+        async def get_client_config(player_id: str):
+            self.__requested[player_id] += 1
+            if player_id == 'player_0':
+                return Response(status_code=404)
+            return {'player_id': player_id, 'active_campaigns': []}
+
+        self.__client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.__app), base_url='http://test'
+        )
+
+    def test_zipf_hot_keys(self):
+        """
+        Test that the zipf distribution sends most requests to the first players, unlike the uniform distribution.
+        """
+        # Arrange
+        uniform = player_id_sampler(PLAYER_IDS, KeyDistribution.UNIFORM, seed=1)
+        zipf = player_id_sampler(PLAYER_IDS, KeyDistribution.ZIPF, seed=1)
+
+        # Act
+        uniform_counts = Counter(uniform() for _ in range(10_000))
+        zipf_counts = Counter(zipf() for _ in range(10_000))
+
+        # Assert
+        hot_players = PLAYER_IDS[:5]
+        assert sum(uniform_counts[player_id] for player_id in hot_players) < 1_000
+        assert sum(zipf_counts[player_id] for player_id in hot_players) > 4_000
+        assert (
+            zipf_counts['player_0'] > zipf_counts['player_1'] > zipf_counts['player_9']
+        )
+        with pytest.raises(ValueError):
+            player_id_sampler([])
+
+    @pytest.mark.asyncio
+    async def test_report(self):
+        """
+        Test that the report counts every request sent by the workers during the run, with the errors and the latency
+        percentiles.
+        """
+        # Arrange
+        generator = LoadGenerator(
+            self.__client,
+            player_id_sampler(PLAYER_IDS[:2], seed=1),
+            concurrency=4,
+            duration=0.3,
+            params={'fields': 'level'},
+        )
+
+        # Act
+        report = await generator.run()
+
+        # Assert
+        assert report.requests == sum(self.__requested.values()) > 0
+        assert report.errors == self.__requested['player_0']
+        assert report.status_codes == {
+            '200': self.__requested['player_1'],
+            '404': self.__requested['player_0'],
+        }
+        assert 0 < report.error_rate < 1
+        assert report.throughput_rps > 0
+        assert (
+            report.latency_ms['p50']
+            <= report.latency_ms['p95']
+            <= report.latency_ms['p99']
+            <= report.latency_ms['max']
+        )
+        assert LoadReport.model_validate_json(report.model_dump_json()) == report
+
+    def test_regressions(self):
+        """
+        Test that a run is compared with a baseline within the tolerance.
+        """
+        # Arrange
+        baseline = self.create_report(throughput_rps=1000, p99=10, error_rate=0.01)
+        similar = self.create_report(throughput_rps=950, p99=10.5, error_rate=0.01)
+        slower = self.create_report(throughput_rps=800, p99=20, error_rate=0.05)
+
+        # Act
+        similar_regressions = similar.regressions(baseline)
+        slower_regressions = slower.regressions(baseline)
+
+        # Assert
+        assert similar_regressions == []
+        assert [regression.split()[0] for regression in slower_regressions] == [
+            'throughput',
+            'p99',
+            'error',
+        ]
+
+    @staticmethod
+    def create_report(
+        throughput_rps: float, p99: float, error_rate: float
+    ) -> LoadReport:
+        return LoadReport(
+            target='http://test',
+            distribution=KeyDistribution.UNIFORM,
+            concurrency=10,
+            duration_s=10,
+            requests=int(throughput_rps * 10),
+            errors=int(throughput_rps * 10 * error_rate),
+            error_rate=error_rate,
+            status_codes={},
+            throughput_rps=throughput_rps,
+            latency_ms={'p50': 1.0, 'p95': 5.0, 'p99': p99, 'max': 50.0},
+        )
@@ -0,0 +1,199 @@
+import random
+import threading
+from datetime import datetime, timezone
+from typing import Sequence
+
+import pytest
+
+from profile_matcher.api.models import (
+    ActiveCampaign,
+    Level,
+    Matcher,
+    MatcherContent,
+)
+from profile_matcher.catalog import (
+    CompiledCampaign,
+    PlayerFeatures,
+    compile_catalog,
+    items_to_mask,
+)
+from profile_matcher.matching import (
+    MATCHER_ENGINES,
+    CompiledEngine,
+    MatcherEngine,
+    ShadowRunner,
+)
+
+NOW = datetime(2022, 2, 1, tzinfo=timezone.utc).timestamp()
+ITEMS = ['item_1', 'item_4', 'item_34']
+COUNTRIES = ['CA', 'US', 'RO']
+
+
+class FirstCampaignOnlyEngine(MatcherEngine):
+    """
+    A faulty candidate: it stops at the first campaign matched.
+    """
+
+    name = 'first_campaign_only'
+
+    def match(
+        self, player: PlayerFeatures, campaigns: Sequence[CompiledCampaign], now: float
+    ) -> list[str]:
+        return CompiledEngine().match(player, campaigns, now)[:1]
+
+
+class ThreadRecordingEngine(CompiledEngine):
+    """
+    The compiled engine, recording the threads it runs in.
+    """
+
+    name = 'thread_recording'
+
+    def __init__(self):
+        self.threads = set()
+
+    def match(
+        self, player: PlayerFeatures, campaigns: Sequence[CompiledCampaign], now: float
+    ) -> list[str]:
+        self.threads.add(threading.current_thread())
+        return super().match(player, campaigns, now)
+
+
+class TestShadowRunner:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__random = random.Random(1234)
+        self.__campaigns = compile_catalog(
+            [self.create_campaign(index) for index in range(20)]
+        ).campaigns
+
+    def test_engines_parity(self):
+        """
+        Test that every engine gives the result of the compiled engine on random players.
+        """
+        # Arrange
+        players = [self.create_player() for _ in range(200)]
+        reference = CompiledEngine()
+
+        # Act
+        results = {
+            name: [engine().match(player, self.__campaigns, NOW) for player in players]
+            for name, engine in MATCHER_ENGINES.items()
+        }
+
+        # Assert
+        expected = [
+            reference.match(player, self.__campaigns, NOW) for player in players
+        ]
+        assert any(expected)
+        for name, result in results.items():
+            assert result == expected, name
+
+    @pytest.mark.asyncio
+    async def test_mismatches(self):
+        """
+        Test that the sampled players are compared in the background, that the mismatches are recorded with inputs
+        that reproduce them, and that the latencies of both engines are measured.
+        """
+        # Arrange
+        runner = ShadowRunner(FirstCampaignOnlyEngine(), sample_rate=1.0)
+        players = [self.create_player() for _ in range(50)]
+
+        # Act
+        for index, player in enumerate(players):
+            assert runner.submit(f'player_{index}', player, self.__campaigns, NOW)
+        compared_before_drain = runner.compared
+        await runner.drain()
+
+        # Assert
+        assert compared_before_drain == 0
+        assert runner.compared == 50
+        assert runner.mismatched == len(runner.mismatches) > 0
+        mismatch = runner.mismatches[0]
+        assert mismatch.replay(runner.candidate) == mismatch.actual
+        assert mismatch.replay(CompiledEngine()) == mismatch.expected
+        assert mismatch.to_dict()['campaigns'][0]['rules'][0][0] == 'level'
+        stats = runner.stats()
+        assert set(stats['reference_latency_ms']) == {'p50', 'p90', 'p99'}
+        assert set(stats['candidate_latency_ms']) == {'p50', 'p90', 'p99'}
+
+    @pytest.mark.asyncio
+    async def test_bounded(self):
+        """
+        Test that nothing is compared without candidate or when the player is not sampled, and that the players
+        submitted while too many comparisons are pending are dropped.
+        """
+        # Arrange
+        disabled_runner = ShadowRunner(None, sample_rate=1.0)
+        unsampled_runner = ShadowRunner(CompiledEngine(), sample_rate=0.0)
+        runner = ShadowRunner(CompiledEngine(), sample_rate=1.0, max_pending=3)
+        player = self.create_player()
+
+        # Act
+        submitted = [
+            runner.submit('player', player, self.__campaigns, NOW) for _ in range(5)
+        ]
+        await runner.drain()
+
+        # Assert
+        assert not disabled_runner.submit('player', player, self.__campaigns, NOW)
+        assert not unsampled_runner.submit('player', player, self.__campaigns, NOW)
+        assert submitted == [True, True, True, False, False]
+        assert (runner.compared, runner.dropped, runner.mismatched) == (3, 2, 0)
+
+    @pytest.mark.asyncio
+    async def test_off_event_loop(self):
+        """
+        Test that both engines run out of the thread of the event loop, in the single thread of the runner, and that
+        the runner can be used again once stopped.
+        """
+        # Arrange
+        reference = ThreadRecordingEngine()
+        candidate = ThreadRecordingEngine()
+        runner = ShadowRunner(candidate, reference, sample_rate=1.0)
+        player = self.create_player()
+
+        # Act
+        for _ in range(5):
+            runner.submit('player', player, self.__campaigns, NOW)
+        await runner.drain()
+        await runner.stop()
+        runner.submit('player', player, self.__campaigns, NOW)
+        await runner.drain()
+
+        # Assert
+        assert runner.compared == 6
+        assert threading.current_thread() not in reference.threads | candidate.threads
+        assert len(reference.threads) == 2
+        assert reference.threads == candidate.threads
+
+    def create_player(self) -> PlayerFeatures:
+        return PlayerFeatures(
+            level=self.__random.randint(1, 20),
+            country=self.__random.choice(COUNTRIES + ['JP']),
+            item_mask=items_to_mask(
+                item for item in ITEMS if self.__random.random() < 0.5
+            ),
+            active_campaigns=frozenset(),
+            language=self.__random.choice(['fr', 'en']),
+        )
+
+    def create_campaign(self, index: int) -> ActiveCampaign:
+        return ActiveCampaign(
+            game='mygame',
+            name=f'campaign_{index}',
+            priority=index,
+            matchers=Matcher(
+                level=Level(min=1, max=self.__random.randint(5, 20)),
+                has=MatcherContent(
+                    country=self.__random.sample(COUNTRIES, 2),
+                    items=self.__random.sample(ITEMS, 2),
+                    language=['fr'] if index % 3 == 0 else None,
+                ),
+                does_not_have=MatcherContent(items=[]),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
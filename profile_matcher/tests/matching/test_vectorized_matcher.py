@@ -0,0 +1,380 @@
+import logging
+import random
+import time
+from datetime import datetime, timezone
+
+from unittest.mock import patch
+
+import pytest
+
+from profile_matcher.api.models import (
+    Matcher,
+    Level,
+    MatcherContent,
+    ActiveCampaign,
+)
+from profile_matcher.catalog import (
+    CatalogIndex,
+    ITEM_NAMES,
+    PlayerFeatures,
+    compile_catalog,
+    to_timestamp,
+)
+from profile_matcher.api.routes._client_config import _get
+from profile_matcher.database.models import PlayerProfile, Clan, Device, Inventory
+from profile_matcher.matching import BulkMatcher, VectorizedMatcher
+
+logger = logging.getLogger('uvicorn')
+
+
+def validate_player_and_campaign_match(
+    player: PlayerProfile, campaign: ActiveCampaign
+) -> bool:
+    """
+    Reference matcher: the campaign matchers evaluated on the player model, as the route did (debug logs included)
+    before the players were reduced to their features.
+    """
+    logger.debug(f'Validating player {player} with campaign {campaign}')
+    logger.debug(f'Parsing items from inventory: {player.inventory}')
+    player_items = {
+        key for key, value in player.inventory.model_dump().items() if value is not None
+    }
+    return (
+        campaign.matchers.level.min <= player.level <= campaign.matchers.level.max
+        and bool(player_items.intersection(campaign.matchers.has.items))
+        and player.country in campaign.matchers.has.country
+        and not player_items.intersection(campaign.matchers.does_not_have.items)
+    )
+
+
+ITEMS = ['item_1', 'item_4', 'item_34', 'item_55', 'item_100']
+COUNTRIES = ['CA', 'US', 'RO', 'FR', 'DE']
+
+
+class TestVectorizedMatcher:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__random = random.Random(1234)
+
+    def test_same_result_as_route_matcher(self):
+        """
+        Test on random players and campaigns that the match matrix is exactly the result of the route matcher.
+        """
+        # Arrange
+        players = [self.create_player(index) for index in range(300)]
+        campaigns = [self.create_campaign(index) for index in range(40)]
+        matcher = VectorizedMatcher(compile_catalog(campaigns).campaigns)
+
+        # Act
+        matrix = matcher.match_matrix(self.build_columns(matcher, players))
+
+        # Assert
+        expected = [
+            [
+                bool(validate_player_and_campaign_match(player, campaign))
+                for campaign in campaigns
+            ]
+            for player in players
+        ]
+        assert matrix.tolist() == expected
+
+    def test_columns_from_features(self):
+        """
+        Test that the columns built from the player features give the same match matrix as the model columns.
+        """
+        # Arrange
+        players = [self.create_player(index) for index in range(100)]
+        campaigns = [self.create_campaign(index) for index in range(20)]
+        matcher = VectorizedMatcher(compile_catalog(campaigns).campaigns)
+        expected = matcher.match_matrix(self.build_columns(matcher, players))
+
+        # Act
+        matrix = matcher.match_matrix(
+            matcher.columns_from_features(
+                [player.player_id for player in players],
+                [PlayerFeatures.from_player(player) for player in players],
+            )
+        )
+
+        # Assert
+        assert matrix.tolist() == expected.tolist()
+
+    def test_other_rules_on_features(self):
+        """
+        Test that the rules that are not vectorized are evaluated on the features of the players, with the same result
+        as the compiled campaigns.
+        """
+        # Arrange
+        players = [self.create_player(index) for index in range(100)]
+        for player in players:
+            player.language = self.__random.choice(['fr', 'en'])
+            player.devices = []
+        campaigns = [self.create_campaign(index) for index in range(20)]
+        for campaign in campaigns[::2]:
+            campaign.matchers.has.language = ['fr']
+        catalog = compile_catalog(campaigns)
+        matcher = VectorizedMatcher(catalog.campaigns)
+        features = [PlayerFeatures.from_player(player) for player in players]
+
+        # Act
+        matrix = matcher.match_matrix(
+            matcher.columns_from_features(
+                [player.player_id for player in players], features
+            )
+        )
+
+        # Assert
+        assert matcher.needs_features
+        assert matrix.tolist() == [
+            [campaign.matches(player) for campaign in catalog] for player in features
+        ]
+        with pytest.raises(ValueError):
+            matcher.match_matrix(self.build_columns(matcher, players))
+
+    @pytest.mark.benchmark
+    def test_throughput(self):
+        """
+        Test that the vectorized matcher is at least 50 times faster than calling the route matcher for every player
+        and campaign. Timed, so only run with -m benchmark.
+        """
+        # Arrange
+        players = [self.create_player(index) for index in range(300)]
+        campaigns = [self.create_campaign(index) for index in range(30)]
+        matcher = VectorizedMatcher(compile_catalog(campaigns).campaigns)
+
+        # Act
+        start = time.perf_counter()
+        for player in players:
+            for campaign in campaigns:
+                validate_player_and_campaign_match(player, campaign)
+        reference_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher.match_matrix(self.build_columns(matcher, players))
+        vectorized_duration = time.perf_counter() - start
+
+        # Assert
+        assert reference_duration / vectorized_duration >= 50
+
+    def test_bulk_selection_same_as_route(self):
+        """
+        Test that the active campaigns selected by the bulk matcher are the ones the route saves, with the game limits.
+        """
+        # Arrange
+        players = [self.create_player(index) for index in range(200)]
+        campaigns = [self.create_campaign(index) for index in range(30)]
+        now = datetime(2022, 2, 1, tzinfo=timezone.utc)
+        game_limits = {'mygame': 2}
+        index = CatalogIndex(campaigns)
+        bulk_matcher = BulkMatcher(index, now, game_limits=game_limits)
+        running_campaigns = index.compiled_running_at(now)
+        select_route_campaigns = getattr(_get, '__select_active_campaigns')
+
+        # Act
+        matrix = bulk_matcher.matcher.match_matrix(
+            self.build_columns(bulk_matcher.matcher, players), to_timestamp(now)
+        )
+        bulk_campaigns = [
+            bulk_matcher.select_active_campaigns(matches) for matches in matrix
+        ]
+        with patch.object(_get, 'GAME_CAMPAIGN_LIMITS', game_limits):
+            route_campaigns = [
+                select_route_campaigns(
+                    PlayerFeatures.from_player(player),
+                    running_campaigns,
+                    to_timestamp(now),
+                )
+                for player in players
+            ]
+
+        # Assert
+        assert bulk_campaigns == route_campaigns
+        assert max(len(names) for names in bulk_campaigns) > 2
+
+    def test_bulk_matcher_keeps_timeline(self):
+        """
+        Test that a bulk matcher at a past instant matches the campaigns running then, without moving the timeline of
+        the index used by the requests.
+        """
+        # Arrange
+        campaigns = [self.create_campaign(index) for index in range(10)]
+        for campaign in campaigns[:5]:
+            campaign.start_date = datetime(2022, 1, 1)
+            campaign.end_date = datetime(2022, 1, 10)
+        index = CatalogIndex(campaigns)
+        now = datetime(2022, 2, 1, tzinfo=timezone.utc)
+        running_now = index.compiled_running_at(now)
+        next_change = index.timeline.next_change()
+
+        # Act
+        bulk_matcher = BulkMatcher(index, datetime(2022, 1, 5, tzinfo=timezone.utc))
+
+        # Assert
+        assert list(bulk_matcher.matcher.campaigns) == sorted(
+            index.compiled.campaigns[:5], key=lambda campaign: -campaign.priority
+        )
+        assert index.timeline.next_change() == next_change
+        assert index.compiled_running_at(now) == running_now
+
+    @pytest.mark.asyncio
+    async def test_bulk_matcher(self, async_session):
+        """
+        Test that the bulk matcher counts the audience of every running campaign and updates the players whose active
+        campaigns changed.
+        """
+        # Arrange
+        async_session.add(Clan(id=1, name='clan'))
+        players = [self.create_player(index) for index in range(50)]
+        for player in players:
+            player.clan_id = 1
+            player.active_campaigns = []
+            async_session.add(player)
+        await async_session.flush()
+        for player in players:
+            async_session.add(player.inventory)
+        await async_session.commit()
+        campaigns = [self.create_campaign(index) for index in range(10)]
+        index = CatalogIndex(campaigns)
+        bulk_matcher = BulkMatcher(
+            index, datetime(2022, 2, 1, tzinfo=timezone.utc), chunk_size=20
+        )
+        expected = {
+            player.player_id: [
+                campaign.name
+                for campaign in index.running_at(datetime(2022, 2, 1))
+                if validate_player_and_campaign_match(player, campaign)
+            ]
+            for player in players
+        }
+
+        # Act
+        audience_sizes = await bulk_matcher.audience_sizes(async_session)
+        await async_session.commit()
+        updated = await bulk_matcher.rematch(
+            async_session, connect=async_session.bind.begin
+        )
+        await async_session.commit()
+
+        # Assert
+        assert audience_sizes == {
+            campaign.name: sum(campaign.name in names for names in expected.values())
+            for campaign in campaigns
+        }
+        assert updated == sum(1 for names in expected.values() if names)
+        # Every player was looked up in the match cache, once
+        assert bulk_matcher.match_cache.hits + bulk_matcher.match_cache.misses == 50
+        for player in players:
+            await async_session.refresh(player)
+            assert player.active_campaigns == expected[player.player_id]
+
+    @pytest.mark.asyncio
+    async def test_bulk_matcher_other_rules(self, async_session):
+        """
+        Test that the bulk matcher reads the features of the players, devices included, when some campaigns have rules
+        that are not vectorized.
+        """
+        # Arrange
+        async_session.add(Clan(id=1, name='clan'))
+        players = [self.create_player(index) for index in range(30)]
+        for player in players:
+            player.clan_id = 1
+            player.active_campaigns = []
+            async_session.add(player)
+        await async_session.flush()
+        for index, player in enumerate(players):
+            async_session.add(player.inventory)
+            async_session.add(
+                Device(
+                    id=index + 1,
+                    player_id=player.player_id,
+                    model='pixel' if index % 2 else 'iphone',
+                    carrier='vodafone',
+                    firmware='1',
+                )
+            )
+        await async_session.commit()
+        campaigns = [self.create_campaign(index) for index in range(10)]
+        for campaign in campaigns:
+            campaign.matchers.has.device_model = ['pixel']
+        index = CatalogIndex(campaigns)
+        bulk_matcher = BulkMatcher(index, datetime(2022, 2, 1, tzinfo=timezone.utc))
+        expected = {
+            campaign.name: sum(
+                validate_player_and_campaign_match(player, campaign)
+                and position % 2 == 1
+                for position, player in enumerate(players)
+            )
+            for campaign in index.running_at(datetime(2022, 2, 1))
+        }
+
+        # Act
+        audience_sizes = await bulk_matcher.audience_sizes(async_session)
+
+        # Assert
+        assert audience_sizes == expected
+        assert sum(expected.values()) > 0
+
+    @staticmethod
+    def build_columns(matcher: VectorizedMatcher, players: list[PlayerProfile]):
+        return matcher.build_columns(
+            [player.player_id for player in players],
+            [player.level for player in players],
+            [player.country for player in players],
+            [
+                [getattr(player.inventory, name) for player in players]
+                for name in ITEM_NAMES
+            ],
+        )
+
+    def create_player(self, index: int) -> PlayerProfile:
+        player = PlayerProfile(
+            player_id=f'player_{index}',
+            credential='apple_credential',
+            created=datetime(2021, 1, 10, 13, 37, 17),
+            modified=datetime(2021, 1, 23, 13, 37, 17),
+            level=self.__random.randint(1, 20),
+            country=self.__random.choice(COUNTRIES + ['JP']),
+            language='fr',
+            birthdate=datetime(2000, 1, 10, 13, 37, 17),
+            gender='male',
+        )
+        player.inventory = Inventory(
+            id=index + 1,
+            player_id=player.player_id,
+            cash=123,
+            coins=123,
+            **{
+                item: self.__random.randint(1, 5)
+                for item in ITEMS
+                if self.__random.random() < 0.4
+            },
+        )
+        return player
+
+    def create_campaign(self, index: int) -> ActiveCampaign:
+        level_min = self.__random.randint(1, 15)
+        return ActiveCampaign(
+            game=self.__random.choice(['mygame', 'othergame']),
+            name=f'campaign_{index}',
+            priority=self.__random.uniform(0, 100),
+            matchers=Matcher(
+                level=Level(
+                    min=level_min, max=level_min + self.__random.randint(0, 10)
+                ),
+                has=MatcherContent(
+                    country=self.__random.sample(
+                        COUNTRIES, self.__random.randint(1, 4)
+                    ),
+                    items=self.__random.sample(
+                        ITEMS + ['item_999'], self.__random.randint(1, 3)
+                    ),
+                ),
+                does_not_have=MatcherContent(
+                    items=self.__random.sample(ITEMS, self.__random.randint(0, 2))
+                ),
+            ),
+            start_date=datetime(2022, 1, 25),
+            end_date=datetime(2022, 2, 25),
+            enabled=True,
+            last_updated=datetime(2021, 7, 13),
+        )
@@ -0,0 +1,130 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from profile_matcher.repository import InMemoryPlayerRepository, RepositoryException
+
+
+class TestInMemoryPlayerRepository:
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        self.__player = {
+            'player_id': 'player_1',
+            'credential': 'apple_credential',
+            'created': '2021-01-10T13:37:17',
+            'modified': '2021-01-23T13:37:17',
+            'level': 3,
+            'country': 'CA',
+            'language': 'fr',
+            'birthdate': '2000-01-10T13:37:17',
+            'gender': 'male',
+            'clan_id': 1,
+            'clan_name': 'clan',
+            'inventory': {'cash': 123, 'coins': 12, 'item_1': 1},
+            'devices': [
+                {
+                    'id': 1,
+                    'model': 'apple iphone 11',
+                    'carrier': 'vodafone',
+                    'firmware': '123',
+                }
+            ],
+            'active_campaigns': ['mycampaign'],
+            'version': 3,
+        }
+
+    @pytest.mark.asyncio
+    async def test_load_player(self):
+        """
+        Test that a player of the snapshot is loaded with its inventory, devices and clan, the clan of the players
+        without clan name being the one of a previous player.
+        """
+        # Arrange
+        second_player = {
+            **self.__player,
+            'player_id': 'player_2',
+            'clan_name': None,
+            'inventory': None,
+            'devices': [],
+        }
+        repository = InMemoryPlayerRepository()
+        player_count = repository.load_snapshot(
+            [json.dumps(self.__player), '', json.dumps(second_player)]
+        )
+
+        # Act
+        player = await repository.load_player('player_1')
+        second = await repository.load_player('player_2')
+        missing = await repository.load_player('player_3')
+
+        # Assert
+        assert player_count == 2
+        assert len(repository) == 2
+        assert player.level == 3
+        assert player.birthdate == datetime(2000, 1, 10, 13, 37, 17)
+        assert player.active_campaigns == ['mycampaign']
+        assert player.version == 3
+        assert player.inventory.cash == 123
+        assert player.inventory.item_4 is None
+        assert [device.model for device in player.devices] == ['apple iphone 11']
+        assert player.clan.name == 'clan'
+        assert second.inventory is None
+        assert second.clan.name == 'clan'
+        assert missing is None
+
+    @pytest.mark.asyncio
+    async def test_load_player_fields(self):
+        """
+        Test that the relationships not requested are not built.
+        """
+        # Arrange
+        repository = InMemoryPlayerRepository()
+        repository.load_snapshot([json.dumps(self.__player)])
+
+        # Act
+        player = await repository.load_player('player_1', {'level', 'inventory'})
+
+        # Assert
+        assert player.level == 3
+        assert player.inventory.cash == 123
+        assert player.version == 3
+        assert 'devices' not in player.__dict__
+        assert 'clan' not in player.__dict__
+
+    @pytest.mark.asyncio
+    async def test_save_active_campaigns(self):
+        """
+        Test that the active campaigns are saved only if the player was not saved since it was loaded.
+        """
+        # Arrange
+        repository = InMemoryPlayerRepository()
+        repository.load_snapshot([json.dumps(self.__player)])
+        player = await repository.load_player('player_1')
+        concurrent_player = await repository.load_player('player_1')
+
+        # Act
+        saved = await repository.save_active_campaigns(player, ['campaign_1'])
+        concurrent_saved = await repository.save_active_campaigns(
+            concurrent_player, ['campaign_2']
+        )
+        reloaded = await repository.load_player('player_1')
+
+        # Assert
+        assert saved
+        assert not concurrent_saved
+        assert player.active_campaigns == ['campaign_1']
+        assert player.version == 4
+        assert reloaded.active_campaigns == ['campaign_1']
+        assert reloaded.version == 4
+
+    def test_unknown_clan(self):
+        """
+        Test that a player of a clan without name cannot be added.
+        """
+        # Arrange
+        repository = InMemoryPlayerRepository()
+
+        # Act / Assert
+        with pytest.raises(RepositoryException, match='Unknown clan 1'):
+            repository.load_snapshot([json.dumps({**self.__player, 'clan_name': None})])